@@ -1,18 +1,40 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Query, Depends, Response
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, UploadFile, File, HTTPException, Query, Depends, Request, Response
+from sqlalchemy.orm import Session, defer
 from pydantic import BaseModel
-from typing import List, Optional
-from .storage import upload_audio_file
-from .assembly import transcribe_audio, transcribe_audio_realtime
+from typing import Any, Dict, List, Optional
+from .storage import OBJECT_NAME, get_storage, path_from_url, upload_audio_file
+from .uploads import UploadError, complete_upload, create_upload
+from .preprocessing import maybe_preprocess
+from .assembly import chunk_mode, transcribe_audio, transcribe_audio_chunked, transcribe_audio_realtime
+from .backends import choose_backend
 from .websocket import notify_clients
 from .database import SessionLocal
 from .models import Transcript, Speaker
 from .subtitle_generator import generate_srt_from_transcript, generate_vtt_from_transcript
+from .metrics import SUBTITLE_RENDER_SECONDS, timer, track_db
+from .cpu_tasks import encode_json, encode_response
+from .responses import FastJSONResponse, RawJSONResponse, cached_json_response, etag_matches
+from .workers import CpuTaskTimeout, run_cpu
+from .diarization import build_analytics, build_timeline
+from .cache import canonical_id, invalidate_transcript, response_cache, transcript_cache
+from .transcript_index import LARGE_COLUMNS, parse_fields, parse_speakers, transcript_payload, view_key
+from .config import ADMISSION_TIMEOUT, KEYWORD_MAX_TERMS, TIMELINE_MAX_BINS
+from .rate_limit import RateLimited, client_key, rate_limit, too_many_requests, upload_gate
+from .scheduler import parse_priority, scheduler
+from .waveform import ensure_peaks, read_peaks
+from .retention import delete_archive, needs_payload, rehydrate
+from . import export
+from .search import MATCH_MODES, delete_index, get_word_index, keyword_hits, parse_keywords
+from .replicas import read_router, transcript_key
+from .tenants import is_admin, owned_by, owner_key, quotas, tenant_of
+from .cleanup import gc_supported, get_job, list_jobs, remove_objects, start_bulk_delete, start_gc, unreferenced
+import asyncio
 import os
-from fastapi.responses import JSONResponse
+from datetime import datetime
+from fastapi.responses import JSONResponse, RedirectResponse, StreamingResponse
 import json
 
-router = APIRouter()
+router = APIRouter(default_response_class=FastJSONResponse)
 
 # Dependency to get DB session
 def get_db():
@@ -22,8 +44,58 @@ def get_db():
     finally:
         db.close()
 
+def get_read_db(request: Request):
+    """Session for read-only routes: a read replica unless this client or transcript was just written"""
+    keys = [client_key(request)]
+    if "transcript_id" in request.path_params:
+        try:
+            keys.append(transcript_key(canonical_id(request.path_params["transcript_id"])))
+        except ValueError:
+            pass  # the route answers 400
+    db = read_router.session(*keys)
+    try:
+        yield db
+    finally:
+        db.close()
+
+def transcript_uuid(transcript_id: str) -> str:
+    """Canonical spelling of a transcript id path parameter (cache keys use it); 400 if it isn't a UUID"""
+    try:
+        return canonical_id(transcript_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid transcript id")
+
+def require_admin(request: Request):
+    """403 unless the API key belongs to a tenant in ADMIN_TENANTS"""
+    if not is_admin(tenant_of(request)):
+        raise HTTPException(status_code=403, detail="Needs an admin API key (ADMIN_TENANTS)")
+
 class TranscribeRequest(BaseModel):
     audio_url: str
+    upstream_id: Optional[str] = None  # resume polling an existing AssemblyAI job
+    chunked: Optional[bool] = None  # split into parallel chunks; defaults to CHUNKED_MODE
+    preprocessing: Optional[Dict[str, Any]] = None  # report from /upload-audio, stored with the transcript
+    backend: Optional[str] = None  # one of CLIENT_BACKENDS; routed by size/language/load when omitted
+    language: Optional[str] = None  # language code hint; auto-detected when omitted
+    priority: Optional[str] = None  # batch (default) or backfill
+    duration: Optional[float] = None  # audio length hint (s); shorter jobs start sooner
+
+class BulkDeleteRequest(BaseModel):
+    ids: Optional[List[str]] = None  # transcript ids; combined with the filters below when both are given
+    status: Optional[List[str]] = None
+    since: Optional[datetime] = None  # created at or after
+    until: Optional[datetime] = None  # created before
+
+class UploadRequest(BaseModel):
+    filename: Optional[str] = None  # only the extension matters
+    size: Optional[int] = None  # rejected up front when over MAX_FILE_SIZE
+
+class CompleteUploadRequest(BaseModel):
+    upload_id: str  # token returned by POST /uploads
+    chunked: Optional[bool] = None
+    backend: Optional[str] = None
+    language: Optional[str] = None
+    priority: Optional[str] = None  # batch (default) or backfill
 
 class TranscriptResponse(BaseModel):
     id: str
@@ -36,37 +108,110 @@ class TranscriptResponse(BaseModel):
     created_at: str
     processing_time: Optional[float]
 
-@router.post("/upload-audio")
-async def upload_audio(file: UploadFile = File(...)):
-    """Upload an audio file and return the Supabase URL"""
+@router.post("/upload-audio", dependencies=[Depends(rate_limit)])
+async def upload_audio(file: UploadFile = File(...), preprocess: Optional[bool] = Query(None)):
+    """Upload an audio file (optionally downmixed/trimmed first) and return the Supabase URL"""
     try:
         # Check if it's an audio file
         if not file.content_type.startswith('audio/'):
             raise HTTPException(status_code=400, detail="Only audio files are allowed")
         
-        # Read file content
-        file_content = await file.read()
-        
-        # Get file extension
-        file_extension = os.path.splitext(file.filename)[1] if file.filename else '.wav'
-        
-        # Upload to Supabase
-        audio_url = await upload_audio_file(file_content, file_extension)
+        # Hold an upload slot before pulling the file into memory
+        async with upload_gate.slot():
+            # Read file content
+            file_content = await file.read()
+            
+            # Get file extension
+            file_extension = os.path.splitext(file.filename)[1] if file.filename else '.wav'
+            
+            # Downmix, resample and trim silence when enabled
+            prepared = await maybe_preprocess(file_content, file_extension, preprocess)
+            
+            # Upload to Supabase
+            audio_url = await upload_audio_file(prepared.data, prepared.file_extension)
         
         return {
             "status": "success",
             "audio_url": audio_url,
-            "filename": file.filename
+            "filename": file.filename,
+            "preprocessing": prepared.report or None
         }
         
+    except RateLimited as e:
+        raise too_many_requests(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/uploads", dependencies=[Depends(rate_limit)])
+async def create_direct_upload(request: UploadRequest):
+    """Signed URL for uploading audio straight to storage; confirm with POST /uploads/complete"""
+    try:
+        return await create_upload(request.filename, request.size)
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/uploads/complete", status_code=202, dependencies=[Depends(rate_limit)])
+async def complete_direct_upload(request: CompleteUploadRequest, http_request: Request):
+    """Validate a direct upload and queue its transcription; poll GET /transcripts/{transcript_id}"""
+    try:
+        backend = choose_backend(request.backend, language=request.language) if request.backend else None
+        priority = parse_priority(request.priority)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        return await complete_upload(request.upload_id, request.chunked, backend, request.language,
+                                     tenant=client_key(http_request), priority=priority,
+                                     account=tenant_of(http_request))
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except RateLimited as e:
+        raise too_many_requests(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.post("/transcribe")
-async def transcribe_audio_file(request: TranscribeRequest):
+@router.get("/usage")
+async def get_usage(request: Request):
+    """The calling tenant's audio minutes, jobs and requests this month against its quotas"""
+    tenant = tenant_of(request)
+    if tenant is None:
+        raise HTTPException(status_code=401, detail="Send an API key (X-API-Key) to see its tenant's usage")
+    try:
+        return await quotas.usage(tenant)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/queue")
+async def get_queue():
+    """Transcription queue: capacity, running and waiting jobs per priority class"""
+    return scheduler.snapshot()
+
+@router.post("/transcribe", dependencies=[Depends(rate_limit)])
+async def transcribe_audio_file(request: TranscribeRequest, http_request: Request):
     """Transcribe an audio file from URL"""
     try:
-        result = await transcribe_audio(request.audio_url)
+        backend = choose_backend(request.backend, language=request.language) if request.backend else None
+        priority = parse_priority(request.priority)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        # Tenant quotas first; then the caller is waiting on this request: queue briefly,
+        # then 429 with an estimated wait
+        with await quotas.admit(tenant_of(http_request), request.duration):
+            async with scheduler.slot(client_key(http_request), priority, request.duration,
+                                      timeout=ADMISSION_TIMEOUT) as ticket:
+                mode = chunk_mode(request.chunked)
+                if mode != "off" and not request.upstream_id:
+                    result = await transcribe_audio_chunked(request.audio_url, force=(mode == "on"),
+                                                            preprocessing=request.preprocessing,
+                                                            backend=backend, language=request.language,
+                                                            ticket=ticket)
+                else:
+                    result = await transcribe_audio(request.audio_url, upstream_id=request.upstream_id,
+                                                    preprocessing=request.preprocessing,
+                                                    backend=backend, language=request.language)
+        read_router.pin(client_key(http_request))
         return {
             "status": "success",
             "transcription": result["text"],
@@ -75,28 +220,32 @@ async def transcribe_audio_file(request: TranscribeRequest):
             "confidence": result.get("confidence", 0.0),
             "processing_time": result.get("processing_time", 0.0)
         }
+    except RateLimited as e:
+        raise too_many_requests(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/transcripts", response_model=List[TranscriptResponse])
 async def get_transcripts(
+    request: Request,
     page: int = Query(1, ge=1),
     limit: int = Query(10, ge=1, le=100),
     status: Optional[str] = Query(None),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
-    """Get all transcripts with pagination"""
+    """Get the caller's transcripts with pagination (without an API key, the anonymous ones)"""
     try:
         offset = (page - 1) * limit
         
-        query = db.query(Transcript)
+        query = db.query(Transcript).filter(owned_by(tenant_of(request)))
         if status:
             query = query.filter(Transcript.status == status)
         
-        transcripts = query.order_by(Transcript.created_at.desc())\
-                          .offset(offset)\
-                          .limit(limit)\
-                          .all()
+        with track_db("get_transcripts"):
+            transcripts = query.order_by(Transcript.created_at.desc())\
+                              .offset(offset)\
+                              .limit(limit)\
+                              .all()
         
         result = []
         for transcript in transcripts:
@@ -117,63 +266,153 @@ async def get_transcripts(
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/export", dependencies=[Depends(rate_limit)])
+async def export_transcripts(
+    request: Request,
+    format: str = Query("ndjson", description="ndjson or parquet"),
+    status: Optional[str] = Query(None, description="Comma-separated statuses"),
+    since: Optional[datetime] = Query(None, description="Created at or after (ISO 8601)"),
+    until: Optional[datetime] = Query(None, description="Created before (ISO 8601)"),
+):
+    """Stream every matching transcript of the caller's with its speakers, oldest first"""
+    if format not in export.FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of: {', '.join(export.FORMATS)}")
+    if format == "parquet" and not export.parquet_available():
+        raise HTTPException(status_code=501, detail="Parquet export needs pyarrow installed")
+    statuses = [s.strip() for s in status.split(",") if s.strip()] if status else None
+    encode = export.parquet_chunks if format == "parquet" else export.ndjson_chunks
+    owner = owned_by(tenant_of(request))
+    produce = lambda: encode(export.iter_batches(statuses, since, until, owner))  # noqa: E731
+    filename = f"transcripts-{datetime.utcnow():%Y%m%dT%H%M%SZ}.{format}"
+    return StreamingResponse(
+        export.stream_in_thread(produce),
+        media_type=export.MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+@router.post("/import", dependencies=[Depends(rate_limit)])
+async def import_transcripts(
+    request: Request,
+    on_conflict: str = Query("skip", description="skip or replace transcripts whose id already exists"),
+):
+    """Load an NDJSON export (optionally gzip-encoded) in batches; admin keys only"""
+    require_admin(request)
+    if on_conflict not in export.CONFLICT_MODES:
+        raise HTTPException(status_code=400, detail=f"on_conflict must be one of: {', '.join(export.CONFLICT_MODES)}")
+    encoding = (request.headers.get("content-encoding") or "identity").strip().lower()
+    if encoding not in export.BODY_ENCODINGS:
+        raise HTTPException(status_code=415, detail=f"Unsupported Content-Encoding: {encoding}")
+    try:
+        report = await export.import_ndjson(request.stream(), on_conflict, encoding)
+        read_router.pin(client_key(request))
+        for transcript_id in report.pop("replaced_ids"):
+            await invalidate_transcript(transcript_id)
+        return report
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @router.get("/transcripts/{transcript_id}")
-async def get_transcript(transcript_id: str, db: Session = Depends(get_db)):
-    """Get a specific transcript by ID"""
+async def get_transcript(
+    transcript_id: str,
+    request: Request,
+    start: Optional[float] = Query(None, ge=0, description="Window start (seconds)"),
+    end: Optional[float] = Query(None, ge=0, description="Window end (seconds)"),
+    speaker: Optional[str] = Query(None, description="Comma-separated speaker labels"),
+    fields: Optional[str] = Query(None, description="Comma-separated response fields"),
+    db: Session = Depends(get_read_db)
+):
+    """Get a specific transcript by ID, optionally only a time window / some speakers / some fields"""
     try:
-        transcript = db.query(Transcript).filter(Transcript.id == transcript_id).first()
+        transcript_id = transcript_uuid(transcript_id)
+        try:
+            wanted = parse_fields(fields)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if start is not None and end is not None and end <= start:
+            raise HTTPException(status_code=400, detail="end must be after start")
+        speakers = parse_speakers(speaker)
+        partial = wanted is not None or start is not None or end is not None or speakers is not None
+        
+        # Completed transcripts never change: serve the stored bytes without touching the DB.
+        # Entries are per owner, so only a caller that could read the row finds them
+        tenant = tenant_of(request)
+        variant = f"{owner_key(tenant)}|detail:" + view_key(wanted, start, end, speakers)
+        cached = await response_cache.get(transcript_id, variant)
+        if cached is not None:
+            return cached_json_response(cached, request.headers.get("if-none-match"))
+        
+        with track_db("get_transcript"):
+            query = db.query(Transcript)
+            if partial:
+                # Big JSON columns are read only if the response needs them
+                query = query.options(*(defer(getattr(Transcript, c)) for c in LARGE_COLUMNS))
+            transcript = query.filter(Transcript.id == transcript_id, owned_by(tenant)).first()
         
         if not transcript:
             raise HTTPException(status_code=404, detail="Transcript not found")
-        
-        # Get speaker data
-        speakers = db.query(Speaker).filter(Speaker.transcript_id == transcript_id).all()
-        
-        speaker_data = []
-        for speaker in speakers:
-            speaker_data.append({
-                "speaker_label": speaker.speaker_label,
-                "total_words": speaker.total_words,
-                "total_duration": speaker.total_duration,
-                "confidence_score": speaker.confidence_score
-            })
-        
-        return {
-            "id": str(transcript.id),
-            "audio_url": transcript.audio_url,
-            "transcript": transcript.transcript,
-            "diarized_transcript": transcript.diarized_transcript,
-            "utterances": transcript.utterances,
-            "speakers_count": transcript.speakers_count,
-            "speakers": speaker_data,
-            "confidence_score": transcript.confidence_score,
-            "processing_time": transcript.processing_time,
-            "audio_duration": transcript.audio_duration,
-            "language_detected": transcript.language_detected,
-            "status": transcript.status,
-            "created_at": transcript.created_at.isoformat() if transcript.created_at else None,
-            "completed_at": transcript.completed_at.isoformat() if transcript.completed_at else None
-        }
+        if needs_payload(wanted, start is not None or end is not None or speakers is not None):
+            await rehydrate(transcript)
+        
+        extra = {}
+        if wanted is None or "speakers" in wanted:
+            # Get speaker data
+            with track_db("get_transcript"):
+                speakers_rows = db.query(Speaker).filter(Speaker.transcript_id == transcript_id).all()
+            extra["speakers"] = [
+                {
+                    "speaker_label": s.speaker_label,
+                    "total_words": s.total_words,
+                    "total_duration": s.total_duration,
+                    "confidence_score": s.confidence_score
+                }
+                for s in speakers_rows
+            ]
+        
+        with track_db("get_transcript"):
+            payload = transcript_payload(transcript, wanted, start, end, speakers, extra)
+        # Large transcripts take a while to encode: do it off the event loop
+        size = len(payload.get("utterances") or [])
+        if transcript.status != "completed":
+            return RawJSONResponse(await run_cpu(encode_json, payload, task="json", size=size))
+        body, etag = await run_cpu(encode_response, payload, task="json", size=size)
+        cached = await response_cache.set(transcript_id, variant, body, etag)
+        return cached_json_response(cached, request.headers.get("if-none-match"))
         
     except HTTPException:
         raise
+    except CpuTaskTimeout as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.delete("/transcripts/{transcript_id}")
-async def delete_transcript(transcript_id: str, db: Session = Depends(get_db)):
-    """Delete a transcript and its associated data"""
+async def delete_transcript(transcript_id: str, request: Request, db: Session = Depends(get_db)):
+    """Delete one of the caller's transcripts and its associated data"""
     try:
-        # Delete speakers first (foreign key constraint)
-        db.query(Speaker).filter(Speaker.transcript_id == transcript_id).delete()
-        
-        # Delete transcript
-        transcript = db.query(Transcript).filter(Transcript.id == transcript_id).first()
-        if not transcript:
-            raise HTTPException(status_code=404, detail="Transcript not found")
-        
-        db.delete(transcript)
-        db.commit()
+        transcript_id = transcript_uuid(transcript_id)
+        with track_db("delete_transcript"):
+            # Another tenant's transcript is as good as missing
+            transcript = db.query(Transcript).filter(Transcript.id == transcript_id,
+                                                     owned_by(tenant_of(request))).first()
+            if not transcript:
+                raise HTTPException(status_code=404, detail="Transcript not found")
+            
+            # Delete speakers first (foreign key constraint)
+            db.query(Speaker).filter(Speaker.transcript_id == transcript.id).delete()
+            
+            archive_key = transcript.archive_key
+            audio_url = transcript.audio_url
+            delete_index(db, transcript.id)
+            db.delete(transcript)
+            db.flush()
+            # The audio object goes too, unless another transcript uses it
+            freed = unreferenced(db, [audio_url])
+            db.commit()
+        read_router.pin(client_key(request), transcript_key(transcript_id))
+        await invalidate_transcript(transcript_id)
+        await delete_archive(transcript_id, archive_key)
+        # Failures are counted in stt_storage_objects_deleted_total; the GC retries them
+        await remove_objects(freed, "transcript_deleted")
         
         return {"status": "success", "message": "Transcript deleted successfully"}
         
@@ -183,18 +422,76 @@ async def delete_transcript(transcript_id: str, db: Session = Depends(get_db)):
         db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/transcripts/bulk-delete", status_code=202)
+async def bulk_delete_transcripts(body: BulkDeleteRequest, request: Request):
+    """Delete the caller's transcripts by id and/or filter in a background job; poll /cleanup/jobs/{job_id}"""
+    try:
+        if body.ids is None and not body.status and body.since is None and body.until is None:
+            raise HTTPException(status_code=400, detail="Give ids, status, since or until")
+        if body.ids is not None and not body.ids:
+            raise HTTPException(status_code=400, detail="ids is empty")
+        try:
+            job = start_bulk_delete(body.ids, body.status, body.since, body.until,
+                                    owner=owned_by(tenant_of(request)), requested_by=client_key(request))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="ids must be transcript UUIDs")
+        return job.snapshot()
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/storage/gc", status_code=202)
+async def collect_storage_garbage(
+    request: Request,
+    dry_run: bool = Query(False, description="Report orphaned objects without deleting them"),
+):
+    """Delete audio objects no transcript references, in a background job; admin keys only"""
+    require_admin(request)
+    if not gc_supported():
+        raise HTTPException(status_code=501, detail="The storage backend can't list its objects")
+    return start_gc(dry_run=dry_run).snapshot()
+
+@router.get("/cleanup/jobs")
+async def get_cleanup_jobs(request: Request):
+    """Recent bulk delete and storage GC jobs, newest first (the caller's own unless an admin)"""
+    return {"jobs": list_jobs(None if is_admin(tenant_of(request)) else client_key(request))}
+
+@router.get("/cleanup/jobs/{job_id}")
+async def get_cleanup_job(job_id: str, request: Request):
+    """Progress of a bulk delete or storage GC job"""
+    job = get_job(job_id)
+    if job is None or not (is_admin(tenant_of(request)) or job.requested_by == client_key(request)):
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.snapshot()
+
 @router.get("/speakers/{transcript_id}")
-async def get_speakers(transcript_id: str, db: Session = Depends(get_db)):
+async def get_speakers(transcript_id: str, request: Request, db: Session = Depends(get_read_db)):
     """Get speaker statistics for a transcript"""
     try:
-        transcript = db.query(Transcript).filter(Transcript.id == transcript_id).first()
+        transcript_id = transcript_uuid(transcript_id)
+        tenant = tenant_of(request)
+        variant = f"{owner_key(tenant)}|speakers"
+        cached = await response_cache.get(transcript_id, variant)
+        if cached is not None:
+            return cached_json_response(cached, request.headers.get("if-none-match"))
+        
+        with track_db("get_speakers"):
+            transcript = db.query(Transcript).filter(Transcript.id == transcript_id, owned_by(tenant)).first()
         if not transcript:
             raise HTTPException(status_code=404, detail="Transcript not found")
         
-        speakers = db.query(Speaker).filter(Speaker.transcript_id == transcript_id).all()
+        with track_db("get_speakers"):
+            speakers = db.query(Speaker).filter(Speaker.transcript_id == transcript_id).all()
+        await rehydrate(transcript)
+        
+        analytics = await run_cpu(build_analytics, transcript.utterances or [], transcript.audio_duration or None,
+                                  task="analytics", size=len(transcript.utterances or []))
         
         speaker_stats = []
         for speaker in speakers:
+            dynamics = analytics["speakers"].get(speaker.speaker_label, {})
             speaker_stats.append({
                 "id": str(speaker.id),
                 "speaker_label": speaker.speaker_label,
@@ -202,39 +499,237 @@ async def get_speakers(transcript_id: str, db: Session = Depends(get_db)):
                 "total_duration": speaker.total_duration,
                 "confidence_score": speaker.confidence_score,
                 "speaking_percentage": (speaker.total_duration / transcript.audio_duration * 100) 
-                                     if transcript.audio_duration and transcript.audio_duration > 0 else 0
+                                     if transcript.audio_duration and transcript.audio_duration > 0 else 0,
+                "turns": dynamics.get("turns", 0),
+                "interruptions": dynamics.get("interruptions", 0),
+                "overlap_duration": dynamics.get("overlap_duration", 0.0),
+                "words_per_minute": dynamics.get("words_per_minute", 0.0)
             })
         
-        return {
+        result = {
             "transcript_id": transcript_id,
             "speakers": speaker_stats,
-            "total_speakers": len(speaker_stats)
+            "total_speakers": len(speaker_stats),
+            "turn_changes": analytics["turn_changes"],
+            "transitions": analytics["transitions"],
+            "overlap_duration": analytics.get("overlap_duration", 0.0),
+            "silence": analytics["silence"]
         }
+        if transcript.status != "completed":
+            return result
+        body, etag = encode_response(result)
+        cached = await response_cache.set(transcript_id, variant, body, etag)
+        return cached_json_response(cached, request.headers.get("if-none-match"))
+        
+    except HTTPException:
+        raise
+    except CpuTaskTimeout as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/transcripts/{transcript_id}/timeline")
+async def get_speaker_timeline(
+    transcript_id: str,
+    request: Request,
+    resolution: float = Query(1.0, gt=0, le=3600, description="Bin width in seconds"),
+    db: Session = Depends(get_read_db)
+):
+    """Run-length-encoded speaker segments (``[start, end, speaker]``, ``null`` = silence) and analytics"""
+    try:
+        transcript_id = transcript_uuid(transcript_id)
+        tenant = tenant_of(request)
+        key = (transcript_id, "timeline", owner_key(tenant), resolution)
+        cached = transcript_cache.get(key)
+        if cached is not None:
+            return cached
+        
+        with track_db("get_speaker_timeline"):
+            transcript = db.query(Transcript).filter(Transcript.id == transcript_id, owned_by(tenant)).first()
+        if not transcript:
+            raise HTTPException(status_code=404, detail="Transcript not found")
+        if transcript.status != "completed":
+            raise HTTPException(status_code=409, detail=f"Transcript is {transcript.status}")
+        if (transcript.audio_duration or 0) / resolution > TIMELINE_MAX_BINS:
+            raise HTTPException(status_code=400, detail=f"Resolution too fine: more than {TIMELINE_MAX_BINS} bins")
+        
+        await rehydrate(transcript)
+        utterances = transcript.utterances or []
+        timeline = await run_cpu(build_timeline, utterances, resolution, transcript.audio_duration or None,
+                                 task="timeline", size=len(utterances))
+        result = {"transcript_id": transcript_id, **timeline}
+        transcript_cache.set(key, result)
+        return result
+        
+    except HTTPException:
+        raise
+    except CpuTaskTimeout as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/transcripts/{transcript_id}/find")
+async def find_in_transcript(
+    transcript_id: str,
+    request: Request,
+    q: str = Query(..., min_length=1, description='A word, a phrase ("thank you") or a prefix ("refund*")'),
+    speaker: Optional[str] = Query(None, description="Comma-separated speaker labels"),
+    limit: int = Query(100, ge=1, le=1000),
+    db: Session = Depends(get_read_db)
+):
+    """Where a word or phrase is said (seconds), for click-to-seek"""
+    try:
+        with track_db("find_in_transcript"):
+            transcript = db.query(Transcript).options(*(defer(getattr(Transcript, c)) for c in LARGE_COLUMNS)) \
+                .filter(Transcript.id == transcript_id, owned_by(tenant_of(request))).first()
+        if not transcript:
+            raise HTTPException(status_code=404, detail="Transcript not found")
+        if transcript.status != "completed":
+            raise HTTPException(status_code=409, detail=f"Transcript is {transcript.status}")
+        
+        # Archived transcripts keep their stored index: only a build needs the payload back
+        index = await get_word_index(db, transcript, prepare=rehydrate)
+        hits = index.find(q, parse_speakers(speaker), limit)
+        return {"transcript_id": transcript_id, "query": q, "count": len(hits), "hits": hits}
+        
+    except HTTPException:
+        raise
+    except CpuTaskTimeout as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/keywords")
+async def find_keywords(
+    request: Request,
+    q: str = Query(..., min_length=1, description="Comma-separated words, phrases or prefixes (refund*)"),
+    match: str = Query("any", description="any or all of the keywords"),
+    status: Optional[str] = Query(None, description="Comma-separated statuses"),
+    since: Optional[datetime] = Query(None, description="Created at or after (ISO 8601)"),
+    until: Optional[datetime] = Query(None, description="Created before (ISO 8601)"),
+    limit: int = Query(50, ge=1, le=500),
+    db: Session = Depends(get_read_db)
+):
+    """The caller's transcripts mentioning the keywords, with hit counts and first occurrences"""
+    try:
+        if match not in MATCH_MODES:
+            raise HTTPException(status_code=400, detail=f"match must be one of: {', '.join(MATCH_MODES)}")
+        keywords = parse_keywords(q)
+        if not keywords:
+            raise HTTPException(status_code=400, detail="No keywords in q")
+        if len(keywords) > KEYWORD_MAX_TERMS:
+            raise HTTPException(status_code=400, detail=f"At most {KEYWORD_MAX_TERMS} keywords")
+        statuses = [s.strip() for s in status.split(",") if s.strip()] if status else None
+        with track_db("find_keywords"):
+            results = keyword_hits(db, keywords, match, statuses, since, until, limit,
+                                   owner=owned_by(tenant_of(request)))
+        return {"keywords": keywords, "match": match, "count": len(results), "transcripts": results}
         
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.post("/transcribe/")
-async def transcribe_legacy(audio_url: str):
+@router.get("/transcripts/{transcript_id}/peaks")
+async def get_waveform_peaks(
+    transcript_id: str,
+    request: Request,
+    resolution: Optional[float] = Query(None, gt=0, description="Peaks per second (default: overview)"),
+    start: Optional[float] = Query(None, ge=0, description="Window start in seconds"),
+    end: Optional[float] = Query(None, gt=0, description="Window end in seconds"),
+    db: Session = Depends(get_read_db)
+):
+    """Min/max waveform peaks of a transcript's audio, in the audiowaveform ``.dat`` binary format"""
+    try:
+        with track_db("get_waveform_peaks"):
+            row = db.query(Transcript.audio_url).filter(Transcript.id == transcript_id,
+                                                        owned_by(tenant_of(request))).first()
+        if not row:
+            raise HTTPException(status_code=404, detail="Transcript not found")
+        name = path_from_url(row.audio_url)
+        # Built from the stored audio on first use when this instance has no peaks file for it
+        path = await ensure_peaks(name, get_storage().get) if name else None
+        if path is None:
+            raise HTTPException(status_code=404, detail="Waveform peaks not available")
+        stat = os.stat(path)
+
+        # Peaks of a stored object never change, so the file identity plus the view is a stable ETag
+        etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}-{resolution}-{start}-{end}"'
+        headers = {"ETag": etag, "Cache-Control": "private, max-age=86400"}
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=headers)
+        body, level, first, count = await asyncio.to_thread(read_peaks, path, resolution, start, end)
+        headers["X-Peaks-Offset"] = str(first)
+        return Response(body, media_type="application/octet-stream", headers=headers)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.api_route("/audio/files/{name}", methods=["GET", "HEAD"])
+async def serve_audio_file(name: str, request: Request):
+    """A stored audio object (local storage backend), with Range support"""
+    try:
+        storage = get_storage()
+        if storage.name != "local" or not OBJECT_NAME.match(name):
+            raise HTTPException(status_code=404, detail="Not found")
+        return await storage.serve(name, request.headers.get("range"), head=request.method == "HEAD")
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.api_route("/audio/{transcript_id}", methods=["GET", "HEAD"])
+async def get_audio(transcript_id: str, request: Request, db: Session = Depends(get_read_db)):
+    """A transcript's audio with Range support, so the player can seek without downloading it all"""
+    try:
+        with track_db("get_audio"):
+            row = db.query(Transcript.audio_url).filter(Transcript.id == transcript_id,
+                                                        owned_by(tenant_of(request))).first()
+        if not row:
+            raise HTTPException(status_code=404, detail="Transcript not found")
+        
+        path = path_from_url(row.audio_url)
+        if path is not None:
+            response = await get_storage().serve(path, request.headers.get("range"), head=request.method == "HEAD")
+            if response.status_code != 404:
+                return response
+        # Stored somewhere else (another backend, or an external URL): let the client fetch it there
+        return RedirectResponse(row.audio_url, status_code=307)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/transcribe/", dependencies=[Depends(rate_limit)])
+async def transcribe_legacy(audio_url: str, request: Request):
     """Legacy endpoint for backward compatibility"""
-    result = await transcribe_audio(audio_url)
-    await notify_clients(result)
+    try:
+        with await quotas.admit(tenant_of(request)):
+            async with scheduler.slot(client_key(request), timeout=ADMISSION_TIMEOUT):
+                result = await transcribe_audio(audio_url)
+        read_router.pin(client_key(request))
+    except RateLimited as e:
+        raise too_many_requests(e)
+    await notify_clients(result, tenant_of(request))
     return result
 
 @router.get("/transcripts/{transcript_id}/srt")
 async def get_srt_subtitle(
     transcript_id: str, 
+    request: Request,
     chars_per_caption: int = Query(80, ge=20, le=200),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """Get SRT subtitle for a transcript"""
     try:
-        transcript = db.query(Transcript).filter(Transcript.id == transcript_id).first()
+        with track_db("get_srt_subtitle"):
+            transcript = db.query(Transcript).filter(Transcript.id == transcript_id,
+                                                     owned_by(tenant_of(request))).first()
         
         if not transcript:
             raise HTTPException(status_code=404, detail="Transcript not found")
+        await rehydrate(transcript)
         
         # Prepare transcript data for subtitle generation
         transcript_data = {
@@ -243,7 +738,9 @@ async def get_srt_subtitle(
             "diarized_transcript": transcript.diarized_transcript or {}
         }
         
-        srt_content = generate_srt_from_transcript(transcript_data, chars_per_caption)
+        with timer(SUBTITLE_RENDER_SECONDS, format="srt"):
+            srt_content = await run_cpu(generate_srt_from_transcript, transcript_data, chars_per_caption,
+                                        task="subtitles", size=len(transcript_data["utterances"]))
         
         return Response(
             content=srt_content, 
@@ -253,21 +750,27 @@ async def get_srt_subtitle(
         
     except HTTPException:
         raise
+    except CpuTaskTimeout as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/transcripts/{transcript_id}/vtt")
 async def get_vtt_subtitle(
     transcript_id: str, 
+    request: Request,
     chars_per_caption: int = Query(80, ge=20, le=200),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """Get VTT subtitle for a transcript"""
     try:
-        transcript = db.query(Transcript).filter(Transcript.id == transcript_id).first()
+        with track_db("get_vtt_subtitle"):
+            transcript = db.query(Transcript).filter(Transcript.id == transcript_id,
+                                                     owned_by(tenant_of(request))).first()
         
         if not transcript:
             raise HTTPException(status_code=404, detail="Transcript not found")
+        await rehydrate(transcript)
         
         # Prepare transcript data for subtitle generation
         transcript_data = {
@@ -276,7 +779,9 @@ async def get_vtt_subtitle(
             "diarized_transcript": transcript.diarized_transcript or {}
         }
         
-        vtt_content = generate_vtt_from_transcript(transcript_data, chars_per_caption)
+        with timer(SUBTITLE_RENDER_SECONDS, format="vtt"):
+            vtt_content = await run_cpu(generate_vtt_from_transcript, transcript_data, chars_per_caption,
+                                        task="subtitles", size=len(transcript_data["utterances"]))
         
         return Response(
             content=vtt_content, 
@@ -286,5 +791,7 @@ async def get_vtt_subtitle(
         
     except HTTPException:
         raise
+    except CpuTaskTimeout as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
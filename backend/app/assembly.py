@@ -1,56 +1,115 @@
 import httpx
 import asyncio
+import os
 import time
+import uuid
+from urllib.parse import urlparse
 from datetime import datetime
 from typing import Dict, List, Optional
 from .database import SessionLocal
+from .replicas import read_router, transcript_key
 from .models import Transcript, Speaker
-from .config import ASSEMBLY_API_KEY
+from .config import (
+    CHUNK_CONCURRENCY,
+    CHUNK_MIN_DURATION,
+    CHUNK_OVERLAP,
+    CHUNK_SECONDS,
+    CHUNKED_MODE,
+    TRANSCRIPTION_BACKEND,
+)
+from .metrics import (
+    ASSEMBLY_COMPLETE_SECONDS,
+    ASSEMBLY_JOBS,
+    ASSEMBLY_POLLS,
+    ASSEMBLY_QUEUE_SECONDS,
+    ASSEMBLY_SUBMIT_SECONDS,
+    observe,
+    timer,
+)
+from .tracing import record_stage, span, stage_timings
+from .resilience import UpstreamError, raise_for_status
+from .backends import TranscriptionBackend, choose_backend, get_backend
+from .audio import AudioDecodeError, decode_audio, encode_wav
+from .chunking import chunk_utterances, plan_chunks, transcribe_in_chunks
+from .scheduler import Ticket, scheduler
+from .storage import get_storage, path_from_url, upload_audio_file
+from .cpu_tasks import speaker_statistics
+from .delivery import stream_for
+from .word_index import index_transcript
+from .search import store_index
+from .tenants import current_lease
+from .workers import run_cpu
 import logging
 
 logger = logging.getLogger(__name__)
 
-headers = {"authorization": ASSEMBLY_API_KEY}
+class PollingInterrupted(UpstreamError):
+    """Polling gave up, but the upstream job may still be running and can be resumed"""
 
-async def transcribe_audio_realtime(audio_url: str, websocket=None) -> Dict:
+    def __init__(self, transcript_id: str, cause: Exception):
+        super().__init__(
+            f"Lost contact with the transcription backend while polling {transcript_id} ({cause}); "
+            f"resume with upstream_id={transcript_id}",
+            status_code=getattr(cause, "status_code", None),
+        )
+        self.transcript_id = transcript_id
+
+async def transcribe_audio_realtime(audio_url: str, websocket=None, upstream_id: Optional[str] = None,
+                                    preprocessing: Optional[Dict] = None,
+                                    backend: Optional[TranscriptionBackend] = None,
+                                    language: Optional[str] = None, record_id: Optional[str] = None) -> Dict:
     """
     Enhanced transcription with speaker diarization and real-time updates
     
     Args:
         audio_url: URL of the audio file to transcribe
         websocket: WebSocket connection for real-time updates (optional)
+        upstream_id: Existing backend job id to resume polling instead of resubmitting
+        preprocessing: Report from preprocessing.maybe_preprocess, stored with the transcript
+        backend: Backend to run the job on; chosen by backends.choose_backend when omitted
+        language: Language code hint; auto-detected when omitted
+        record_id: Existing "processing" Transcript row to complete instead of inserting a new one
     """
     start_time = time.time()
     
-    async with httpx.AsyncClient() as client:
+    with span("assembly.transcribe", audio_url=audio_url):
+        return await _transcribe(audio_url, websocket, start_time, upstream_id, preprocessing, backend, language,
+                                 record_id)
+
+async def _transcribe(audio_url: str, websocket, start_time: float, upstream_id: Optional[str] = None,
+                      preprocessing: Optional[Dict] = None, backend: Optional[TranscriptionBackend] = None,
+                      language: Optional[str] = None, record_id: Optional[str] = None) -> Dict:
+    if backend is None:
+        # A resumed job lives on the default backend; new jobs go through the routing rules
+        backend = get_backend(TRANSCRIPTION_BACKEND) if upstream_id else choose_backend(language=language)
+    result = await run_transcription_job(backend, audio_url, websocket, upstream_id, {"language": language})
+    return await finalize_transcription(audio_url, result, websocket, start_time, preprocessing, record_id)
+
+async def run_transcription_job(backend: TranscriptionBackend, audio_url: str, websocket=None,
+                                upstream_id: Optional[str] = None, options: Optional[Dict] = None) -> Dict:
+    """Submit (or resume) one job on ``backend`` and follow it to completion; returns the raw result"""
+    with backend.track():
+        return await _run_job(backend, audio_url, websocket, upstream_id, options)
+
+async def _run_job(backend: TranscriptionBackend, audio_url: str, websocket, upstream_id: Optional[str],
+                   options: Optional[Dict]) -> Dict:
+    if upstream_id:
+        transcript_id = upstream_id
+        if websocket:
+            await websocket.send_json({
+                "status": "submitted",
+                "message": f"Resuming transcription (ID: {transcript_id}). Processing..."
+            })
+    else:
         # Notify start
         if websocket:
             await websocket.send_json({
                 "status": "starting",
                 "message": "Submitting transcription request..."
             })
-
-        # Submit transcription request with basic, well-documented parameters
-        payload = {
-            "audio_url": audio_url,
-            "speaker_labels": True,  # Enable speaker diarization
-            "language_detection": True, # Auto-detect language
-            "punctuate": True,
-            "format_text": True
-        }
-        
-        logger.info(f"AssemblyAI payload: {payload}")
         
-        res = await client.post(
-            "https://api.assemblyai.com/v2/transcript",
-            headers=headers,
-            json=payload
-        )
-        
-        if res.status_code != 200:
-            raise Exception(f"Failed to submit transcription: {res.text}")
-            
-        transcript_id = res.json()["id"]
+        with span("assembly.submit", stage="submit", backend=backend.name), timer(ASSEMBLY_SUBMIT_SECONDS):
+            transcript_id = await backend.submit(audio_url, options)
         
         if websocket:
             await websocket.send_json({
@@ -58,118 +117,109 @@ async def transcribe_audio_realtime(audio_url: str, websocket=None) -> Dict:
                 "message": f"Transcription submitted (ID: {transcript_id}). Processing..."
             })
 
-        # Enhanced polling with progress updates
-        status = "queued"
-        last_update = time.time()
+    submitted_ns = time.time_ns()
+    processing_ns = submitted_ns
+
+    # Follow the job with periodic progress updates
+    status = "queued"
+    result: Dict = {}
+    last_update = time.time()
+    polls = 0
+    queue_recorded = False
+    
+    updates = backend.stream(transcript_id)
+    while status not in ["completed", "error"]:
+        try:
+            result = await updates.__anext__()
+        except StopAsyncIteration:
+            break
+        except Exception as e:
+            # The job keeps running upstream; surface the id so it can be resumed
+            raise PollingInterrupted(transcript_id, e) from e
+        polls += 1
+        status = result["status"]
         
-        while status not in ["completed", "error"]:
-            await asyncio.sleep(3)  # Check every 3 seconds
-            
-            r = await client.get(
-                f"https://api.assemblyai.com/v2/transcript/{transcript_id}", 
-                headers=headers
-            )
-            
-            if r.status_code != 200:
-                raise Exception(f"Failed to get transcript status: {r.text}")
-            
-            result = r.json()
-            status = result["status"]
-            
-            # Send periodic updates
-            current_time = time.time()
-            if websocket and (current_time - last_update) > 10:  # Update every 10 seconds
-                await websocket.send_json({
-                    "status": "processing",
-                    "message": f"Still processing... Status: {status}"
-                })
-                last_update = current_time
-
-        if status == "error":
-            error_msg = result.get("error", "Unknown error occurred")
-            raise Exception(f"Transcription failed: {error_msg}")
-
-        # Calculate processing time
-        processing_time = time.time() - start_time
-        
-        # Parse results
-        transcript_text = result.get("text", "")
-        utterances = result.get("utterances", [])
-        confidence = result.get("confidence", 0.0)
-        audio_duration = result.get("audio_duration", 0.0) / 1000.0  # Convert ms to seconds
-        language_code = result.get("language_code", "en")
-        
-        logger.info(f"Received {len(utterances)} utterances from AssemblyAI")
-        logger.info(f"Audio duration: {audio_duration} seconds")
-        
-        # Enhance speaker diarization data
-        enhanced_utterances = []
-        speaker_stats = {}
-        
-        for utterance in utterances:
-            speaker_label = utterance.get("speaker", "Unknown")
-            words = utterance.get("words", [])
-            text = utterance.get("text", "")
-            start_time_ms = utterance.get("start", 0)
-            end_time_ms = utterance.get("end", 0)
-            confidence_score = utterance.get("confidence", 0.0)
-            
-            # Calculate duration
-            duration = (end_time_ms - start_time_ms) / 1000.0
-            
-            # Track speaker statistics
-            if speaker_label not in speaker_stats:
-                speaker_stats[speaker_label] = {
-                    "total_words": 0,
-                    "total_duration": 0.0,
-                    "utterances": 0,
-                    "confidence_scores": []
-                }
-            
-            speaker_stats[speaker_label]["total_words"] += len(words)
-            speaker_stats[speaker_label]["total_duration"] += duration
-            speaker_stats[speaker_label]["utterances"] += 1
-            speaker_stats[speaker_label]["confidence_scores"].append(confidence_score)
-            
-            enhanced_utterances.append({
-                "speaker": speaker_label,
-                "text": text,
-                "start": start_time_ms / 1000.0,  # Convert to seconds
-                "end": end_time_ms / 1000.0,
-                "duration": duration,
-                "confidence": confidence_score,
-                "words": words
-            })
+        if not queue_recorded and status != "queued":
+            processing_ns = time.time_ns()
+            observe(ASSEMBLY_QUEUE_SECONDS, (processing_ns - submitted_ns) / 1e9)
+            record_stage("assembly.queue", "queue", submitted_ns, processing_ns, transcript_id=transcript_id)
+            queue_recorded = True
         
-        # Create structured diarization data
-        speakers_summary = []
-        for speaker, stats in speaker_stats.items():
-            avg_confidence = sum(stats["confidence_scores"]) / len(stats["confidence_scores"]) if stats["confidence_scores"] else 0.0
-            speakers_summary.append({
-                "speaker": speaker,
-                "total_words": stats["total_words"],
-                "total_duration": stats["total_duration"],
-                "utterances_count": stats["utterances"],
-                "avg_confidence": avg_confidence,
-                "speaking_percentage": (stats["total_duration"] / audio_duration * 100) if audio_duration > 0 else 0
+        # Send periodic updates
+        current_time = time.time()
+        if websocket and (current_time - last_update) > 10:  # Update every 10 seconds
+            await websocket.send_json({
+                "status": "processing",
+                "message": f"Still processing... Status: {status}"
             })
-        
-        logger.info(f"Speaker diarization results:")
-        logger.info(f"- Total speakers detected: {len(speaker_stats)}")
+            last_update = current_time
+
+    completed_ns = time.time_ns()
+    observe(ASSEMBLY_COMPLETE_SECONDS, (completed_ns - submitted_ns) / 1e9)
+    record_stage("assembly.processing", "processing", processing_ns, completed_ns,
+                 polls=polls, status=status, backend=backend.name)
+    observe(ASSEMBLY_POLLS, polls)
+    ASSEMBLY_JOBS.labels(status=status).inc()
+
+    if status != "completed":
+        error_msg = result.get("error", "Unknown error occurred")
+        raise Exception(f"Transcription failed: {error_msg}")
+
+    result.setdefault("id", transcript_id)
+    return result
+
+async def finalize_transcription(audio_url: str, result: Dict, websocket=None, start_time: Optional[float] = None,
+                                 preprocessing: Optional[Dict] = None, record_id: Optional[str] = None) -> Dict:
+    """Compute speaker statistics for a completed result and persist it (into ``record_id``'s row if given)"""
+    # Calculate processing time
+    processing_time = time.time() - start_time if start_time else 0.0
+    
+    # Parse results
+    transcript_text = result.get("text", "")
+    utterances = result.get("utterances", [])
+    confidence = result.get("confidence", 0.0)
+    audio_duration = result.get("audio_duration", 0.0) / 1000.0  # Convert ms to seconds
+    language_code = result.get("language_code", "en")
+    
+    # Speaker statistics are CPU-bound on long transcripts: keep them off the event loop
+    computed = await run_cpu(speaker_statistics, utterances, audio_duration,
+                             task="speaker_stats", size=len(utterances))
+    enhanced_utterances = computed["enhanced_utterances"]
+    speaker_stats = computed["speaker_stats"]
+    speakers_summary = computed["speakers_summary"]
+    word_index, word_terms = await run_cpu(index_transcript, utterances, task="word_index", size=len(utterances))
+    
+    logger.info(
+        "Transcription %s completed",
+        result.get("id"),
+        extra={
+            "utterances": len(utterances),
+            "speakers": len(speaker_stats),
+            "audio_duration": audio_duration,
+            "processing_time": processing_time,
+        },
+    )
+    if logger.isEnabledFor(logging.DEBUG):
         for speaker, stats in speaker_stats.items():
-            logger.info(f"- {speaker}: {stats['utterances']} utterances, {stats['total_duration']:.1f}s speaking time")
-        
-        diarized_transcript = {
-            "speakers_summary": speakers_summary,
-            "speakers_count": len(speaker_stats),
-            "enhanced_utterances": enhanced_utterances
-        }
+            logger.debug("%s: %d utterances, %.1fs speaking time", speaker, stats["utterances"], stats["total_duration"])
+    
+    diarized_transcript = {
+        "speakers_summary": speakers_summary,
+        "speakers_count": len(speaker_stats),
+        "enhanced_utterances": enhanced_utterances
+    }
 
-        # Save to database
-        db = SessionLocal()
-        try:
-            # Create transcript record
-            db_transcript = Transcript(
+    # Save to database: the completed row, its speakers and word index in one
+    # transaction, so no reader sees a completed transcript without them
+    db = SessionLocal()
+    try:
+        with span("db.persist", stage="persist"):
+            # Complete the queued row, or create the transcript record
+            db_transcript = db.get(Transcript, uuid.UUID(str(record_id))) if record_id else None
+            if db_transcript is None:
+                db_transcript = Transcript(id=uuid.UUID(str(record_id))) if record_id else Transcript()
+                db.add(db_transcript)
+            fields = dict(
                 audio_url=audio_url,
                 transcript=transcript_text,
                 diarized_transcript=diarized_transcript,
@@ -178,58 +228,166 @@ async def transcribe_audio_realtime(audio_url: str, websocket=None) -> Dict:
                 confidence_score=confidence,
                 processing_time=processing_time,
                 audio_duration=audio_duration,
+                preprocessing=preprocessing or None,
                 language_detected=language_code,
                 status="completed",
                 completed_at=datetime.utcnow()
             )
-            db.add(db_transcript)
-            db.commit()
-            db.refresh(db_transcript)
-            
-            # Save speaker data
-            for speaker, stats in speaker_stats.items():
-                avg_confidence = sum(stats["confidence_scores"]) / len(stats["confidence_scores"]) if stats["confidence_scores"] else 0.0
-                db_speaker = Speaker(
-                    transcript_id=db_transcript.id,
-                    speaker_label=speaker,
-                    total_words=stats["total_words"],
-                    total_duration=stats["total_duration"],
-                    confidence_score=avg_confidence
-                )
-                db.add(db_speaker)
-            
-            db.commit()
-            
-            # Prepare final result
-            final_result = {
-                "id": str(db_transcript.id),
-                "text": transcript_text,
-                "utterances": enhanced_utterances,
-                "diarized_transcript": diarized_transcript,
-                "speakers_summary": speakers_summary,
-                "confidence": confidence,
-                "processing_time": processing_time,
-                "audio_duration": audio_duration,
-                "language_detected": language_code,
-                "created_at": db_transcript.created_at.isoformat()
-            }
-            
-            if websocket:
-                await websocket.send_json({
-                    "status": "completed",
-                    "message": "Transcription completed successfully!",
-                    "data": final_result
-                })
-            
-            return final_result
-            
-        except Exception as e:
-            db.rollback()
-            raise e
+            lease = current_lease()
+            if lease is not None:
+                fields["tenant_id"] = uuid.UUID(lease.tenant_id)
+            for name, value in fields.items():
+                setattr(db_transcript, name, value)
+            db.flush()
+        
+        # Stage timings ride along in the same commit, so recording them costs no extra round trip
+        timings = stage_timings()
+        db_transcript.stage_timings = timings
+        
+        # Save speaker data
+        for speaker, stats in speaker_stats.items():
+            db_speaker = Speaker(
+                transcript_id=db_transcript.id,
+                speaker_label=speaker,
+                total_words=stats["total_words"],
+                total_duration=stats["total_duration"],
+                confidence_score=stats["avg_confidence"]
+            )
+            db.add(db_speaker)
+        
+        # Word index for click-to-seek and keyword search, replacing any earlier one
+        store_index(db, db_transcript.id, word_index, word_terms)
+        
+        db.commit()
+        # Readers of this transcript go to the primary until replicas have it
+        read_router.pin(transcript_key(db_transcript.id))
+        if lease is not None:
+            lease.bill(audio_duration)
+        
+        # Prepare final result
+        final_result = {
+            "id": str(db_transcript.id),
+            "text": transcript_text,
+            "utterances": enhanced_utterances,
+            "diarized_transcript": diarized_transcript,
+            "speakers_summary": speakers_summary,
+            "confidence": confidence,
+            "processing_time": processing_time,
+            "stage_timings": timings,
+            "audio_duration": audio_duration,
+            "preprocessing": preprocessing or None,
+            "language_detected": language_code,
+            "created_at": db_transcript.created_at.isoformat()
+        }
+        
+        if websocket:
+            # Summary first, then the utterances in sequenced pages
+            await stream_for(websocket).completed(final_result)
+        
+        return final_result
+        
+    except Exception as e:
+        db.rollback()
+        raise e
+    finally:
+        db.close()
+
+def chunk_mode(requested: Optional[bool] = None) -> str:
+    """Resolve a per-request ``chunked`` flag against CHUNKED_MODE: off, auto or on"""
+    if requested is None:
+        return CHUNKED_MODE if CHUNKED_MODE in ("auto", "on") else "off"
+    return "on" if requested else "off"
+
+async def download_audio(audio_url: str) -> bytes:
+    """Fetch audio bytes so they can be decoded locally"""
+    async with httpx.AsyncClient(timeout=60.0, follow_redirects=True) as client:
+        response = await client.get(audio_url)
+        raise_for_status(response, "Failed to download audio", ok=(200,))
+        return response.content
+
+async def transcribe_audio_chunked(audio_url: str, websocket=None, audio_data: Optional[bytes] = None,
+                                   file_extension: Optional[str] = None, force: bool = False,
+                                   preprocessing: Optional[Dict] = None,
+                                   backend: Optional[TranscriptionBackend] = None,
+                                   language: Optional[str] = None, record_id: Optional[str] = None,
+                                   ticket: Optional[Ticket] = None) -> Dict:
+    """
+    Transcribe a long recording as parallel, overlapping chunks split on silence
+    
+    Produces the same result shape as transcribe_audio_realtime. Falls back to a
+    single job when the audio is shorter than CHUNK_MIN_DURATION (unless forced)
+    or can't be decoded locally. ``ticket`` is the scheduler slot the caller
+    holds: one chunk at a time runs under it, and each further parallel chunk
+    takes a slot of its own for the same tenant and priority.
+    """
+    start_time = time.time()
+    backend = backend or choose_backend(size=len(audio_data) if audio_data else None, language=language)
+    # One stream for the whole job, so partial and final messages share a sequence
+    websocket = stream_for(websocket)
+    
+    with span("assembly.transcribe_chunked", audio_url=audio_url):
+        try:
+            if audio_data is None:
+                audio_data = await download_audio(audio_url)
+            extension = file_extension or os.path.splitext(urlparse(audio_url).path)[1] or ".wav"
+            samples, sample_rate = await asyncio.to_thread(decode_audio, audio_data, extension)
+        except (AudioDecodeError, UpstreamError, httpx.HTTPError) as e:
+            logger.warning("Chunked mode unavailable for %s, using a single job: %s", audio_url, e)
+            return await _transcribe(audio_url, websocket, start_time, preprocessing=preprocessing,
+                                     backend=backend, language=language, record_id=record_id)
+        
+        duration = len(samples) / sample_rate
+        chunks = plan_chunks(samples, sample_rate, CHUNK_SECONDS, CHUNK_OVERLAP)
+        if len(chunks) == 1 or (not force and duration < CHUNK_MIN_DURATION):
+            return await _transcribe(audio_url, websocket, start_time, preprocessing=preprocessing,
+                                     backend=backend, language=language, record_id=record_id)
+        
+        if websocket:
+            await websocket.send_json({
+                "status": "submitted",
+                "message": f"Transcribing {duration / 60:.0f} minutes of audio as {len(chunks)} parallel chunks..."
+            })
+        
+        async def on_progress(done: int, total: int):
+            await websocket.send_json({
+                "status": "processing",
+                "message": f"Transcribed chunk {done}/{total}",
+                "progress": {"completed": done, "total": total}
+            })
+        
+        async def on_chunk(chunk, chunk_result):
+            await websocket.partial(chunk.index, len(chunks), chunk_utterances(chunk, chunk_result))
+        
+        chunk_objects = []
+        
+        async def transcribe_chunk(chunk, chunk_samples):
+            chunk_url = await upload_audio_file(encode_wav(chunk_samples, sample_rate), ".wav", peaks=False)
+            chunk_objects.append(path_from_url(chunk_url))
+            return await run_transcription_job(backend, chunk_url, options={"language": language})
+        
+        extra_slot = (lambda: scheduler.slot(ticket.tenant, ticket.priority, CHUNK_SECONDS)) if ticket else None
+        try:
+            result = await transcribe_in_chunks(
+                samples, sample_rate, chunks, transcribe_chunk, CHUNK_CONCURRENCY,
+                on_progress if websocket else None, on_chunk if websocket else None, extra_slot
+            )
         finally:
-            db.close()
+            # The chunk objects were only there for the upstream jobs to fetch; storage GC gets any left over
+            try:
+                failed = await get_storage().delete_many([name for name in chunk_objects if name])
+            except Exception as e:
+                failed = chunk_objects
+                logger.warning("Deleting chunk objects of %s failed: %s", audio_url, e)
+            if failed:
+                logger.warning("%d chunk object(s) of %s were not deleted", len(failed), audio_url)
+    
+        return await finalize_transcription(audio_url, result, websocket, start_time, preprocessing, record_id)
 
 # Legacy function for backward compatibility
-async def transcribe_audio(audio_url: str) -> Dict:
+async def transcribe_audio(audio_url: str, upstream_id: Optional[str] = None,
+                           preprocessing: Optional[Dict] = None,
+                           backend: Optional[TranscriptionBackend] = None,
+                           language: Optional[str] = None, record_id: Optional[str] = None) -> Dict:
     """Backward compatible function"""
-    return await transcribe_audio_realtime(audio_url)
+    return await transcribe_audio_realtime(audio_url, upstream_id=upstream_id, preprocessing=preprocessing,
+                                           backend=backend, language=language, record_id=record_id)
@@ -0,0 +1,97 @@
+"""
+Audio decoding/encoding helpers built on NumPy
+
+WAV (16-bit PCM) is decoded with the standard library; every other format
+goes through an ``ffmpeg`` binary when one is on the PATH.
+"""
+import io
+import shutil
+import subprocess
+import wave
+from typing import Optional, Tuple
+
+import numpy as np
+
+
+class AudioDecodeError(Exception):
+    """Raised when audio can't be decoded into PCM samples"""
+
+
+def _decode_wav(audio_data: bytes) -> Tuple[np.ndarray, int]:
+    with wave.open(io.BytesIO(audio_data), "rb") as wav:
+        if wav.getsampwidth() != 2:
+            raise AudioDecodeError(f"Unsupported WAV sample width: {wav.getsampwidth() * 8} bits")
+        channels = wav.getnchannels()
+        sample_rate = wav.getframerate()
+        samples = np.frombuffer(wav.readframes(wav.getnframes()), dtype="<i2")
+    if channels > 1:
+        # Downmix: average channels in int32 to avoid overflow
+        samples = samples[: len(samples) - len(samples) % channels].reshape(-1, channels)
+        samples = samples.astype(np.int32).mean(axis=1).astype(np.int16)
+    return samples, sample_rate
+
+
+def _decode_ffmpeg(audio_data: bytes, sample_rate: int) -> Tuple[np.ndarray, int]:
+    ffmpeg = shutil.which("ffmpeg")
+    if not ffmpeg:
+        raise AudioDecodeError("ffmpeg is required to decode this format")
+    proc = subprocess.run(
+        [ffmpeg, "-nostdin", "-loglevel", "error", "-i", "pipe:0",
+         "-f", "s16le", "-ac", "1", "-ar", str(sample_rate), "pipe:1"],
+        input=audio_data,
+        capture_output=True,
+    )
+    if proc.returncode != 0:
+        raise AudioDecodeError(proc.stderr.decode(errors="replace").strip() or "ffmpeg failed")
+    return np.frombuffer(proc.stdout, dtype="<i2"), sample_rate
+
+
+def decode_audio(audio_data: bytes, file_extension: str = ".wav", sample_rate: int = 16000) -> Tuple[np.ndarray, int]:
+    """
+    Decode audio bytes into mono int16 samples.
+
+    WAV keeps its native sample rate; other formats are resampled to
+    ``sample_rate`` by ffmpeg. Returns ``(samples, sample_rate)``.
+    """
+    if file_extension.lower() == ".wav":
+        try:
+            return _decode_wav(audio_data)
+        except (wave.Error, EOFError, AudioDecodeError):
+            pass  # e.g. float or 24-bit WAV: let ffmpeg handle it
+    return _decode_ffmpeg(audio_data, sample_rate)
+
+
+def encode_wav(samples: np.ndarray, sample_rate: int) -> bytes:
+    """Encode mono int16 samples as a WAV file"""
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(np.ascontiguousarray(samples, dtype="<i2").tobytes())
+    return buffer.getvalue()
+
+
+def frame_rms(samples: np.ndarray, frame_length: int) -> np.ndarray:
+    """RMS energy of consecutive non-overlapping frames (trailing partial frame dropped)"""
+    n_frames = len(samples) // frame_length
+    if n_frames == 0:
+        return np.zeros(0, dtype=np.float32)
+    frames = samples[: n_frames * frame_length].reshape(n_frames, frame_length).astype(np.float32)
+    return np.sqrt(np.mean(frames * frames, axis=1))
+
+
+# Typical bytes per second of compressed formats, for rough duration hints
+BYTES_PER_SECOND = {".mp3": 16000, ".m4a": 16000, ".aac": 16000, ".ogg": 12000, ".webm": 12000, ".flac": 90000}
+
+
+def estimate_duration(size: int, file_extension: str, head: bytes = b"") -> Optional[float]:
+    """
+    Rough duration in seconds from the file size, without decoding: exact
+    for canonical WAV headers, a typical-bitrate guess for other formats
+    """
+    if head[:4] == b"RIFF" and head[8:12] == b"WAVE" and head[12:16] == b"fmt ":
+        byte_rate = int.from_bytes(head[28:32], "little")
+        return max(0, size - 44) / byte_rate if byte_rate else None
+    rate = BYTES_PER_SECOND.get(file_extension.lower())
+    return size / rate if rate else None
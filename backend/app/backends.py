@@ -0,0 +1,385 @@
+"""
+Transcription backends behind one interface, and the rules that pick one
+
+Every backend speaks the AssemblyAI result schema (``status``, ``text``,
+``utterances`` with ms times and ``words``), so the rest of the pipeline
+doesn't care which engine produced a transcript.
+"""
+import asyncio
+import hashlib
+import logging
+import random
+import time
+import uuid
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from typing import AsyncIterator, Dict, Optional
+
+import httpx
+
+from . import local_engine
+from .config import (
+    ASSEMBLY_API_BASE,
+    ASSEMBLY_API_KEY,
+    BACKEND_OVERFLOW_JOBS,
+    CLIENT_BACKENDS,
+    LOCAL_COMPUTE_TYPE,
+    LOCAL_LANGUAGES,
+    LOCAL_MAX_BYTES,
+    LOCAL_MODEL,
+    LOCAL_WORKERS,
+    MOCK_QUEUE_SECONDS,
+    MOCK_REALTIME_FACTOR,
+    POLL_HEDGE_DELAY,
+    TRANSCRIPTION_BACKEND,
+)
+from .metrics import BACKEND_IN_FLIGHT, BACKEND_ROUTED
+from .resilience import CircuitBreaker, RetryPolicy, hedged, raise_for_status, with_retries
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = ("completed", "error")
+
+
+class TranscriptionBackend:
+    """
+    Interface every engine implements.
+
+    ``submit`` starts a job and returns its id; ``status`` returns the job's
+    current state, which is the full result once ``status == "completed"``;
+    ``stream`` yields status updates until the job finishes.
+    """
+
+    name = "base"
+    poll_interval = 3.0
+    active = 0  # jobs currently running on this backend
+
+    def available(self) -> bool:
+        return True
+
+    @contextmanager
+    def track(self):
+        """Count a job as in flight for load-based routing"""
+        self.active += 1
+        BACKEND_IN_FLIGHT.labels(backend=self.name).inc()
+        try:
+            yield
+        finally:
+            self.active -= 1
+            BACKEND_IN_FLIGHT.labels(backend=self.name).dec()
+
+    async def submit(self, audio_url: str, options: Optional[Dict] = None) -> str:
+        raise NotImplementedError
+
+    async def status(self, job_id: str) -> Dict:
+        raise NotImplementedError
+
+    async def result(self, job_id: str) -> Dict:
+        status = await self.status(job_id)
+        if status["status"] != "completed":
+            raise ValueError(f"Job {job_id} is {status['status']}, not completed")
+        return status
+
+    async def stream(self, job_id: str) -> AsyncIterator[Dict]:
+        """Poll ``status`` every ``poll_interval`` seconds until the job finishes"""
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            status = await self.status(job_id)
+            yield status
+            if status["status"] in TERMINAL_STATUSES:
+                return
+
+    async def aclose(self):
+        pass
+
+
+# AssemblyAI
+
+headers = {"authorization": ASSEMBLY_API_KEY}
+
+# Opens after repeated submit failures so callers fail fast during an outage
+assembly_breaker = CircuitBreaker("assemblyai")
+
+# Polls ride out longer outages: losing a long job costs far more than waiting
+POLL_POLICY = RetryPolicy(max_attempts=10, base_delay=1.0)
+
+
+async def submit_transcript(client: httpx.AsyncClient, payload: Dict) -> str:
+    """Submit a job and return its AssemblyAI transcript id"""
+    async def call():
+        res = await client.post(
+            f"{ASSEMBLY_API_BASE}/transcript",
+            headers=headers,
+            json=payload
+        )
+        raise_for_status(res, "Failed to submit transcription", ok=(200,))
+        return res.json()["id"]
+
+    # Submitting isn't idempotent: only retry when the job can't have been created
+    return await with_retries(call, "assembly_submit", breaker=assembly_breaker, idempotent=False)
+
+
+async def get_transcript_status(client: httpx.AsyncClient, transcript_id: str) -> Dict:
+    """Fetch a job's status, hedging slow polls and retrying transient failures"""
+    async def fetch():
+        r = await client.get(
+            f"{ASSEMBLY_API_BASE}/transcript/{transcript_id}",
+            headers=headers
+        )
+        raise_for_status(r, "Failed to get transcript status", ok=(200,))
+        return r.json()
+
+    return await with_retries(lambda: hedged(fetch, POLL_HEDGE_DELAY), "assembly_poll", policy=POLL_POLICY)
+
+
+class AssemblyAIBackend(TranscriptionBackend):
+    name = "assemblyai"
+
+    def __init__(self):
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # One pooled client for all jobs, created on first use inside the event loop
+        if self._client is None:
+            self._client = httpx.AsyncClient()
+        return self._client
+
+    def available(self) -> bool:
+        # Read-only check: allow() would move an expired open circuit to half-open
+        return assembly_breaker.state != CircuitBreaker.OPEN or assembly_breaker.retry_after() == 0
+
+    async def submit(self, audio_url: str, options: Optional[Dict] = None) -> str:
+        options = options or {}
+        # Basic, well-documented parameters
+        payload = {
+            "audio_url": audio_url,
+            "speaker_labels": True,  # Enable speaker diarization
+            "punctuate": True,
+            "format_text": True
+        }
+        if options.get("language"):
+            payload["language_code"] = options["language"]
+        else:
+            payload["language_detection"] = True  # Auto-detect language
+        logger.debug("AssemblyAI payload: %s", payload)
+        return await submit_transcript(self.client, payload)
+
+    async def status(self, job_id: str) -> Dict:
+        return await get_transcript_status(self.client, job_id)
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+# Deterministic mock
+
+MOCK_WORDS = (
+    "the quick brown fox jumps over a lazy dog while we talk about audio "
+    "transcription speakers meetings budget plans next quarter results"
+).split()
+
+
+def mock_result(seed: str, duration: float, speakers: int = 2) -> Dict:
+    """A completed, AssemblyAI-shaped result that depends only on ``seed`` and ``duration``"""
+    rng = random.Random(seed)
+    utterances = []
+    t = 0
+    total_ms = int(duration * 1000)
+    turn = 0
+    while t < total_ms:
+        speaker = chr(ord("A") + turn % speakers)
+        words = []
+        for _ in range(rng.randint(3, 20)):
+            length = rng.randint(150, 600)
+            if t + length > total_ms:
+                break
+            words.append({"text": rng.choice(MOCK_WORDS), "start": t, "end": t + length,
+                          "confidence": round(rng.uniform(0.8, 1.0), 3), "speaker": speaker})
+            t += length + rng.randint(20, 200)
+        if not words:
+            break
+        utterances.append({
+            "speaker": speaker,
+            "text": " ".join(w["text"] for w in words),
+            "start": words[0]["start"],
+            "end": words[-1]["end"],
+            "confidence": round(sum(w["confidence"] for w in words) / len(words), 3),
+            "words": words,
+        })
+        t += rng.randint(200, 1500)
+        turn += rng.choice((1, 1, 1, 2))
+    return {
+        "status": "completed",
+        "text": " ".join(u["text"] for u in utterances),
+        "utterances": utterances,
+        "confidence": 0.9,
+        "audio_duration": total_ms,
+        "language_code": "en",
+    }
+
+
+class MockBackend(TranscriptionBackend):
+    """
+    Answers like AssemblyAI without network calls, for load tests and
+    benchmarks. A job waits ``queue_seconds`` then ``duration * realtime_factor``
+    (both multiplied by ``time_scale``) and returns ``mock_result`` for its URL.
+    Pass ``options={"duration": seconds}`` to control the simulated length.
+    """
+
+    name = "mock"
+
+    def __init__(self, queue_seconds: float = MOCK_QUEUE_SECONDS, realtime_factor: float = MOCK_REALTIME_FACTOR,
+                 time_scale: float = 1.0, poll_interval: float = 0.05):
+        self.queue_seconds = queue_seconds
+        self.realtime_factor = realtime_factor
+        self.time_scale = time_scale
+        self.poll_interval = poll_interval
+        self._jobs: Dict[str, Dict] = {}
+
+    async def submit(self, audio_url: str, options: Optional[Dict] = None) -> str:
+        options = options or {}
+        seed = hashlib.sha1(audio_url.encode()).hexdigest()
+        duration = options.get("duration") or 30 + int(seed[:4], 16) % 570
+        job_id = f"mock-{seed[:12]}-{uuid.uuid4().hex[:8]}"
+        now = time.monotonic()
+        self._jobs[job_id] = {
+            "seed": seed,
+            "duration": duration,
+            "processing_at": now + self.queue_seconds * self.time_scale,
+            "ready_at": now + (self.queue_seconds + duration * self.realtime_factor) * self.time_scale,
+        }
+        return job_id
+
+    async def status(self, job_id: str) -> Dict:
+        job = self._jobs.get(job_id)
+        if job is None:
+            return {"id": job_id, "status": "error", "error": "Unknown job"}
+        now = time.monotonic()
+        if now < job["processing_at"]:
+            return {"id": job_id, "status": "queued"}
+        if now < job["ready_at"]:
+            return {"id": job_id, "status": "processing"}
+        self._jobs.pop(job_id, None)
+        return {"id": job_id, **mock_result(job["seed"], job["duration"])}
+
+
+# Local CPU engine
+
+class LocalBackend(TranscriptionBackend):
+    """faster-whisper in a process pool; jobs live in memory and can't be resumed after a restart"""
+
+    name = "local"
+
+    def __init__(self, workers: int = LOCAL_WORKERS, model: str = LOCAL_MODEL, compute_type: str = LOCAL_COMPUTE_TYPE):
+        self.workers = workers
+        self.model = model
+        self.compute_type = compute_type
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._jobs: Dict[str, asyncio.Future] = {}
+
+    def available(self) -> bool:
+        return self.workers > 0 and local_engine.is_available()
+
+    @property
+    def pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn: workers must not inherit the server's threads and sockets
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=get_context("spawn"))
+        return self._pool
+
+    async def submit(self, audio_url: str, options: Optional[Dict] = None) -> str:
+        if not self.available():
+            raise RuntimeError("Local transcription engine is not installed (pip install faster-whisper)")
+        job_id = f"local-{uuid.uuid4().hex}"
+        loop = asyncio.get_running_loop()
+        self._jobs[job_id] = loop.run_in_executor(
+            self.pool, local_engine.transcribe_file, audio_url, self.model, self.compute_type,
+            (options or {}).get("language"),
+        )
+        return job_id
+
+    async def status(self, job_id: str) -> Dict:
+        future = self._jobs.get(job_id)
+        if future is None:
+            return {"id": job_id, "status": "error", "error": "Unknown job (lost on restart?)"}
+        if not future.done():
+            return {"id": job_id, "status": "processing"}
+        self._jobs.pop(job_id, None)
+        if future.exception() is not None:
+            return {"id": job_id, "status": "error", "error": str(future.exception())}
+        return {"id": job_id, **future.result()}
+
+    async def stream(self, job_id: str) -> AsyncIterator[Dict]:
+        # No polling needed: wait on the worker's future directly
+        future = self._jobs.get(job_id)
+        if future is not None:
+            yield {"id": job_id, "status": "processing"}
+            await asyncio.wait({future})
+        yield await self.status(job_id)
+
+    async def aclose(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+backends: Dict[str, TranscriptionBackend] = {
+    backend.name: backend for backend in (AssemblyAIBackend(), MockBackend(), LocalBackend())
+}
+
+
+def get_backend(name: str) -> TranscriptionBackend:
+    try:
+        return backends[name]
+    except KeyError:
+        raise ValueError(f"Unknown transcription backend: {name}") from None
+
+
+def check_requested(name: str):
+    """ValueError unless clients may ask for this backend (CLIENT_BACKENDS)"""
+    if name not in CLIENT_BACKENDS:
+        raise ValueError(f"Backend {name!r} can't be requested; allowed: {', '.join(CLIENT_BACKENDS) or 'none'}")
+
+
+def choose_backend(requested: Optional[str] = None, size: Optional[int] = None,
+                   language: Optional[str] = None) -> TranscriptionBackend:
+    """
+    Pick a backend for one job. An explicit ``requested`` name wins if it
+    is in CLIENT_BACKENDS (ValueError otherwise); otherwise the first matching rule routes to the local engine:
+
+    - size: files up to LOCAL_MAX_BYTES
+    - language: languages listed in LOCAL_LANGUAGES
+    - load: TRANSCRIPTION_BACKEND already has BACKEND_OVERFLOW_JOBS running,
+      or is unavailable (circuit open)
+
+    Rules that route to an unavailable local engine are skipped.
+    """
+    if requested:
+        check_requested(requested)
+        backend, reason = get_backend(requested), "requested"
+    else:
+        default = get_backend(TRANSCRIPTION_BACKEND)
+        local = backends["local"]
+        backend, reason = default, "default"
+        if default is not local and local.available():
+            if LOCAL_MAX_BYTES and size is not None and size <= LOCAL_MAX_BYTES:
+                backend, reason = local, "size"
+            elif language and language.lower() in LOCAL_LANGUAGES:
+                backend, reason = local, "language"
+            elif not default.available():
+                backend, reason = local, "unavailable"
+            elif BACKEND_OVERFLOW_JOBS and default.active >= BACKEND_OVERFLOW_JOBS:
+                backend, reason = local, "load"
+
+    BACKEND_ROUTED.labels(backend=backend.name, reason=reason).inc()
+    logger.debug("Routing job to %s (%s)", backend.name, reason)
+    return backend
+
+
+async def shutdown_backends():
+    for backend in backends.values():
+        await backend.aclose()
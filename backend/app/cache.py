@@ -0,0 +1,238 @@
+"""
+In-process caches for data derived from completed transcripts, plus a
+read-through cache of serialized responses with an optional shared tier
+"""
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Hashable, NamedTuple, Optional
+
+from .config import (
+    RESPONSE_CACHE_BYTES,
+    RESPONSE_CACHE_LOCAL_TTL,
+    RESPONSE_CACHE_TTL,
+    RESPONSE_CACHE_URL,
+    TRANSCRIPT_CACHE_ENTRIES,
+    TRANSCRIPT_INDEX_CACHE_ENTRIES,
+)
+from .cpu_tasks import etag_for
+from .metrics import CACHE_BYTES, CACHE_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+
+class LRUCache:
+    """
+    Least-recently-used cache keyed by tuples whose first element is the
+    transcript id, so everything derived from one transcript can be
+    dropped together.
+    """
+
+    def __init__(self, max_entries: int, name: str = "derived"):
+        self.max_entries = max_entries
+        self.name = name
+        self._entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        value = self._entries.get(key)
+        CACHE_REQUESTS.labels(cache=self.name, result="miss" if value is None else "hit").inc()
+        if value is not None:
+            self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any):
+        if self.max_entries <= 0:
+            return
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, transcript_id: str):
+        for key in [k for k in self._entries if k[0] == transcript_id]:
+            del self._entries[key]
+
+
+class CachedResponse(NamedTuple):
+    body: bytes
+    etag: str
+
+
+class ByteLRUCache(LRUCache):
+    """LRU of CachedResponse values bounded by total body size, with an optional TTL"""
+
+    def __init__(self, max_bytes: int, ttl: Optional[float] = None, name: str = "responses_local"):
+        super().__init__(max_entries=0, name=name)
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.size = 0
+
+    def get(self, key: Hashable) -> Optional[CachedResponse]:
+        entry = self._entries.get(key)
+        if entry is not None and self.ttl is not None and entry[1] < time.monotonic():
+            self._remove(key)
+            entry = None
+        CACHE_REQUESTS.labels(cache=self.name, result="miss" if entry is None else "hit").inc()
+        if entry is None:
+            return None
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def set(self, key: Hashable, value: CachedResponse):
+        if len(value.body) > self.max_bytes:
+            return  # would evict everything else; not worth it
+        if key in self._entries:
+            self._remove(key)
+        expires = time.monotonic() + self.ttl if self.ttl is not None else None
+        self._entries[key] = (value, expires)
+        self.size += len(value.body)
+        while self.size > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+        CACHE_BYTES.labels(cache=self.name).set(self.size)
+
+    def invalidate(self, transcript_id: str):
+        for key in [k for k in self._entries if k[0] == transcript_id]:
+            self._remove(key)
+        CACHE_BYTES.labels(cache=self.name).set(self.size)
+
+    def _remove(self, key: Hashable):
+        value, _ = self._entries.pop(key)
+        self.size -= len(value.body)
+
+
+class MemorySharedCache:
+    """
+    In-process stand-in for the shared tier (``RESPONSE_CACHE_URL=memory://``);
+    same interface and per-transcript layout as RedisSharedCache
+    """
+
+    def __init__(self):
+        self._data = {}
+
+    async def get(self, transcript_id: str, variant: str) -> Optional[CachedResponse]:
+        entry = self._data.get(transcript_id, {}).get(variant)
+        return CachedResponse(*entry) if entry else None
+
+    async def set(self, transcript_id: str, variant: str, value: CachedResponse):
+        self._data.setdefault(transcript_id, {})[variant] = tuple(value)
+
+    async def delete(self, transcript_id: str):
+        self._data.pop(transcript_id, None)
+
+    async def aclose(self):
+        pass
+
+
+class RedisSharedCache:
+    """
+    One Redis hash per transcript (field per response variant, plus its
+    ETag), so invalidating a transcript is a single DEL
+    """
+
+    PREFIX = "stt:responses:"
+
+    def __init__(self, url: str, ttl: int):
+        import redis.asyncio as redis
+
+        self.client = redis.from_url(url)
+        self.ttl = ttl
+
+    async def get(self, transcript_id: str, variant: str) -> Optional[CachedResponse]:
+        body, etag = await self.client.hmget(self.PREFIX + transcript_id, variant, variant + ":etag")
+        return CachedResponse(body, etag.decode()) if body is not None and etag is not None else None
+
+    async def set(self, transcript_id: str, variant: str, value: CachedResponse):
+        key = self.PREFIX + transcript_id
+        async with self.client.pipeline(transaction=False) as pipe:
+            pipe.hset(key, mapping={variant: value.body, variant + ":etag": value.etag})
+            pipe.expire(key, self.ttl)
+            await pipe.execute()
+
+    async def delete(self, transcript_id: str):
+        await self.client.delete(self.PREFIX + transcript_id)
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+def _shared_backend(url: str):
+    if not url:
+        return None
+    if url.startswith("memory://"):
+        return MemorySharedCache()
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        try:
+            return RedisSharedCache(url, RESPONSE_CACHE_TTL)
+        except ImportError:
+            logger.warning("RESPONSE_CACHE_URL is set but the redis package is not installed; shared cache disabled")
+            return None
+    raise ValueError(f"Unsupported RESPONSE_CACHE_URL: {url}")
+
+
+class ResponseCache:
+    """
+    Serialized responses of completed transcripts (they never change until
+    deleted). Reads go local LRU -> shared cache -> caller; shared-tier
+    errors count as misses. With a shared tier, local entries expire after
+    RESPONSE_CACHE_LOCAL_TTL so deletes made by other workers are seen.
+    """
+
+    def __init__(self, max_bytes: int, shared=None, local_ttl: Optional[float] = None):
+        self.local = ByteLRUCache(max_bytes, ttl=local_ttl if shared is not None else None)
+        self.shared = shared
+
+    async def get(self, transcript_id: str, variant: str) -> Optional[CachedResponse]:
+        key = (transcript_id, variant)
+        cached = self.local.get(key)
+        if cached is not None or self.shared is None:
+            return cached
+        try:
+            cached = await self.shared.get(transcript_id, variant)
+        except Exception as e:
+            logger.warning("Shared response cache read failed: %s", e)
+            cached = None
+        CACHE_REQUESTS.labels(cache="responses_shared", result="miss" if cached is None else "hit").inc()
+        if cached is not None:
+            self.local.set(key, cached)
+        return cached
+
+    async def set(self, transcript_id: str, variant: str, body: bytes, etag: Optional[str] = None) -> CachedResponse:
+        cached = CachedResponse(body, etag or etag_for(body))
+        self.local.set((transcript_id, variant), cached)
+        if self.shared is not None:
+            try:
+                await self.shared.set(transcript_id, variant, cached)
+            except Exception as e:
+                logger.warning("Shared response cache write failed: %s", e)
+        return cached
+
+    async def invalidate(self, transcript_id: str):
+        self.local.invalidate(transcript_id)
+        if self.shared is not None:
+            try:
+                await self.shared.delete(transcript_id)
+            except Exception as e:
+                logger.warning("Shared response cache invalidation failed: %s", e)
+
+    async def aclose(self):
+        if self.shared is not None:
+            await self.shared.aclose()
+
+
+transcript_cache = LRUCache(TRANSCRIPT_CACHE_ENTRIES, name="derived")
+# Interval indexes hold every utterance of a transcript, so keep fewer of them
+index_cache = LRUCache(TRANSCRIPT_INDEX_CACHE_ENTRIES, name="index")
+response_cache = ResponseCache(RESPONSE_CACHE_BYTES, _shared_backend(RESPONSE_CACHE_URL), RESPONSE_CACHE_LOCAL_TTL)
+
+
+def canonical_id(transcript_id) -> str:
+    """The spelling of a transcript id used in cache keys (lower-case UUID); ValueError if it isn't one"""
+    return str(uuid.UUID(str(transcript_id)))
+
+
+async def invalidate_transcript(transcript_id: str):
+    """Drop everything cached for a transcript (after it changes or is deleted)"""
+    transcript_cache.invalidate(transcript_id)
+    index_cache.invalidate(transcript_id)
+    await response_cache.invalidate(transcript_id)
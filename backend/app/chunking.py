@@ -0,0 +1,310 @@
+"""
+Chunked transcription: split long recordings on silence, transcribe the
+pieces concurrently and stitch the results back into one transcript
+
+Chunks overlap by ``overlap`` seconds around each cut. Every chunk "owns"
+the audio between its two cut points; words are kept only from the chunk
+that owns their midpoint, which de-duplicates the overlap. Words heard by
+both neighbours in the overlap are also used to match up their speaker
+labels, since each upstream job labels speakers independently.
+"""
+import asyncio
+import contextlib
+from collections import Counter
+from typing import AsyncContextManager, Awaitable, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from .audio import frame_rms
+from .rate_limit import RateLimited
+
+# Words from two chunks count as the same word if their starts are this close
+MATCH_TOLERANCE_MS = 300
+# Adjacent same-speaker utterances across a cut are merged below this gap
+MERGE_GAP_MS = 1000
+FRAME_SECONDS = 0.05
+SMOOTHING_SECONDS = 0.5
+
+
+class Chunk(NamedTuple):
+    index: int
+    start: int          # first sample (inclusive)
+    end: int            # last sample (exclusive)
+    offset_ms: int      # start of the chunk in the original recording
+    end_ms: int         # end of the chunk in the original recording
+    own_start_ms: int   # words whose midpoint falls in [own_start_ms, own_end_ms)
+    own_end_ms: int     # belong to this chunk
+
+
+def _find_cut(energy: np.ndarray, lo: int, hi: int) -> int:
+    """Index of the quietest frame in energy[lo:hi]"""
+    return lo + int(np.argmin(energy[lo:hi]))
+
+
+def plan_chunks(samples: np.ndarray, sample_rate: int, chunk_seconds: float,
+                overlap_seconds: float, search_seconds: float = 30.0) -> List[Chunk]:
+    """
+    Choose cut points near every ``chunk_seconds`` at the quietest moment in
+    the preceding ``search_seconds`` window and build overlapping chunks.
+    """
+    total = len(samples)
+    chunk_len = int(chunk_seconds * sample_rate)
+    half_overlap = int(overlap_seconds * sample_rate / 2)
+    to_ms = 1000.0 / sample_rate
+
+    if total <= chunk_len + 2 * half_overlap:
+        return [Chunk(0, 0, total, 0, int(total * to_ms), 0, int(total * to_ms) + 1)]
+
+    frame = max(1, int(FRAME_SECONDS * sample_rate))
+    energy = frame_rms(samples, frame)
+    # Smooth so cuts land inside a pause, not on one quiet frame mid-word
+    width = max(1, int(SMOOTHING_SECONDS / FRAME_SECONDS))
+    energy = np.convolve(energy, np.ones(width, dtype=np.float32) / width, mode="same")
+
+    search = int(search_seconds * sample_rate)
+    cuts = [0]
+    while total - cuts[-1] > chunk_len + 2 * half_overlap:
+        target = cuts[-1] + chunk_len
+        lo = max(cuts[-1] + chunk_len // 2, target - search) // frame
+        hi = max(lo + 1, min(target // frame, len(energy)))
+        cuts.append(_find_cut(energy, lo, hi) * frame + frame // 2)
+    cuts.append(total)
+
+    chunks = []
+    for i in range(len(cuts) - 1):
+        start = max(0, cuts[i] - half_overlap)
+        end = min(total, cuts[i + 1] + half_overlap)
+        own_end = cuts[i + 1] if i < len(cuts) - 2 else total + 1
+        chunks.append(Chunk(i, start, end, int(start * to_ms), int(end * to_ms),
+                            int(cuts[i] * to_ms), int(own_end * to_ms)))
+    return chunks
+
+
+def _speaker_label(n: int) -> str:
+    return chr(ord("A") + n) if n < 26 else f"S{n}"
+
+
+def _words_in_range(result: Dict, offset_ms: int, lo_ms: int, hi_ms: int) -> List[Tuple[int, str, str]]:
+    """(global start, normalized text, local speaker) for words starting in [lo_ms, hi_ms)"""
+    words = []
+    for utterance in result.get("utterances") or []:
+        speaker = utterance.get("speaker")
+        for word in utterance.get("words") or []:
+            start = word.get("start", 0) + offset_ms
+            if lo_ms <= start < hi_ms:
+                words.append((start, word.get("text", "").strip(".,?!").lower(), speaker))
+    return words
+
+
+def _match_speakers(prev_words: List[Tuple[int, str, str]], next_words: List[Tuple[int, str, str]]) -> Counter:
+    """Count (prev global speaker, next local speaker) pairs over words both chunks heard"""
+    votes = Counter()
+    if not prev_words or not next_words:
+        return votes
+    prev_words = sorted(prev_words)
+    prev_starts = np.array([w[0] for w in prev_words], dtype=np.int64)
+    next_starts = np.array([w[0] for w in next_words], dtype=np.int64)
+
+    idx = np.searchsorted(prev_starts, next_starts)
+    left = np.clip(idx - 1, 0, len(prev_starts) - 1)
+    right = np.clip(idx, 0, len(prev_starts) - 1)
+    nearest = np.where(np.abs(prev_starts[left] - next_starts) <= np.abs(prev_starts[right] - next_starts), left, right)
+    close = np.abs(prev_starts[nearest] - next_starts) <= MATCH_TOLERANCE_MS
+
+    for j in np.nonzero(close)[0]:
+        prev = prev_words[nearest[j]]
+        if prev[1] == next_words[j][1]:
+            votes[(prev[2], next_words[j][2])] += 1
+    return votes
+
+
+def _reconcile(votes: Counter, local_labels: List[str], talk_ms: Counter) -> Dict[str, str]:
+    """
+    Map this chunk's local labels (ordered by talk time) onto global labels.
+
+    Labels heard in the overlap are matched greedily by votes. Speakers who
+    were silent in the overlap are paired with known global speakers not
+    matched yet, busiest first; a new label is minted only when every known
+    speaker is already taken.
+    """
+    mapping: Dict[str, str] = {}
+    taken = set()
+    for (global_label, local_label), _ in votes.most_common():
+        if local_label not in mapping and global_label not in taken:
+            mapping[local_label] = global_label
+            taken.add(global_label)
+
+    spare = [label for label, _ in talk_ms.most_common() if label not in taken]
+    for local_label in local_labels:
+        if local_label in mapping:
+            continue
+        if spare:
+            mapping[local_label] = spare.pop(0)
+        else:
+            mapping[local_label] = next(_speaker_label(n) for n in range(len(talk_ms) + len(local_labels) + 1)
+                                        if _speaker_label(n) not in talk_ms and _speaker_label(n) not in taken)
+        taken.add(mapping[local_label])
+    return mapping
+
+
+def _utterance_from_words(speaker: str, words: List[Dict], fallback_confidence: float) -> Dict:
+    confidences = [w.get("confidence", fallback_confidence) for w in words]
+    return {
+        "speaker": speaker,
+        "text": " ".join(w.get("text", "") for w in words),
+        "start": words[0]["start"],
+        "end": words[-1]["end"],
+        "confidence": float(np.mean(confidences)) if confidences else fallback_confidence,
+        "words": words,
+    }
+
+
+def chunk_utterances(chunk: Chunk, result: Dict) -> List[Dict]:
+    """
+    One chunk's utterances on the recording's timeline, for partial results
+
+    Only words the chunk owns are kept, as in stitching. Speaker labels are
+    still the chunk's own: they are reconciled once every chunk is in.
+    """
+    utterances = []
+    for utterance in result.get("utterances") or []:
+        kept = []
+        for word in utterance.get("words") or []:
+            start = word.get("start", 0) + chunk.offset_ms
+            end = word.get("end", 0) + chunk.offset_ms
+            if chunk.own_start_ms <= (start + end) // 2 < chunk.own_end_ms:
+                kept.append({**word, "start": start, "end": end})
+        if kept:
+            utterances.append(_utterance_from_words(utterance.get("speaker"), kept, utterance.get("confidence", 0.0)))
+    return utterances
+
+
+def stitch_results(chunks: List[Chunk], results: List[Dict], total_ms: int) -> Dict:
+    """
+    Combine per-chunk upstream results into a single result in the same
+    shape AssemblyAI returns (``text``, ``utterances`` with ms times, ...).
+    """
+    stitched: List[Dict] = []
+    mappings: List[Dict[str, str]] = []
+    talk_ms: Counter = Counter()  # global label -> kept speaking time so far
+
+    for i, (chunk, result) in enumerate(zip(chunks, results)):
+        local_talk: Counter = Counter()
+        for utterance in result.get("utterances") or []:
+            local_talk[utterance.get("speaker")] += utterance.get("end", 0) - utterance.get("start", 0)
+        local_labels = [label for label, _ in local_talk.most_common()]
+
+        if i == 0:
+            mapping = {label: label for label in local_labels}
+        else:
+            prev_chunk, prev_result = chunks[i - 1], results[i - 1]
+            overlap_lo, overlap_hi = chunk.offset_ms, prev_chunk.end_ms
+            prev_words = [(s, t, mappings[i - 1].get(spk, spk))
+                          for s, t, spk in _words_in_range(prev_result, prev_chunk.offset_ms, overlap_lo, overlap_hi)]
+            next_words = _words_in_range(result, chunk.offset_ms, overlap_lo, overlap_hi)
+            mapping = _reconcile(_match_speakers(prev_words, next_words), local_labels, talk_ms)
+        mappings.append(mapping)
+
+        first_in_chunk = True
+        for utterance in result.get("utterances") or []:
+            speaker = mapping.get(utterance.get("speaker"), utterance.get("speaker"))
+            kept = []
+            for word in utterance.get("words") or []:
+                start = word.get("start", 0) + chunk.offset_ms
+                end = word.get("end", 0) + chunk.offset_ms
+                if chunk.own_start_ms <= (start + end) // 2 < chunk.own_end_ms:
+                    kept.append({**word, "start": start, "end": end, "speaker": speaker})
+            if not kept:
+                continue
+
+            talk_ms[speaker] += kept[-1]["end"] - kept[0]["start"]
+            merged = _utterance_from_words(speaker, kept, utterance.get("confidence", 0.0))
+            previous = stitched[-1] if stitched else None
+            if (first_in_chunk and previous and previous["speaker"] == speaker
+                    and merged["start"] - previous["end"] < MERGE_GAP_MS):
+                stitched[-1] = _utterance_from_words(speaker, previous["words"] + kept, previous["confidence"])
+            else:
+                stitched.append(merged)
+            first_in_chunk = False
+
+    languages = Counter(r.get("language_code") for r in results if r.get("language_code"))
+    all_confidences = [w.get("confidence", 0.0) for u in stitched for w in u["words"]]
+    return {
+        "id": "+".join(str(r.get("id", "")) for r in results),
+        "status": "completed",
+        "text": " ".join(u["text"] for u in stitched),
+        "utterances": stitched,
+        "confidence": float(np.mean(all_confidences)) if all_confidences else 0.0,
+        "audio_duration": total_ms,
+        "language_code": languages.most_common(1)[0][0] if languages else "en",
+    }
+
+
+async def transcribe_in_chunks(
+    samples: np.ndarray,
+    sample_rate: int,
+    chunks: List[Chunk],
+    transcribe_chunk: Callable[[Chunk, np.ndarray], Awaitable[Dict]],
+    concurrency: int,
+    on_progress: Optional[Callable[[int, int], Awaitable[None]]] = None,
+    on_chunk: Optional[Callable[[Chunk, Dict], Awaitable[None]]] = None,
+    extra_slot: Optional[Callable[[], AsyncContextManager]] = None,
+) -> Dict:
+    """
+    Run ``transcribe_chunk`` over every chunk with bounded concurrency and
+    stitch the results. ``transcribe_chunk`` receives the chunk and its
+    samples and returns a raw upstream result (times relative to the chunk).
+    ``on_chunk`` gets each chunk's result as soon as it is in. If a chunk
+    fails, the others are cancelled and waited for before the error is raised.
+
+    Up to ``concurrency`` workers take chunks in turn. With ``extra_slot``,
+    the first worker runs under the caller's own job slot and every other
+    worker holds ``extra_slot()`` while it works, so the job never has more
+    upstream jobs running than slots. The first worker alone always makes
+    progress, so waiting for extra slots can't deadlock, and a worker whose
+    slot is refused (queue full) just stops instead of failing the job.
+    """
+    results: List[Optional[Dict]] = [None] * len(chunks)
+    pending = iter(range(len(chunks)))
+    finished = asyncio.Event()
+    failures: List[BaseException] = []
+    done = 0
+
+    async def work():
+        nonlocal done
+        for i in pending:
+            chunk = chunks[i]
+            results[i] = await transcribe_chunk(chunk, samples[chunk.start:chunk.end])
+            done += 1
+            if on_chunk:
+                await on_chunk(chunk, results[i])
+            if on_progress:
+                await on_progress(done, len(chunks))
+            if done == len(chunks):
+                finished.set()
+
+    async def worker(n: int):
+        try:
+            async with contextlib.AsyncExitStack() as stack:
+                if n > 0 and extra_slot is not None:
+                    try:
+                        await stack.enter_async_context(extra_slot())
+                    except RateLimited:
+                        return  # no slot to spare: the others carry on without this worker
+                await work()
+        except Exception as e:
+            failures.append(e)
+            finished.set()
+
+    workers = [asyncio.ensure_future(worker(n)) for n in range(max(1, min(concurrency, len(chunks))))]
+    try:
+        await finished.wait()
+    finally:
+        # Workers still waiting for a slot have nothing left to do
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+    if failures:
+        raise failures[0]
+    total_ms = int(len(samples) * 1000 / sample_rate)
+    return stitch_results(chunks, results, total_ms)
@@ -0,0 +1,376 @@
+"""
+Bulk deletes and storage garbage collection, as background jobs
+
+``start_bulk_delete`` removes transcripts by id or by filter (status,
+created since/until), CLEANUP_BATCH_SIZE rows per transaction. An
+``owner`` filter keeps it to one caller's transcripts. Their speakers and
+word index rows go in the same transaction. Then the batch's
+audio objects are removed from storage in one batched call, along with
+their waveform peaks and cold-storage archives. Objects still used by a
+surviving transcript are kept. Transcripts still processing are never
+touched.
+
+``start_gc`` reconciles the bucket against ``Transcript.audio_url``. It
+walks the bucket listing and the referenced object names side by side,
+both in name order, keeping only the orphans in memory. Orphans younger
+than STORAGE_GC_MIN_AGE are left alone, since uploads exist before their
+transcript row does. Nothing is deleted until the whole diff has run with
+both sides in order, and ``dry_run`` only reports. With STORAGE_GC_INTERVAL
+set, a collection runs periodically.
+
+Jobs live in this process. ``get_job`` reports their progress until
+CLEANUP_JOBS_KEPT newer ones have finished.
+"""
+import asyncio
+import logging
+import os
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import delete, func, or_, select
+
+from .cache import invalidate_transcript
+from .config import (
+    ARCHIVE_STORAGE_BACKEND,
+    CLEANUP_BATCH_SIZE,
+    CLEANUP_JOBS_KEPT,
+    STORAGE_GC_INTERVAL,
+    STORAGE_GC_MIN_AGE,
+)
+from .database import SessionLocal
+from .metrics import STORAGE_OBJECTS_DELETED
+from .models import Speaker, Transcript, TranscriptTerm, TranscriptWordIndex
+from .retention import archive_cache
+from .storage import OBJECT_NAME, StorageBackend, get_storage, path_from_url
+from .tracing import span
+from .waveform import peaks_path
+
+logger = logging.getLogger(__name__)
+
+# Rows a bulk delete leaves alone: a job is still writing them
+BUSY = ("processing",)
+ORPHAN_SAMPLE = 20
+
+_jobs: "OrderedDict[str, CleanupJob]" = OrderedDict()
+_gc_task: Optional[asyncio.Task] = None
+
+
+class CleanupJob:
+    """One background cleanup and its progress"""
+
+    def __init__(self, kind: str, params: Dict[str, Any], requested_by: Optional[str] = None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.params = params
+        self.requested_by = requested_by  # client key; None for scheduled runs
+        self.state = "queued"
+        self.progress: Dict[str, Any] = {}
+        self.error: Optional[str] = None
+        self.created_at = datetime.utcnow()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self.task: Optional[asyncio.Task] = None
+
+    def count(self, key: str, n: int = 1):
+        self.progress[key] = self.progress.get(key, 0) + n
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "params": self.params,
+            "state": self.state,
+            "progress": dict(self.progress),
+            "error": self.error,
+            "created_at": self.created_at.isoformat(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+
+def get_job(job_id: str) -> Optional[CleanupJob]:
+    return _jobs.get(job_id)
+
+
+def list_jobs(requested_by: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Newest first; only one client's if requested_by is given"""
+    return [job.snapshot() for job in reversed(_jobs.values())
+            if requested_by is None or job.requested_by == requested_by]
+
+
+def _running(kind: str) -> Optional[CleanupJob]:
+    return next((j for j in _jobs.values() if j.kind == kind and j.state in ("queued", "running")), None)
+
+
+def _submit(job: CleanupJob, run: Callable[[CleanupJob], Awaitable[None]]) -> CleanupJob:
+    finished = [key for key, j in _jobs.items() if j.state in ("completed", "failed")]
+    for key in finished[:max(0, len(finished) - CLEANUP_JOBS_KEPT + 1)]:
+        del _jobs[key]
+    _jobs[job.id] = job
+
+    async def wrapper():
+        job.state, job.started_at = "running", datetime.utcnow()
+        try:
+            with span(f"cleanup.{job.kind}", job_id=job.id):
+                await run(job)
+            job.state = "completed"
+        except Exception as e:
+            logger.error("Cleanup job %s (%s) failed: %s", job.id, job.kind, e)
+            job.state, job.error = "failed", str(e)
+        finally:
+            job.finished_at = datetime.utcnow()
+            logger.info("Cleanup job %s (%s) %s: %s", job.id, job.kind, job.state, job.progress)
+
+    job.task = asyncio.create_task(wrapper())
+    return job
+
+
+async def remove_objects(names: List[str], reason: str) -> List[str]:
+    """Delete audio objects and their peak files; returns the names that couldn't be deleted"""
+    if not names:
+        return []
+    failed = await get_storage().delete_many(names)
+    removed = [name for name in names if name not in set(failed)]
+
+    def unlink_peaks():
+        for name in removed:
+            try:
+                os.remove(peaks_path(name))
+            except FileNotFoundError:
+                pass
+
+    await asyncio.to_thread(unlink_peaks)
+    STORAGE_OBJECTS_DELETED.labels(reason=reason, outcome="deleted").inc(len(removed))
+    if failed:
+        STORAGE_OBJECTS_DELETED.labels(reason=reason, outcome="failed").inc(len(failed))
+    return failed
+
+
+def unreferenced(db, audio_urls) -> List[str]:
+    """Object names behind these URLs that no remaining transcript uses"""
+    urls = {url for url in audio_urls if url}
+    if not urls:
+        return []
+    used = set(db.execute(select(Transcript.audio_url).where(Transcript.audio_url.in_(urls))).scalars())
+    return sorted({name for name in map(path_from_url, urls - used) if name})
+
+
+# Bulk delete
+
+def _matching(query, ids, statuses, since, until, owner):
+    if owner is not None:
+        query = query.where(owner)
+    if ids is not None:
+        query = query.where(Transcript.id.in_(ids))
+    if statuses:
+        query = query.where(Transcript.status.in_(statuses))
+    if since is not None:
+        query = query.where(Transcript.created_at >= since)
+    if until is not None:
+        query = query.where(Transcript.created_at < until)
+    return query
+
+
+def _delete_batch(ids: Optional[List[uuid.UUID]], statuses: Optional[List[str]], since: Optional[datetime],
+                  until: Optional[datetime], owner, limit: int) -> Tuple[List[Tuple[str, Optional[str]]], List[str]]:
+    """Delete up to limit matching transcripts in one transaction; returns (id, archive_key) rows and freed objects"""
+    query = _matching(select(Transcript.id, Transcript.audio_url, Transcript.archive_key).where(
+        or_(Transcript.status.is_(None), Transcript.status.notin_(BUSY))
+    ), ids, statuses, since, until, owner)
+
+    with SessionLocal() as db, db.begin():
+        rows = db.execute(query.limit(limit)).all()
+        found = [row.id for row in rows]
+        if not found:
+            return [], []
+        for model in (Speaker, TranscriptTerm, TranscriptWordIndex):
+            db.execute(delete(model).where(model.transcript_id.in_(found)))
+        db.execute(delete(Transcript).where(Transcript.id.in_(found)))
+        freed = unreferenced(db, [row.audio_url for row in rows])
+    return [(str(row.id), row.archive_key) for row in rows], freed
+
+
+def _count_matching(ids, statuses, since, until, owner) -> int:
+    query = _matching(select(func.count()).select_from(Transcript), ids, statuses, since, until, owner)
+    with SessionLocal() as db:
+        return db.execute(query).scalar() or 0
+
+
+async def _bulk_delete(job: CleanupJob, ids: Optional[List[uuid.UUID]], statuses: Optional[List[str]],
+                       since: Optional[datetime], until: Optional[datetime], owner, batch_size: int):
+    job.progress.update(matched=await asyncio.to_thread(_count_matching, ids, statuses, since, until, owner),
+                        deleted=0, objects_deleted=0, objects_failed=0, archives_deleted=0)
+    # With ids the batches are slices of the list; with a filter, each batch is
+    # whatever still matches (the previous ones are gone)
+    slices = [ids[i:i + batch_size] for i in range(0, len(ids), batch_size)] if ids is not None else None
+    while True:
+        if slices is not None:
+            if not slices:
+                break
+            rows, freed = await asyncio.to_thread(_delete_batch, slices.pop(0), statuses, since, until, owner,
+                                                 batch_size)
+        else:
+            rows, freed = await asyncio.to_thread(_delete_batch, None, statuses, since, until, owner, batch_size)
+            if not rows:
+                break
+        job.count("deleted", len(rows))
+
+        for transcript_id, _ in rows:
+            await invalidate_transcript(transcript_id)
+        failed = await remove_objects(freed, "transcript_deleted")
+        job.count("objects_deleted", len(freed) - len(failed))
+        job.count("objects_failed", len(failed))
+
+        archives = [key for _, key in rows if key]
+        if archives:
+            for transcript_id, key in rows:
+                if key:
+                    archive_cache.invalidate(transcript_id)
+            failed = await get_storage(ARCHIVE_STORAGE_BACKEND).delete_many(archives)
+            job.count("archives_deleted", len(archives) - len(failed))
+            job.count("objects_failed", len(failed))
+    # Matched but still processing
+    job.progress["skipped"] = max(0, job.progress["matched"] - job.progress["deleted"])
+
+
+def start_bulk_delete(ids: Optional[List[str]] = None, statuses: Optional[List[str]] = None,
+                      since: Optional[datetime] = None, until: Optional[datetime] = None,
+                      owner=None, requested_by: Optional[str] = None,
+                      batch_size: int = CLEANUP_BATCH_SIZE) -> CleanupJob:
+    """Queue a bulk delete by ids and/or filter; ValueError for ids that aren't UUIDs
+
+    ``owner`` (a ``tenants.owned_by`` filter) limits it to one caller's transcripts.
+    """
+    parsed = [uuid.UUID(str(i)) for i in ids] if ids is not None else None
+    job = CleanupJob("bulk_delete", {
+        "ids": len(parsed) if parsed is not None else None,
+        "status": statuses, "since": since.isoformat() if since else None,
+        "until": until.isoformat() if until else None,
+    }, requested_by)
+    return _submit(job, lambda j: _bulk_delete(j, parsed, statuses, since, until, owner, batch_size))
+
+
+# Garbage collection
+
+def _referenced_names(batch_size: int) -> Iterator[List[str]]:
+    """Object names referenced by transcripts, in byte order, a batch at a time"""
+    with SessionLocal() as db:
+        url = Transcript.audio_url
+        # The name is the rest of the URL from "audio_" on; sorting on that sorts by name
+        if db.bind.dialect.name == "postgresql":
+            position = func.strpos(url, "audio_")
+            key = func.substr(url, position).collate("C")
+        else:
+            position = func.instr(url, "audio_")
+            key = func.substr(url, position)
+        query = select(url).where(position > 0).order_by(key).execution_options(yield_per=batch_size)
+        for partition in db.execute(query).scalars().partitions():
+            yield [name for name in map(path_from_url, partition) if name]
+
+
+async def _references(batch_size: int) -> AsyncIterator[str]:
+    # One thread owns the cursor for the whole walk (SQLite connections are per thread)
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="gc-references")
+    loop = asyncio.get_running_loop()
+    batches = _referenced_names(batch_size)
+    try:
+        while True:
+            batch = await loop.run_in_executor(executor, next, batches, None)
+            if batch is None:
+                return
+            for name in batch:
+                yield name
+    finally:
+        await loop.run_in_executor(executor, batches.close)
+        executor.shutdown(wait=False)
+
+
+async def _collect_garbage(job: CleanupJob, min_age: float, dry_run: bool, batch_size: int):
+    cutoff = datetime.utcnow() - timedelta(seconds=min_age)
+    job.progress.update(listed=0, referenced=0, too_young=0, orphans=0, orphan_bytes=0,
+                        objects_deleted=0, objects_failed=0, orphan_sample=[])
+    orphans: List[str] = []
+    references = _references(batch_size)
+    try:
+        reference, previous_reference, previous_name = await anext(references, None), "", ""
+        async for item in get_storage().list_objects("audio_"):
+            if not OBJECT_NAME.match(item.name):
+                continue
+            if item.name < previous_name:
+                raise RuntimeError(f"Storage listing out of order at {item.name}; nothing deleted")
+            previous_name = item.name
+            job.count("listed")
+            while reference is not None and reference < item.name:
+                reference = await anext(references, None)
+                if reference is not None:
+                    if reference < previous_reference:
+                        raise RuntimeError(f"Referenced names out of order at {reference}; nothing deleted")
+                    previous_reference = reference
+            if reference == item.name:
+                job.count("referenced")
+            elif item.modified is None or item.modified > cutoff:
+                job.count("too_young")
+            else:
+                orphans.append(item.name)
+                job.count("orphans")
+                job.count("orphan_bytes", item.size)
+                if len(job.progress["orphan_sample"]) < ORPHAN_SAMPLE:
+                    job.progress["orphan_sample"].append(item.name)
+    finally:
+        await references.aclose()
+
+    if dry_run:
+        return
+    for i in range(0, len(orphans), batch_size):
+        batch = orphans[i:i + batch_size]
+        failed = await remove_objects(batch, "orphan")
+        job.count("objects_deleted", len(batch) - len(failed))
+        job.count("objects_failed", len(failed))
+
+
+def gc_supported() -> bool:
+    """Whether the audio storage backend can list its objects"""
+    return type(get_storage()).list_objects is not StorageBackend.list_objects
+
+
+def start_gc(dry_run: bool = False, min_age: float = STORAGE_GC_MIN_AGE,
+             batch_size: int = CLEANUP_BATCH_SIZE) -> CleanupJob:
+    """Queue a storage garbage collection, or return the one already running"""
+    running = _running("storage_gc")
+    if running is not None:
+        return running
+    job = CleanupJob("storage_gc", {"dry_run": dry_run, "min_age_seconds": min_age})
+    return _submit(job, lambda j: _collect_garbage(j, min_age, dry_run, batch_size))
+
+
+async def _gc_loop():
+    while True:
+        await asyncio.sleep(STORAGE_GC_INTERVAL)
+        job = start_gc()
+        await asyncio.wait([job.task])
+
+
+def start_gc_schedule():
+    """Collect garbage every STORAGE_GC_INTERVAL seconds (no-op when 0)"""
+    global _gc_task
+    if STORAGE_GC_INTERVAL > 0 and _gc_task is None:
+        _gc_task = asyncio.create_task(_gc_loop())
+
+
+async def stop_cleanup():
+    """Stop the GC schedule and cancel running jobs"""
+    global _gc_task
+    tasks = [job.task for job in _jobs.values() if job.task is not None and not job.task.done()]
+    if _gc_task is not None:
+        tasks.append(_gc_task)
+        _gc_task = None
+    for task in tasks:
+        task.cancel()
+    for task in tasks:
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
@@ -0,0 +1,184 @@
+"""
+Negotiated HTTP response compression (zstd, brotli, gzip)
+
+Picks the best encoding both sides support from Accept-Encoding and
+compresses JSON/text bodies on the way out. Single-message bodies are
+compressed in one go (large ones in a thread, since zlib/brotli/zstd
+release the GIL); streaming bodies are compressed chunk by chunk.
+brotli and zstd are used only when their packages are installed.
+"""
+import asyncio
+import zlib
+from typing import Callable, Dict, Iterable, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .config import COMPRESSION_ENCODINGS, COMPRESSION_MIN_BYTES
+from .metrics import COMPRESSION_BYTES
+
+# Bodies at least this large are compressed off the event loop
+THREAD_THRESHOLD = 256 * 1024
+# Already-compressed or binary payloads aren't worth the CPU
+COMPRESSIBLE_TYPES = (
+    "application/json", "application/x-ndjson", "application/x-subrip", "application/xml", "text/", "image/svg+xml",
+)
+
+
+class _Brotli:
+    def __init__(self, brotli):
+        self._compressor = brotli.Compressor(quality=5)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.finish()
+
+
+def _available_compressors() -> Dict[str, Callable]:
+    # gzip level 6 / brotli 5 / zstd 3: good ratios at a few ms per MB
+    compressors = {"gzip": lambda: zlib.compressobj(6, zlib.DEFLATED, 31)}
+    try:
+        import brotli
+        compressors["br"] = lambda: _Brotli(brotli)
+    except ImportError:
+        pass
+    try:
+        import zstandard
+        compressors["zstd"] = lambda: zstandard.ZstdCompressor(level=3).compressobj()
+    except ImportError:
+        pass
+    return compressors
+
+
+COMPRESSORS = _available_compressors()
+
+
+def negotiate(accept_encoding: str, available: Iterable[str]) -> Optional[str]:
+    """
+    Choose an encoding: highest client q-value wins, ties go to the
+    server's preference order; ``*`` covers anything not listed.
+    """
+    weights = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        if not name:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        weights[name.strip()] = q
+
+    best, best_q = None, 0.0
+    for encoding in available:
+        q = weights.get(encoding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+class CompressionMiddleware:
+    """ASGI middleware compressing responses with the negotiated encoding"""
+
+    def __init__(self, app: ASGIApp, encodings: Iterable[str] = COMPRESSION_ENCODINGS,
+                 minimum_size: int = COMPRESSION_MIN_BYTES):
+        self.app = app
+        self.encodings = [e for e in encodings if e in COMPRESSORS]
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding", ""), self.encodings)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        await _Responder(self.app, encoding, self.minimum_size)(scope, receive, send)
+
+
+class _Responder:
+    def __init__(self, app: ASGIApp, encoding: str, minimum_size: int):
+        self.app = app
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.send: Send = None
+        self.start: Optional[Message] = None
+        self.compressor = None
+        self.passthrough = False
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        self.send = send
+        await self.app(scope, receive, self.send_wrapper)
+
+    def _skip(self, headers: MutableHeaders) -> bool:
+        content_type = headers.get("content-type", "")
+        return (
+            "content-encoding" in headers
+            or "content-range" in headers
+            or self.start["status"] < 200 or self.start["status"] in (204, 206, 304)
+            or not content_type.startswith(COMPRESSIBLE_TYPES)
+        )
+
+    async def send_wrapper(self, message: Message):
+        if message["type"] == "http.response.start":
+            # Hold the headers until the first body chunk shows what we're sending
+            self.start = message
+            return
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.compressor is None:
+            headers = MutableHeaders(raw=self.start["headers"])
+            if self._skip(headers) or (not more_body and len(body) < self.minimum_size):
+                self.passthrough = True
+                await self.send(self.start)
+                await self.send(message)
+                return
+
+            self.compressor = COMPRESSORS[self.encoding]()
+            headers["Content-Encoding"] = self.encoding
+            headers.add_vary_header("Accept-Encoding")
+            etag = headers.get("etag")
+            if etag and not etag.startswith("W/"):
+                # A strong ETag names the identity bytes; the compressed body only matches weakly
+                headers["ETag"] = "W/" + etag
+            if not more_body:
+                # Whole body at once: compress, then send with the real length
+                compressed = await self._compress_all(body)
+                headers["Content-Length"] = str(len(compressed))
+                self._observe(len(body), len(compressed))
+                await self.send(self.start)
+                await self.send({"type": "http.response.body", "body": compressed})
+                return
+            del headers["Content-Length"]
+            await self.send(self.start)
+
+        chunk = self.compressor.compress(body)
+        if not more_body:
+            chunk += self.compressor.flush()
+        self._observe(len(body), len(chunk))
+        if chunk or not more_body:
+            await self.send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+    async def _compress_all(self, body: bytes) -> bytes:
+        def compress():
+            return self.compressor.compress(body) + self.compressor.flush()
+
+        if len(body) >= THREAD_THRESHOLD:
+            return await asyncio.to_thread(compress)
+        return compress()
+
+    def _observe(self, original: int, sent: int):
+        COMPRESSION_BYTES.labels(encoding=self.encoding, stage="original").inc(original)
+        COMPRESSION_BYTES.labels(encoding=self.encoding, stage="sent").inc(sent)
@@ -1,12 +1,11 @@
 import os
 from dotenv import load_dotenv
 import logging
+from .logging_config import parse_module_levels, setup_logging
 
 # Load environment variables from .env file
 load_dotenv()
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 def get_env_var(var_name: str, default=None, required=True):
@@ -18,6 +17,7 @@ def get_env_var(var_name: str, default=None, required=True):
 
 # AssemblyAI Configuration
 ASSEMBLY_API_KEY = get_env_var("ASSEMBLY_API_KEY", required=True)
+ASSEMBLY_API_BASE = get_env_var("ASSEMBLY_API_BASE", "https://api.assemblyai.com/v2", required=False).rstrip("/")
 
 # Supabase Configuration
 SUPABASE_URL = get_env_var("SUPABASE_URL", required=True)
@@ -30,16 +30,115 @@ DATABASE_URL = get_env_var(
     "sqlite:///./speech_to_text.db",  # SQLite fallback for development
     required=False
 )
+# Read replicas for read-only routes, comma-separated; reads fall back to DATABASE_URL
+DATABASE_REPLICA_URLS = [u.strip() for u in get_env_var("DATABASE_REPLICA_URLS", "", required=False).split(",") if u.strip()]
+REPLICA_MAX_LAG = float(get_env_var("REPLICA_MAX_LAG", "5", required=False))  # seconds behind before a replica is skipped
+REPLICA_CHECK_INTERVAL = float(get_env_var("REPLICA_CHECK_INTERVAL", "5", required=False))
+READ_YOUR_WRITES_SECONDS = float(get_env_var("READ_YOUR_WRITES_SECONDS", "15", required=False))  # primary-only reads after a write
 
 # Server Configuration
 HOST = get_env_var("HOST", "0.0.0.0", required=False)
 PORT = int(get_env_var("PORT", "8000", required=False))
 DEBUG = get_env_var("DEBUG", "False", required=False).lower() == "true"
 LOG_LEVEL = get_env_var("LOG_LEVEL", "INFO", required=False)
+LOG_FORMAT = get_env_var("LOG_FORMAT", "json", required=False).lower()  # json or text
+LOG_MODULE_LEVELS = parse_module_levels(get_env_var("LOG_MODULE_LEVELS", "", required=False))
+LOG_SAMPLE_RATE = int(get_env_var("LOG_SAMPLE_RATE", "100", required=False))  # 1 in N high-frequency events
+
+# Audio storage: supabase, local (disk under LOCAL_STORAGE_DIR) or s3 (any S3-compatible service)
+STORAGE_BACKEND = get_env_var("STORAGE_BACKEND", "supabase", required=False).lower()
+LOCAL_STORAGE_DIR = get_env_var("LOCAL_STORAGE_DIR", "./storage", required=False)
+STORAGE_PUBLIC_URL = get_env_var("STORAGE_PUBLIC_URL", f"http://localhost:{PORT}", required=False)  # this API, as seen by transcription services
+S3_BUCKET = get_env_var("S3_BUCKET", "audio-files", required=False)
+S3_ENDPOINT_URL = get_env_var("S3_ENDPOINT_URL", "", required=False)  # e.g. http://localhost:9000 for MinIO
+S3_REGION = get_env_var("S3_REGION", "us-east-1", required=False)
+S3_ACCESS_KEY_ID = get_env_var("S3_ACCESS_KEY_ID", "", required=False)
+S3_SECRET_ACCESS_KEY = get_env_var("S3_SECRET_ACCESS_KEY", "", required=False)
+S3_PUBLIC_URL = get_env_var("S3_PUBLIC_URL", "", required=False)  # public bucket/CDN base; presigned URLs otherwise
+S3_URL_TTL = int(get_env_var("S3_URL_TTL", str(7 * 24 * 3600), required=False))  # presigned GETs for transcription
+
+# Configure logging before anything else logs
+setup_logging(LOG_LEVEL, LOG_MODULE_LEVELS, LOG_FORMAT)
+
+# Upstream resilience (AssemblyAI, Supabase)
+UPSTREAM_MAX_RETRIES = int(get_env_var("UPSTREAM_MAX_RETRIES", "4", required=False))  # attempts per call
+UPSTREAM_BACKOFF_BASE = float(get_env_var("UPSTREAM_BACKOFF_BASE", "0.5", required=False))
+UPSTREAM_BACKOFF_MAX = float(get_env_var("UPSTREAM_BACKOFF_MAX", "30", required=False))
+BREAKER_FAILURE_THRESHOLD = int(get_env_var("BREAKER_FAILURE_THRESHOLD", "5", required=False))
+BREAKER_RESET_TIMEOUT = float(get_env_var("BREAKER_RESET_TIMEOUT", "30", required=False))
+POLL_HEDGE_DELAY = float(get_env_var("POLL_HEDGE_DELAY", "2", required=False))  # seconds before a hedged status poll
+
+# Transcription backends: assemblyai, local (faster-whisper) or mock
+TRANSCRIPTION_BACKEND = get_env_var("TRANSCRIPTION_BACKEND", "assemblyai", required=False).lower()
+LOCAL_MODEL = get_env_var("LOCAL_MODEL", "base", required=False)
+LOCAL_COMPUTE_TYPE = get_env_var("LOCAL_COMPUTE_TYPE", "int8", required=False)
+LOCAL_WORKERS = int(get_env_var("LOCAL_WORKERS", "1", required=False))  # processes running the local engine
+LOCAL_MAX_BYTES = int(get_env_var("LOCAL_MAX_BYTES", "0", required=False))  # route files up to this size locally; 0 = off
+LOCAL_LANGUAGES = [
+    lang.strip().lower() for lang in get_env_var("LOCAL_LANGUAGES", "", required=False).split(",") if lang.strip()
+]
+BACKEND_OVERFLOW_JOBS = int(get_env_var("BACKEND_OVERFLOW_JOBS", "0", required=False))  # overflow to local past N jobs; 0 = off
+MOCK_QUEUE_SECONDS = float(get_env_var("MOCK_QUEUE_SECONDS", "1", required=False))
+MOCK_REALTIME_FACTOR = float(get_env_var("MOCK_REALTIME_FACTOR", "0.1", required=False))
+# Backends a client may pick with "backend"; mock stays server-side unless listed
+CLIENT_BACKENDS = [
+    name.strip().lower() for name in get_env_var("CLIENT_BACKENDS", "assemblyai,local", required=False).split(",")
+    if name.strip()
+]
+
+# Chunked transcription of long recordings
+CHUNKED_MODE = get_env_var("CHUNKED_MODE", "off", required=False).lower()  # off, auto or on
+CHUNK_MIN_DURATION = float(get_env_var("CHUNK_MIN_DURATION", "1800", required=False))  # auto mode threshold (s)
+CHUNK_SECONDS = float(get_env_var("CHUNK_SECONDS", "600", required=False))
+CHUNK_OVERLAP = float(get_env_var("CHUNK_OVERLAP", "20", required=False))  # seconds shared by neighbours
+CHUNK_CONCURRENCY = int(get_env_var("CHUNK_CONCURRENCY", "4", required=False))
+
+# Audio preprocessing before upload
+PREPROCESS_AUDIO = get_env_var("PREPROCESS_AUDIO", "False", required=False).lower() == "true"
+PREPROCESS_SAMPLE_RATE = int(get_env_var("PREPROCESS_SAMPLE_RATE", "16000", required=False))
+PREPROCESS_CODEC = get_env_var("PREPROCESS_CODEC", "flac", required=False).lower()  # flac, opus or wav
+SILENCE_THRESHOLD_DB = float(get_env_var("SILENCE_THRESHOLD_DB", "-45", required=False))  # dBFS
+
+# Waveform peaks for the player, built when audio is stored
+PEAKS_ENABLED = get_env_var("PEAKS_ENABLED", "True", required=False).lower() == "true"
+PEAKS_DIR = get_env_var("PEAKS_DIR", os.path.join(LOCAL_STORAGE_DIR, "peaks"), required=False)
+PEAKS_SAMPLES_PER_PEAK = int(get_env_var("PEAKS_SAMPLES_PER_PEAK", "256", required=False))  # finest level
+PEAKS_BITS = 16 if get_env_var("PEAKS_BITS", "8", required=False) == "16" else 8
+PEAKS_RETRY_AFTER = float(get_env_var("PEAKS_RETRY_AFTER", "3600", required=False))  # seconds a failed build is remembered
+
+# CPU-bound post-processing (speaker stats, JSON encoding, subtitles)
+CPU_POOL_KIND = get_env_var("CPU_POOL_KIND", "process", required=False).lower()  # process or thread
+CPU_POOL_SIZE = int(get_env_var("CPU_POOL_SIZE", str(min(4, os.cpu_count() or 1)), required=False))  # 0 = run inline
+CPU_TASK_TIMEOUT = float(get_env_var("CPU_TASK_TIMEOUT", "30", required=False))
+CPU_OFFLOAD_MIN_ITEMS = int(get_env_var("CPU_OFFLOAD_MIN_ITEMS", "200", required=False))  # smaller jobs run inline
+
+# Derived-data caches and speaker timelines
+TRANSCRIPT_CACHE_ENTRIES = int(get_env_var("TRANSCRIPT_CACHE_ENTRIES", "256", required=False))
+TRANSCRIPT_INDEX_CACHE_ENTRIES = int(get_env_var("TRANSCRIPT_INDEX_CACHE_ENTRIES", "32", required=False))
+TIMELINE_MAX_BINS = int(get_env_var("TIMELINE_MAX_BINS", "100000", required=False))
+
+# Serialized responses of completed transcripts (local LRU + optional shared tier)
+RESPONSE_CACHE_BYTES = int(get_env_var("RESPONSE_CACHE_BYTES", str(64 * 1024 * 1024), required=False))
+RESPONSE_CACHE_URL = get_env_var("RESPONSE_CACHE_URL", "", required=False)  # "", memory:// or redis://host:6379/0
+RESPONSE_CACHE_TTL = int(get_env_var("RESPONSE_CACHE_TTL", "86400", required=False))  # shared tier
+RESPONSE_CACHE_LOCAL_TTL = float(get_env_var("RESPONSE_CACHE_LOCAL_TTL", "60", required=False))  # only with a shared tier
+
+# Response compression (negotiated from Accept-Encoding, server preference order)
+COMPRESSION_ENCODINGS = [e.strip() for e in get_env_var(
+    "COMPRESSION_ENCODINGS", "zstd,br,gzip", required=False
+).split(",") if e.strip()]  # br/zstd need the brotli/zstandard packages
+COMPRESSION_MIN_BYTES = int(get_env_var("COMPRESSION_MIN_BYTES", "1024", required=False))
+
+# Tracing Configuration
+TRACE_EXPORTER = get_env_var("TRACE_EXPORTER", "none", required=False).lower()  # none, file or otlp
+TRACE_FILE = get_env_var("TRACE_FILE", "traces.jsonl", required=False)
+TRACE_OTLP_ENDPOINT = get_env_var("TRACE_OTLP_ENDPOINT", "http://localhost:4318", required=False)
 
 # WebSocket Configuration
 MAX_CONNECTIONS = int(get_env_var("MAX_CONNECTIONS", "100", required=False))
 WEBSOCKET_TIMEOUT = int(get_env_var("WEBSOCKET_TIMEOUT", "300", required=False))
+UTTERANCE_PAGE_SIZE = int(get_env_var("UTTERANCE_PAGE_SIZE", "100", required=False))  # utterances per WebSocket page
+UTTERANCE_PAGE_MAX = int(get_env_var("UTTERANCE_PAGE_MAX", "1000", required=False))  # largest page/get_utterances limit
 
 # File Upload Configuration
 MAX_FILE_SIZE = int(get_env_var("MAX_FILE_SIZE", "104857600", required=False))  # 100MB
@@ -51,6 +150,9 @@ ALLOWED_EXTENSIONS = get_env_var(
 
 # Security Configuration
 SECRET_KEY = get_env_var("SECRET_KEY", "your-secret-key-change-in-production", required=False)
+# The built-in default and the env.example placeholder are public, so nothing may be signed with them
+SECRET_KEY_SET = SECRET_KEY not in ("", "your-secret-key-change-in-production", "your_secret_key_here")
+UPLOAD_TOKEN_TTL = int(get_env_var("UPLOAD_TOKEN_TTL", "7200", required=False))  # direct uploads; Supabase signs for 2h
 ALLOWED_ORIGINS = get_env_var(
     "ALLOWED_ORIGINS",
     "http://localhost:3000,http://127.0.0.1:3000",
@@ -61,6 +163,49 @@ ALLOWED_ORIGINS = get_env_var(
 RATE_LIMIT_REQUESTS = int(get_env_var("RATE_LIMIT_REQUESTS", "100", required=False))
 RATE_LIMIT_WINDOW = int(get_env_var("RATE_LIMIT_WINDOW", "3600", required=False))
 
+# Admission control: server-wide caps on concurrent work
+MAX_CONCURRENT_JOBS = int(get_env_var("MAX_CONCURRENT_JOBS", "20", required=False))  # upstream transcription jobs
+MAX_CONCURRENT_UPLOADS = int(get_env_var("MAX_CONCURRENT_UPLOADS", "10", required=False))
+ADMISSION_TIMEOUT = float(get_env_var("ADMISSION_TIMEOUT", "2", required=False))  # seconds to wait for a slot
+ADMISSION_RETRY_AFTER = int(get_env_var("ADMISSION_RETRY_AFTER", "10", required=False))
+
+# Job scheduling: priority classes and per-tenant fair share of MAX_CONCURRENT_JOBS
+SCHEDULER_INTERACTIVE_RESERVE = int(get_env_var("SCHEDULER_INTERACTIVE_RESERVE", "2", required=False))  # slots only WebSocket jobs may use
+SCHEDULER_TENANT_WEIGHTS = get_env_var("SCHEDULER_TENANT_WEIGHTS", "", required=False)  # e.g. tenant:<uuid>:4,ip:10.0.0.5:0.5
+SCHEDULER_MAX_QUEUE = int(get_env_var("SCHEDULER_MAX_QUEUE", "1000", required=False))
+SCHEDULER_DEFAULT_JOB_SECONDS = float(get_env_var("SCHEDULER_DEFAULT_JOB_SECONDS", "300", required=False))  # cost when the duration is unknown
+SCHEDULER_UPDATE_INTERVAL = float(get_env_var("SCHEDULER_UPDATE_INTERVAL", "5", required=False))  # queue updates to WebSocket clients
+
+# Bulk export / import of transcripts
+EXPORT_BATCH_SIZE = int(get_env_var("EXPORT_BATCH_SIZE", "500", required=False))  # rows per cursor fetch / Parquet row group
+IMPORT_BATCH_SIZE = int(get_env_var("IMPORT_BATCH_SIZE", "500", required=False))  # rows per COPY / INSERT transaction
+
+# Monthly partitions of transcripts/speakers (PostgreSQL) and cold storage of old transcript JSON
+PARTITION_MONTHS_AHEAD = int(get_env_var("PARTITION_MONTHS_AHEAD", "3", required=False))  # partitions created ahead of time
+ARCHIVE_AFTER_DAYS = float(get_env_var("ARCHIVE_AFTER_DAYS", "0", required=False))  # 0 = never archive
+ARCHIVE_STORAGE_BACKEND = (get_env_var("ARCHIVE_STORAGE_BACKEND", "", required=False) or STORAGE_BACKEND).lower()
+ARCHIVE_INTERVAL = float(get_env_var("ARCHIVE_INTERVAL", "3600", required=False))  # seconds between retention runs
+ARCHIVE_BATCH_SIZE = int(get_env_var("ARCHIVE_BATCH_SIZE", "100", required=False))
+ARCHIVE_CACHE_ENTRIES = int(get_env_var("ARCHIVE_CACHE_ENTRIES", "32", required=False))  # rehydrated transcripts kept in memory
+
+# Word index (click-to-seek / keyword spotting)
+WORD_INDEX_BACKFILL_BATCH = int(get_env_var("WORD_INDEX_BACKFILL_BATCH", "200", required=False))  # per retention run; 0 = off
+KEYWORD_MAX_TERMS = int(get_env_var("KEYWORD_MAX_TERMS", "20", required=False))  # keywords per /keywords query
+
+# Bulk deletes and storage garbage collection
+CLEANUP_BATCH_SIZE = int(get_env_var("CLEANUP_BATCH_SIZE", "500", required=False))  # rows/objects per batch
+CLEANUP_JOBS_KEPT = int(get_env_var("CLEANUP_JOBS_KEPT", "50", required=False))  # finished jobs kept for status queries
+STORAGE_GC_INTERVAL = float(get_env_var("STORAGE_GC_INTERVAL", "0", required=False))  # seconds between GC runs; 0 = off
+STORAGE_GC_MIN_AGE = float(get_env_var("STORAGE_GC_MIN_AGE", "86400", required=False))  # younger objects are never collected
+
+# API keys and tenants: quotas and usage metering
+API_KEYS_REQUIRED = get_env_var("API_KEYS_REQUIRED", "False", required=False).lower() == "true"  # else anonymous use stays open
+API_KEY_CACHE_TTL = float(get_env_var("API_KEY_CACHE_TTL", "60", required=False))  # seconds a key lookup (hit or miss) is reused
+API_KEY_CACHE_ENTRIES = int(get_env_var("API_KEY_CACHE_ENTRIES", "10000", required=False))
+# Tenant names or ids whose keys may run storage GC and imports, comma-separated
+ADMIN_TENANTS = {t.strip() for t in get_env_var("ADMIN_TENANTS", "", required=False).split(",") if t.strip()}
+USAGE_FLUSH_INTERVAL = float(get_env_var("USAGE_FLUSH_INTERVAL", "10", required=False))  # seconds between usage counter writes
+
 # Validate critical configuration
 def validate_config():
     """Validate that all required configuration is present"""
@@ -74,10 +219,13 @@ def validate_config():
         if not SUPABASE_KEY or SUPABASE_KEY == "your_supabase_anon_key_here":
             logger.warning("⚠️  Supabase key not configured!")
             
+        if not SECRET_KEY_SET:
+            logger.warning("⚠️  SECRET_KEY not configured: direct uploads (/api/uploads) are disabled")
+            
         logger.info("✅ Configuration loaded successfully")
-        logger.info(f"📊 Database: {DATABASE_URL}")
-        logger.info(f"🌐 Server: {HOST}:{PORT}")
-        logger.info(f"📁 Max file size: {MAX_FILE_SIZE / 1024 / 1024:.1f}MB")
+        logger.info("📊 Database: %s", DATABASE_URL)
+        logger.info("🌐 Server: %s:%s", HOST, PORT)
+        logger.info("📁 Max file size: %.1fMB", MAX_FILE_SIZE / 1024 / 1024)
         
     except Exception as e:
         logger.error(f"❌ Configuration validation failed: {e}")
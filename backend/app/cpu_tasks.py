@@ -0,0 +1,96 @@
+"""
+CPU-bound post-processing steps, run through workers.run_cpu
+
+Pure functions (NumPy aside) with no config or I/O imports, so
+process-pool workers can import this module cheaply.
+"""
+import hashlib
+import json
+from typing import Any, Dict, List, Tuple, Union
+
+from .diarization import speaker_totals, to_arrays
+
+try:
+    import orjson
+except ImportError:  # optional; stdlib json is the fallback
+    orjson = None
+
+_ORJSON_OPTIONS = (orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY) if orjson else 0
+
+
+def encode_json(payload: Any) -> bytes:
+    """Compact UTF-8 JSON bytes; orjson when installed (several times faster on big transcripts)"""
+    if orjson is not None:
+        return orjson.dumps(payload, option=_ORJSON_OPTIONS)
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def dumps_json(payload: Any) -> str:
+    """Same as encode_json but as text, for WebSocket text frames"""
+    return encode_json(payload).decode("utf-8")
+
+
+def etag_for(body: bytes) -> str:
+    """Strong ETag: hash of the exact response bytes"""
+    return '"%s"' % hashlib.blake2b(body, digest_size=16).hexdigest()
+
+
+def encode_response(payload: Any) -> Tuple[bytes, str]:
+    """encode_json plus the body's ETag, so both are computed in the worker"""
+    body = encode_json(payload)
+    return body, etag_for(body)
+
+
+def loads_json(data: Union[str, bytes]) -> Any:
+    """Parse JSON; orjson errors subclass json.JSONDecodeError, so callers catch that"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def enhance_utterances(utterances: List[Dict]) -> List[Dict]:
+    """Utterances as clients get them: times in seconds, plus a duration"""
+    return [
+        {
+            "speaker": utterance.get("speaker", "Unknown"),
+            "text": utterance.get("text", ""),
+            "start": utterance.get("start", 0) / 1000.0,  # Convert to seconds
+            "end": utterance.get("end", 0) / 1000.0,
+            "duration": (utterance.get("end", 0) - utterance.get("start", 0)) / 1000.0,
+            "confidence": utterance.get("confidence", 0.0),
+            "words": utterance.get("words", [])
+        }
+        for utterance in utterances
+    ]
+
+
+def speaker_statistics(utterances: List[Dict], audio_duration: float) -> Dict:
+    """
+    Per-speaker totals plus utterances converted to seconds.
+
+    Returns ``enhanced_utterances``, ``speaker_stats`` (label -> total_words,
+    total_duration, utterances, avg_confidence) and ``speakers_summary``.
+    """
+    enhanced_utterances = enhance_utterances(utterances)
+
+    # Totals in vectorized passes over the utterance arrays
+    speaker_stats = speaker_totals(to_arrays(utterances))
+
+    # Create structured diarization data
+    speakers_summary = [
+        {
+            "speaker": speaker,
+            "total_words": stats["total_words"],
+            "total_duration": stats["total_duration"],
+            "utterances_count": stats["utterances"],
+            "avg_confidence": stats["avg_confidence"],
+            "speaking_percentage": (stats["total_duration"] / audio_duration * 100) if audio_duration > 0 else 0
+        }
+        for speaker, stats in speaker_stats.items()
+    ]
+
+    return {
+        "enhanced_utterances": enhanced_utterances,
+        "speaker_stats": speaker_stats,
+        "speakers_summary": speakers_summary,
+    }
@@ -0,0 +1,135 @@
+"""
+Incremental transcript delivery over WebSocket
+
+A finished job is no longer one ``completed`` message carrying every
+utterance. Instead the client gets a ``completed`` summary (text,
+speakers, timings, ``utterances_total``) followed by ``utterances`` pages
+of ``page_size``. Every message of a job that carries utterances has a
+``seq`` number, increasing by one per message, so clients can spot a gap.
+Pages also carry their ``offset`` into the transcript.
+
+``initial_utterances`` limits how many are pushed. The client fetches the
+rest with ``get_utterances`` messages (``transcript_id``, ``offset``,
+``limit``), answered by pages in the same shape.
+
+In chunked mode each chunk's utterances go out as a ``partial`` message as
+soon as the chunk is transcribed. Their speaker labels are provisional,
+and the final pages replace them.
+
+``paged: false`` on the transcribe message keeps the old single
+``completed`` message.
+"""
+import asyncio
+import itertools
+from typing import Any, Dict, List, Optional
+
+from .config import UTTERANCE_PAGE_MAX, UTTERANCE_PAGE_SIZE
+from .cpu_tasks import dumps_json, enhance_utterances
+from .workers import run_cpu
+
+
+def clamp_page_size(value: Any) -> int:
+    try:
+        return max(1, min(int(value), UTTERANCE_PAGE_MAX))
+    except (TypeError, ValueError):
+        return UTTERANCE_PAGE_SIZE
+
+
+class UtteranceStream:
+    """
+    Sequenced delivery to one WebSocket for one job
+
+    Stands in for the WebSocket wherever a job reports progress, so plain
+    ``send_json``/``send_text`` calls keep working.
+    """
+
+    def __init__(self, websocket, page_size: int = UTTERANCE_PAGE_SIZE, initial: Optional[int] = None,
+                 paged: bool = True):
+        self.websocket = websocket
+        self.page_size = clamp_page_size(page_size)
+        try:
+            self.initial = None if initial is None else max(0, int(initial))
+        except (TypeError, ValueError):
+            self.initial = None
+        self.paged = paged
+        self._seq = itertools.count()
+        # Chunks report concurrently: numbering, encoding and sending happen as one step
+        self._send_lock = asyncio.Lock()
+
+    async def send_json(self, message: Dict):
+        await self.websocket.send_text(dumps_json(message))
+
+    async def send_text(self, message: str):
+        await self.websocket.send_text(message)
+
+    async def _send_sequenced(self, message: Dict, size: int = 0):
+        async with self._send_lock:
+            message["seq"] = next(self._seq)
+            await self.websocket.send_text(await run_cpu(dumps_json, message, task="json", size=size))
+
+    async def partial(self, chunk_index: int, chunk_count: int, utterances: List[Dict]):
+        """A chunk's utterances (ms, as from upstream) ahead of the stitched result"""
+        if not self.paged:
+            return
+        await self._send_sequenced({
+            "status": "partial",
+            "message": f"Partial result for chunk {chunk_index + 1}/{chunk_count}",
+            "chunk": {"index": chunk_index, "total": chunk_count},
+            "provisional_speakers": True,
+            "utterances": enhance_utterances(utterances),
+        }, size=len(utterances))
+
+    async def completed(self, final_result: Dict):
+        """The summary, then the first ``initial`` utterances (all by default) in pages"""
+        utterances = final_result["utterances"]
+        if not self.paged:
+            await self._send_sequenced({
+                "status": "completed",
+                "message": "Transcription completed successfully!",
+                "data": final_result
+            }, size=len(utterances))
+            return
+        pushed = len(utterances) if self.initial is None else min(self.initial, len(utterances))
+        diarized = {k: v for k, v in (final_result.get("diarized_transcript") or {}).items()
+                    if k != "enhanced_utterances"}
+        await self._send_sequenced({
+            "status": "completed",
+            "message": "Transcription completed successfully!",
+            "data": {**{k: v for k, v in final_result.items() if k != "utterances"},
+                     "diarized_transcript": diarized},
+            "utterances_total": len(utterances),
+            "page_size": self.page_size,
+            "utterances_pushed": pushed,
+        })
+        await self.pages(final_result["id"], utterances[:pushed], 0, len(utterances))
+
+    async def pages(self, transcript_id: str, utterances: List[Dict], offset: int, total: int):
+        """
+        A slice of a transcript's utterances (already in seconds) as ``utterances`` messages
+
+        ``offset`` is where the slice starts in the transcript and ``total``
+        how many the transcript has. An empty slice still gets one page, so
+        the client sees ``last``.
+        """
+        position = 0
+        while True:
+            page = utterances[position:position + self.page_size]
+            position += len(page)
+            await self._send_sequenced({
+                "status": "utterances",
+                "transcript_id": transcript_id,
+                "offset": offset + position - len(page),
+                "count": len(page),
+                "total": total,
+                "last": position >= len(utterances),
+                "utterances": page,
+            }, size=len(page))
+            if position >= len(utterances):
+                break
+
+
+def stream_for(websocket) -> Optional[UtteranceStream]:
+    """The job's stream: the WebSocket itself if it already is one, else a default stream around it"""
+    if websocket is None or isinstance(websocket, UtteranceStream):
+        return websocket
+    return UtteranceStream(websocket)
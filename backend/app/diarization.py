@@ -0,0 +1,218 @@
+"""
+Vectorized speaker-diarization analytics
+
+Utterances become parallel NumPy arrays (start, end, speaker code,
+confidence, word count) sorted by start time; every statistic below is a
+handful of array passes instead of a per-utterance Python loop. Only NumPy
+is imported so the functions can run in the CPU worker pool.
+"""
+from typing import Dict, List, NamedTuple, Optional
+
+import numpy as np
+
+# Gaps shorter than this between speech are ordinary pauses, not silence
+MIN_SILENCE_GAP = 0.3
+# A timeline bin is silent when less than this fraction of it has speech
+SILENCE_FRACTION = 0.5
+
+
+class SpeakerArrays(NamedTuple):
+    labels: List[str]        # speaker code -> label
+    start: np.ndarray        # seconds, float64, sorted ascending
+    end: np.ndarray          # seconds, float64
+    speaker: np.ndarray      # int codes into ``labels``
+    confidence: np.ndarray   # float64
+    words: np.ndarray        # int64 word counts
+
+
+def to_arrays(utterances: List[Dict], time_unit: float = 1000.0) -> SpeakerArrays:
+    """
+    Convert utterances to arrays. ``time_unit`` is the number of input
+    units per second: 1000 for raw upstream results (ms), 1 for the
+    ``enhanced_utterances`` stored in seconds.
+    """
+    n = len(utterances)
+    start = np.fromiter((u.get("start", 0) for u in utterances), dtype=np.float64, count=n) / time_unit
+    end = np.fromiter((u.get("end", 0) for u in utterances), dtype=np.float64, count=n) / time_unit
+    confidence = np.fromiter((u.get("confidence") or 0.0 for u in utterances), dtype=np.float64, count=n)
+    words = np.fromiter((len(u.get("words") or ()) for u in utterances), dtype=np.int64, count=n)
+    labels, speaker = np.unique(np.array([str(u.get("speaker", "Unknown")) for u in utterances], dtype=object),
+                                return_inverse=True) if n else (np.array([], dtype=object), np.zeros(0, dtype=np.int64))
+    order = np.argsort(start, kind="stable")
+    return SpeakerArrays(
+        labels=[str(label) for label in labels],
+        start=start[order],
+        end=np.maximum(end[order], start[order]),
+        speaker=speaker.astype(np.int64)[order],
+        confidence=confidence[order],
+        words=words[order],
+    )
+
+
+def speaker_totals(arrays: SpeakerArrays) -> Dict[str, Dict]:
+    """Talk time, word count, utterance count and mean confidence per speaker"""
+    k = len(arrays.labels)
+    durations = arrays.end - arrays.start
+    talk = np.bincount(arrays.speaker, weights=durations, minlength=k)
+    words = np.bincount(arrays.speaker, weights=arrays.words, minlength=k)
+    count = np.bincount(arrays.speaker, minlength=k)
+    confidence = np.bincount(arrays.speaker, weights=arrays.confidence, minlength=k)
+    return {
+        label: {
+            "total_words": int(words[i]),
+            "total_duration": float(talk[i]),
+            "utterances": int(count[i]),
+            "avg_confidence": float(confidence[i] / count[i]) if count[i] else 0.0,
+        }
+        for i, label in enumerate(arrays.labels)
+    }
+
+
+def _previous_holder(arrays: SpeakerArrays):
+    """For each utterance: latest end among earlier utterances, and which utterance it belongs to"""
+    n = len(arrays.start)
+    running_end = np.maximum.accumulate(arrays.end)
+    holder = np.maximum.accumulate(np.where(arrays.end >= running_end, np.arange(n), 0))
+    prev_end = np.empty(n)
+    prev_holder = np.zeros(n, dtype=np.int64)
+    prev_end[0] = -np.inf
+    prev_end[1:] = running_end[:-1]
+    prev_holder[1:] = holder[:-1]
+    return prev_end, prev_holder
+
+
+def analyze(arrays: SpeakerArrays, duration: Optional[float] = None) -> Dict:
+    """
+    Conversation dynamics in vectorized passes.
+
+    - turns: runs of consecutive utterances by one speaker
+    - interruptions: starting while another speaker is still talking
+    - overlap: seconds of such simultaneous speech (credited to the interrupter)
+    - words_per_minute: words over own talk time
+    - silence gaps: nobody talking for at least MIN_SILENCE_GAP seconds
+    """
+    k = len(arrays.labels)
+    n = len(arrays.start)
+    if duration is None:
+        duration = float(arrays.end.max()) if n else 0.0
+    if n == 0:
+        return {"duration": duration, "speakers": {}, "turn_changes": 0, "transitions": {},
+                "silence": {"gaps": 0, "total": duration, "longest": duration}}
+
+    totals = speaker_totals(arrays)
+    sp = arrays.speaker
+
+    changed = np.empty(n, dtype=bool)
+    changed[0] = True
+    changed[1:] = sp[1:] != sp[:-1]
+    turns = np.bincount(sp[changed], minlength=k)
+    transitions = np.zeros((k, k), dtype=np.int64)
+    np.add.at(transitions, (sp[:-1][changed[1:]], sp[1:][changed[1:]]), 1)
+
+    prev_end, prev_holder = _previous_holder(arrays)
+    other = sp != sp[prev_holder]
+    interrupting = other & (arrays.start < prev_end)
+    overlap = np.where(interrupting, np.minimum(arrays.end, prev_end) - arrays.start, 0.0)
+    interruptions = np.bincount(sp[interrupting], minlength=k)
+    overlap_by_speaker = np.bincount(sp, weights=overlap, minlength=k)
+
+    gaps = np.empty(n + 1)
+    gaps[0] = arrays.start[0]
+    gaps[1:n] = arrays.start[1:] - prev_end[1:]
+    gaps[n] = duration - arrays.end.max()
+    silent = gaps[gaps >= MIN_SILENCE_GAP]
+
+    speakers = {}
+    for i, label in enumerate(arrays.labels):
+        talk = totals[label]["total_duration"]
+        speakers[label] = {
+            **totals[label],
+            "turns": int(turns[i]),
+            "interruptions": int(interruptions[i]),
+            "overlap_duration": float(overlap_by_speaker[i]),
+            "words_per_minute": totals[label]["total_words"] / talk * 60 if talk > 0 else 0.0,
+            "speaking_percentage": talk / duration * 100 if duration > 0 else 0.0,
+        }
+
+    return {
+        "duration": duration,
+        "speakers": speakers,
+        "turn_changes": int(changed[1:].sum()),
+        "transitions": {
+            arrays.labels[a]: {arrays.labels[b]: int(transitions[a, b]) for b in range(k) if transitions[a, b]}
+            for a in range(k) if transitions[a].any()
+        },
+        "overlap_duration": float(overlap.sum()),
+        "silence": {
+            "gaps": int(len(silent)),
+            "total": float(silent.sum()),
+            "longest": float(silent.max()) if len(silent) else 0.0,
+        },
+    }
+
+
+def _coverage_at(starts: np.ndarray, ends: np.ndarray, t: np.ndarray) -> np.ndarray:
+    """
+    Seconds of speech in [0, t) for each t: sum of max(0, t - s) - max(0, t - e),
+    evaluated with sorted prefix sums in O((n + len(t)) log n)
+    """
+    def ramp(points):
+        points = np.sort(points)
+        prefix = np.concatenate([[0.0], np.cumsum(points)])
+        k = np.searchsorted(points, t, side="left")
+        return k * t - prefix[k]
+
+    return ramp(starts) - ramp(ends)
+
+
+def timeline(arrays: SpeakerArrays, resolution: float, duration: Optional[float] = None) -> Dict:
+    """
+    Run-length-encoded speaker timeline.
+
+    Time is cut into ``resolution``-second bins; each bin goes to the
+    speaker with the most speech in it, or ``None`` (silence) when under
+    SILENCE_FRACTION of the bin has speech. Adjacent equal bins are merged
+    into ``[start, end, speaker]`` segments.
+    """
+    n = len(arrays.start)
+    if duration is None:
+        duration = float(arrays.end.max()) if n else 0.0
+    bins = max(1, int(np.ceil(duration / resolution)))
+    edges = np.minimum(np.arange(bins + 1) * resolution, max(duration, resolution * 1e-9))
+    widths = np.diff(edges)
+
+    k = len(arrays.labels)
+    coverage = np.zeros((max(k, 1), bins))
+    for code in range(k):
+        mine = arrays.speaker == code
+        coverage[code] = np.diff(_coverage_at(arrays.start[mine], arrays.end[mine], edges))
+
+    dominant = coverage.argmax(axis=0)
+    speech = coverage.sum(axis=0)
+    codes = np.where((speech >= SILENCE_FRACTION * widths) & (k > 0), dominant, -1)
+
+    # Run-length encode
+    boundaries = np.flatnonzero(np.diff(codes)) + 1
+    run_starts = np.concatenate([[0], boundaries])
+    run_ends = np.concatenate([boundaries, [bins]])
+    segments = [
+        [round(float(edges[a]), 3), round(float(edges[b]), 3), arrays.labels[codes[a]] if codes[a] >= 0 else None]
+        for a, b in zip(run_starts, run_ends)
+    ]
+    return {
+        "resolution": resolution,
+        "duration": duration,
+        "speakers": arrays.labels,
+        "segments": segments,
+    }
+
+
+def build_timeline(utterances: List[Dict], resolution: float, duration: Optional[float] = None) -> Dict:
+    """Timeline plus conversation analytics for raw (ms) utterances; worker-pool entry point"""
+    arrays = to_arrays(utterances)
+    return {**timeline(arrays, resolution, duration), "analytics": analyze(arrays, duration)}
+
+
+def build_analytics(utterances: List[Dict], duration: Optional[float] = None) -> Dict:
+    """Conversation analytics for raw (ms) utterances; worker-pool entry point"""
+    return analyze(to_arrays(utterances), duration)
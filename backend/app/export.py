@@ -0,0 +1,488 @@
+"""
+Bulk export and import of transcripts
+
+Export walks the transcripts table through a server-side cursor
+(``yield_per``) in one worker thread. Each batch gets its speakers from a
+single IN query and goes out as NDJSON lines or as one Parquet row group,
+so memory stays flat however many rows there are. Import reads an NDJSON
+body line by line and writes IMPORT_BATCH_SIZE rows per transaction: COPY
+on PostgreSQL, multi-row INSERTs elsewhere. This is also the way to move
+data between SQLite and PostgreSQL.
+"""
+import asyncio
+import json
+import logging
+import uuid
+import zlib
+from collections import defaultdict
+from contextlib import closing
+from datetime import datetime, timezone
+from io import StringIO
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Set
+
+from sqlalchemy import delete, insert, select
+from sqlalchemy.dialects.postgresql import JSONB, UUID
+from sqlalchemy.types import DateTime, Float, Integer
+
+from .config import EXPORT_BATCH_SIZE, IMPORT_BATCH_SIZE
+from .cpu_tasks import encode_json
+from .database import SessionLocal
+from .metrics import BULK_ROWS
+from .models import Speaker, Transcript, TranscriptTerm, TranscriptWordIndex
+from .replicas import read_router
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ("ndjson", "parquet")
+BODY_ENCODINGS = ("identity", "gzip", "x-gzip", "deflate")
+CONFLICT_MODES = ("skip", "replace")
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "parquet": "application/vnd.apache.parquet"}
+TRANSCRIPTS = Transcript.__table__
+SPEAKERS = Speaker.__table__
+# Rebuilt for imported transcripts by the retention loop's backfill
+WORD_TABLES = (TranscriptTerm.__table__, TranscriptWordIndex.__table__)
+# Speaker rows are nested in their transcript's record
+SPEAKER_FIELDS = [c.name for c in SPEAKERS.columns if c.name != "transcript_id"]
+MAX_LINE_BYTES = 64 * 1024 * 1024
+MAX_REPORTED_ERRORS = 100
+
+
+class RecordError(ValueError):
+    """A malformed import line or body"""
+
+
+def _naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    # Timestamps are stored as naive UTC
+    if value is not None and value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _plain(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    return value
+
+
+# -- export -------------------------------------------------------------------
+
+def iter_batches(
+    statuses: Optional[Sequence[str]] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    owner=None,
+    batch_size: int = EXPORT_BATCH_SIZE,
+) -> Iterator[List[Dict[str, Any]]]:
+    """Transcript rows (with a ``speakers`` list) in created_at order, batch_size at a time
+
+    ``owner`` (a ``tenants.owned_by`` filter) limits it to one caller's transcripts.
+    """
+    query = select(TRANSCRIPTS).order_by(TRANSCRIPTS.c.created_at, TRANSCRIPTS.c.id)
+    if owner is not None:
+        query = query.where(owner)
+    if statuses:
+        query = query.where(TRANSCRIPTS.c.status.in_(statuses))
+    if since is not None:
+        query = query.where(TRANSCRIPTS.c.created_at >= _naive_utc(since))
+    if until is not None:
+        query = query.where(TRANSCRIPTS.c.created_at < _naive_utc(until))
+
+    with read_router.session() as db:
+        result = db.execute(query.execution_options(yield_per=batch_size))
+        for part in result.mappings().partitions():
+            rows = [dict(row) for row in part]
+            speakers = defaultdict(list)
+            ids = [row["id"] for row in rows]
+            for s in db.execute(
+                select(SPEAKERS).where(SPEAKERS.c.transcript_id.in_(ids)).order_by(SPEAKERS.c.speaker_label)
+            ).mappings():
+                speakers[s["transcript_id"]].append({name: s[name] for name in SPEAKER_FIELDS})
+            for row in rows:
+                row["speakers"] = speakers.get(row["id"], [])
+            yield rows
+            BULK_ROWS.labels(direction="export", outcome="exported").inc(len(rows))
+
+
+def ndjson_chunks(batches: Iterable[List[Dict[str, Any]]]) -> Iterator[bytes]:
+    """One JSON object per line; one chunk per batch"""
+    for rows in batches:
+        lines = []
+        for row in rows:
+            record = {key: _plain(value) for key, value in row.items()}
+            record["speakers"] = [{k: _plain(v) for k, v in s.items()} for s in row["speakers"]]
+            lines.append(encode_json(record))
+            lines.append(b"\n")
+        yield b"".join(lines)
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:  # optional; only needed for Parquet
+        return None
+    return pyarrow
+
+
+def parquet_available() -> bool:
+    return _pyarrow() is not None
+
+
+class _ChunkSink:
+    """Write-only file that hands back whatever was written since the last drain"""
+
+    def __init__(self):
+        self._parts: List[bytes] = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._parts.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data, self._parts = b"".join(self._parts), []
+        return data
+
+
+def _arrow_schema(pa):
+    fields = []
+    for column in TRANSCRIPTS.columns:
+        if isinstance(column.type, DateTime):
+            kind = pa.timestamp("us")
+        elif isinstance(column.type, Integer):
+            kind = pa.int64()
+        elif isinstance(column.type, Float):
+            kind = pa.float64()
+        else:  # text, UUIDs, and JSON documents as JSON text
+            kind = pa.string()
+        fields.append(pa.field(column.name, kind, nullable=column.name != "id"))
+    fields.append(pa.field("speakers", pa.string()))
+    return pa.schema(fields)
+
+
+def _arrow_value(value: Any) -> Any:
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, (dict, list)):
+        return encode_json(_jsonable(value)).decode("utf-8")
+    return value
+
+
+def _jsonable(value: Any) -> Any:
+    if isinstance(value, list):
+        return [_jsonable(v) for v in value]
+    if isinstance(value, dict):
+        return {k: _jsonable(v) for k, v in value.items()}
+    return _plain(value)
+
+
+def parquet_chunks(batches: Iterable[List[Dict[str, Any]]]) -> Iterator[bytes]:
+    """A zstd-compressed Parquet file, one row group per batch; JSON columns are JSON text"""
+    pa = _pyarrow()
+    schema = _arrow_schema(pa)
+    sink = _ChunkSink()
+    writer = pa.parquet.ParquetWriter(pa.PythonFile(sink, mode="w"), schema, compression="zstd")
+    try:
+        for rows in batches:
+            columns = {name: [_arrow_value(row[name]) for row in rows] for name in schema.names}
+            writer.write_table(pa.table(columns, schema=schema))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+async def stream_in_thread(produce: Callable[[], Iterator[bytes]], depth: int = 4) -> AsyncIterator[bytes]:
+    """
+    Run a blocking generator in one worker thread and yield its chunks
+
+    The queue between them is bounded, so a slow client pauses the cursor
+    instead of piling up rows. The generator is closed in its own thread
+    (releasing its session) when the client goes away.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue(depth)
+    stopped = False
+    done = object()
+
+    def put(item):
+        asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+
+    def run():
+        try:
+            with closing(produce()) as chunks:
+                for chunk in chunks:
+                    if stopped:
+                        return
+                    if chunk:
+                        put(chunk)
+            put(done)
+        except Exception as e:
+            logger.error("Bulk export failed: %s", e)
+            if not stopped:
+                put(e)
+
+    worker = loop.run_in_executor(None, run)
+    try:
+        while True:
+            item = await queue.get()
+            if item is done:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stopped = True
+        # Unblock a pending put so the worker sees the flag and closes the cursor
+        while not queue.empty():
+            queue.get_nowait()
+        await asyncio.shield(worker)
+
+
+# -- import -------------------------------------------------------------------
+
+def _column_defaults(table) -> Dict[str, Any]:
+    return {
+        c.name: c.default.arg if c.default is not None and c.default.is_scalar else None
+        for c in table.columns
+    }
+
+
+TRANSCRIPT_DEFAULTS = _column_defaults(TRANSCRIPTS)
+SPEAKER_DEFAULTS = _column_defaults(SPEAKERS)
+
+
+def _coerce(table, name: str, value: Any) -> Any:
+    if value is None:
+        return None
+    column_type = table.c[name].type
+    try:
+        if isinstance(column_type, UUID):
+            return uuid.UUID(str(value))
+        if isinstance(column_type, DateTime):
+            return _naive_utc(value if isinstance(value, datetime) else datetime.fromisoformat(value))
+        if isinstance(column_type, Integer) and not isinstance(value, bool):
+            return int(value)
+        if isinstance(column_type, Float):
+            return float(value)
+    except (TypeError, ValueError) as e:
+        raise RecordError(f"bad {name}: {e}")
+    if isinstance(column_type, JSONB):
+        return value
+    if isinstance(value, (dict, list)):
+        raise RecordError(f"bad {name}: expected a scalar")
+    return value
+
+
+def parse_record(record: Any) -> Dict[str, Any]:
+    """Validate one exported record into a transcript row plus its speaker rows"""
+    if not isinstance(record, dict):
+        raise RecordError("expected a JSON object")
+    if not record.get("audio_url"):
+        raise RecordError("audio_url is required")
+    row = dict(TRANSCRIPT_DEFAULTS)
+    for name in row:
+        if name in record:
+            row[name] = _coerce(TRANSCRIPTS, name, record[name])
+    row["id"] = row["id"] or uuid.uuid4()
+    row["created_at"] = row["created_at"] or datetime.utcnow()
+
+    speakers = record.get("speakers") or []
+    if not isinstance(speakers, list):
+        raise RecordError("speakers must be a list")
+    speaker_rows = []
+    for s in speakers:
+        if not isinstance(s, dict) or not s.get("speaker_label"):
+            raise RecordError("every speaker needs a speaker_label")
+        speaker = dict(SPEAKER_DEFAULTS)
+        for name in speaker:
+            if name in s:
+                speaker[name] = _coerce(SPEAKERS, name, s[name])
+        speaker["id"] = speaker["id"] or uuid.uuid4()
+        speaker["transcript_id"] = row["id"]
+        speaker["created_at"] = speaker["created_at"] or row["created_at"]
+        speaker_rows.append(speaker)
+    row["speakers"] = speaker_rows
+    return row
+
+
+def _csv_field(value: Any) -> str:
+    # Every value is quoted, so only the unquoted empty field means NULL
+    if value is None:
+        return ""
+    if isinstance(value, (dict, list)):
+        value = encode_json(_jsonable(value)).decode("utf-8")
+    elif isinstance(value, datetime):
+        value = value.isoformat()
+    else:
+        value = str(value)
+    return '"' + value.replace('"', '""') + '"'
+
+
+def _copy_rows(connection, table, rows: List[Dict[str, Any]]):
+    """COPY rows into a PostgreSQL table inside the current transaction"""
+    names = [c.name for c in table.columns]
+    buffer = StringIO()
+    for row in rows:
+        buffer.write(",".join(_csv_field(row[name]) for name in names))
+        buffer.write("\n")
+    buffer.seek(0)
+    columns = ", ".join(f'"{name}"' for name in names)
+    cursor = connection.connection.cursor()
+    try:
+        cursor.copy_expert(f'COPY "{table.name}" ({columns}) FROM STDIN WITH (FORMAT csv)', buffer)
+    finally:
+        cursor.close()
+
+
+def write_batch(rows: List[Dict[str, Any]], replace: bool) -> Dict[str, Any]:
+    """Write one batch in one transaction; existing ids are skipped or replaced"""
+    ids = [row["id"] for row in rows]
+    with SessionLocal() as db, db.begin():
+        connection = db.connection()
+        existing: Set[uuid.UUID] = set(
+            connection.execute(select(TRANSCRIPTS.c.id).where(TRANSCRIPTS.c.id.in_(ids))).scalars()
+        )
+        if replace and existing:
+            connection.execute(delete(SPEAKERS).where(SPEAKERS.c.transcript_id.in_(existing)))
+            for table in WORD_TABLES:
+                connection.execute(delete(table).where(table.c.transcript_id.in_(existing)))
+            connection.execute(delete(TRANSCRIPTS).where(TRANSCRIPTS.c.id.in_(existing)))
+        else:
+            rows = [row for row in rows if row["id"] not in existing]
+        speakers = [s for row in rows for s in row["speakers"]]
+        transcripts = [{k: v for k, v in row.items() if k != "speakers"} for row in rows]
+
+        if transcripts:
+            if connection.dialect.name == "postgresql":
+                _copy_rows(connection, TRANSCRIPTS, transcripts)
+                if speakers:
+                    _copy_rows(connection, SPEAKERS, speakers)
+            else:
+                connection.execute(insert(TRANSCRIPTS), transcripts)
+                if speakers:
+                    connection.execute(insert(SPEAKERS), speakers)
+
+    replaced = [str(i) for i in existing] if replace else []
+    return {
+        "inserted": len(transcripts) - len(replaced),
+        "replaced": replaced,
+        "skipped": 0 if replace else len(existing),
+    }
+
+
+async def _lines(chunks: AsyncIterator[bytes], encoding: Optional[str]) -> AsyncIterator[bytes]:
+    """Split a (possibly gzip/deflate-encoded) byte stream into lines"""
+    encoding = (encoding or "identity").strip().lower()
+    if encoding in ("gzip", "x-gzip"):
+        decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    elif encoding == "deflate":
+        decoder = zlib.decompressobj()
+    else:
+        decoder = None
+
+    pending = b""
+    async for chunk in chunks:
+        if decoder is not None:
+            try:
+                chunk = decoder.decompress(chunk)
+            except zlib.error as e:
+                raise RecordError(f"corrupt {encoding} body: {e}")
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        if len(pending) > MAX_LINE_BYTES:
+            raise RecordError(f"line longer than {MAX_LINE_BYTES} bytes")
+        for line in lines:
+            yield line
+    if decoder is not None:
+        pending += decoder.flush()
+    if pending:
+        yield pending
+
+
+async def import_ndjson(
+    chunks: AsyncIterator[bytes],
+    on_conflict: str = "skip",
+    encoding: Optional[str] = None,
+    batch_size: int = IMPORT_BATCH_SIZE,
+) -> Dict[str, Any]:
+    """
+    Import an NDJSON export
+
+    Bad lines are counted and reported (the first MAX_REPORTED_ERRORS)
+    without stopping the import. Returns the counts and the ids of
+    replaced transcripts, whose caches the caller should drop.
+    """
+    replace = on_conflict == "replace"
+    report = {"received": 0, "inserted": 0, "skipped": 0, "replaced": 0, "failed": 0, "errors": []}
+    replaced: List[str] = []
+    batch: Dict[uuid.UUID, Dict[str, Any]] = {}
+    batch_lines: List[int] = []
+
+    def fail(line: int, error: str, count: int = 1):
+        report["failed"] += count
+        if len(report["errors"]) < MAX_REPORTED_ERRORS:
+            report["errors"].append({"line": line, "error": error})
+
+    async def flush():
+        if not batch:
+            return
+        rows = list(batch.values())
+        try:
+            result = await asyncio.to_thread(write_batch, rows, replace)
+        except Exception as e:
+            logger.error("Import batch starting at line %d failed: %s", batch_lines[0], e)
+            fail(batch_lines[0], f"batch of {len(rows)} rows not written: {e}", len(rows))
+        else:
+            report["inserted"] += result["inserted"]
+            report["skipped"] += result["skipped"]
+            report["replaced"] += len(result["replaced"])
+            replaced.extend(result["replaced"])
+        batch.clear()
+        batch_lines.clear()
+
+    number = 0
+    try:
+        async for line in _lines(chunks, encoding):
+            number += 1
+            if not line.strip():
+                continue
+            report["received"] += 1
+            try:
+                row = parse_record(json.loads(line))
+            except ValueError as e:
+                fail(number, str(e))
+                continue
+            if row["id"] in batch:
+                # Repeated id within a batch: the first line wins unless replacing
+                report["replaced" if replace else "skipped"] += 1
+                if not replace:
+                    continue
+            batch[row["id"]] = row
+            batch_lines.append(number)
+            if len(batch) >= batch_size:
+                await flush()
+    except RecordError as e:
+        # Undecodable body: keep what was read so far, report where it stopped
+        fail(number + 1, str(e))
+        report["truncated"] = True
+    await flush()
+
+    for outcome in ("inserted", "skipped", "replaced", "failed"):
+        BULK_ROWS.labels(direction="import", outcome=outcome).inc(report[outcome])
+    report["replaced_ids"] = replaced
+    return report
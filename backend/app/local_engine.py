@@ -0,0 +1,87 @@
+"""
+Offline CPU transcription engine (faster-whisper) run in worker processes
+
+Kept free of app imports so spawned workers start quickly. Produces the
+same result shape as AssemblyAI: ``utterances`` with ms ``start``/``end``
+and per-word ``words``. Whisper does no diarization, so every utterance is
+labelled speaker "A".
+"""
+import importlib.util
+import math
+import os
+import tempfile
+import urllib.parse
+import urllib.request
+from typing import Dict, Optional
+
+_model = None
+_model_key = None
+
+
+def is_available() -> bool:
+    return importlib.util.find_spec("faster_whisper") is not None
+
+
+def _load_model(model_name: str, compute_type: str):
+    global _model, _model_key
+    if _model is None or _model_key != (model_name, compute_type):
+        from faster_whisper import WhisperModel
+
+        _model = WhisperModel(model_name, device="cpu", compute_type=compute_type)
+        _model_key = (model_name, compute_type)
+    return _model
+
+
+def _fetch(audio_url: str) -> str:
+    # The URL comes from the client: never let it name a local file (a path or file://)
+    if urllib.parse.urlsplit(audio_url).scheme not in ("http", "https"):
+        raise ValueError("audio_url must be an http(s) URL")
+    suffix = os.path.splitext(audio_url.split("?")[0])[1] or ".audio"
+    fd, path = tempfile.mkstemp(suffix=suffix)
+    with os.fdopen(fd, "wb") as out, urllib.request.urlopen(audio_url, timeout=60) as response:
+        while True:
+            block = response.read(1 << 16)
+            if not block:
+                break
+            out.write(block)
+    return path
+
+
+def transcribe_file(audio_url: str, model_name: str, compute_type: str, language: Optional[str] = None) -> Dict:
+    """Transcribe an http(s) URL; runs inside a worker process"""
+    model = _load_model(model_name, compute_type)
+    path = _fetch(audio_url)
+    try:
+        segments, info = model.transcribe(path, language=language, word_timestamps=True, vad_filter=True)
+        utterances = []
+        for segment in segments:
+            words = [
+                {
+                    "text": word.word.strip(),
+                    "start": int(word.start * 1000),
+                    "end": int(word.end * 1000),
+                    "confidence": float(word.probability),
+                    "speaker": "A",
+                }
+                for word in segment.words or []
+            ]
+            utterances.append({
+                "speaker": "A",
+                "text": segment.text.strip(),
+                "start": int(segment.start * 1000),
+                "end": int(segment.end * 1000),
+                "confidence": float(math.exp(segment.avg_logprob)),
+                "words": words,
+            })
+    finally:
+        os.unlink(path)
+
+    confidences = [u["confidence"] for u in utterances]
+    return {
+        "status": "completed",
+        "text": " ".join(u["text"] for u in utterances),
+        "utterances": utterances,
+        "confidence": sum(confidences) / len(confidences) if confidences else 0.0,
+        "audio_duration": int(info.duration * 1000),
+        "language_code": info.language,
+    }
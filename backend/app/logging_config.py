@@ -0,0 +1,95 @@
+"""
+Central logging setup: JSON output through a queue-based handler
+"""
+import atexit
+import logging
+import logging.handlers
+import queue
+import sys
+from typing import Dict, Optional
+
+from pythonjsonlogger import jsonlogger
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+JSON_FORMAT = "%(asctime)s %(name)s %(levelname)s %(message)s"
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Let through 1 in N records for high-frequency events.
+
+    Callers opt in per call with ``extra={"sample_rate": N}``; records are
+    counted per (logger, message template) so different events don't share
+    a budget. Records without a sample rate always pass.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._counts: Dict[tuple, int] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rate = getattr(record, "sample_rate", 1)
+        if rate <= 1:
+            return True
+        key = (record.name, record.msg)
+        count = self._counts.get(key, 0)
+        self._counts[key] = count + 1
+        return count % rate == 0
+
+
+def parse_module_levels(spec: str) -> Dict[str, str]:
+    """Parse ``"app.websocket=WARNING,app.storage=DEBUG"`` into a dict"""
+    levels = {}
+    for item in spec.split(","):
+        if "=" not in item:
+            continue
+        name, level = item.split("=", 1)
+        levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def setup_logging(level: str = "INFO", module_levels: Optional[Dict[str, str]] = None, fmt: str = "json"):
+    """
+    Configure the root logger once for the whole process.
+
+    Handlers run on a background QueueListener thread so request handlers
+    only pay for enqueuing a record, never for formatting or stream I/O.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    if fmt == "json":
+        formatter = jsonlogger.JsonFormatter(JSON_FORMAT, json_ensure_ascii=False)
+    else:
+        formatter = logging.Formatter(TEXT_FORMAT)
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter())
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level.upper())
+
+    for name, module_level in (module_levels or {}).items():
+        logging.getLogger(name).setLevel(module_level)
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    """Flush queued records and stop the listener thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -1,13 +1,13 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Response
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 import logging
 
-# Configure logging for better performance monitoring
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+from . import config  # noqa: F401 - configures logging on import
+from .logging_config import shutdown_logging
+from .compression import CompressionMiddleware
+from .tenants import TenantMiddleware
+
 logger = logging.getLogger(__name__)
 
 # Create FastAPI app with optimized settings
@@ -17,6 +17,9 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# API keys -> tenants; inside CORS so preflights and 401s carry CORS headers
+app.add_middleware(TenantMiddleware)
+
 # CORS configuration - allow all origins for development
 app.add_middleware(
     CORSMiddleware,
@@ -26,6 +29,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# zstd/br/gzip for JSON and subtitle bodies, negotiated per request
+app.add_middleware(CompressionMiddleware)
+
 @app.on_event("startup")
 async def startup_event():
     logger.info("🚀 Starting Speech-to-Text API...")
@@ -34,11 +40,41 @@ async def startup_event():
     from .api import router as api_router
     app.include_router(api_router, prefix="/api")
     
+    # Upcoming partitions and archiving of old transcripts
+    from .retention import start_retention
+    start_retention()
+    from .cleanup import start_gc_schedule
+    start_gc_schedule()
+    # Batched writes of per-tenant usage
+    from .tenants import meter
+    meter.start()
+    from .replicas import read_router
+    read_router.start()
+    
     logger.info("⚡ Server ready for connections!")
 
 @app.on_event("shutdown")
 async def shutdown_event():
     logger.info("🛑 Shutting down Speech-to-Text API...")
+    from .retention import stop_retention
+    await stop_retention()
+    from .cleanup import stop_cleanup
+    await stop_cleanup()
+    from .tenants import meter
+    await meter.stop()
+    from .replicas import read_router
+    await read_router.stop()
+    from .backends import shutdown_backends
+    await shutdown_backends()
+    from .workers import shutdown_workers
+    shutdown_workers()
+    from .cache import response_cache
+    await response_cache.aclose()
+    from .storage import shutdown_storage
+    await shutdown_storage()
+    from .tracing import shutdown_tracing
+    shutdown_tracing()
+    shutdown_logging()
 
 @app.get("/")
 async def root():
@@ -50,7 +86,18 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "service": "speech-to-text-api"}
+    from .replicas import read_router
+    health = {"status": "healthy", "service": "speech-to-text-api"}
+    if read_router.replicas:
+        health["read_replicas"] = read_router.snapshot()
+    return health
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus scrape endpoint"""
+    from .metrics import render_latest
+    payload, content_type = render_latest()
+    return Response(content=payload, media_type=content_type)
 
 # WebSocket endpoint
 @app.websocket("/ws")
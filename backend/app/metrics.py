@@ -0,0 +1,217 @@
+"""
+Prometheus metrics and a small timing API for instrumenting hot paths
+"""
+import time
+from contextlib import contextmanager
+from functools import wraps
+import asyncio
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+
+# Buckets tuned for the latencies we actually see: sub-millisecond DB reads
+# up to multi-minute transcription jobs.
+FAST_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+SLOW_BUCKETS = (0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1200, 2400, 3600)
+BYTES_BUCKETS = tuple(2 ** n for n in range(10, 28, 2))  # 1KB .. 128MB
+POLL_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+# Storage
+UPLOAD_BYTES = Histogram(
+    "stt_upload_bytes", "Size of uploaded audio files", buckets=BYTES_BUCKETS
+)
+UPLOAD_SECONDS = Histogram(
+    "stt_upload_seconds", "Audio upload latency", ["method"], buckets=FAST_BUCKETS + (10.0, 30.0, 60.0)
+)
+PREPROCESS_SECONDS = Histogram(
+    "stt_preprocess_seconds", "Audio preprocessing time before upload", buckets=SLOW_BUCKETS
+)
+PREPROCESS_BYTES_SAVED = Counter(
+    "stt_preprocess_bytes_saved_total", "Upload bytes saved by audio preprocessing"
+)
+PEAKS_SECONDS = Histogram(
+    "stt_peaks_seconds", "Time to build the waveform peaks of stored audio", buckets=SLOW_BUCKETS
+)
+
+# AssemblyAI
+ASSEMBLY_SUBMIT_SECONDS = Histogram(
+    "stt_assembly_submit_seconds", "Latency of the transcription submit request", buckets=FAST_BUCKETS
+)
+ASSEMBLY_QUEUE_SECONDS = Histogram(
+    "stt_assembly_queue_seconds", "Time a job spent queued upstream", buckets=SLOW_BUCKETS
+)
+ASSEMBLY_COMPLETE_SECONDS = Histogram(
+    "stt_assembly_time_to_complete_seconds", "Time from submit to completed/error", buckets=SLOW_BUCKETS
+)
+ASSEMBLY_POLLS = Histogram(
+    "stt_assembly_polls_per_job", "Number of status polls per job", buckets=POLL_BUCKETS
+)
+ASSEMBLY_JOBS = Counter(
+    "stt_assembly_jobs_total", "Transcription jobs by final status", ["status"]
+)
+
+BACKEND_ROUTED = Counter(
+    "stt_backend_routed_total", "Transcription jobs routed to each backend", ["backend", "reason"]
+)
+BACKEND_IN_FLIGHT = Gauge(
+    "stt_backend_jobs_in_flight", "Transcription jobs running on each backend", ["backend"]
+)
+UPSTREAM_RETRIES = Counter(
+    "stt_upstream_retries_total", "Retried upstream calls", ["operation"]
+)
+BREAKER_STATE = Gauge(
+    "stt_circuit_breaker_state", "Circuit breaker state (0=closed, 1=half-open, 2=open)", ["name"]
+)
+
+# Database
+DB_QUERY_SECONDS = Histogram(
+    "stt_db_query_seconds", "Database query latency", ["route"], buckets=FAST_BUCKETS
+)
+DB_READ_SESSIONS = Counter(
+    "stt_db_read_sessions_total", "Read-only sessions by target (replica/primary) and reason", ["target", "reason"]
+)
+REPLICA_LAG_SECONDS = Gauge(
+    "stt_db_replica_lag_seconds", "Replication lag of each read replica at its last check", ["replica"]
+)
+REPLICA_HEALTHY = Gauge(
+    "stt_db_replica_healthy", "1 if the read replica passed its last health check", ["replica"]
+)
+
+# WebSocket
+WEBSOCKET_CONNECTIONS = Gauge(
+    "stt_websocket_connections", "Currently open WebSocket connections"
+)
+WEBSOCKET_SEND_QUEUE = Gauge(
+    "stt_websocket_send_queue_depth", "WebSocket messages waiting to be written"
+)
+
+# Rate limiting / admission control
+REJECTED_REQUESTS = Counter(
+    "stt_rejected_requests_total", "Requests rejected by rate limiting or admission control", ["reason"]
+)
+ADMISSION_IN_USE = Gauge(
+    "stt_admission_slots_in_use", "Admission slots currently held", ["gate"]
+)
+SCHEDULER_QUEUE_DEPTH = Gauge(
+    "stt_scheduler_queue_depth", "Transcription jobs waiting for a slot", ["priority"]
+)
+SCHEDULER_WAIT_SECONDS = Histogram(
+    "stt_scheduler_wait_seconds", "Time transcription jobs waited for a slot", ["priority"],
+    buckets=(0.01, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 1800, 3600)
+)
+
+# Tenants
+TENANT_AUDIO_SECONDS = Counter(
+    "stt_tenant_audio_seconds_total", "Audio seconds transcribed per tenant", ["tenant"]
+)
+USAGE_FLUSH_SECONDS = Histogram(
+    "stt_usage_flush_seconds", "Time to write batched usage counters", buckets=FAST_BUCKETS
+)
+
+# Bulk export / import
+BULK_ROWS = Counter(
+    "stt_bulk_rows_total", "Transcripts exported or imported in bulk", ["direction", "outcome"]
+)
+
+# Cleanup
+STORAGE_OBJECTS_DELETED = Counter(
+    "stt_storage_objects_deleted_total", "Audio objects removed with their transcript or as orphans",
+    ["reason", "outcome"]
+)
+
+# Retention
+ARCHIVE_TRANSCRIPTS = Counter(
+    "stt_archive_transcripts_total", "Transcripts moved to cold storage (archived) or read back (rehydrated)",
+    ["action"]
+)
+
+# CPU offload
+CPU_TASK_SECONDS = Histogram(
+    "stt_cpu_task_seconds", "CPU-bound task time including pool wait", ["task"], buckets=FAST_BUCKETS
+)
+CPU_TASK_TIMEOUTS = Counter(
+    "stt_cpu_task_timeouts_total", "CPU-bound tasks abandoned after their timeout", ["task"]
+)
+
+# Caches
+CACHE_REQUESTS = Counter(
+    "stt_cache_requests_total", "Cache lookups by cache and result (hit/miss)", ["cache", "result"]
+)
+CACHE_BYTES = Gauge(
+    "stt_cache_bytes", "Bytes held by size-bounded caches", ["cache"]
+)
+
+# HTTP responses
+COMPRESSION_BYTES = Counter(
+    "stt_http_compression_bytes_total", "Response bytes before (original) and after (sent) compression",
+    ["encoding", "stage"]
+)
+
+# Subtitles
+SUBTITLE_RENDER_SECONDS = Histogram(
+    "stt_subtitle_render_seconds", "Subtitle rendering time", ["format"], buckets=FAST_BUCKETS
+)
+
+
+def _child(metric, labels: dict):
+    return metric.labels(**labels) if labels else metric
+
+
+@contextmanager
+def timer(histogram, **labels):
+    """Observe the wall-clock duration of the enclosed block on a histogram"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _child(histogram, labels).observe(time.perf_counter() - start)
+
+
+def timed(histogram, **labels):
+    """Decorator version of timer() for sync and async functions"""
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with timer(histogram, **labels):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with timer(histogram, **labels):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def observe(histogram, value: float, **labels):
+    """Record a single value on a histogram"""
+    _child(histogram, labels).observe(value)
+
+
+@contextmanager
+def track_db(route: str):
+    """Time a database query for the given route"""
+    with timer(DB_QUERY_SECONDS, route=route):
+        yield
+
+
+@contextmanager
+def in_flight(gauge):
+    """Increment a gauge for the duration of the enclosed block"""
+    gauge.inc()
+    try:
+        yield
+    finally:
+        gauge.dec()
+
+
+def render_latest():
+    """Return the Prometheus exposition payload and its content type"""
+    return generate_latest(), CONTENT_TYPE_LATEST
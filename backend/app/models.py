@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Text, DateTime, Integer, Float, Boolean
+from sqlalchemy import Column, String, Text, DateTime, Integer, Float, Boolean, LargeBinary
 from sqlalchemy.dialects.postgresql import UUID, JSONB
 from datetime import datetime
 import uuid
@@ -15,12 +15,16 @@ class Transcript(Base):
     speakers_count = Column(Integer, default=0)
     confidence_score = Column(Float)
     processing_time = Column(Float)  # Time taken to process
+    stage_timings = Column(JSONB)  # Per-stage durations: upload, submit, queue, processing, persist
     audio_duration = Column(Float)  # Duration in seconds
+    preprocessing = Column(JSONB)  # Preprocessing report incl. offset_map onto the original recording
     language_detected = Column(String(10))
     status = Column(String(20), default="processing")  # processing, completed, error
     error_message = Column(Text)
     created_at = Column(DateTime, default=datetime.utcnow)
     completed_at = Column(DateTime)
+    archive_key = Column(Text)  # Cold-storage object holding utterances/diarized_transcript once archived
+    tenant_id = Column(UUID(as_uuid=True), index=True)  # Owner when created with an API key
 
 class Speaker(Base):
     __tablename__ = "speakers"
@@ -32,3 +36,51 @@ class Speaker(Base):
     total_duration = Column(Float, default=0.0)  # Total speaking time
     confidence_score = Column(Float)
     created_at = Column(DateTime, default=datetime.utcnow)
+
+class TranscriptWordIndex(Base):
+    __tablename__ = "transcript_word_index"
+    
+    transcript_id = Column(UUID(as_uuid=True), primary_key=True)
+    data = Column(LargeBinary, nullable=False)  # Packed word index, see word_index.py
+    words = Column(Integer, default=0)
+    terms = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class TranscriptTerm(Base):
+    __tablename__ = "transcript_terms"
+    
+    term = Column(String(64), primary_key=True)  # Lowercased word
+    transcript_id = Column(UUID(as_uuid=True), primary_key=True, index=True)
+    hits = Column(Integer, nullable=False)
+    first_ms = Column(Integer)  # Start of the first occurrence
+
+class Tenant(Base):
+    __tablename__ = "tenants"
+    
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    name = Column(String(100), nullable=False, unique=True)
+    max_concurrent_jobs = Column(Integer)  # Queued plus running jobs; None = no limit
+    monthly_minutes = Column(Float)  # Audio minutes per calendar month (UTC); None = no limit
+    active = Column(Boolean, nullable=False, default=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class ApiKey(Base):
+    __tablename__ = "api_keys"
+    
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    tenant_id = Column(UUID(as_uuid=True), nullable=False, index=True)
+    key_hash = Column(String(64), nullable=False, unique=True)  # SHA-256 of the key; the key itself isn't stored
+    prefix = Column(String(16), nullable=False)  # First characters, to tell keys apart
+    name = Column(String(100))
+    created_at = Column(DateTime, default=datetime.utcnow)
+    revoked_at = Column(DateTime)
+
+class TenantUsage(Base):
+    __tablename__ = "tenant_usage"
+    
+    tenant_id = Column(UUID(as_uuid=True), primary_key=True)
+    month = Column(String(7), primary_key=True)  # YYYY-MM (UTC)
+    audio_seconds = Column(Float, nullable=False, default=0.0)
+    jobs = Column(Integer, nullable=False, default=0)
+    requests = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
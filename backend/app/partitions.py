@@ -0,0 +1,161 @@
+"""
+Monthly range partitions of transcripts and speakers on created_at (PostgreSQL)
+
+``create_tables.py --partitioned`` creates both tables partitioned.
+``create_tables.py --convert`` rebuilds existing tables in place, in one
+transaction. The retention loop then keeps PARTITION_MONTHS_AHEAD months of
+partitions created ahead of time. A DEFAULT partition takes anything
+outside them, so inserts never fail for want of a partition. Old months can
+be detached or dropped as whole tables, so vacuum and backups only touch
+recent data.
+
+PostgreSQL needs the partition key in every unique index, so the primary
+keys become (id, created_at). Ids are UUID4s and stay unique in practice;
+lookups by id probe each partition's primary-key index.
+"""
+import logging
+from datetime import date, datetime
+from typing import List, Optional
+
+from sqlalchemy import Column, Index, MetaData, PrimaryKeyConstraint, Table, text
+
+from .config import PARTITION_MONTHS_AHEAD
+from .database import engine as default_engine
+from .models import Speaker, Transcript
+
+logger = logging.getLogger(__name__)
+
+TABLES = (Transcript.__table__, Speaker.__table__)
+# Indexes created on the partitioned parent (and so on every partition)
+INDEXES = {"transcripts": ("created_at",), "speakers": ("transcript_id",)}
+
+
+def month_start(day: date) -> date:
+    return date(day.year, day.month, 1)
+
+
+def add_months(month: date, count: int) -> date:
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_p{month:%Y_%m}"
+
+
+def is_partitioned(connection, table: str) -> bool:
+    return connection.execute(text(
+        "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+        "WHERE c.relname = :table AND pg_table_is_visible(c.oid)"
+    ), {"table": table}).first() is not None
+
+
+def _partitions(connection, table: str) -> set:
+    return set(connection.execute(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "JOIN pg_class p ON p.oid = i.inhparent WHERE p.relname = :table AND pg_table_is_visible(p.oid)"
+    ), {"table": table}).scalars())
+
+
+def _partitioned_table(table: Table) -> Table:
+    """Copy of a model table with (id, created_at) as primary key, partitioned by range of created_at"""
+    columns = [
+        Column(c.name, c.type, nullable=c.nullable and c.name not in ("id", "created_at"))
+        for c in table.columns
+    ]
+    indexes = [Index(f"ix_{table.name}_{name}", name) for name in INDEXES.get(table.name, ())]
+    return Table(
+        table.name, MetaData(), *columns, *indexes,
+        PrimaryKeyConstraint("id", "created_at", name=f"pk_{table.name}"),
+        postgresql_partition_by="RANGE (created_at)",
+    )
+
+
+def _create_partitions(connection, table: str, first: date, last: date) -> List[str]:
+    """Monthly partitions for first..last (inclusive) that don't exist yet, plus the DEFAULT one"""
+    existing = _partitions(connection, table)
+    created = []
+    month = first
+    while month <= last:
+        name = partition_name(table, month)
+        if name not in existing:
+            try:
+                # A savepoint, so one clash with rows already in DEFAULT doesn't abort the rest
+                with connection.begin_nested():
+                    connection.execute(text(
+                        f'CREATE TABLE IF NOT EXISTS "{name}" PARTITION OF "{table}" '
+                        f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{add_months(month, 1):%Y-%m-%d}')"
+                    ))
+                created.append(name)
+            except Exception as e:
+                logger.warning("Partition %s not created (rows for that month already in the default "
+                               "partition?): %s", name, e)
+        month = add_months(month, 1)
+    default = f"{table}_default"
+    if default not in existing:
+        connection.execute(text(f'CREATE TABLE IF NOT EXISTS "{default}" PARTITION OF "{table}" DEFAULT'))
+        created.append(default)
+    return created
+
+
+def ensure_partitions(engine=default_engine, months_ahead: int = PARTITION_MONTHS_AHEAD,
+                      today: Optional[date] = None) -> List[str]:
+    """Create this month's and the next ``months_ahead`` months' partitions where missing"""
+    if engine.dialect.name != "postgresql":
+        return []
+    first = month_start(today or datetime.utcnow().date())
+    created = []
+    with engine.begin() as connection:
+        for table in TABLES:
+            if is_partitioned(connection, table.name):
+                created += _create_partitions(connection, table.name, first, add_months(first, months_ahead))
+    if created:
+        logger.info("Created partitions: %s", ", ".join(created))
+    return created
+
+
+def create_partitioned_tables(engine=default_engine, months_ahead: int = PARTITION_MONTHS_AHEAD):
+    """Create transcripts and speakers as partitioned tables (they must not exist yet)"""
+    first = month_start(datetime.utcnow().date())
+    with engine.begin() as connection:
+        for table in TABLES:
+            _partitioned_table(table).create(connection)
+            _create_partitions(connection, table.name, first, add_months(first, months_ahead))
+
+
+def convert_to_partitioned(engine=default_engine, months_ahead: int = PARTITION_MONTHS_AHEAD):
+    """
+    Rebuild existing plain tables as partitioned ones, keeping every row
+
+    Runs in one transaction holding an exclusive lock on both tables while
+    rows are copied, so schedule it for a quiet period. Rows without a
+    created_at get the current time.
+    """
+    this_month = month_start(datetime.utcnow().date())
+    with engine.begin() as connection:
+        for table in TABLES:
+            name = table.name
+            if is_partitioned(connection, name):
+                logger.info("%s is already partitioned", name)
+                continue
+            legacy = f"{name}_unpartitioned"
+            connection.execute(text(f'ALTER TABLE "{name}" RENAME TO "{legacy}"'))
+            _partitioned_table(table).create(connection)
+
+            oldest = connection.execute(text(f'SELECT min(created_at) FROM "{legacy}"')).scalar()
+            first = min(month_start(oldest.date()), this_month) if oldest else this_month
+            _create_partitions(connection, name, first, add_months(this_month, months_ahead))
+
+            # Columns added to the model since the table was created start out NULL
+            present = set(connection.execute(text(
+                "SELECT column_name FROM information_schema.columns WHERE table_name = :table"
+            ), {"table": legacy}).scalars())
+            columns = [f'"{c.name}"' for c in table.columns if c.name in present]
+            selected = [
+                "COALESCE(created_at, now() AT TIME ZONE 'utc')" if c == '"created_at"' else c for c in columns
+            ]
+            copied = connection.execute(text(
+                f'INSERT INTO "{name}" ({", ".join(columns)}) SELECT {", ".join(selected)} FROM "{legacy}"'
+            )).rowcount
+            connection.execute(text(f'DROP TABLE "{legacy}"'))
+            logger.info("Partitioned %s: %d rows copied", name, copied)
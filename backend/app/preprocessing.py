@@ -0,0 +1,328 @@
+"""
+Server-side audio preprocessing before upload
+
+Decodes the upload block by block, downmixes to mono, resamples to
+PREPROCESS_SAMPLE_RATE, trims leading/trailing silence and re-encodes to a
+compact codec. Only one block is held as floats at a time; the processed
+PCM is spooled to disk past a few MB before the final encode.
+
+The processed audio is what gets stored, played back and transcribed, so
+transcript times, waveform peaks and seek positions all share its
+timeline. Trimming shifts it against the original recording; each run's
+report carries an offset map back onto the original for clients that
+still hold it. The original is uploaded instead when nothing would be
+gained: no speech was found, or the processed audio isn't smaller.
+"""
+import asyncio
+import io
+import logging
+import shutil
+import subprocess
+import tempfile
+import threading
+import wave
+from typing import Dict, Iterator, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from .audio import AudioDecodeError
+from .config import (
+    PREPROCESS_AUDIO,
+    PREPROCESS_CODEC,
+    PREPROCESS_SAMPLE_RATE,
+    SILENCE_THRESHOLD_DB,
+)
+from .metrics import PREPROCESS_BYTES_SAVED, PREPROCESS_SECONDS, timer
+
+logger = logging.getLogger(__name__)
+
+BLOCK_SECONDS = 5
+FRAME_SECONDS = 0.02
+SILENCE_PADDING_SECONDS = 0.25  # keep a little room around speech
+SPOOL_MAX_BYTES = 8 * 1024 * 1024
+CODECS = {
+    "flac": (".flac", ["-c:a", "flac", "-f", "flac"]),
+    "opus": (".ogg", ["-c:a", "libopus", "-b:a", "24k", "-application", "voip", "-f", "ogg"]),
+    "wav": (".wav", None),
+}
+
+
+class PreprocessResult(NamedTuple):
+    data: bytes
+    file_extension: str
+    report: Dict
+
+
+def _pump(source, sink, block_size: int = 1 << 16):
+    """Copy a file-like into a pipe on a helper thread (avoids pipe deadlocks)"""
+    try:
+        while True:
+            chunk = source.read(block_size)
+            if not chunk:
+                break
+            sink.write(chunk)
+    except BrokenPipeError:
+        pass
+    finally:
+        sink.close()
+
+
+def _iter_wav_blocks(audio_data: bytes) -> Iterator[Tuple[np.ndarray, int]]:
+    with wave.open(io.BytesIO(audio_data), "rb") as wav:
+        if wav.getsampwidth() != 2:
+            raise AudioDecodeError("Unsupported WAV sample width")
+        channels = wav.getnchannels()
+        rate = wav.getframerate()
+        block_frames = rate * BLOCK_SECONDS
+        while True:
+            raw = wav.readframes(block_frames)
+            if not raw:
+                break
+            block = np.frombuffer(raw, dtype="<i2").astype(np.float32)
+            if channels > 1:
+                block = block[: len(block) - len(block) % channels].reshape(-1, channels).mean(axis=1)
+            yield block, rate
+
+
+def _iter_ffmpeg_blocks(audio_data: bytes, rate: int) -> Iterator[Tuple[np.ndarray, int]]:
+    ffmpeg = shutil.which("ffmpeg")
+    if not ffmpeg:
+        raise AudioDecodeError("ffmpeg is required to decode this format")
+    proc = subprocess.Popen(
+        [ffmpeg, "-nostdin", "-loglevel", "error", "-i", "pipe:0", "-f", "s16le", "-ac", "1", "-ar", str(rate), "pipe:1"],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+    )
+    feeder = threading.Thread(target=_pump, args=(io.BytesIO(audio_data), proc.stdin), daemon=True)
+    feeder.start()
+    block_bytes = rate * BLOCK_SECONDS * 2
+    try:
+        while True:
+            raw = proc.stdout.read(block_bytes)
+            if not raw:
+                break
+            yield np.frombuffer(raw[: len(raw) - len(raw) % 2], dtype="<i2").astype(np.float32), rate
+    finally:
+        proc.stdout.close()
+        feeder.join()
+        if proc.wait() != 0:
+            raise AudioDecodeError("ffmpeg failed to decode audio")
+
+
+def iter_mono_blocks(audio_data: bytes, file_extension: str, rate: int) -> Iterator[Tuple[np.ndarray, int]]:
+    """Yield (float32 mono block, sample rate) without decoding the whole file at once"""
+    if file_extension.lower() == ".wav":
+        try:
+            with wave.open(io.BytesIO(audio_data), "rb") as wav:
+                if wav.getsampwidth() == 2:
+                    yield from _iter_wav_blocks(audio_data)
+                    return
+        except (wave.Error, EOFError):
+            pass
+    yield from _iter_ffmpeg_blocks(audio_data, rate)
+
+
+class StreamingResampler:
+    """
+    Block-wise resampler: boxcar low-pass (when downsampling) followed by
+    linear interpolation, with filter history and fractional read position
+    carried across blocks so block edges leave no seams.
+    """
+
+    def __init__(self, in_rate: int, out_rate: int):
+        self.step = in_rate / out_rate
+        self.taps = max(1, int(round(self.step))) if self.step > 1 else 1
+        self.kernel = np.ones(self.taps, dtype=np.float32) / self.taps
+        self.history = np.zeros(self.taps - 1, dtype=np.float32)
+        self.tail: Optional[np.ndarray] = None
+        self.pos = 0.0
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        if self.step == 1:
+            return block
+        if self.taps > 1:
+            filtered = np.convolve(np.concatenate([self.history, block]), self.kernel, mode="valid")
+            self.history = np.concatenate([self.history, block])[-(self.taps - 1):]
+            block = filtered.astype(np.float32)
+
+        x = block if self.tail is None else np.concatenate([self.tail, block])
+        last = len(x) - 1
+        if last < self.pos:
+            self.tail = x[-1:]
+            self.pos -= last
+            return np.zeros(0, dtype=np.float32)
+        positions = np.arange(self.pos, last + 1e-9, self.step)
+        out = np.interp(positions, np.arange(len(x)), x).astype(np.float32)
+        self.pos = positions[-1] + self.step - last
+        self.tail = x[-1:]
+        return out
+
+
+def _voiced_frames(block: np.ndarray, frame: int, threshold: float) -> np.ndarray:
+    n = len(block) // frame
+    if n == 0:
+        return np.zeros(0, dtype=bool)
+    frames = block[: n * frame].reshape(n, frame)
+    return np.sqrt(np.mean(frames * frames, axis=1)) >= threshold
+
+
+def _encode(spool, samples: int, rate: int, codec: str) -> Tuple[bytes, str]:
+    extension, args = CODECS.get(codec, CODECS["wav"])
+    ffmpeg = shutil.which("ffmpeg") if args else None
+    if args and not ffmpeg:
+        logger.warning("ffmpeg not found, storing preprocessed audio as WAV instead of %s", codec)
+        extension, args = CODECS["wav"]
+
+    spool.seek(0)
+    if not args:
+        buffer = io.BytesIO()
+        with wave.open(buffer, "wb") as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(2)
+            wav.setframerate(rate)
+            remaining = samples * 2
+            while remaining > 0:
+                chunk = spool.read(min(remaining, 1 << 20))
+                if not chunk:
+                    break
+                wav.writeframes(chunk)
+                remaining -= len(chunk)
+        return buffer.getvalue(), extension
+
+    proc = subprocess.Popen(
+        [ffmpeg, "-nostdin", "-loglevel", "error", "-f", "s16le", "-ar", str(rate), "-ac", "1",
+         "-i", "pipe:0", *args, "pipe:1"],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+    )
+    feeder = threading.Thread(target=_pump, args=(_LimitedReader(spool, samples * 2), proc.stdin), daemon=True)
+    feeder.start()
+    data = proc.stdout.read()
+    feeder.join()
+    if proc.wait() != 0:
+        raise AudioDecodeError(f"ffmpeg failed to encode {codec}")
+    return data, extension
+
+
+class _LimitedReader:
+    def __init__(self, source, limit: int):
+        self.source = source
+        self.remaining = limit
+
+    def read(self, size: int) -> bytes:
+        if self.remaining <= 0:
+            return b""
+        chunk = self.source.read(min(size, self.remaining))
+        self.remaining -= len(chunk)
+        return chunk
+
+
+def preprocess_audio(audio_data: bytes, file_extension: str = ".wav",
+                     sample_rate: int = PREPROCESS_SAMPLE_RATE, codec: str = PREPROCESS_CODEC,
+                     threshold_db: float = SILENCE_THRESHOLD_DB) -> Optional[PreprocessResult]:
+    """
+    Downmix, resample, trim and re-encode ``audio_data``; CPU-bound, run it off the event loop
+
+    Returns None when the original should be kept: it is all silence, or
+    the processed audio is no smaller.
+    """
+    threshold = 32768.0 * 10 ** (threshold_db / 20)
+    frame = max(1, int(FRAME_SECONDS * sample_rate))
+    padding = frame * int(round(SILENCE_PADDING_SECONDS / FRAME_SECONDS))  # whole frames
+
+    resampler: Optional[StreamingResampler] = None
+    source_rate = sample_rate
+    input_samples = 0
+    pending = np.zeros(0, dtype=np.float32)  # output samples not yet framed
+    lead = np.zeros(0, dtype=np.float32)     # recent silence kept as padding before speech starts
+    trimmed_start = 0                         # output samples dropped before the first voiced frame
+    written = 0                               # output samples written to the spool
+    last_voiced_end = 0                       # spool position just past the last voiced frame
+    started = False
+
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES) as spool:
+        for block, rate in iter_mono_blocks(audio_data, file_extension, sample_rate):
+            if resampler is None:
+                source_rate = rate
+                resampler = StreamingResampler(rate, sample_rate)
+            input_samples += len(block)
+            out = np.concatenate([pending, resampler.process(block)])
+            usable = len(out) - len(out) % frame
+            out, pending = out[:usable], out[usable:]
+            if not usable:
+                continue
+
+            voiced = _voiced_frames(out, frame, threshold)
+            if not started:
+                hits = np.flatnonzero(voiced)
+                if len(hits) == 0:
+                    lead = np.concatenate([lead, out])[-padding:] if padding else lead
+                    trimmed_start += usable
+                    continue
+                first = hits[0] * frame
+                head = np.concatenate([lead, out[:first]])[-padding:] if padding else out[:0]
+                trimmed_start += first - len(head)
+                out = np.concatenate([head, out[first:]])
+                voiced = np.concatenate([np.zeros(len(head) // frame, dtype=bool), voiced[hits[0]:]])
+                started = True
+
+            hits = np.flatnonzero(voiced)
+            if len(hits):
+                last_voiced_end = written + (hits[-1] + 1) * frame
+            spool.write(np.clip(out, -32768, 32767).astype("<i2").tobytes())
+            written += len(out)
+
+        if resampler is None:
+            raise AudioDecodeError("No audio samples decoded")
+
+        if not started:
+            logger.info("No speech above %.0f dB, keeping the original audio", threshold_db)
+            return None
+        kept = min(written, last_voiced_end + padding)
+        data, extension = _encode(spool, kept, sample_rate, codec)
+
+    if len(data) >= len(audio_data):
+        logger.info("Preprocessed audio is no smaller (%d -> %d bytes), keeping the original",
+                    len(audio_data), len(data))
+        return None
+
+    original_ms = int(input_samples * 1000 / source_rate)
+    start_ms = int(trimmed_start * 1000 / sample_rate)
+    kept_ms = int(kept * 1000 / sample_rate)
+    report = {
+        "original_bytes": len(audio_data),
+        "processed_bytes": len(data),
+        "bytes_saved": len(audio_data) - len(data),
+        "original_duration": original_ms / 1000.0,
+        "processed_duration": kept_ms / 1000.0,
+        "trimmed_start": start_ms / 1000.0,
+        "trimmed_end": max(0, original_ms - start_ms - kept_ms) / 1000.0,
+        "sample_rate": sample_rate,
+        "codec": extension.lstrip("."),
+        # [processed ms, original ms] anchors; times map piecewise-linearly between them.
+        # Transcript times stay on the processed (stored) timeline.
+        "offset_map": [[0, start_ms]],
+    }
+    return PreprocessResult(data, extension, report)
+
+
+async def maybe_preprocess(audio_data: bytes, file_extension: str,
+                           requested: Optional[bool] = None) -> PreprocessResult:
+    """
+    Preprocess when enabled (PREPROCESS_AUDIO or a per-request flag).
+
+    Runs in a worker thread. The original bytes are returned unchanged with
+    an empty report when preprocessing fails or gains nothing.
+    """
+    enabled = PREPROCESS_AUDIO if requested is None else requested
+    if not enabled:
+        return PreprocessResult(audio_data, file_extension, {})
+    try:
+        with timer(PREPROCESS_SECONDS):
+            result = await asyncio.to_thread(preprocess_audio, audio_data, file_extension)
+    except (AudioDecodeError, OSError, ValueError) as e:
+        logger.warning("Audio preprocessing skipped: %s", e)
+        return PreprocessResult(audio_data, file_extension, {})
+    if result is None:
+        return PreprocessResult(audio_data, file_extension, {})
+    PREPROCESS_BYTES_SAVED.inc(result.report["bytes_saved"])
+    logger.info("Preprocessed audio: %d -> %d bytes", result.report["original_bytes"], result.report["processed_bytes"])
+    return result
@@ -0,0 +1,138 @@
+"""
+Per-client token-bucket rate limiting and global admission control
+"""
+import asyncio
+import math
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from fastapi import HTTPException, Request
+from starlette.requests import HTTPConnection
+
+from .config import (
+    ADMISSION_RETRY_AFTER,
+    ADMISSION_TIMEOUT,
+    MAX_CONCURRENT_UPLOADS,
+    RATE_LIMIT_REQUESTS,
+    RATE_LIMIT_WINDOW,
+)
+from .metrics import ADMISSION_IN_USE, REJECTED_REQUESTS
+
+# Idle buckets are evicted least-recently-used first past this many clients
+MAX_TRACKED_CLIENTS = 10000
+
+
+class RateLimited(Exception):
+    """Raised when a client or the server is over its limit"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    __slots__ = ("capacity", "rate", "tokens", "updated")
+
+    def __init__(self, capacity: int, rate: float):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def take(self) -> float:
+        """Take one token; return 0 if allowed, else seconds until one is available"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class RateLimiter:
+    """RATE_LIMIT_REQUESTS per RATE_LIMIT_WINDOW seconds for each client key"""
+
+    def __init__(self, requests: int, window: int, max_clients: int = MAX_TRACKED_CLIENTS):
+        self.capacity = requests
+        self.rate = requests / window
+        self.max_clients = max_clients
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+
+    def check(self, key: str, scope: str):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(self.capacity, self.rate)
+            self._buckets[key] = bucket
+            if len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+
+        wait = bucket.take()
+        if wait > 0:
+            REJECTED_REQUESTS.labels(reason=f"rate_limit_{scope}").inc()
+            raise RateLimited("Rate limit exceeded", wait)
+
+
+class AdmissionGate:
+    """Caps a class of work server-wide; callers wait briefly, then get rejected"""
+
+    def __init__(self, name: str, limit: int, timeout: float = ADMISSION_TIMEOUT):
+        self.name = name
+        self.timeout = timeout
+        self._semaphore = asyncio.Semaphore(limit)
+
+    @asynccontextmanager
+    async def slot(self, block: bool = False):
+        """Hold a slot; ``block`` waits as long as it takes (for work that was already accepted)"""
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=None if block else self.timeout)
+        except asyncio.TimeoutError:
+            REJECTED_REQUESTS.labels(reason=f"admission_{self.name}").inc()
+            raise RateLimited(f"Server busy: too many concurrent {self.name}", ADMISSION_RETRY_AFTER)
+        ADMISSION_IN_USE.labels(gate=self.name).inc()
+        try:
+            yield
+        finally:
+            ADMISSION_IN_USE.labels(gate=self.name).dec()
+            self._semaphore.release()
+
+
+limiter = RateLimiter(RATE_LIMIT_REQUESTS, RATE_LIMIT_WINDOW)
+upload_gate = AdmissionGate("uploads", MAX_CONCURRENT_UPLOADS)
+# Transcription jobs are capped by scheduler.scheduler (priorities and fair share)
+
+
+def request_api_key(conn: HTTPConnection) -> Optional[str]:
+    return conn.headers.get("x-api-key") or conn.query_params.get("api_key")
+
+
+def client_key(conn: HTTPConnection) -> str:
+    """
+    Identify a client by the tenant its API key resolved to, otherwise by
+    address. An unverified key is ignored: a fresh random key per request
+    would otherwise get a fresh bucket.
+    """
+    tenant = conn.scope.get("state", {}).get("tenant")
+    if tenant is not None:
+        return tenant.key
+    return f"ip:{conn.client.host if conn.client else 'unknown'}"
+
+
+def retry_after_header(exc: RateLimited) -> dict:
+    return {"Retry-After": str(max(1, math.ceil(exc.retry_after)))}
+
+
+def too_many_requests(exc: RateLimited) -> HTTPException:
+    return HTTPException(status_code=429, detail=str(exc), headers=retry_after_header(exc))
+
+
+async def rate_limit(request: Request):
+    """FastAPI dependency enforcing the per-client rate limit"""
+    try:
+        limiter.check(client_key(request), scope="http")
+    except RateLimited as e:
+        raise too_many_requests(e)
@@ -0,0 +1,181 @@
+"""
+Read-replica routing for read-only routes
+
+``read_router.session(*keys)`` returns a session on a read replica from
+DATABASE_REPLICA_URLS, taken round robin from those that passed their
+last health check and are at most REPLICA_MAX_LAG seconds behind. When
+no replica qualifies, the session is on the primary. A background loop
+checks every replica every REPLICA_CHECK_INTERVAL seconds. On PostgreSQL
+the lag is the time since the last replayed transaction. It is zero only
+while the WAL receiver is streaming from the primary and replay has
+caught up with everything received. A standby whose receiver has stalled
+or disconnected has no idea what it is missing, so its lag keeps growing
+(infinite if it never replayed anything). Other databases only need to
+answer. A dropped connection marks the replica down at once.
+benchmarks/check_replicas.py exercises the routing against two local
+databases.
+
+Read-your-writes: writers ``pin`` the keys they touched, i.e. the
+client's key and ``transcript_key(id)``. Reads carrying a pinned key go
+to the primary for READ_YOUR_WRITES_SECONDS. Pins live in this process
+only.
+"""
+import asyncio
+import itertools
+import logging
+import time
+from typing import Dict, List, Optional
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session, sessionmaker
+
+from .config import DATABASE_REPLICA_URLS, READ_YOUR_WRITES_SECONDS, REPLICA_CHECK_INTERVAL, REPLICA_MAX_LAG
+from .database import SessionLocal
+from .metrics import DB_READ_SESSIONS, REPLICA_HEALTHY, REPLICA_LAG_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Zero while a streaming standby has replayed all the WAL it received: an idle primary isn't lag.
+# Without a streaming receiver, "caught up" only means caught up with what arrived before it stopped.
+# Roles without pg_read_all_stats see the receiver's row with a NULL status.
+PG_LAG_SQL = text(
+    "SELECT CASE WHEN NOT pg_is_in_recovery() THEN 0::float8 "
+    "WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() "
+    "AND EXISTS (SELECT 1 FROM pg_stat_wal_receiver WHERE COALESCE(status, 'streaming') = 'streaming') "
+    "THEN 0::float8 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())::float8, 'Infinity'::float8) END"
+)
+MAX_PINS = 100_000
+
+
+def transcript_key(transcript_id) -> str:
+    return f"transcript:{transcript_id}"
+
+
+class Replica:
+    """One read replica and the result of its last health check"""
+
+    def __init__(self, url: str):
+        parsed = make_url(url)
+        self.name = parsed.render_as_string(hide_password=True)
+        connect_args = {"connect_timeout": 3} if parsed.get_backend_name() == "postgresql" else {}
+        self.engine = create_engine(url, pool_pre_ping=True, connect_args=connect_args)
+        self.sessions = sessionmaker(bind=self.engine)
+        # Unused until the first check passes
+        self.healthy = False
+        self.lag: Optional[float] = None
+        self.error: Optional[str] = None
+        self.checked: Optional[float] = None
+        event.listen(self.engine, "handle_error", self._on_error)
+
+    def _on_error(self, context):
+        if context.is_disconnect:
+            self.mark_down(str(context.original_exception))
+
+    def mark_down(self, error: str):
+        if self.healthy:
+            logger.warning("Read replica %s down: %s", self.name, error)
+        self.healthy = False
+        self.error = error
+        REPLICA_HEALTHY.labels(replica=self.name).set(0)
+
+    def check(self):
+        """Probe the replica and measure its lag (blocking)"""
+        try:
+            with self.engine.connect() as connection:
+                if connection.dialect.name == "postgresql":
+                    lag = float(connection.execute(PG_LAG_SQL).scalar() or 0.0)
+                else:
+                    connection.execute(text("SELECT 1"))
+                    lag = 0.0
+        except Exception as e:
+            self.mark_down(str(e))
+        else:
+            if not self.healthy:
+                logger.info("Read replica %s up (lag %.1fs)", self.name, lag)
+            self.healthy, self.lag, self.error = True, lag, None
+            REPLICA_HEALTHY.labels(replica=self.name).set(1)
+            REPLICA_LAG_SECONDS.labels(replica=self.name).set(lag)
+        self.checked = time.time()
+
+
+class ReadRouter:
+    def __init__(self, urls: List[str], max_lag: float = REPLICA_MAX_LAG,
+                 pin_seconds: float = READ_YOUR_WRITES_SECONDS, primary: sessionmaker = SessionLocal):
+        self.replicas = [Replica(url) for url in urls]
+        self.max_lag = max_lag
+        self.pin_seconds = pin_seconds
+        self.primary = primary
+        self._pins: Dict[str, float] = {}
+        self._turn = itertools.count()
+        self._task: Optional[asyncio.Task] = None
+
+    def pin(self, *keys: str):
+        """Send reads carrying any of these keys to the primary for a while"""
+        if not self.replicas:
+            return
+        now = time.monotonic()
+        if len(self._pins) > MAX_PINS:
+            self._pins = {k: t for k, t in self._pins.items() if t > now}
+        for key in keys:
+            if key:
+                self._pins[key] = now + self.pin_seconds
+
+    def pinned(self, keys) -> bool:
+        now = time.monotonic()
+        return any(self._pins.get(key, 0) > now for key in keys)
+
+    def replica(self, *keys: str) -> Optional[Replica]:
+        """Replica to read from, or None for the primary"""
+        if not self.replicas or self.pinned(keys):
+            return None
+        usable = [r for r in self.replicas if r.healthy and r.lag is not None and r.lag <= self.max_lag]
+        if not usable:
+            return None
+        return usable[next(self._turn) % len(usable)]
+
+    def session(self, *keys: str) -> Session:
+        """Session for read-only work; see the module docstring for where it points"""
+        if not self.replicas:
+            return self.primary()
+        replica = self.replica(*keys)
+        if replica is not None:
+            DB_READ_SESSIONS.labels(target="replica", reason="healthy").inc()
+            return replica.sessions()
+        DB_READ_SESSIONS.labels(target="primary", reason="pinned" if self.pinned(keys) else "no_replica").inc()
+        return self.primary()
+
+    def check(self):
+        for replica in self.replicas:
+            replica.check()
+
+    def snapshot(self) -> List[Dict]:
+        return [
+            {"replica": r.name, "healthy": r.healthy, "lag_seconds": r.lag, "error": r.error, "checked_at": r.checked}
+            for r in self.replicas
+        ]
+
+    async def _loop(self):
+        while True:
+            await asyncio.to_thread(self.check)
+            await asyncio.sleep(REPLICA_CHECK_INTERVAL)
+
+    def start(self):
+        """Start the health-check loop (no-op without replicas)"""
+        if self.replicas and self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for replica in self.replicas:
+            replica.engine.dispose()
+
+
+read_router = ReadRouter(DATABASE_REPLICA_URLS)
@@ -0,0 +1,202 @@
+"""
+Resilience helpers shared by the upstream clients (AssemblyAI, Supabase):
+classified retries with backoff, a circuit breaker and hedged requests
+"""
+import asyncio
+import logging
+import random
+import time
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, Optional, TypeVar
+
+import httpx
+
+from .config import (
+    BREAKER_FAILURE_THRESHOLD,
+    BREAKER_RESET_TIMEOUT,
+    UPSTREAM_BACKOFF_BASE,
+    UPSTREAM_BACKOFF_MAX,
+    UPSTREAM_MAX_RETRIES,
+)
+from .metrics import BREAKER_STATE, UPSTREAM_RETRIES
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Statuses worth retrying for idempotent calls (GET, upsert PUT/POST)
+RETRYABLE_STATUS = {408, 425, 429, 500, 502, 503, 504}
+# For non-idempotent calls only retry when the server cannot have acted on it
+SAFE_RETRY_STATUS = {429, 503}
+
+
+class UpstreamError(Exception):
+    """A failed call to an upstream service, classified for retry"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class CircuitOpen(UpstreamError):
+    """Raised instead of calling an upstream that is known to be unhealthy"""
+
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+
+def raise_for_status(response: httpx.Response, message: str, ok=(200, 201)):
+    """Raise an UpstreamError carrying the status and Retry-After of a failed response"""
+    if response.status_code not in ok:
+        raise UpstreamError(
+            f"{message}: {response.status_code} - {response.text}",
+            status_code=response.status_code,
+            retry_after=_parse_retry_after(response.headers.get("retry-after")),
+        )
+
+
+def is_retryable(exc: Exception, idempotent: bool = True) -> bool:
+    """Decide whether a failure is transient enough to try again"""
+    if isinstance(exc, CircuitOpen):
+        return False
+    if isinstance(exc, UpstreamError):
+        statuses = RETRYABLE_STATUS if idempotent else SAFE_RETRY_STATUS
+        return exc.status_code in statuses
+    if isinstance(exc, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)):
+        # The request never reached the server
+        return True
+    if isinstance(exc, httpx.TransportError):
+        return idempotent
+    return False
+
+
+class RetryPolicy:
+    def __init__(self, max_attempts: int = UPSTREAM_MAX_RETRIES, base_delay: float = UPSTREAM_BACKOFF_BASE,
+                 max_delay: float = UPSTREAM_BACKOFF_MAX):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt: int, exc: Exception) -> float:
+        retry_after = getattr(exc, "retry_after", None)
+        if retry_after is not None:
+            return min(self.max_delay, retry_after)
+        # Exponential backoff with full jitter
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+
+DEFAULT_POLICY = RetryPolicy()
+
+
+class CircuitBreaker:
+    """
+    Classic three-state breaker.
+
+    After ``failure_threshold`` consecutive failures the circuit opens and
+    calls are refused for ``reset_timeout`` seconds; the next call is then
+    let through as a probe (half-open) and closes the circuit on success.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 reset_timeout: float = BREAKER_RESET_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = 0.0
+        self.state = self.CLOSED
+        BREAKER_STATE.labels(name=name).set(0)
+
+    def _set_state(self, state: str):
+        if state != self.state:
+            logger.warning("Circuit %s: %s -> %s", self.name, self.state, state)
+        self.state = state
+        BREAKER_STATE.labels(name=self.name).set({self.CLOSED: 0, self.HALF_OPEN: 1, self.OPEN: 2}[state])
+
+    def allow(self) -> bool:
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self._set_state(self.HALF_OPEN)
+        return True
+
+    def retry_after(self) -> float:
+        return max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+
+    def record_success(self):
+        self.failures = 0
+        self._set_state(self.CLOSED)
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            self._set_state(self.OPEN)
+
+
+async def with_retries(
+    call: Callable[[], Awaitable[T]],
+    operation: str,
+    policy: RetryPolicy = DEFAULT_POLICY,
+    breaker: Optional[CircuitBreaker] = None,
+    idempotent: bool = True,
+) -> T:
+    """Run ``call`` with classified retries, optionally guarded by a circuit breaker"""
+    for attempt in range(policy.max_attempts):
+        if breaker and not breaker.allow():
+            raise CircuitOpen(f"{breaker.name} circuit is open", retry_after=breaker.retry_after())
+        try:
+            result = await call()
+        except Exception as e:
+            retryable = is_retryable(e, idempotent)
+            if breaker and (retryable or isinstance(e, httpx.TransportError)):
+                breaker.record_failure()
+            if not retryable or attempt == policy.max_attempts - 1:
+                raise
+            delay = policy.delay(attempt, e)
+            UPSTREAM_RETRIES.labels(operation=operation).inc()
+            logger.warning("%s failed (attempt %d/%d), retrying in %.1fs: %s",
+                           operation, attempt + 1, policy.max_attempts, delay, e)
+            await asyncio.sleep(delay)
+        else:
+            if breaker:
+                breaker.record_success()
+            return result
+    raise AssertionError("unreachable")
+
+
+async def hedged(call: Callable[[], Awaitable[T]], delay: float) -> T:
+    """
+    Start a second copy of an idempotent call if the first hasn't answered
+    within ``delay`` seconds, and return whichever succeeds first.
+    """
+    first = asyncio.ensure_future(call())
+    done, _ = await asyncio.wait({first}, timeout=delay)
+    if done:
+        return first.result()
+
+    pending = {first, asyncio.ensure_future(call())}
+    error: Optional[BaseException] = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
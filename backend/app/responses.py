@@ -0,0 +1,129 @@
+"""
+JSON response classes backed by cpu_tasks.encode_json (orjson when installed),
+conditional responses for cached bodies and byte-range file responses
+"""
+import asyncio
+import os
+from typing import Any, Optional, Tuple
+
+from fastapi.responses import JSONResponse
+from starlette.responses import Response
+
+from .cache import CachedResponse
+from .cpu_tasks import encode_json
+
+# Clients may keep the body but must revalidate it with If-None-Match
+CACHE_CONTROL = "no-cache"
+
+
+class FastJSONResponse(JSONResponse):
+    """Drop-in JSONResponse with the faster encoder; same compact output"""
+
+    def render(self, content: Any) -> bytes:
+        return encode_json(content)
+
+
+class RawJSONResponse(JSONResponse):
+    """Response for bodies already encoded with encode_json (e.g. in the CPU pool)"""
+
+    def render(self, content: bytes) -> bytes:
+        return content
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match uses weak comparison, so W/ (added when compressed) is ignored"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+def cached_json_response(cached: CachedResponse, if_none_match: Optional[str]) -> Response:
+    """200 with the cached body and its ETag, or 304 if the client already has it"""
+    headers = {"ETag": cached.etag, "Cache-Control": CACHE_CONTROL}
+    if etag_matches(if_none_match, cached.etag):
+        return Response(status_code=304, headers=headers)
+    return RawJSONResponse(cached.body, headers=headers)
+
+
+# Read size when the server can't sendfile for us
+FILE_CHUNK_BYTES = 256 * 1024
+
+
+def parse_range(range_header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Inclusive (start, end) for a single ``bytes=`` range. None means serve
+    the whole file (no header, or several ranges, which we may ignore);
+    ValueError means unsatisfiable.
+    """
+    if not range_header or not range_header.startswith("bytes=") or "," in range_header:
+        return None
+    first, _, last = range_header[len("bytes="):].strip().partition("-")
+    try:
+        if not first:  # suffix: the last N bytes
+            length = int(last)
+            if length <= 0:
+                raise ValueError("empty suffix range")
+            return max(0, size - length), size - 1
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    except ValueError:
+        raise ValueError(f"Malformed range: {range_header}")
+    if start >= size or end < start:
+        raise ValueError(f"Range not satisfiable: {range_header}")
+    return start, end
+
+
+class FileRangeResponse(Response):
+    """
+    A file, or one byte range of it (206), for media seeking. Uses the
+    ASGI zero-copy send extension when the server offers it; otherwise reads
+    the range in chunks off the event loop, so memory stays flat.
+    """
+
+    def __init__(self, path: str, stat: os.stat_result, media_type: str,
+                 range_header: Optional[str] = None, head: bool = False):
+        super().__init__(content=b"", media_type=media_type)
+        self.path = path
+        self.head = head
+        size = stat.st_size
+        try:
+            byte_range = parse_range(range_header, size)
+        except ValueError:
+            self.status_code = 416
+            self.start, self.end = 0, -1
+            self.raw_headers = [(b"content-range", f"bytes */{size}".encode()), (b"content-length", b"0")]
+            return
+        self.start, self.end = byte_range or (0, size - 1)
+        headers = {
+            "accept-ranges": "bytes",
+            "content-length": str(self.end - self.start + 1),
+            "etag": '"%x-%x"' % (stat.st_mtime_ns, size),
+            "cache-control": "private, max-age=3600",
+        }
+        if byte_range is not None:
+            self.status_code = 206
+            headers["content-range"] = f"bytes {self.start}-{self.end}/{size}"
+        self.init_headers({"content-type": media_type, **headers})
+
+    async def __call__(self, scope, receive, send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        count = self.end - self.start + 1
+        if self.head or count <= 0:
+            await send({"type": "http.response.body", "body": b""})
+            return
+        with open(self.path, "rb") as f:
+            if "http.response.zerocopysend" in scope.get("extensions", {}):
+                await send({"type": "http.response.zerocopysend", "file": f, "offset": self.start, "count": count})
+                return
+            offset, remaining = self.start, count
+            while remaining > 0:
+                chunk = await asyncio.to_thread(os.pread, f.fileno(), min(FILE_CHUNK_BYTES, remaining), offset)
+                if not chunk:
+                    break  # file shrank underneath us
+                offset += len(chunk)
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+            if remaining > 0:
+                await send({"type": "http.response.body", "body": b""})
@@ -0,0 +1,234 @@
+"""
+Retention: move old transcripts' heavy JSON to cold storage
+
+Every ARCHIVE_INTERVAL seconds, finished transcripts older than
+ARCHIVE_AFTER_DAYS have their ``utterances`` and ``diarized_transcript``
+written to the archive storage backend as one compressed JSON object
+(zstd when ``zstandard`` is installed, gzip otherwise). Those columns are
+then nulled out and ``archive_key`` records the object. Summary columns
+and speaker rows stay in place. Endpoints that need the payload call
+``rehydrate``, which reads it back into the ORM object (without writing
+it to the database) and keeps a few recent ones in memory.
+
+The same loop also creates upcoming monthly partitions (see partitions.py)
+and builds word indexes that are missing (see search.py) before archiving,
+reading archived transcripts back when needed; ``archive_transcript``
+indexes a transcript itself before moving its utterances out.
+"""
+import asyncio
+import gzip
+import json
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Set
+
+from sqlalchemy.orm import load_only
+from sqlalchemy.orm.attributes import set_committed_value
+
+from .cache import LRUCache
+from .config import (
+    ARCHIVE_AFTER_DAYS,
+    ARCHIVE_BATCH_SIZE,
+    ARCHIVE_CACHE_ENTRIES,
+    ARCHIVE_INTERVAL,
+    ARCHIVE_STORAGE_BACKEND,
+    WORD_INDEX_BACKFILL_BATCH,
+)
+from .cpu_tasks import encode_json
+from .database import SessionLocal
+from .metrics import ARCHIVE_TRANSCRIPTS
+from .models import Transcript
+from .partitions import ensure_partitions
+from .search import backfill, ensure_index
+from .storage import get_storage
+from .tracing import span
+from .transcript_index import LARGE_COLUMNS
+
+try:
+    import zstandard
+except ImportError:  # optional; gzip is the fallback
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+ZSTD_LEVEL = 10
+FINISHED = ("completed", "error")
+
+archive_cache = LRUCache(ARCHIVE_CACHE_ENTRIES, name="archive")
+_task: Optional[asyncio.Task] = None
+
+
+class ArchiveMissing(Exception):
+    """The archived payload of a transcript couldn't be read back"""
+
+
+def archive_name(transcript_id: str) -> str:
+    return f"archive_{transcript_id}.json.{'zst' if zstandard else 'gz'}"
+
+
+def pack(payload: Dict[str, Any]) -> bytes:
+    data = encode_json(payload)
+    if zstandard is not None:
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return gzip.compress(data, compresslevel=9)
+
+
+def unpack(name: str, blob: bytes) -> Dict[str, Any]:
+    if name.endswith(".zst"):
+        if zstandard is None:
+            raise ArchiveMissing(f"{name} needs the zstandard package to read")
+        data = zstandard.ZstdDecompressor().decompress(blob)
+    else:
+        data = gzip.decompress(blob)
+    return json.loads(data)
+
+
+def needs_payload(fields: Optional[Set[str]], ranged: bool) -> bool:
+    """Whether a transcript_payload view reads the columns that archiving moves out"""
+    return fields is None or bool(fields & set(LARGE_COLUMNS)) or (ranged and "transcript" in fields)
+
+
+async def rehydrate(transcript: Transcript):
+    """Load an archived transcript's JSON columns back onto the object; no-op for live rows"""
+    name = transcript.archive_key
+    if not name:
+        return
+    key = (str(transcript.id), name)
+    payload = archive_cache.get(key)
+    if payload is None:
+        with span("retention.rehydrate"):
+            blob = await get_storage(ARCHIVE_STORAGE_BACKEND).get(name)
+            if blob is None:
+                raise ArchiveMissing(f"Archived transcript data {name} not found")
+            payload = await asyncio.to_thread(unpack, name, blob)
+        archive_cache.set(key, payload)
+        ARCHIVE_TRANSCRIPTS.labels(action="rehydrated").inc()
+    for column in LARGE_COLUMNS:
+        # Committed value: the session never sees a change to write back
+        set_committed_value(transcript, column, payload.get(column))
+
+
+async def _archived_utterances(name: str) -> Optional[list]:
+    blob = await get_storage(ARCHIVE_STORAGE_BACKEND).get(name)
+    if blob is None:
+        raise ArchiveMissing(f"Archived transcript data {name} not found")
+    payload = await asyncio.to_thread(unpack, name, blob)
+    return payload.get("utterances")
+
+
+async def delete_archive(transcript_id: str, name: Optional[str]):
+    """Remove a deleted transcript's archive object; failures only leave an orphan behind"""
+    if not name:
+        return
+    archive_cache.invalidate(transcript_id)
+    try:
+        await get_storage(ARCHIVE_STORAGE_BACKEND).delete(name)
+    except Exception as e:
+        logger.warning("Deleting archive %s failed: %s", name, e)
+
+
+def _candidates(cutoff: datetime, limit: int) -> List[str]:
+    with SessionLocal() as db:
+        rows = db.query(Transcript.id).filter(
+            Transcript.created_at < cutoff,
+            Transcript.status.in_(FINISHED),
+            Transcript.archive_key.is_(None),
+            (Transcript.utterances.isnot(None)) | (Transcript.diarized_transcript.isnot(None)),
+        ).order_by(Transcript.created_at).limit(limit).all()
+    return [str(row.id) for row in rows]
+
+
+def _load(transcript_id: str) -> Optional[Dict[str, Any]]:
+    with SessionLocal() as db:
+        transcript = db.query(Transcript).options(load_only(*(getattr(Transcript, c) for c in LARGE_COLUMNS))) \
+            .filter(Transcript.id == transcript_id, Transcript.archive_key.is_(None)).first()
+        if transcript is None:
+            return None
+        return {column: getattr(transcript, column) for column in LARGE_COLUMNS}
+
+
+def _mark_archived(transcript_id: str, name: str) -> bool:
+    with SessionLocal() as db:
+        updated = db.query(Transcript).filter(
+            Transcript.id == transcript_id, Transcript.archive_key.is_(None)
+        ).update({**{column: None for column in LARGE_COLUMNS}, "archive_key": name}, synchronize_session=False)
+        db.commit()
+    return bool(updated)
+
+
+async def archive_transcript(transcript_id: str) -> bool:
+    """
+    Move one transcript's JSON columns to cold storage
+
+    The object is written before the row changes, so a crash in between
+    leaves at worst an unreferenced object, never a row without its data.
+    A missing word index is built first, while the utterances are at hand.
+    """
+    payload = await asyncio.to_thread(_load, transcript_id)
+    if payload is None:
+        return False
+    try:
+        await ensure_index(transcript_id, payload.get("utterances"))
+    except Exception as e:
+        # backfill reads it back from the archive later
+        logger.warning("Indexing words of transcript %s before archiving failed: %s", transcript_id, e)
+    name = archive_name(transcript_id)
+    with span("retention.archive", transcript_id=transcript_id):
+        blob = await asyncio.to_thread(pack, payload)
+        content_type = "application/zstd" if zstandard else "application/gzip"
+        await get_storage(ARCHIVE_STORAGE_BACKEND).put(name, blob, content_type)
+    if not await asyncio.to_thread(_mark_archived, transcript_id, name):
+        return False
+    ARCHIVE_TRANSCRIPTS.labels(action="archived").inc()
+    return True
+
+
+async def run_retention(after_days: float = ARCHIVE_AFTER_DAYS, batch_size: int = ARCHIVE_BATCH_SIZE) -> int:
+    """Archive every transcript past the retention age, batch_size at a time; returns how many"""
+    if after_days <= 0:
+        return 0
+    cutoff = datetime.utcnow() - timedelta(days=after_days)
+    archived = 0
+    while True:
+        ids = await asyncio.to_thread(_candidates, cutoff, batch_size)
+        moved = 0
+        for transcript_id in ids:
+            try:
+                moved += await archive_transcript(transcript_id)
+            except Exception as e:
+                logger.warning("Archiving transcript %s failed: %s", transcript_id, e)
+        archived += moved
+        if len(ids) < batch_size or not moved:
+            break
+    if archived:
+        logger.info("Archived %d transcripts older than %s days", archived, after_days)
+    return archived
+
+
+async def _loop():
+    while True:
+        try:
+            await asyncio.to_thread(ensure_partitions)
+            await backfill(WORD_INDEX_BACKFILL_BATCH, _archived_utterances)
+            await run_retention()
+        except Exception as e:
+            logger.error("Retention run failed: %s", e)
+        await asyncio.sleep(ARCHIVE_INTERVAL)
+
+
+def start_retention():
+    """Start the background partition/retention loop (once per process)"""
+    global _task
+    if _task is None:
+        _task = asyncio.create_task(_loop())
+
+
+async def stop_retention():
+    global _task
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+        _task = None
@@ -0,0 +1,323 @@
+"""
+Priority and fair-share scheduling of transcription jobs
+
+Every upstream job holds one of MAX_CONCURRENT_JOBS slots (the upstream
+quota). A chunked job runs one chunk at a time under its own slot and
+takes another slot for each further chunk it runs in parallel. Waiting
+jobs are started in this order:
+
+1. By priority class: interactive (WebSocket sessions) before batch (HTTP
+   and direct uploads) before backfill. The last
+   SCHEDULER_INTERACTIVE_RESERVE slots are kept for interactive jobs.
+2. Within a class, by weighted fair queuing across tenants (the API
+   key's tenant, else the client address). Each tenant's virtual finish time advances by job
+   cost / tenant weight, and the smallest finish time goes next.
+3. Within a tenant, shortest job first. The cost is the audio duration
+   when known, else SCHEDULER_DEFAULT_JOB_SECONDS.
+
+Estimated start times replay that order against the expected run times
+of running and queued jobs. Run time per audio second is learned as a
+moving average.
+"""
+import asyncio
+import heapq
+import itertools
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from .config import (
+    ADMISSION_RETRY_AFTER,
+    MAX_CONCURRENT_JOBS,
+    SCHEDULER_DEFAULT_JOB_SECONDS,
+    SCHEDULER_INTERACTIVE_RESERVE,
+    SCHEDULER_MAX_QUEUE,
+    SCHEDULER_TENANT_WEIGHTS,
+    SCHEDULER_UPDATE_INTERVAL,
+)
+from .metrics import ADMISSION_IN_USE, REJECTED_REQUESTS, SCHEDULER_QUEUE_DEPTH, SCHEDULER_WAIT_SECONDS
+from .rate_limit import RateLimited
+
+INTERACTIVE, BATCH, BACKFILL = PRIORITIES = ("interactive", "batch", "backfill")
+ESTIMATE_MAX_AGE = 1.0  # seconds a replayed schedule is reused while the queue is unchanged
+
+
+def parse_priority(value: Optional[str], default: str = BATCH, allowed=(BATCH, BACKFILL)) -> str:
+    """Validate a client-supplied priority; clients may lower theirs but not raise it"""
+    if value is None:
+        return default
+    if value not in allowed:
+        raise ValueError(f"Invalid priority '{value}' (expected one of: {', '.join(allowed)})")
+    return value
+
+
+def parse_weights(spec: str) -> Dict[str, float]:
+    """``"tenant:<uuid>:4,ip:10.0.0.1:0.5"`` -> tenant weights (the weight follows the last colon)"""
+    weights = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        tenant, _, weight = item.rpartition(":")
+        weights[tenant] = float(weight)
+    return weights
+
+
+class Ticket:
+    """One job's place in the queue"""
+
+    __slots__ = ("tenant", "priority", "duration", "cost", "seq", "enqueued", "started", "granted", "cancelled")
+
+    def __init__(self, tenant: str, priority: str, duration: Optional[float], cost: float, seq: int):
+        self.tenant = tenant
+        self.priority = priority
+        self.duration = duration
+        self.cost = cost
+        self.seq = seq
+        self.enqueued = time.monotonic()
+        self.started: Optional[float] = None
+        self.granted: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.cancelled = False
+
+
+class _Tenant:
+    __slots__ = ("weight", "finish", "queues")
+
+    def __init__(self, weight: float):
+        self.weight = weight
+        self.finish = {p: 0.0 for p in PRIORITIES}
+        self.queues = {p: [] for p in PRIORITIES}  # heaps of (cost, seq, ticket)
+
+
+def _next(tenants: Dict[str, _Tenant], virtual: Dict[str, float], running: int, capacity: int, reserve: int):
+    """The (priority, finish tag, start tag, tenant key) to start next, or None"""
+    for priority in PRIORITIES:
+        if running >= (capacity if priority == INTERACTIVE else capacity - reserve):
+            continue
+        best = None
+        for key, tenant in tenants.items():
+            queue = tenant.queues[priority]
+            while queue and queue[0][2].cancelled:
+                heapq.heappop(queue)
+            if not queue:
+                continue
+            start = max(virtual[priority], tenant.finish[priority])
+            finish = start + queue[0][0] / tenant.weight
+            if best is None or finish < best[1]:
+                best = (priority, finish, start, key)
+        if best is not None:
+            return best
+    return None
+
+
+class JobScheduler:
+    def __init__(self, capacity: int = MAX_CONCURRENT_JOBS, reserve: int = SCHEDULER_INTERACTIVE_RESERVE,
+                 weights: Optional[Dict[str, float]] = None, max_queue: int = SCHEDULER_MAX_QUEUE,
+                 default_cost: float = SCHEDULER_DEFAULT_JOB_SECONDS):
+        self.capacity = capacity
+        self.reserve = max(0, min(reserve, capacity - 1))
+        self.weights = weights or {}
+        self.max_queue = max_queue
+        self.default_cost = default_cost
+        self._tenants: Dict[str, _Tenant] = {}
+        self._virtual = {p: 0.0 for p in PRIORITIES}
+        self._running: Dict[int, Ticket] = {}
+        self._queued = {p: 0 for p in PRIORITIES}
+        self._seq = itertools.count()
+        self._version = 0
+        self._estimates = (-1, 0.0, {})  # (version, computed at, seq -> seconds until start)
+        # Learned run time: per audio second when the duration is known, per job otherwise
+        self.run_ratio = 0.3
+        self.run_seconds = 60.0
+
+    # Queue
+
+    def submit(self, tenant: str, priority: str = BATCH, duration: Optional[float] = None) -> Ticket:
+        """Queue a job (started at once if a slot is free); RateLimited when the queue is full"""
+        if sum(self._queued.values()) >= self.max_queue:
+            REJECTED_REQUESTS.labels(reason="admission_jobs").inc()
+            raise RateLimited("Server busy: transcription queue is full", ADMISSION_RETRY_AFTER)
+        cost = max(1.0, duration) if duration else self.default_cost
+        ticket = Ticket(tenant, priority, duration, cost, next(self._seq))
+        state = self._tenants.get(tenant)
+        if state is None:
+            state = self._tenants[tenant] = _Tenant(self.weights.get(tenant, 1.0))
+            # A newly active tenant starts at the current virtual time, not with banked credit
+            state.finish = dict(self._virtual)
+        heapq.heappush(state.queues[priority], (cost, ticket.seq, ticket))
+        self._queued[priority] += 1
+        self._changed()
+        self._dispatch()
+        return ticket
+
+    def cancel(self, ticket: Ticket):
+        """Give up a ticket, queued or running"""
+        if ticket.started is not None:
+            self._release(ticket)
+        elif not ticket.cancelled:
+            ticket.cancelled = True
+            self._queued[ticket.priority] -= 1
+            self._changed()
+
+    def _dispatch(self):
+        while True:
+            choice = _next(self._tenants, self._virtual, len(self._running), self.capacity, self.reserve)
+            if choice is None:
+                break
+            priority, finish, start, key = choice
+            tenant = self._tenants[key]
+            _, _, ticket = heapq.heappop(tenant.queues[priority])
+            tenant.finish[priority] = finish
+            self._virtual[priority] = start
+            self._queued[priority] -= 1
+            ticket.started = time.monotonic()
+            self._running[ticket.seq] = ticket
+            ticket.granted.set_result(None)
+            SCHEDULER_WAIT_SECONDS.labels(priority=priority).observe(ticket.started - ticket.enqueued)
+            ADMISSION_IN_USE.labels(gate="jobs").inc()
+        # Tenants with nothing queued are dropped; they rejoin at the current virtual time
+        for key in [k for k, t in self._tenants.items() if not any(t.queues.values())]:
+            del self._tenants[key]
+        self._changed()
+
+    def _release(self, ticket: Ticket):
+        if self._running.pop(ticket.seq, None) is None:
+            return
+        ADMISSION_IN_USE.labels(gate="jobs").dec()
+        elapsed = time.monotonic() - ticket.started
+        if ticket.duration:
+            self.run_ratio = 0.8 * self.run_ratio + 0.2 * elapsed / ticket.duration
+        else:
+            self.run_seconds = 0.8 * self.run_seconds + 0.2 * elapsed
+        self._dispatch()
+
+    def _changed(self):
+        self._version += 1
+        for priority in PRIORITIES:
+            SCHEDULER_QUEUE_DEPTH.labels(priority=priority).set(self._queued[priority])
+
+    @asynccontextmanager
+    async def hold(self, ticket: Ticket, timeout: Optional[float] = None,
+                   on_wait: Optional[Callable[[Dict], Awaitable]] = None):
+        """
+        Wait for the ticket's slot and hold it for the block. ``on_wait`` gets
+        the estimate right away and every SCHEDULER_UPDATE_INTERVAL seconds
+        while queued. With a ``timeout``, give up (RateLimited) after that long.
+        """
+        try:
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while not ticket.granted.done():
+                if on_wait is not None:
+                    await on_wait(self.estimate(ticket))
+                wait = SCHEDULER_UPDATE_INTERVAL if on_wait is not None else None
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        REJECTED_REQUESTS.labels(reason="admission_jobs").inc()
+                        raise RateLimited("Server busy: too many concurrent jobs",
+                                          max(ADMISSION_RETRY_AFTER, self.estimate(ticket)["estimated_wait_seconds"]))
+                    wait = remaining if wait is None else min(wait, remaining)
+                try:
+                    await asyncio.wait_for(asyncio.shield(ticket.granted), wait)
+                except asyncio.TimeoutError:
+                    pass
+        except BaseException:
+            self.cancel(ticket)
+            raise
+        try:
+            yield ticket
+        finally:
+            self._release(ticket)
+
+    def slot(self, tenant: str, priority: str = BATCH, duration: Optional[float] = None,
+             timeout: Optional[float] = None, on_wait: Optional[Callable[[Dict], Awaitable]] = None):
+        """submit + hold in one step"""
+        return self.hold(self.submit(tenant, priority, duration), timeout, on_wait)
+
+    # Estimates
+
+    def _expected_run(self, ticket: Ticket) -> float:
+        return ticket.duration * self.run_ratio if ticket.duration else self.run_seconds
+
+    def _replay(self) -> Dict[int, float]:
+        """Seconds until each queued ticket starts, assuming no new arrivals"""
+        now = time.monotonic()
+        # When each slot frees up
+        slots = sorted(max(0.0, t.started + self._expected_run(t) - now) for t in self._running.values())
+        slots += [0.0] * (self.capacity - len(slots))
+        heapq.heapify(slots)
+        tenants = {}
+        for key, tenant in self._tenants.items():
+            copy = _Tenant(tenant.weight)
+            copy.finish = dict(tenant.finish)
+            copy.queues = {p: list(q) for p, q in tenant.queues.items()}
+            tenants[key] = copy
+        virtual = dict(self._virtual)
+        starts = {}
+        while True:
+            # Order only: slot limits are applied through the free times below
+            choice = _next(tenants, virtual, 0, self.capacity, 0)
+            if choice is None:
+                return starts
+            priority, finish, start_tag, key = choice
+            _, _, ticket = heapq.heappop(tenants[key].queues[priority])
+            tenants[key].finish[priority] = finish
+            virtual[priority] = start_tag
+            if priority == INTERACTIVE:
+                begins = heapq.heappop(slots)
+            else:
+                # Lower classes need reserve + 1 free slots: the (reserve + 1)-th to free up
+                begins = heapq.nsmallest(self.reserve + 1, slots)[-1]
+                heapq.heappop(slots)
+            starts[ticket.seq] = begins
+            heapq.heappush(slots, begins + self._expected_run(ticket))
+
+    def _starts(self) -> Dict[int, float]:
+        version, computed, starts = self._estimates
+        if version != self._version or time.monotonic() - computed > ESTIMATE_MAX_AGE:
+            starts = self._replay()
+            self._estimates = (self._version, time.monotonic(), starts)
+        return starts
+
+    def estimate(self, ticket: Ticket) -> Dict:
+        """Queue position and estimated start of a ticket"""
+        if ticket.started is not None:
+            return {"position": 0, "estimated_wait_seconds": 0, "estimated_start": _iso(0)}
+        starts = self._starts()
+        wait = starts.get(ticket.seq, 0.0)
+        position = 1 + sum(1 for seq, s in starts.items() if (s, seq) < (wait, ticket.seq))
+        return {
+            "position": position,
+            "queued": sum(self._queued.values()),
+            "priority": ticket.priority,
+            "estimated_wait_seconds": round(wait),
+            "estimated_start": _iso(wait),
+        }
+
+    def snapshot(self) -> Dict:
+        """Queue depth, running jobs and drain time per priority class"""
+        starts = self._starts()
+        now = time.monotonic()
+        classes = {}
+        for priority in PRIORITIES:
+            waiting: List[Ticket] = [ticket for tenant in self._tenants.values()
+                                     for _, _, ticket in tenant.queues[priority] if not ticket.cancelled]
+            classes[priority] = {
+                "queued": len(waiting),
+                "running": sum(1 for t in self._running.values() if t.priority == priority),
+                "oldest_wait_seconds": round(max((now - t.enqueued for t in waiting), default=0.0), 1),
+                "drain_seconds": round(max((starts.get(t.seq, 0.0) for t in waiting), default=0.0)),
+            }
+        return {
+            "capacity": self.capacity,
+            "reserved_interactive": self.reserve,
+            "running": len(self._running),
+            "tenants_waiting": sum(1 for t in self._tenants.values() if any(t.queues.values())),
+            "run_seconds_per_audio_second": round(self.run_ratio, 3),
+            "classes": classes,
+        }
+
+
+def _iso(seconds_from_now: float) -> str:
+    return (datetime.now(timezone.utc) + timedelta(seconds=seconds_from_now)).isoformat(timespec="seconds")
+
+
+scheduler = JobScheduler(weights=parse_weights(SCHEDULER_TENANT_WEIGHTS))
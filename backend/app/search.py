@@ -0,0 +1,268 @@
+"""
+Word search: click-to-seek within a transcript and keyword spotting across them
+
+Each completed transcript gets two things. One is a packed word index
+(``transcript_word_index``, see word_index.py), which answers "where is X
+said" inside the transcript. The other is one ``transcript_terms`` row per
+distinct word, with its hit count and first occurrence, which answers
+"which calls mention X" with an index lookup instead of a scan over every
+transcript's JSON. Both are written in the same transaction as the
+transcript, and rewritten whenever it is.
+
+Transcripts finished before the index existed are filled in by
+``backfill`` from the retention loop, reading archived ones back from cold
+storage; retention also indexes a transcript before archiving it. Until
+then ``/find`` builds their index on the fly.
+"""
+import asyncio
+import logging
+import uuid
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import delete, func, or_, select
+from sqlalchemy.orm import Session
+
+from .cache import index_cache
+from .database import SessionLocal
+from .models import Transcript, TranscriptTerm, TranscriptWordIndex
+from .tracing import span
+from .word_index import WordIndex, index_transcript, tokenize
+from .workers import run_cpu
+
+logger = logging.getLogger(__name__)
+
+MATCH_MODES = ("any", "all")
+
+
+def store_index(db: Session, transcript_id, blob: bytes, terms: Sequence[Tuple[str, int, int]]):
+    """Replace a transcript's word index and term rows (the caller commits)"""
+    delete_index(db, transcript_id)
+    db.add(TranscriptWordIndex(transcript_id=transcript_id, data=blob, words=sum(t[1] for t in terms),
+                               terms=len(terms)))
+    if terms:
+        db.execute(TranscriptTerm.__table__.insert(), [
+            {"term": term, "transcript_id": transcript_id, "hits": hits, "first_ms": first_ms}
+            for term, hits, first_ms in terms
+        ])
+    index_cache.invalidate(str(transcript_id))
+
+
+def delete_index(db: Session, transcript_id):
+    """Drop a transcript's word index rows (the caller commits)"""
+    db.execute(delete(TranscriptTerm).where(TranscriptTerm.transcript_id == transcript_id))
+    db.execute(delete(TranscriptWordIndex).where(TranscriptWordIndex.transcript_id == transcript_id))
+
+
+def _load_index(db: Session, transcript_id: str) -> Optional[WordIndex]:
+    key = (transcript_id, "words")
+    index = index_cache.get(key)
+    if index is None:
+        blob = db.execute(
+            select(TranscriptWordIndex.data).where(TranscriptWordIndex.transcript_id == transcript_id)
+        ).scalar()
+        if blob is None:
+            return None
+        index = WordIndex(blob)
+        index_cache.set(key, index)
+    return index
+
+
+async def get_word_index(db: Session, transcript: Transcript,
+                         prepare: Optional[Callable[[Transcript], Awaitable[None]]] = None) -> WordIndex:
+    """
+    Cached word index of a transcript
+
+    Read from the stored blob, or built from ``transcript.utterances`` if
+    there is none yet, after awaiting ``prepare`` (e.g. rehydrate) on it.
+    """
+    index = _load_index(db, str(transcript.id))
+    if index is None:
+        if prepare is not None:
+            await prepare(transcript)
+        utterances = transcript.utterances or []
+        blob, _ = await run_cpu(index_transcript, utterances, task="word_index", size=len(utterances))
+        index = WordIndex(blob)
+        index_cache.set((str(transcript.id), "words"), index)
+    return index
+
+
+def has_index(db: Session, transcript_id) -> bool:
+    return db.execute(
+        select(TranscriptWordIndex.transcript_id).where(TranscriptWordIndex.transcript_id == transcript_id)
+    ).first() is not None
+
+
+def parse_keywords(q: str) -> List[str]:
+    """``"refund, cancel*, thank you"`` -> ["refund", "cancel*", "thank you"]"""
+    keywords = []
+    for raw in q.split(","):
+        terms = tokenize(raw)
+        if terms:
+            keyword = " ".join(terms) + ("*" if len(terms) == 1 and raw.strip().endswith("*") else "")
+            if keyword not in keywords:
+                keywords.append(keyword)
+    return keywords
+
+
+def _term_filter(keywords: Sequence[str]):
+    exact, prefixes = set(), []
+    for keyword in keywords:
+        if keyword.endswith("*"):
+            prefix = keyword[:-1].replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            prefixes.append(TranscriptTerm.term.like(prefix + "%", escape="\\"))
+        else:
+            exact.update(keyword.split(" "))
+    clauses = prefixes + ([TranscriptTerm.term.in_(exact)] if exact else [])
+    return or_(*clauses)
+
+
+def keyword_hits(db: Session, keywords: Sequence[str], match: str = "any", statuses: Optional[List[str]] = None,
+                 since: Optional[datetime] = None, until: Optional[datetime] = None,
+                 limit: int = 50, owner=None) -> List[Dict]:
+    """
+    Transcripts mentioning any (or all) of the keywords, most hits first
+
+    A keyword is a word, a prefix ending in ``*`` or a phrase. Phrases are
+    looked up word by word in the term table, then checked against the
+    candidates' word indexes. ``owner`` (a ``tenants.owned_by`` filter) limits
+    the search to one caller's transcripts.
+    """
+    query = select(
+        TranscriptTerm.transcript_id, TranscriptTerm.term, TranscriptTerm.hits, TranscriptTerm.first_ms,
+        Transcript.created_at, Transcript.status,
+    ).join(Transcript, Transcript.id == TranscriptTerm.transcript_id).where(_term_filter(keywords))
+    if owner is not None:
+        query = query.where(owner)
+    if statuses:
+        query = query.where(Transcript.status.in_(statuses))
+    if since is not None:
+        query = query.where(Transcript.created_at >= since)
+    if until is not None:
+        query = query.where(Transcript.created_at < until)
+
+    with span("search.keywords", keywords=len(keywords)):
+        terms: Dict[str, Dict[str, Tuple[int, int]]] = {}
+        meta = {}
+        for row in db.execute(query):
+            transcript_id = str(row.transcript_id)
+            terms.setdefault(transcript_id, {})[row.term] = (row.hits, row.first_ms)
+            meta[transcript_id] = (row.created_at, row.status)
+
+        results = []
+        phrases = [k for k in keywords if " " in k]
+        for transcript_id, found in terms.items():
+            counts = {}
+            for keyword in keywords:
+                if keyword.endswith("*"):
+                    matched = [v for t, v in found.items() if t.startswith(keyword[:-1])]
+                elif " " in keyword:
+                    # Verified below; here only whether every word occurs
+                    matched = [(0, 0)] if all(t in found for t in keyword.split(" ")) else []
+                else:
+                    matched = [found[keyword]] if keyword in found else []
+                if matched:
+                    counts[keyword] = {"hits": sum(h for h, _ in matched), "first": min(f for _, f in matched) / 1000.0}
+            if phrases and any(p in counts for p in phrases):
+                _verify_phrases(db, transcript_id, phrases, counts)
+            if not counts or (match == "all" and len(counts) < len(keywords)):
+                continue
+            created_at, status = meta[transcript_id]
+            results.append({
+                "transcript_id": transcript_id,
+                "status": status,
+                "created_at": created_at.isoformat() if created_at else None,
+                "hits": sum(c["hits"] for c in counts.values()),
+                "keywords": counts,
+            })
+    results.sort(key=lambda r: (r["hits"], r["created_at"] or ""), reverse=True)
+    return results[:limit]
+
+
+def _verify_phrases(db: Session, transcript_id: str, phrases: Sequence[str], counts: Dict):
+    index = _load_index(db, transcript_id)
+    for phrase in phrases:
+        if phrase not in counts:
+            continue
+        hits = index.find(phrase) if index is not None else []
+        if hits:
+            counts[phrase] = {"hits": len(hits), "first": hits[0]["start"]}
+        else:
+            del counts[phrase]
+
+
+def _unindexed(limit: int, archived: bool) -> List[Tuple[str, Optional[str]]]:
+    """Completed transcripts without a word index, with their archive key (None while live)"""
+    query = select(Transcript.id, Transcript.archive_key) \
+        .outerjoin(TranscriptWordIndex, TranscriptWordIndex.transcript_id == Transcript.id) \
+        .where(Transcript.status == "completed", TranscriptWordIndex.transcript_id.is_(None))
+    if not archived:
+        query = query.where(Transcript.archive_key.is_(None))
+    with SessionLocal() as db:
+        rows = db.execute(query.order_by(Transcript.created_at.desc()).limit(limit)).all()
+    return [(str(row.id), row.archive_key) for row in rows]
+
+
+def _needs_index(transcript_id: str) -> bool:
+    with SessionLocal() as db:
+        status = db.execute(select(Transcript.status).where(Transcript.id == transcript_id)).scalar()
+        return status == "completed" and not has_index(db, transcript_id)
+
+
+def _utterances(transcript_id: str) -> Tuple[Optional[list], Optional[str]]:
+    with SessionLocal() as db:
+        row = db.execute(
+            select(Transcript.utterances, Transcript.archive_key).where(Transcript.id == transcript_id)
+        ).first()
+    return (row.utterances, row.archive_key) if row is not None else (None, None)
+
+
+def _store(transcript_id: str, blob: bytes, terms):
+    with SessionLocal() as db:
+        # The transcript may have been deleted or re-indexed meanwhile
+        exists = db.execute(select(func.count()).select_from(Transcript).where(Transcript.id == transcript_id)).scalar()
+        if exists and not has_index(db, transcript_id):
+            store_index(db, uuid.UUID(transcript_id), blob, terms)
+            db.commit()
+
+
+async def _index(transcript_id: str, utterances: Optional[list]):
+    utterances = utterances or []
+    blob, terms = await run_cpu(index_transcript, utterances, task="word_index", size=len(utterances))
+    await asyncio.to_thread(_store, transcript_id, blob, terms)
+
+
+async def ensure_index(transcript_id: str, utterances: Optional[list]) -> bool:
+    """Index a completed transcript from utterances already in hand, unless it has an index; returns whether it did"""
+    if not await asyncio.to_thread(_needs_index, transcript_id):
+        return False
+    await _index(transcript_id, utterances)
+    return True
+
+
+async def backfill(batch_size: int, load_archived: Optional[Callable[[str], Awaitable[Optional[list]]]] = None) -> int:
+    """
+    Index up to batch_size completed transcripts that have no word index yet; returns how many
+
+    Archived ones are read back with ``load_archived(archive_key)``, and
+    left out when it isn't given.
+    """
+    if batch_size <= 0:
+        return 0
+    indexed = 0
+    for transcript_id, archive_key in await asyncio.to_thread(_unindexed, batch_size, load_archived is not None):
+        try:
+            if not archive_key:
+                # Archiving may have moved the payload out since the listing
+                utterances, archive_key = await asyncio.to_thread(_utterances, transcript_id)
+            if archive_key:
+                if load_archived is None:
+                    continue
+                utterances = await load_archived(archive_key)
+            await _index(transcript_id, utterances)
+            indexed += 1
+        except Exception as e:
+            logger.warning("Indexing words of transcript %s failed: %s", transcript_id, e)
+    if indexed:
+        logger.info("Built word indexes for %d transcripts", indexed)
+    return indexed
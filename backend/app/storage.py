@@ -1,13 +1,49 @@
+"""
+Audio object storage: Supabase (default), local disk or any S3-compatible service
+
+Objects live flat at the bucket/directory root as ``audio_<uuid><ext>``
+(and archived transcript JSON as ``archive_<uuid>.json.zst``).
+Each backend hands out the URL transcription services fetch, probes and
+deletes objects (one at a time or in batches), lists them for garbage
+collection, signs direct uploads where it can and serves audio to the
+UI with HTTP Range support (local disk directly, remote stores by
+redirecting to a URL that honours Range itself).
+"""
+import asyncio
 import os
+import re
+import tempfile
 import uuid
+from datetime import datetime, timezone
+from typing import AsyncIterator, Dict, List, NamedTuple, Optional
+from urllib.parse import urlparse
 from supabase import create_client, Client
 import httpx
-from .config import SUPABASE_URL, SUPABASE_KEY
+from starlette.responses import RedirectResponse, Response
+from .config import (
+    LOCAL_STORAGE_DIR,
+    S3_ACCESS_KEY_ID,
+    S3_BUCKET,
+    S3_ENDPOINT_URL,
+    S3_PUBLIC_URL,
+    S3_REGION,
+    S3_SECRET_ACCESS_KEY,
+    S3_URL_TTL,
+    STORAGE_BACKEND,
+    STORAGE_PUBLIC_URL,
+    SUPABASE_BUCKET_NAME,
+    SUPABASE_URL,
+    SUPABASE_KEY,
+    UPLOAD_TOKEN_TTL,
+)
+from .metrics import UPLOAD_BYTES, UPLOAD_SECONDS, observe, timer
+from .tracing import span
+from .resilience import CircuitBreaker, raise_for_status, with_retries
+from .responses import FileRangeResponse
+from .waveform import schedule_peaks
 import logging
 
-# Optimize logging for performance
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.WARNING)  # Reduce log verbosity for speed
 
 # Initialize Supabase client (cached)
 _supabase_client = None
@@ -19,65 +55,220 @@ def get_supabase_client() -> Client:
         _supabase_client = create_client(SUPABASE_URL, SUPABASE_KEY)
     return _supabase_client
 
-async def upload_audio_file(audio_data: bytes, file_extension: str = ".wav") -> str:
+# Opens while the SDK path keeps failing so uploads go straight to the HTTP fallback
+supabase_breaker = CircuitBreaker("supabase_sdk")
+
+def upload_via_sdk(audio_data: bytes, filename: str, file_extension: str) -> str:
     """
-    Optimized audio file upload to Supabase storage
+    Primary upload method: Supabase Python client (faster)
     """
-    # Generate unique filename
-    filename = f"audio_{uuid.uuid4()}{file_extension}"
+    supabase = get_supabase_client()
     
-    try:
-        # Primary method: Supabase Python client (faster)
-        supabase = get_supabase_client()
-        
-        # Upload with optimized settings
-        response = supabase.storage.from_("audio-files").upload(
-            path=filename,
-            file=audio_data,
-            file_options={
-                "content-type": f"audio/{file_extension[1:] if file_extension.startswith('.') else file_extension}",
-                "cache-control": "3600"  # 1 hour cache
-            }
-        )
-        
-        if response:
-            # Get public URL
-            public_url_response = supabase.storage.from_("audio-files").get_public_url(filename)
-            if public_url_response:
-                return public_url_response
-        
-        raise Exception("Failed to get public URL from Supabase")
-        
-    except Exception as e:
-        logger.warning(f"Supabase upload failed: {e}")
-        
-        # Fallback: HTTP method (slower but reliable)
+    # Upload with optimized settings
+    response = supabase.storage.from_(SUPABASE_BUCKET_NAME).upload(
+        path=filename,
+        file=audio_data,
+        file_options={
+            "content-type": f"audio/{file_extension[1:] if file_extension.startswith('.') else file_extension}",
+            "cache-control": "3600"  # 1 hour cache
+        }
+    )
+    
+    if response:
+        # Get public URL
+        public_url_response = supabase.storage.from_(SUPABASE_BUCKET_NAME).get_public_url(filename)
+        if public_url_response:
+            return public_url_response
+    
+    raise Exception("Failed to get public URL from Supabase")
+
+async def upload_to_supabase(audio_data: bytes, filename: str, file_extension: str) -> str:
+    """SDK upload, falling back to plain HTTP while the SDK path is failing"""
+    if supabase_breaker.allow():
         try:
-            return await upload_via_http(audio_data, filename, file_extension)
-        except Exception as fallback_error:
-            logger.error(f"Both upload methods failed: {fallback_error}")
-            raise Exception(f"Upload failed: {fallback_error}")
+            with span("storage.upload_sdk"), timer(UPLOAD_SECONDS, method="sdk"):
+                public_url = upload_via_sdk(audio_data, filename, file_extension)
+            supabase_breaker.record_success()
+            return public_url
+        except Exception as e:
+            supabase_breaker.record_failure()
+            logger.warning("Supabase upload failed: %s", e)
+    else:
+        logger.debug("Supabase SDK circuit open, uploading via HTTP")
+    
+    # Fallback: HTTP method (slower but reliable), retried on transient errors
+    try:
+        with span("storage.upload_http"), timer(UPLOAD_SECONDS, method="http"):
+            return await with_retries(
+                lambda: upload_via_http(audio_data, filename, file_extension),
+                "supabase_http_upload"
+            )
+    except Exception as fallback_error:
+        logger.error("Both upload methods failed: %s", fallback_error)
+        raise Exception(f"Upload failed: {fallback_error}")
 
 async def upload_via_http(audio_data: bytes, filename: str, file_extension: str) -> str:
     """
     Fallback HTTP upload method
     """
-    upload_url = f"{SUPABASE_URL}/storage/v1/object/audio-files/{filename}"
+    upload_url = f"{SUPABASE_URL}/storage/v1/object/{SUPABASE_BUCKET_NAME}/{filename}"
     
     headers = {
         "Authorization": f"Bearer {SUPABASE_KEY}",
         "Content-Type": f"audio/{file_extension[1:] if file_extension.startswith('.') else file_extension}",
-        "x-upsert": "true"
+        "x-upsert": "true"  # makes retries idempotent
     }
     
     async with httpx.AsyncClient(timeout=30.0) as client:  # Reduced timeout for speed
         response = await client.post(upload_url, content=audio_data, headers=headers)
-        
-        if response.status_code not in [200, 201]:
-            raise Exception(f"HTTP upload failed: {response.status_code} - {response.text}")
+        raise_for_status(response, "HTTP upload failed")
     
-    # Return public URL
-    return f"{SUPABASE_URL}/storage/v1/object/public/audio-files/{filename}"
+    return public_url(filename)
+
+def public_url(path: str) -> str:
+    """Public URL of an object in the audio bucket"""
+    return f"{SUPABASE_URL}/storage/v1/object/public/{SUPABASE_BUCKET_NAME}/{path}"
+
+def _service_headers() -> dict:
+    return {"Authorization": f"Bearer {SUPABASE_KEY}", "apikey": SUPABASE_KEY or ""}
+
+async def create_signed_upload_url(path: str) -> str:
+    """
+    Signed URL the client PUTs the file to, straight into the bucket.
+    Supabase keeps these valid for two hours.
+    """
+    async def sign():
+        async with httpx.AsyncClient(timeout=10.0) as client:
+            response = await client.post(
+                f"{SUPABASE_URL}/storage/v1/object/upload/sign/{SUPABASE_BUCKET_NAME}/{path}",
+                headers=_service_headers(),
+            )
+            raise_for_status(response, "Failed to sign upload URL", ok=(200,))
+            return response.json()["url"]
+
+    with span("storage.sign_upload"):
+        signed = await with_retries(sign, "supabase_sign_upload")
+    return f"{SUPABASE_URL}/storage/v1{signed}"
+
+class ObjectInfo(NamedTuple):
+    size: int
+    content_type: str
+    head: bytes  # first bytes, for format sniffing
+
+class StoredObject(NamedTuple):
+    name: str
+    size: int
+    modified: Optional[datetime]  # UTC; None if the store doesn't say
+
+async def probe_object(path: str, head_bytes: int = 64) -> Optional[ObjectInfo]:
+    """
+    Size, content type and first bytes of an uploaded object, from a single
+    ranged GET; None if it doesn't exist (yet)
+    """
+    headers = {**_service_headers(), "Range": f"bytes=0-{head_bytes - 1}"}
+    url = f"{SUPABASE_URL}/storage/v1/object/authenticated/{SUPABASE_BUCKET_NAME}/{path}"
+
+    async def probe():
+        async with httpx.AsyncClient(timeout=10.0) as client:
+            return await _probe(client, url, headers, head_bytes)
+
+    with span("storage.probe"):
+        return await with_retries(probe, "supabase_probe")
+
+async def _probe(client: httpx.AsyncClient, url: str, headers: dict, head_bytes: int):
+    async with client.stream("GET", url, headers=headers) as response:
+        if response.status_code in (400, 404):
+            return None
+        if response.status_code not in (200, 206):
+            await response.aread()
+            raise_for_status(response, "Failed to inspect upload", ok=(200, 206))
+        head = b""
+        async for chunk in response.aiter_bytes():
+            head += chunk
+            if len(head) >= head_bytes:
+                break  # server ignored Range; don't pull the whole file
+        content_range = response.headers.get("content-range", "")
+        if "/" in content_range and not content_range.endswith("/*"):
+            size = int(content_range.rsplit("/", 1)[1])
+        else:
+            size = int(response.headers.get("content-length", len(head)))
+        return ObjectInfo(size, response.headers.get("content-type", ""), head[:head_bytes])
+
+async def download_object(path: str) -> Optional[bytes]:
+    """Whole object from the audio bucket; None if it doesn't exist"""
+    url = f"{SUPABASE_URL}/storage/v1/object/authenticated/{SUPABASE_BUCKET_NAME}/{path}"
+
+    async def download():
+        async with httpx.AsyncClient(timeout=30.0) as client:
+            response = await client.get(url, headers=_service_headers())
+            if response.status_code in (400, 404):
+                return None
+            raise_for_status(response, "Failed to download object")
+            return response.content
+
+    with span("storage.download"):
+        return await with_retries(download, "supabase_download")
+
+async def delete_object(path: str):
+    """Remove an object from the audio bucket"""
+    async with httpx.AsyncClient(timeout=10.0) as client:
+        response = await client.delete(
+            f"{SUPABASE_URL}/storage/v1/object/{SUPABASE_BUCKET_NAME}/{path}",
+            headers=_service_headers(),
+        )
+        raise_for_status(response, "Failed to delete object", ok=(200, 204, 404))
+
+# Supabase's bulk remove and list endpoints take up to this many names per call
+SUPABASE_PAGE = 1000
+
+async def delete_objects(paths: List[str]) -> List[str]:
+    """Remove objects from the audio bucket in batches; returns the paths that failed"""
+    failed = []
+    async with httpx.AsyncClient(timeout=30.0) as client:
+        for i in range(0, len(paths), SUPABASE_PAGE):
+            batch = paths[i:i + SUPABASE_PAGE]
+            try:
+                response = await client.request(
+                    "DELETE", f"{SUPABASE_URL}/storage/v1/object/{SUPABASE_BUCKET_NAME}",
+                    headers=_service_headers(), json={"prefixes": batch},
+                )
+                raise_for_status(response, "Failed to delete objects", ok=(200, 204, 404))
+            except Exception as e:
+                logger.warning("Deleting %d objects failed: %s", len(batch), e)
+                failed += batch
+    return failed
+
+def _parse_time(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return parsed.astimezone(timezone.utc).replace(tzinfo=None) if parsed.tzinfo else parsed
+
+async def list_bucket(prefix: str) -> List[StoredObject]:
+    """Every object in the audio bucket whose name starts with prefix"""
+    objects = []
+    async with httpx.AsyncClient(timeout=30.0) as client:
+        offset = 0
+        while True:
+            response = await client.post(
+                f"{SUPABASE_URL}/storage/v1/object/list/{SUPABASE_BUCKET_NAME}",
+                headers=_service_headers(),
+                json={"prefix": "", "search": prefix, "limit": SUPABASE_PAGE, "offset": offset,
+                      "sortBy": {"column": "name", "order": "asc"}},
+            )
+            raise_for_status(response, "Failed to list objects")
+            page = response.json()
+            for item in page:
+                if item.get("id") is None or not item["name"].startswith(prefix):
+                    continue  # folders
+                objects.append(StoredObject(item["name"], int((item.get("metadata") or {}).get("size") or 0),
+                                            _parse_time(item.get("updated_at") or item.get("created_at"))))
+            if len(page) < SUPABASE_PAGE:
+                return objects
+            offset += len(page)
 
 def get_content_type(file_extension: str) -> str:
     """Get the appropriate content type for the file extension"""
@@ -90,4 +281,327 @@ def get_content_type(file_extension: str) -> str:
         '.flac': 'audio/flac',
         '.webm': 'audio/webm'
     }
-    return extension_map.get(file_extension.lower(), 'audio/mpeg') 
\ No newline at end of file
+    return extension_map.get(file_extension.lower(), 'audio/mpeg') 
+# Object names we create; anything else is refused when mapping URLs/paths back
+OBJECT_NAME = re.compile(r"^audio_[0-9a-f-]{36}\.[a-z0-9]{1,5}$")
+# Cold-storage copies of transcript JSON (see retention.py); never served over HTTP
+ARCHIVE_NAME = re.compile(r"^archive_[0-9a-f-]{36}\.json\.(zst|gz)$")
+
+def path_from_url(audio_url: str) -> Optional[str]:
+    """Object name behind a stored audio URL (any backend), or None if it isn't one of ours"""
+    name = os.path.basename(urlparse(audio_url).path)
+    return name if OBJECT_NAME.match(name) else None
+
+class StorageBackend:
+    """Where audio objects live; subclasses implement the object operations"""
+
+    name = "base"
+
+    async def put(self, path: str, data: bytes, content_type: str) -> str:
+        """Store an object and return the URL transcription services fetch it from"""
+        raise NotImplementedError
+
+    def url(self, path: str) -> str:
+        raise NotImplementedError
+
+    async def probe(self, path: str, head_bytes: int = 64) -> Optional[ObjectInfo]:
+        raise NotImplementedError
+
+    async def get(self, path: str) -> Optional[bytes]:
+        """Whole object, or None if it doesn't exist"""
+        raise NotImplementedError
+
+    async def delete(self, path: str):
+        raise NotImplementedError
+
+    async def delete_many(self, paths: List[str]) -> List[str]:
+        """Delete objects, batched where the store allows; returns the paths that failed"""
+        failed = []
+        for path in paths:
+            try:
+                await self.delete(path)
+            except Exception as e:
+                logger.warning("Deleting %s failed: %s", path, e)
+                failed.append(path)
+        return failed
+
+    def list_objects(self, prefix: str = "audio_") -> AsyncIterator[StoredObject]:
+        """Objects whose name starts with prefix, in ascending (byte) order of name"""
+        raise NotImplementedError(f"Listing is not supported by the {self.name} storage backend")
+
+    async def sign_upload(self, path: str, content_type: str) -> str:
+        """URL a client can PUT the object to directly"""
+        raise NotImplementedError(f"Direct uploads are not supported by the {self.name} storage backend")
+
+    async def serve(self, path: str, range_header: Optional[str] = None, head: bool = False) -> Response:
+        """Response delivering the object to a browser, honouring Range"""
+        raise NotImplementedError
+
+    async def aclose(self):
+        pass
+
+class SupabaseStorage(StorageBackend):
+    name = "supabase"
+
+    async def put(self, path: str, data: bytes, content_type: str) -> str:
+        return await upload_to_supabase(data, path, os.path.splitext(path)[1])
+
+    def url(self, path: str) -> str:
+        return public_url(path)
+
+    async def probe(self, path: str, head_bytes: int = 64) -> Optional[ObjectInfo]:
+        return await probe_object(path, head_bytes)
+
+    async def get(self, path: str) -> Optional[bytes]:
+        return await download_object(path)
+
+    async def delete(self, path: str):
+        await delete_object(path)
+
+    async def delete_many(self, paths: List[str]) -> List[str]:
+        return await delete_objects(paths)
+
+    async def list_objects(self, prefix: str = "audio_") -> AsyncIterator[StoredObject]:
+        # The API sorts by the database's collation, which needn't be byte order
+        for item in sorted(await list_bucket(prefix)):
+            yield item
+
+    async def sign_upload(self, path: str, content_type: str) -> str:
+        return await create_signed_upload_url(path)
+
+    async def serve(self, path: str, range_header: Optional[str] = None, head: bool = False) -> Response:
+        # Supabase's public endpoint (and CDN) handle Range themselves
+        return RedirectResponse(public_url(path), status_code=307)
+
+class LocalStorage(StorageBackend):
+    """
+    Objects as files under LOCAL_STORAGE_DIR, served by this API at
+    ``/api/audio/files/{name}``; transcription services fetch them through
+    STORAGE_PUBLIC_URL, so it must be reachable from them.
+    """
+
+    name = "local"
+
+    def __init__(self, root: str = LOCAL_STORAGE_DIR, base_url: str = STORAGE_PUBLIC_URL):
+        self.root = os.path.abspath(root)
+        self.base_url = base_url.rstrip("/")
+        os.makedirs(self.root, exist_ok=True)
+
+    def file_path(self, path: str) -> str:
+        if not (OBJECT_NAME.match(path) or ARCHIVE_NAME.match(path)):
+            raise ValueError(f"Invalid object name: {path}")
+        return os.path.join(self.root, path)
+
+    def _write(self, path: str, data: bytes):
+        # Write then rename, so readers never see a partial file
+        fd, tmp = tempfile.mkstemp(dir=self.root, prefix=".upload-")
+        try:
+            with os.fdopen(fd, "wb") as out:
+                out.write(data)
+            os.replace(tmp, self.file_path(path))
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    async def put(self, path: str, data: bytes, content_type: str) -> str:
+        with timer(UPLOAD_SECONDS, method="local"):
+            await asyncio.to_thread(self._write, path, data)
+        return self.url(path)
+
+    def url(self, path: str) -> str:
+        return f"{self.base_url}/api/audio/files/{path}"
+
+    def _probe(self, path: str, head_bytes: int) -> Optional[ObjectInfo]:
+        try:
+            with open(self.file_path(path), "rb") as f:
+                size = os.fstat(f.fileno()).st_size
+                return ObjectInfo(size, get_content_type(os.path.splitext(path)[1]), f.read(head_bytes))
+        except FileNotFoundError:
+            return None
+
+    async def probe(self, path: str, head_bytes: int = 64) -> Optional[ObjectInfo]:
+        return await asyncio.to_thread(self._probe, path, head_bytes)
+
+    def _read(self, path: str) -> Optional[bytes]:
+        try:
+            with open(self.file_path(path), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    async def get(self, path: str) -> Optional[bytes]:
+        return await asyncio.to_thread(self._read, path)
+
+    async def delete(self, path: str):
+        try:
+            await asyncio.to_thread(os.remove, self.file_path(path))
+        except FileNotFoundError:
+            pass
+
+    def _list(self, prefix: str) -> List[StoredObject]:
+        objects = []
+        with os.scandir(self.root) as entries:
+            for entry in entries:
+                if entry.name.startswith(prefix) and entry.is_file():
+                    stat = entry.stat()
+                    objects.append(StoredObject(entry.name, stat.st_size, datetime.utcfromtimestamp(stat.st_mtime)))
+        return sorted(objects)
+
+    async def list_objects(self, prefix: str = "audio_") -> AsyncIterator[StoredObject]:
+        for item in await asyncio.to_thread(self._list, prefix):
+            yield item
+
+    async def serve(self, path: str, range_header: Optional[str] = None, head: bool = False) -> Response:
+        file_path = self.file_path(path)
+        try:
+            stat = await asyncio.to_thread(os.stat, file_path)
+        except FileNotFoundError:
+            return Response(status_code=404)
+        return FileRangeResponse(file_path, stat, get_content_type(os.path.splitext(path)[1]), range_header, head)
+
+class S3Storage(StorageBackend):
+    """
+    Any S3-compatible service (AWS, MinIO, R2, a local moto server) via
+    boto3, run in threads. Transcription services get S3_PUBLIC_URL links
+    when the bucket is public, otherwise presigned GETs valid S3_URL_TTL.
+    """
+
+    name = "s3"
+
+    def __init__(self):
+        import boto3
+        from botocore.config import Config
+
+        self.bucket = S3_BUCKET
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=S3_ENDPOINT_URL or None,
+            region_name=S3_REGION,
+            aws_access_key_id=S3_ACCESS_KEY_ID or None,
+            aws_secret_access_key=S3_SECRET_ACCESS_KEY or None,
+            # Path-style addressing works with MinIO and other local stand-ins
+            config=Config(signature_version="s3v4", s3={"addressing_style": "path" if S3_ENDPOINT_URL else "auto"}),
+        )
+
+    def _presign(self, method: str, path: str, ttl: int, **params) -> str:
+        return self.client.generate_presigned_url(
+            method, Params={"Bucket": self.bucket, "Key": path, **params}, ExpiresIn=ttl
+        )
+
+    async def put(self, path: str, data: bytes, content_type: str) -> str:
+        with timer(UPLOAD_SECONDS, method="s3"):
+            await asyncio.to_thread(self.client.put_object, Bucket=self.bucket, Key=path, Body=data,
+                                    ContentType=content_type)
+        return self.url(path)
+
+    def url(self, path: str) -> str:
+        if S3_PUBLIC_URL:
+            return f"{S3_PUBLIC_URL.rstrip('/')}/{path}"
+        return self._presign("get_object", path, S3_URL_TTL)
+
+    def _probe(self, path: str, head_bytes: int) -> Optional[ObjectInfo]:
+        from botocore.exceptions import ClientError
+
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=path, Range=f"bytes=0-{head_bytes - 1}")
+        except ClientError as e:
+            code = e.response.get("Error", {}).get("Code")
+            if code in ("NoSuchKey", "404"):
+                return None
+            if code == "InvalidRange":  # zero-length object
+                return ObjectInfo(0, "", b"")
+            raise
+        content_range = response.get("ContentRange") or ""
+        size = int(content_range.rsplit("/", 1)[1]) if "/" in content_range else response["ContentLength"]
+        return ObjectInfo(size, response.get("ContentType", ""), response["Body"].read())
+
+    async def probe(self, path: str, head_bytes: int = 64) -> Optional[ObjectInfo]:
+        return await asyncio.to_thread(self._probe, path, head_bytes)
+
+    def _get(self, path: str) -> Optional[bytes]:
+        from botocore.exceptions import ClientError
+
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=path)["Body"].read()
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+                return None
+            raise
+
+    async def get(self, path: str) -> Optional[bytes]:
+        return await asyncio.to_thread(self._get, path)
+
+    async def delete(self, path: str):
+        await asyncio.to_thread(self.client.delete_object, Bucket=self.bucket, Key=path)
+
+    def _delete_many(self, paths: List[str]) -> List[str]:
+        failed = []
+        # DeleteObjects takes at most 1000 keys
+        for i in range(0, len(paths), 1000):
+            batch = paths[i:i + 1000]
+            try:
+                response = self.client.delete_objects(
+                    Bucket=self.bucket, Delete={"Objects": [{"Key": key} for key in batch], "Quiet": True}
+                )
+            except Exception as e:
+                logger.warning("Deleting %d objects failed: %s", len(batch), e)
+                failed += batch
+                continue
+            failed += [error["Key"] for error in response.get("Errors", [])]
+        return failed
+
+    async def delete_many(self, paths: List[str]) -> List[str]:
+        return await asyncio.to_thread(self._delete_many, paths)
+
+    async def list_objects(self, prefix: str = "audio_") -> AsyncIterator[StoredObject]:
+        # ListObjectsV2 returns keys in UTF-8 byte order, a page at a time
+        params = {"Bucket": self.bucket, "Prefix": prefix, "MaxKeys": 1000}
+        while True:
+            response = await asyncio.to_thread(self.client.list_objects_v2, **params)
+            for item in response.get("Contents", []):
+                modified = item.get("LastModified")
+                if modified is not None and modified.tzinfo:
+                    modified = modified.astimezone(timezone.utc).replace(tzinfo=None)
+                yield StoredObject(item["Key"], item.get("Size", 0), modified)
+            if not response.get("IsTruncated"):
+                return
+            params["ContinuationToken"] = response["NextContinuationToken"]
+
+    async def sign_upload(self, path: str, content_type: str) -> str:
+        return self._presign("put_object", path, UPLOAD_TOKEN_TTL, ContentType=content_type)
+
+    async def serve(self, path: str, range_header: Optional[str] = None, head: bool = False) -> Response:
+        # Presigned GETs honour Range, so seeking goes straight to S3
+        return RedirectResponse(self._presign("get_object", path, 3600), status_code=307)
+
+_storage_classes = {"supabase": SupabaseStorage, "local": LocalStorage, "s3": S3Storage}
+_storages: Dict[str, StorageBackend] = {}
+
+def get_storage(name: str = STORAGE_BACKEND) -> StorageBackend:
+    """The configured storage backend, created on first use"""
+    if name not in _storage_classes:
+        raise ValueError(f"Unknown storage backend '{name}' (expected one of: {', '.join(_storage_classes)})")
+    if name not in _storages:
+        _storages[name] = _storage_classes[name]()
+    return _storages[name]
+
+async def shutdown_storage():
+    for storage in _storages.values():
+        await storage.aclose()
+    _storages.clear()
+
+async def upload_audio_file(audio_data: bytes, file_extension: str = ".wav", peaks: bool = True) -> str:
+    """
+    Store audio in the configured backend and return its URL; waveform
+    peaks are then built in the background unless ``peaks`` is False
+    """
+    # Generate unique filename
+    filename = f"audio_{uuid.uuid4()}{file_extension.lower()}"
+    observe(UPLOAD_BYTES, len(audio_data))
+    storage = get_storage()
+    
+    with span("storage.upload", stage="upload", bytes=len(audio_data), backend=storage.name):
+        url = await storage.put(filename, audio_data, get_content_type(file_extension))
+    if peaks:
+        schedule_peaks(filename, audio_data, file_extension)
+    return url
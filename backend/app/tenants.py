@@ -0,0 +1,498 @@
+"""
+Tenants, API keys, quotas and usage metering
+
+A tenant is a team sharing the deployment. It has API keys, and optionally
+a cap on concurrent transcription jobs and a monthly audio-minutes quota.
+Only the SHA-256 of each key is stored.
+
+``TenantMiddleware`` resolves the ``X-API-Key`` header (or ``api_key``
+query parameter) of /api and WebSocket requests to a tenant. Lookups go
+through an in-memory cache, hits and misses alike, for API_KEY_CACHE_TTL
+seconds, so a hot client costs no database query. A revoked key therefore
+keeps working for up to that long. An unknown key gets 401. A request
+without a key is served anonymously, without quotas, unless
+API_KEYS_REQUIRED is set.
+
+Once resolved, the tenant is the client key used for rate limiting, the
+scheduler's fair share and read-replica pinning (``tenant:<id>``). Each job
+takes a ``Lease`` from ``quotas.admit`` before it is queued upstream. The
+lease holds a concurrency slot and reserves the job's estimated minutes.
+While the lease is held, the transcript row is stamped with the tenant and
+the job's audio seconds are billed when it completes. ``owned_by`` is the
+filter that keeps list, search, export and delete queries to the caller's
+transcripts; ``is_admin`` gates the cross-tenant operations (storage GC,
+import) to the tenants in ADMIN_TENANTS.
+
+Usage (audio seconds, jobs, requests) is counted in memory and written
+every USAGE_FLUSH_INTERVAL seconds as one upsert per tenant and month.
+Each flush also re-reads the month's totals, so quota checks see what
+other processes have recorded, one flush late.
+"""
+import asyncio
+import hashlib
+import logging
+import secrets
+import time
+import uuid
+from collections import OrderedDict
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from starlette.requests import HTTPConnection
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from .config import (
+    ADMIN_TENANTS,
+    ADMISSION_RETRY_AFTER,
+    API_KEY_CACHE_ENTRIES,
+    API_KEY_CACHE_TTL,
+    API_KEYS_REQUIRED,
+    USAGE_FLUSH_INTERVAL,
+)
+from .database import SessionLocal
+from .metrics import CACHE_REQUESTS, REJECTED_REQUESTS, TENANT_AUDIO_SECONDS, USAGE_FLUSH_SECONDS, timer
+from .models import ApiKey, Tenant, TenantUsage, Transcript
+from .rate_limit import RateLimited, request_api_key
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "stt_"
+# Fetched by transcription services and <audio> elements, which send no key
+OPEN_PATHS = ("/api/audio/files/",)
+
+UsageKey = Tuple[str, str]  # (tenant id, YYYY-MM)
+
+
+class TenantInfo(NamedTuple):
+    id: str
+    name: str
+    max_concurrent_jobs: Optional[int]
+    monthly_minutes: Optional[float]
+
+    @property
+    def key(self) -> str:
+        """Client key for rate limiting, scheduling and replica pinning"""
+        return f"tenant:{self.id}"
+
+
+def tenant_of(conn: HTTPConnection) -> Optional[TenantInfo]:
+    """The tenant TenantMiddleware resolved for this request, if any"""
+    return conn.scope.get("state", {}).get("tenant")
+
+
+def owned_by(tenant: Optional[TenantInfo]):
+    """Filter for the transcripts a caller may list, search, export and delete.
+
+    A tenant gets its own; an anonymous caller gets the ones without a tenant.
+    """
+    if tenant is None:
+        return Transcript.tenant_id.is_(None)
+    return Transcript.tenant_id == uuid.UUID(tenant.id)
+
+
+def owner_key(tenant: Optional[TenantInfo]) -> str:
+    """Namespace for cached responses, so one caller's cached reads never reach another"""
+    return tenant.key if tenant is not None else "anonymous"
+
+
+def is_admin(tenant: Optional[TenantInfo]) -> bool:
+    """Whether this tenant is named (or its id listed) in ADMIN_TENANTS"""
+    return tenant is not None and (tenant.name in ADMIN_TENANTS or tenant.id in ADMIN_TENANTS)
+
+
+def current_month(now: Optional[datetime] = None) -> str:
+    return (now or datetime.utcnow()).strftime("%Y-%m")
+
+
+def seconds_until_next_month(now: Optional[datetime] = None) -> float:
+    now = now or datetime.utcnow()
+    start = datetime(now.year + now.month // 12, now.month % 12 + 1, 1)
+    return (start - now).total_seconds()
+
+
+# Keys
+
+def generate_key() -> str:
+    return KEY_PREFIX + secrets.token_urlsafe(32)
+
+
+def hash_key(api_key: str) -> str:
+    # Keys are random, so a plain hash can't be brute-forced and can be looked up directly
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+
+
+def _info(tenant: Tenant) -> TenantInfo:
+    return TenantInfo(str(tenant.id), tenant.name, tenant.max_concurrent_jobs, tenant.monthly_minutes)
+
+
+def _load_key(digest: str) -> Optional[TenantInfo]:
+    with SessionLocal() as db:
+        tenant = db.execute(
+            select(Tenant).join(ApiKey, ApiKey.tenant_id == Tenant.id)
+            .where(ApiKey.key_hash == digest, ApiKey.revoked_at.is_(None), Tenant.active.is_(True))
+        ).scalar()
+        return _info(tenant) if tenant is not None else None
+
+
+class KeyCache:
+    """Key hash -> tenant, or None for keys that don't resolve, each kept for ``ttl`` seconds"""
+
+    def __init__(self, ttl: float = API_KEY_CACHE_TTL, max_entries: int = API_KEY_CACHE_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, Optional[TenantInfo]]]" = OrderedDict()
+
+    async def lookup(self, api_key: str) -> Optional[TenantInfo]:
+        digest = hash_key(api_key)
+        entry = self._entries.get(digest)
+        if entry is not None and entry[0] > time.monotonic():
+            CACHE_REQUESTS.labels(cache="api_keys", result="hit").inc()
+            self._entries.move_to_end(digest)
+            return entry[1]
+        CACHE_REQUESTS.labels(cache="api_keys", result="miss").inc()
+        tenant = await asyncio.to_thread(_load_key, digest)
+        self._entries[digest] = (time.monotonic() + self.ttl, tenant)
+        self._entries.move_to_end(digest)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return tenant
+
+    def clear(self):
+        self._entries.clear()
+
+
+# Administration (manage_tenants.py)
+
+def create_tenant(db, name: str, max_concurrent_jobs: Optional[int] = None,
+                  monthly_minutes: Optional[float] = None) -> Tenant:
+    tenant = Tenant(name=name, max_concurrent_jobs=max_concurrent_jobs, monthly_minutes=monthly_minutes)
+    db.add(tenant)
+    db.commit()
+    return tenant
+
+
+def find_tenant(db, name_or_id: str) -> Optional[Tenant]:
+    try:
+        return db.get(Tenant, uuid.UUID(name_or_id))
+    except ValueError:
+        return db.execute(select(Tenant).where(Tenant.name == name_or_id)).scalar()
+
+
+def issue_key(db, tenant: Tenant, name: Optional[str] = None) -> str:
+    """Create an API key for the tenant; the returned key is not stored and can't be shown again"""
+    api_key = generate_key()
+    db.add(ApiKey(tenant_id=tenant.id, key_hash=hash_key(api_key), prefix=api_key[:12], name=name))
+    db.commit()
+    return api_key
+
+
+def revoke_key(db, prefix: str) -> int:
+    """Revoke the keys with this prefix (as listed: the first 12 characters); returns how many"""
+    keys = db.execute(
+        select(ApiKey).where(ApiKey.prefix == prefix[:12], ApiKey.revoked_at.is_(None))
+    ).scalars().all()
+    for key in keys:
+        key.revoked_at = datetime.utcnow()
+    db.commit()
+    return len(keys)
+
+
+# Usage metering
+
+def _read_totals(db, keys: Iterable[UsageKey]) -> Dict[UsageKey, float]:
+    totals = {key: 0.0 for key in keys}
+    by_month: Dict[str, List[uuid.UUID]] = {}
+    for tenant_id, month in totals:
+        by_month.setdefault(month, []).append(uuid.UUID(tenant_id))
+    for month, tenant_ids in by_month.items():
+        rows = db.execute(
+            select(TenantUsage.tenant_id, TenantUsage.audio_seconds)
+            .where(TenantUsage.month == month, TenantUsage.tenant_id.in_(tenant_ids))
+        )
+        for tenant_id, seconds in rows:
+            totals[(str(tenant_id), month)] = seconds or 0.0
+    return totals
+
+
+def _load_totals(keys: List[UsageKey]) -> Dict[UsageKey, float]:
+    with SessionLocal() as db:
+        return _read_totals(db, keys)
+
+
+def _write_usage(counts: Dict[UsageKey, List], refresh: List[UsageKey]) -> Dict[UsageKey, float]:
+    """Add the counts to tenant_usage in one transaction, then read back the refresh keys' totals"""
+    with SessionLocal() as db, db.begin():
+        if counts:
+            insert = pg_insert if db.bind.dialect.name == "postgresql" else sqlite_insert
+            statement = insert(TenantUsage)
+            statement = statement.on_conflict_do_update(
+                index_elements=[TenantUsage.tenant_id, TenantUsage.month],
+                set_={
+                    "audio_seconds": TenantUsage.audio_seconds + statement.excluded.audio_seconds,
+                    "jobs": TenantUsage.jobs + statement.excluded.jobs,
+                    "requests": TenantUsage.requests + statement.excluded.requests,
+                    "updated_at": statement.excluded.updated_at,
+                },
+            )
+            now = datetime.utcnow()
+            # Sorted, so concurrent flushes from several processes lock rows in the same order
+            db.execute(statement, [
+                {"tenant_id": uuid.UUID(tenant_id), "month": month, "audio_seconds": seconds, "jobs": jobs,
+                 "requests": requests, "updated_at": now}
+                for (tenant_id, month), (seconds, jobs, requests) in sorted(counts.items())
+            ])
+        return _read_totals(db, refresh)
+
+
+class UsageMeter:
+    """Per-tenant usage counted in memory and written in batches"""
+
+    def __init__(self):
+        self._pending: Dict[UsageKey, List] = {}  # [audio seconds, jobs, requests]
+        self._flushing: Dict[UsageKey, List] = {}
+        self._totals: Dict[UsageKey, float] = {}  # audio seconds in the database as of the last read
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def _add(self, tenant_id: str, seconds: float = 0.0, jobs: int = 0, requests: int = 0):
+        counts = self._pending.setdefault((tenant_id, current_month()), [0.0, 0, 0])
+        counts[0] += seconds
+        counts[1] += jobs
+        counts[2] += requests
+
+    def count_request(self, tenant_id: str):
+        self._add(tenant_id, requests=1)
+
+    def record_job(self, tenant_id: str, audio_seconds: float):
+        self._add(tenant_id, seconds=audio_seconds, jobs=1)
+
+    def unflushed(self, key: UsageKey) -> List:
+        pending = self._pending.get(key, [0.0, 0, 0])
+        flushing = self._flushing.get(key, [0.0, 0, 0])
+        return [a + b for a, b in zip(pending, flushing)]
+
+    async def used_seconds(self, tenant_id: str) -> float:
+        """Audio seconds this month, including what hasn't been written yet"""
+        key = (tenant_id, current_month())
+        if key not in self._totals:
+            loaded = await asyncio.to_thread(_load_totals, [key])
+            self._totals.setdefault(key, loaded[key])
+        return self._totals[key] + self.unflushed(key)[0]
+
+    async def flush(self):
+        """Write pending counts and refresh this month's totals"""
+        async with self._lock:
+            month = current_month()
+            self._totals = {k: v for k, v in self._totals.items() if k[1] == month}
+            if not self._pending and not self._totals:
+                return
+            self._flushing, self._pending = self._pending, {}
+            refresh = sorted(set(self._totals) | {k for k in self._flushing if k[1] == month})
+            try:
+                with timer(USAGE_FLUSH_SECONDS):
+                    totals = await asyncio.to_thread(_write_usage, self._flushing, refresh)
+                self._totals.update(totals)
+            except Exception as e:
+                logger.warning("Writing usage of %d tenants failed, retrying next flush: %s", len(self._flushing), e)
+                for key, counts in self._flushing.items():
+                    pending = self._pending.setdefault(key, [0.0, 0, 0])
+                    for i, value in enumerate(counts):
+                        pending[i] += value
+            finally:
+                self._flushing = {}
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(USAGE_FLUSH_INTERVAL)
+            await self.flush()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        """Stop the flush loop and write what's left"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+
+# Quotas
+
+_current_lease: ContextVar[Optional["Lease"]] = ContextVar("current_lease", default=None)
+
+
+def current_lease() -> Optional["Lease"]:
+    """The lease of the job running in this task, if it was admitted for a tenant"""
+    return _current_lease.get()
+
+
+class Lease:
+    """
+    A tenant's claim on one job: a concurrency slot and its reserved
+    seconds, given back on exit. Entering it makes it the current lease, so
+    the job's transcript row and usage are attributed to the tenant.
+    """
+
+    def __init__(self, quotas: "Quotas", tenant: Optional[TenantInfo], reserved: float = 0.0):
+        self.quotas = quotas
+        self.tenant = tenant
+        self.reserved = reserved
+        self._released = tenant is None
+        self._token = None
+
+    @property
+    def tenant_id(self) -> Optional[str]:
+        return self.tenant.id if self.tenant is not None else None
+
+    def bill(self, audio_seconds: float):
+        if self.tenant is None:
+            return
+        seconds = max(0.0, audio_seconds or 0.0)
+        self.quotas.meter.record_job(self.tenant.id, seconds)
+        TENANT_AUDIO_SECONDS.labels(tenant=self.tenant.name).inc(seconds)
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self.quotas._release(self)
+
+    def __enter__(self):
+        self._token = _current_lease.set(self if self.tenant is not None else None)
+        return self
+
+    def __exit__(self, *exc):
+        _current_lease.reset(self._token)
+        self.release()
+
+
+class Quotas:
+    """Per-tenant concurrency and monthly minutes, checked before a job is queued"""
+
+    def __init__(self, meter: UsageMeter):
+        self.meter = meter
+        self._active: Dict[str, int] = {}
+        self._reserved: Dict[str, float] = {}
+
+    async def admit(self, tenant: Optional[TenantInfo], duration: Optional[float] = None) -> Lease:
+        """A lease for one more job of the tenant; RateLimited when over a quota (anonymous: no limits)"""
+        if tenant is None:
+            return Lease(self, None)
+        active = self._active.get(tenant.id, 0)
+        if tenant.max_concurrent_jobs is not None and active >= tenant.max_concurrent_jobs:
+            REJECTED_REQUESTS.labels(reason="quota_concurrency").inc()
+            raise RateLimited(f"Tenant {tenant.name} already has {active} transcription jobs in progress "
+                              f"(limit {tenant.max_concurrent_jobs})", ADMISSION_RETRY_AFTER)
+        # Take the slot before awaiting the usage lookup, so concurrent admissions see it
+        lease = Lease(self, tenant, duration or 0.0)
+        self._active[tenant.id] = active + 1
+        self._reserved[tenant.id] = self._reserved.get(tenant.id, 0.0) + lease.reserved
+        try:
+            if tenant.monthly_minutes is not None:
+                limit = tenant.monthly_minutes * 60
+                used = await self.meter.used_seconds(tenant.id)
+                # Other jobs in progress count with their estimates, this one included
+                if used >= limit or used + self._reserved[tenant.id] > limit:
+                    REJECTED_REQUESTS.labels(reason="quota_minutes").inc()
+                    message = (f"Tenant {tenant.name} has used {used / 60:.1f} of its "
+                               f"{tenant.monthly_minutes:g} audio minutes this month")
+                    if used < limit:
+                        message += f"; this job (~{lease.reserved / 60:.1f} min) would go over"
+                    raise RateLimited(message, seconds_until_next_month())
+        except BaseException:
+            lease.release()
+            raise
+        return lease
+
+    def _release(self, lease: Lease):
+        tenant_id = lease.tenant.id
+        self._active[tenant_id] -= 1
+        self._reserved[tenant_id] -= lease.reserved
+        if self._active[tenant_id] <= 0:
+            del self._active[tenant_id]
+            del self._reserved[tenant_id]
+
+    def active(self, tenant_id: str) -> int:
+        return self._active.get(tenant_id, 0)
+
+    async def usage(self, tenant: TenantInfo) -> Dict:
+        """This month's usage of a tenant against its quotas"""
+        month = current_month()
+
+        def load():
+            with SessionLocal() as db:
+                return db.get(TenantUsage, (uuid.UUID(tenant.id), month))
+
+        row = await asyncio.to_thread(load)
+        seconds, jobs, requests = self.meter.unflushed((tenant.id, month))
+        if row is not None:
+            seconds, jobs, requests = seconds + row.audio_seconds, jobs + row.jobs, requests + row.requests
+        used_minutes = seconds / 60
+        return {
+            "tenant": tenant.name,
+            "tenant_id": tenant.id,
+            "month": month,
+            "audio_minutes": round(used_minutes, 2),
+            "monthly_minutes": tenant.monthly_minutes,
+            "remaining_minutes": (round(max(0.0, tenant.monthly_minutes - used_minutes), 2)
+                                  if tenant.monthly_minutes is not None else None),
+            "jobs": jobs,
+            "requests": requests,
+            "active_jobs": self.active(tenant.id),
+            "max_concurrent_jobs": tenant.max_concurrent_jobs,
+        }
+
+
+# Requests
+
+class TenantMiddleware:
+    """Resolves the API key of /api and WebSocket requests to ``request.state.tenant``"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    @staticmethod
+    def _guarded(scope: Scope) -> bool:
+        path = scope.get("path", "")
+        if scope["type"] == "http" and scope.get("method") == "OPTIONS":
+            return False  # CORS preflight
+        return (path.startswith("/api/") or path.startswith("/ws")) and not path.startswith(OPEN_PATHS)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] not in ("http", "websocket") or not self._guarded(scope):
+            await self.app(scope, receive, send)
+            return
+        api_key = request_api_key(HTTPConnection(scope))
+        tenant = await key_cache.lookup(api_key) if api_key else None
+        if tenant is None and (api_key or API_KEYS_REQUIRED):
+            REJECTED_REQUESTS.labels(reason="auth").inc()
+            await self._reject(scope, receive, send, "Invalid API key" if api_key else "API key required")
+            return
+        if tenant is not None:
+            scope.setdefault("state", {})["tenant"] = tenant
+            meter.count_request(tenant.id)
+        await self.app(scope, receive, send)
+
+    @staticmethod
+    async def _reject(scope: Scope, receive: Receive, send: Send, message: str):
+        if scope["type"] == "websocket":
+            await receive()  # websocket.connect
+            await send({"type": "websocket.close", "code": 4401, "reason": message})
+            return
+        response = JSONResponse({"detail": message}, status_code=401, headers={"WWW-Authenticate": "ApiKey"})
+        await response(scope, receive, send)
+
+
+key_cache = KeyCache()
+meter = UsageMeter()
+quotas = Quotas(meter)
@@ -0,0 +1,193 @@
+"""
+Lightweight OpenTelemetry-style tracing for the transcription pipeline
+
+Spans are tracked with contextvars so they follow a request across awaits.
+Finished traces are exported as OTLP/JSON spans, either appended to a local
+JSONL file or POSTed to an OTLP/HTTP collector, on a background thread.
+Spans tagged with a ``stage`` also accumulate into per-stage durations that
+are persisted on the Transcript row.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+import httpx
+
+from .config import TRACE_EXPORTER, TRACE_FILE, TRACE_OTLP_ENDPOINT
+
+logger = logging.getLogger(__name__)
+
+SERVICE_NAME = "speech-to-text-api"
+
+
+class Span:
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start_ns", "end_ns", "attributes", "stage")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], stage: Optional[str], attributes: Dict):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.stage = stage
+        self.attributes = attributes
+
+    @property
+    def duration(self) -> float:
+        end_ns = self.end_ns if self.end_ns is not None else time.time_ns()
+        return (end_ns - self.start_ns) / 1e9
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def to_otlp(self) -> Dict:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [
+                {"key": key, "value": _otlp_value(value)} for key, value in self.attributes.items()
+            ],
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+class Trace:
+    def __init__(self):
+        self.trace_id = os.urandom(16).hex()
+        self.spans: List[Span] = []
+        self.stages: Dict[str, float] = {}
+
+    def record(self, span: Span):
+        self.spans.append(span)
+        if span.stage:
+            self.stages[span.stage] = round(self.stages.get(span.stage, 0.0) + span.duration, 3)
+
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("current_trace", default=None)
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+def _otlp_value(value) -> Dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+@contextmanager
+def span(name: str, stage: Optional[str] = None, **attributes):
+    """
+    Open a span as a child of the current one.
+
+    If no trace is active a new one is started and exported when this
+    span closes, so callers outside a request still get traced.
+    """
+    trace = _current_trace.get()
+    owns_trace = trace is None
+    if owns_trace:
+        trace = Trace()
+    parent = _current_span.get()
+
+    current = Span(name, trace.trace_id, parent.span_id if parent else None, stage, attributes)
+    trace_token = _current_trace.set(trace) if owns_trace else None
+    span_token = _current_span.set(current)
+    try:
+        yield current
+    except Exception as e:
+        current.set_attribute("error", True)
+        current.set_attribute("exception.message", str(e))
+        raise
+    finally:
+        current.end_ns = time.time_ns()
+        trace.record(current)
+        _current_span.reset(span_token)
+        if owns_trace:
+            _current_trace.reset(trace_token)
+            export(trace)
+
+
+def record_stage(name: str, stage: str, start_ns: int, end_ns: int, **attributes):
+    """Record a span for an interval that wasn't a single code block, e.g. upstream queueing"""
+    trace = _current_trace.get()
+    if trace is None:
+        return
+    parent = _current_span.get()
+    synthetic = Span(name, trace.trace_id, parent.span_id if parent else None, stage, attributes)
+    synthetic.start_ns = start_ns
+    synthetic.end_ns = end_ns
+    trace.record(synthetic)
+
+
+def stage_timings() -> Dict[str, float]:
+    """Per-stage durations (seconds) accumulated so far in the current trace"""
+    trace = _current_trace.get()
+    return dict(trace.stages) if trace else {}
+
+
+# Export
+
+_executor: Optional[ThreadPoolExecutor] = None
+_file_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="trace-export")
+    return _executor
+
+
+def _otlp_payload(trace: Trace) -> Dict:
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+            "scopeSpans": [{
+                "scope": {"name": __name__},
+                "spans": [s.to_otlp() for s in trace.spans],
+            }],
+        }]
+    }
+
+
+def _export_file(trace: Trace):
+    lines = "".join(json.dumps(s.to_otlp()) + "\n" for s in trace.spans)
+    with _file_lock, open(TRACE_FILE, "a", encoding="utf-8") as f:
+        f.write(lines)
+
+
+def _export_otlp(trace: Trace):
+    try:
+        httpx.post(f"{TRACE_OTLP_ENDPOINT.rstrip('/')}/v1/traces", json=_otlp_payload(trace), timeout=5.0)
+    except httpx.HTTPError as e:
+        logger.warning("Trace export failed: %s", e)
+
+
+def export(trace: Trace):
+    """Hand a finished trace to the configured exporter without blocking the caller"""
+    if TRACE_EXPORTER == "file":
+        _get_executor().submit(_export_file, trace)
+    elif TRACE_EXPORTER == "otlp":
+        _get_executor().submit(_export_otlp, trace)
+
+
+def shutdown_tracing():
+    """Wait for pending exports to finish"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
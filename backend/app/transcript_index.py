@@ -0,0 +1,179 @@
+"""
+Time-window and speaker-filtered views of a stored transcript
+
+Each completed transcript gets an interval index over its utterances
+(sorted start times plus a running maximum of end times, overall and per
+speaker). A window query is two binary searches and a slice, O(log n + k),
+and the index is cached so repeat views never touch the big JSON columns.
+"""
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+from typing import Dict, Iterable, List, Optional, Set
+
+from .cache import index_cache
+from .models import Transcript
+
+# Top-level fields of a transcript response; ``fields=`` picks from these
+TRANSCRIPT_FIELDS = (
+    "id", "audio_url", "transcript", "diarized_transcript", "utterances", "speakers_count", "speakers",
+    "confidence_score", "processing_time", "stage_timings", "preprocessing", "audio_duration",
+    "language_detected", "status", "created_at", "completed_at",
+)
+# Columns too large to load unless the response needs them
+LARGE_COLUMNS = ("utterances", "diarized_transcript")
+
+
+class _Intervals:
+    __slots__ = ("positions", "starts", "max_ends")
+
+    def __init__(self, positions: List[int], utterances: List[Dict]):
+        self.positions = positions
+        self.starts = [utterances[p].get("start", 0) for p in positions]
+        # Monotonic, so "first utterance that may still be running at t" is a bisect
+        self.max_ends = list(accumulate((utterances[p].get("end", 0) for p in positions), max))
+
+    def overlapping(self, start: float, end: float) -> Iterable[int]:
+        lo = bisect_right(self.max_ends, start)
+        hi = bisect_left(self.starts, end)
+        return self.positions[lo:hi]
+
+
+class TranscriptIndex:
+    """Interval index over utterances with times in ms"""
+
+    def __init__(self, utterances: List[Dict]):
+        self.utterances = sorted(utterances, key=lambda u: u.get("start", 0))
+        self.all = _Intervals(list(range(len(self.utterances))), self.utterances)
+        by_speaker: Dict[str, List[int]] = {}
+        for position, utterance in enumerate(self.utterances):
+            by_speaker.setdefault(str(utterance.get("speaker")), []).append(position)
+        self.speakers = {label: _Intervals(positions, self.utterances) for label, positions in by_speaker.items()}
+
+    def query(self, start_ms: Optional[float] = None, end_ms: Optional[float] = None,
+              speakers: Optional[Set[str]] = None) -> List[Dict]:
+        """Utterances overlapping [start_ms, end_ms), words clipped to the window, in time order"""
+        lo = float("-inf") if start_ms is None else start_ms
+        hi = float("inf") if end_ms is None else end_ms
+        if speakers is None:
+            positions = list(self.all.overlapping(lo, hi))
+        else:
+            positions = sorted(p for label in speakers if label in self.speakers
+                               for p in self.speakers[label].overlapping(lo, hi))
+
+        result = []
+        for position in positions:
+            utterance = self.utterances[position]
+            if utterance.get("end", 0) <= lo:
+                continue  # ended before the window; only its running-max neighbour reached in
+            if utterance.get("start", 0) >= lo and utterance.get("end", 0) <= hi:
+                result.append(utterance)
+                continue
+            # Straddles a window edge: keep only the words inside
+            words = [w for w in utterance.get("words") or [] if w.get("end", 0) > lo and w.get("start", 0) < hi]
+            if not words and utterance.get("words"):
+                continue
+            clipped = dict(utterance, words=words)
+            if words:
+                clipped.update(start=words[0].get("start", 0), end=words[-1].get("end", 0),
+                               text=" ".join(w.get("text", "") for w in words))
+            result.append(clipped)
+        return result
+
+
+def get_index(transcript: Transcript) -> TranscriptIndex:
+    """Cached index for a transcript; builds it (loading the utterances column) on a miss
+
+    Only completed transcripts are cached: until then the utterances may still change.
+    """
+    key = (str(transcript.id), "index")
+    index = index_cache.get(key)
+    if index is None:
+        index = TranscriptIndex(transcript.utterances or [])
+        if transcript.status == "completed":
+            index_cache.set(key, index)
+    return index
+
+
+def parse_fields(fields: Optional[str]) -> Optional[Set[str]]:
+    """``"id,utterances"`` -> {"id", "utterances"}; None means every field"""
+    if not fields:
+        return None
+    wanted = {f.strip() for f in fields.split(",") if f.strip()}
+    unknown = wanted - set(TRANSCRIPT_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    return wanted
+
+
+def parse_speakers(speaker: Optional[str]) -> Optional[Set[str]]:
+    return {s.strip() for s in speaker.split(",") if s.strip()} if speaker else None
+
+
+def view_key(fields: Optional[Set[str]], start: Optional[float], end: Optional[float],
+             speakers: Optional[Set[str]]) -> str:
+    """Canonical name of a transcript view, for caching its serialized response"""
+    return "|".join((
+        ",".join(sorted(fields)) if fields else "*",
+        "" if start is None else repr(float(start)),
+        "" if end is None else repr(float(end)),
+        ",".join(sorted(speakers)) if speakers else "*",
+    ))
+
+
+def transcript_payload(transcript: Transcript, fields: Optional[Set[str]] = None,
+                       start: Optional[float] = None, end: Optional[float] = None,
+                       speakers: Optional[Set[str]] = None, extra: Optional[Dict] = None) -> Dict:
+    """
+    Build a transcript response.
+
+    ``start``/``end`` (seconds) and ``speakers`` restrict ``utterances`` to
+    that window via the interval index, and ``transcript`` becomes the
+    text of those utterances. A windowed response leaves out
+    ``diarized_transcript`` (a second full copy of every utterance) unless
+    it's asked for in ``fields``. ``extra`` supplies fields computed by the
+    caller, such as ``speakers``. Columns that aren't returned are never
+    read, so deferred JSON columns stay unloaded.
+    """
+    ranged = start is not None or end is not None or speakers is not None
+    if fields is None:
+        fields = set(TRANSCRIPT_FIELDS) - ({"diarized_transcript"} if ranged else set())
+    extra = extra or {}
+
+    utterances = None
+    if ranged and fields & {"utterances", "transcript"}:
+        utterances = get_index(transcript).query(
+            start * 1000 if start is not None else None,
+            end * 1000 if end is not None else None,
+            speakers,
+        )
+
+    getters = {
+        "id": lambda: str(transcript.id),
+        "audio_url": lambda: transcript.audio_url,
+        "transcript": lambda: " ".join(u.get("text", "") for u in utterances) if ranged else transcript.transcript,
+        "diarized_transcript": lambda: transcript.diarized_transcript,
+        "utterances": lambda: utterances if ranged else transcript.utterances,
+        "speakers_count": lambda: transcript.speakers_count,
+        "confidence_score": lambda: transcript.confidence_score,
+        "processing_time": lambda: transcript.processing_time,
+        "stage_timings": lambda: transcript.stage_timings,
+        "preprocessing": lambda: transcript.preprocessing,
+        "audio_duration": lambda: transcript.audio_duration,
+        "language_detected": lambda: transcript.language_detected,
+        "status": lambda: transcript.status,
+        "created_at": lambda: transcript.created_at.isoformat() if transcript.created_at else None,
+        "completed_at": lambda: transcript.completed_at.isoformat() if transcript.completed_at else None,
+    }
+    payload = {}
+    for name in TRANSCRIPT_FIELDS:
+        if name not in fields:
+            continue
+        if name in extra:
+            payload[name] = extra[name]
+        elif name in getters:
+            payload[name] = getters[name]()
+    if ranged:
+        payload["range"] = {"start": start, "end": end,
+                            "speakers": sorted(speakers) if speakers else None,
+                            "utterances": len(utterances) if utterances is not None else None}
+    return payload
@@ -0,0 +1,247 @@
+"""
+Direct-to-storage uploads
+
+The client asks for a signed upload URL, PUTs the audio straight into the
+storage bucket (Supabase or S3) and then confirms. The API only issues and checks an
+HMAC-signed upload token (so any worker can confirm any upload without
+shared state), validates the stored object's size and format and queues
+the transcription. Audio bytes never pass through this process.
+"""
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+import time
+import uuid
+from typing import Dict, Optional
+
+from sqlalchemy.exc import IntegrityError
+
+from .assembly import chunk_mode, transcribe_audio, transcribe_audio_chunked
+from .audio import estimate_duration
+from .backends import TranscriptionBackend, choose_backend
+from .config import ALLOWED_EXTENSIONS, MAX_FILE_SIZE, SECRET_KEY, SECRET_KEY_SET, UPLOAD_TOKEN_TTL
+from .database import SessionLocal
+from .models import Transcript
+from .replicas import read_router, transcript_key
+from .scheduler import BATCH, Ticket, scheduler
+from .storage import get_content_type, get_storage
+from .tenants import Lease, TenantInfo, quotas
+
+logger = logging.getLogger(__name__)
+
+# Leading bytes of each container we accept, checked against the claimed extension
+FORMATS_BY_EXTENSION = {
+    ".wav": {"wav"}, ".mp3": {"mp3"}, ".m4a": {"mp4"}, ".aac": {"aac", "mp4"},
+    ".ogg": {"ogg"}, ".flac": {"flac"}, ".webm": {"webm"},
+}
+
+# Keeps queued jobs referenced until they finish
+_queued_jobs = set()
+
+
+class UploadError(Exception):
+    """Upload token or stored object rejected; ``status_code`` is the HTTP status to return"""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def sniff_format(head: bytes) -> Optional[str]:
+    """Container/codec from the first bytes of a file, or None if unrecognised"""
+    if head[:4] == b"RIFF" and head[8:12] == b"WAVE":
+        return "wav"
+    if head[:4] == b"fLaC":
+        return "flac"
+    if head[:4] == b"OggS":
+        return "ogg"
+    if head[4:8] == b"ftyp":
+        return "mp4"
+    if head[:4] == b"\x1a\x45\xdf\xa3":
+        return "webm"
+    if head[:3] == b"ID3":
+        return "mp3"
+    if len(head) >= 2 and head[0] == 0xFF:
+        if head[1] & 0xF6 == 0xF0:
+            return "aac"  # ADTS
+        if head[1] & 0xE0 == 0xE0:
+            return "mp3"  # MPEG audio frame sync
+    return None
+
+
+def _b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _unb64(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _require_secret_key():
+    if not SECRET_KEY_SET:
+        # Anyone could forge tokens signed with the public default
+        raise UploadError("Direct uploads are disabled until SECRET_KEY is set", 503)
+
+
+def _signature(body: str) -> str:
+    _require_secret_key()
+    return _b64(hmac.new(SECRET_KEY.encode(), body.encode(), hashlib.sha256).digest())
+
+
+def issue_token(path: str, extension: str, ttl: int = UPLOAD_TOKEN_TTL) -> str:
+    body = _b64(json.dumps({"p": path, "e": extension, "x": int(time.time()) + ttl}).encode())
+    return f"{body}.{_signature(body)}"
+
+
+def read_token(token: str) -> Dict:
+    """Claims of a valid token; UploadError if forged or expired"""
+    body, _, signature = token.partition(".")
+    if not signature or not hmac.compare_digest(signature, _signature(body)):
+        raise UploadError("Invalid upload token", 403)
+    claims = json.loads(_unb64(body))
+    if claims["x"] < time.time():
+        raise UploadError("Upload token expired", 410)
+    return claims
+
+
+async def create_upload(filename: Optional[str], size: Optional[int] = None) -> Dict:
+    """Reserve an object path and return where and how the client should upload it"""
+    _require_secret_key()
+    extension = (os.path.splitext(filename)[1] if filename else ".wav").lower()
+    if extension not in ALLOWED_EXTENSIONS:
+        raise UploadError(f"Unsupported file type {extension or '(none)'}", 415)
+    if size is not None and size > MAX_FILE_SIZE:
+        raise UploadError(f"File too large: {size} bytes (max {MAX_FILE_SIZE})", 413)
+
+    # The object's uuid becomes the transcript id, so confirming twice is harmless
+    path = f"audio_{uuid.uuid4()}{extension}"
+    storage = get_storage()
+    content_type = get_content_type(extension)
+    try:
+        upload_url = await storage.sign_upload(path, content_type)
+    except NotImplementedError as e:
+        raise UploadError(str(e), 501)
+    return {
+        "upload_id": issue_token(path, extension),
+        "upload_url": upload_url,
+        "method": "PUT",
+        "headers": {"Content-Type": content_type},
+        "audio_url": storage.url(path),
+        "max_bytes": MAX_FILE_SIZE,
+        "expires_in": UPLOAD_TOKEN_TTL,
+    }
+
+
+async def validate_upload(path: str, extension: str) -> Dict:
+    """Check the stored object; rejected objects are deleted"""
+    storage = get_storage()
+    probe = await storage.probe(path)
+    if probe is None:
+        raise UploadError("Upload not found; PUT the file to upload_url first", 409)
+    size, content_type, head = probe
+
+    problem = None
+    if size == 0:
+        problem = "Uploaded file is empty"
+    elif size > MAX_FILE_SIZE:
+        problem = f"File too large: {size} bytes (max {MAX_FILE_SIZE})"
+    elif sniff_format(head) not in FORMATS_BY_EXTENSION.get(extension, set()):
+        problem = f"File content is not {extension} audio"
+    if problem:
+        try:
+            await storage.delete(path)
+        except Exception as e:
+            logger.warning("Could not delete rejected upload %s: %s", path, e)
+        raise UploadError(problem, 422)
+    return {"size": size, "content_type": content_type,
+            "estimated_duration": estimate_duration(size, extension, head)}
+
+
+async def complete_upload(token: str, chunked: Optional[bool] = None,
+                          backend: Optional[TranscriptionBackend] = None,
+                          language: Optional[str] = None, tenant: str = "", priority: str = BATCH,
+                          account: Optional[TenantInfo] = None) -> Dict:
+    """
+    Validate a finished upload, create its "processing" transcript row and
+    queue the transcription with the scheduler. Returns the transcript id to
+    poll and the queue estimate; RateLimited if the queue is full or the
+    ``account`` tenant is over a quota.
+    """
+    claims = read_token(token)
+    path, extension = claims["p"], claims["e"]
+    record_id = uuid.UUID(path[len("audio_"):-len(extension)])
+    audio_url = get_storage().url(path)
+
+    db = SessionLocal()
+    try:
+        existing = db.get(Transcript, record_id)
+        if existing is not None:
+            return {"status": existing.status, "transcript_id": str(record_id), "audio_url": audio_url}
+    finally:
+        db.close()
+
+    info = await validate_upload(path, extension)
+    backend = backend or choose_backend(size=info["size"], language=language)
+    # Quotas and a place in the queue before creating the row, so a rejection leaves nothing behind
+    lease = await quotas.admit(account, info["estimated_duration"])
+    try:
+        ticket = scheduler.submit(tenant, priority, info["estimated_duration"])
+    except Exception:
+        lease.release()
+        raise
+
+    db = SessionLocal()
+    try:
+        db.add(Transcript(id=record_id, audio_url=audio_url, status="processing",
+                          tenant_id=uuid.UUID(account.id) if account is not None else None))
+        db.commit()
+        read_router.pin(tenant, transcript_key(record_id))
+    except IntegrityError:
+        # A concurrent confirmation of the same upload got there first
+        scheduler.cancel(ticket)
+        lease.release()
+        return {"status": "processing", "transcript_id": str(record_id), "audio_url": audio_url}
+    except Exception:
+        scheduler.cancel(ticket)
+        lease.release()
+        raise
+    finally:
+        db.close()
+
+    task = asyncio.create_task(_run_queued(ticket, lease, str(record_id), audio_url, chunked, backend, language))
+    _queued_jobs.add(task)
+    task.add_done_callback(_queued_jobs.discard)
+    return {"status": "queued", "transcript_id": str(record_id), "audio_url": audio_url, **info,
+            "queue": scheduler.estimate(ticket)}
+
+
+async def _run_queued(ticket: Ticket, lease: Lease, record_id: str, audio_url: str, chunked: Optional[bool],
+                      backend: Optional[TranscriptionBackend], language: Optional[str]):
+    try:
+        # Already accepted: wait for the scheduler however long it takes
+        with lease:
+            async with scheduler.hold(ticket):
+                mode = chunk_mode(chunked)
+                if mode != "off":
+                    await transcribe_audio_chunked(audio_url, force=(mode == "on"), backend=backend,
+                                                   language=language, record_id=record_id, ticket=ticket)
+                else:
+                    await transcribe_audio(audio_url, backend=backend, language=language, record_id=record_id)
+        # The client polling for this job reads its own result from the primary
+        read_router.pin(ticket.tenant)
+    except Exception as e:
+        logger.error("Queued transcription %s failed: %s", record_id, e)
+        db = SessionLocal()
+        try:
+            transcript = db.get(Transcript, uuid.UUID(record_id))
+            if transcript is not None:
+                transcript.status = "error"
+                transcript.error_message = str(e)
+                db.commit()
+                read_router.pin(ticket.tenant, transcript_key(record_id))
+        finally:
+            db.close()
@@ -0,0 +1,233 @@
+"""
+Waveform peaks for the audio player
+
+When audio is stored, it is decoded block by block and reduced to min/max
+pairs per PEAKS_SAMPLES_PER_PEAK samples. Each coarser level halves the
+previous one, down to about MIN_LEVEL_PEAKS pairs. Every level is written
+as int8 (or int16) pairs into one file under PEAKS_DIR. Requests
+memory-map that file and copy out only the level and window they need,
+served in the audiowaveform ``.dat`` (v1) layout that waveform-data.js
+reads directly.
+
+PEAKS_DIR is a local cache, not the record: another instance, a restart
+on an ephemeral disk or a direct upload leaves it without the file.
+``ensure_peaks`` then fetches the audio from storage and builds the file
+once, however many requests are waiting for it. A build that fails is
+remembered for PEAKS_RETRY_AFTER seconds, so undecodable audio isn't
+downloaded again on every request.
+"""
+import asyncio
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import time
+from typing import Awaitable, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from .audio import AudioDecodeError
+from .config import PEAKS_BITS, PEAKS_DIR, PEAKS_ENABLED, PEAKS_RETRY_AFTER, PEAKS_SAMPLES_PER_PEAK
+from .metrics import PEAKS_SECONDS, timer
+from .preprocessing import iter_mono_blocks
+from .tracing import span
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"STTPEAK1"
+# magic, bits, sample rate, total samples, level count
+HEADER = struct.Struct("<8sHIQH")
+# samples per peak, peak count, byte offset of the level's pairs
+LEVEL = struct.Struct("<IIQ")
+# audiowaveform .dat v1: version, flags (1 = 8-bit), sample rate, samples per pixel, length
+DAT_HEADER = struct.Struct("<iIiiI")
+MIN_LEVEL_PEAKS = 1024
+DECODE_RATE = 16000  # formats decoded by ffmpeg; WAV keeps its own rate
+
+# Peak builds in progress by object name; also keeps the tasks referenced until they finish
+_building: Dict[str, asyncio.Task] = {}
+# Objects whose peaks couldn't be built, and when (monotonic) to try again
+_failed: Dict[str, float] = {}
+
+
+class Level(NamedTuple):
+    samples_per_peak: int
+    count: int
+    offset: int
+
+
+class PeaksInfo(NamedTuple):
+    bits: int
+    sample_rate: int
+    samples: int
+    levels: List[Level]
+
+
+def peaks_path(object_name: str, root: str = PEAKS_DIR) -> str:
+    return os.path.join(root, os.path.splitext(object_name)[0] + ".peaks")
+
+
+def _quantize(values: np.ndarray, bits: int) -> np.ndarray:
+    values = np.clip(np.round(values), -32768, 32767).astype(np.int16)
+    return (values >> 8).astype(np.int8) if bits == 8 else values
+
+
+def compute_pyramid(audio_data: bytes, file_extension: str, samples_per_peak: int = PEAKS_SAMPLES_PER_PEAK,
+                    bits: int = PEAKS_BITS) -> Tuple[int, int, List[np.ndarray]]:
+    """
+    Decode in blocks and build the pyramid; returns (sample rate, samples,
+    levels), each level an (n, 2) array of min/max, finest first
+    """
+    rate = 0
+    samples = 0
+    pending = np.zeros(0, dtype=np.float32)
+    mins, maxs = [], []
+    for block, rate in iter_mono_blocks(audio_data, file_extension, DECODE_RATE):
+        samples += len(block)
+        block = np.concatenate([pending, block]) if len(pending) else block
+        usable = len(block) - len(block) % samples_per_peak
+        if usable:
+            frames = block[:usable].reshape(-1, samples_per_peak)
+            mins.append(frames.min(axis=1))
+            maxs.append(frames.max(axis=1))
+        pending = block[usable:]
+    if not rate:
+        raise AudioDecodeError("No audio samples decoded")
+    if len(pending):
+        mins.append(pending.min(keepdims=True))
+        maxs.append(pending.max(keepdims=True))
+
+    level = np.stack([_quantize(np.concatenate(mins), bits), _quantize(np.concatenate(maxs), bits)], axis=1)
+    levels = [level]
+    while len(level) > MIN_LEVEL_PEAKS:
+        if len(level) % 2:
+            level = np.concatenate([level, level[-1:]])
+        pairs = level.reshape(-1, 2, 2)
+        level = np.stack([pairs[:, :, 0].min(axis=1), pairs[:, :, 1].max(axis=1)], axis=1)
+        levels.append(level)
+    return rate, samples, levels
+
+
+def write_pyramid(path: str, sample_rate: int, samples: int, levels: List[np.ndarray],
+                  samples_per_peak: int = PEAKS_SAMPLES_PER_PEAK, bits: int = PEAKS_BITS):
+    """Write the pyramid file atomically"""
+    offset = HEADER.size + LEVEL.size * len(levels)
+    table = []
+    for i, level in enumerate(levels):
+        table.append(LEVEL.pack(samples_per_peak << i, len(level), offset))
+        offset += level.nbytes
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(HEADER.pack(MAGIC, bits, sample_rate, samples, len(levels)))
+            f.write(b"".join(table))
+            for level in levels:
+                f.write(np.ascontiguousarray(level).astype("<i1" if bits == 8 else "<i2").tobytes())
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def build_peaks(object_name: str, audio_data: bytes, file_extension: str) -> str:
+    """Compute and store the peaks of a stored audio object; CPU-bound, run it off the event loop"""
+    rate, samples, levels = compute_pyramid(audio_data, file_extension)
+    path = peaks_path(object_name)
+    write_pyramid(path, rate, samples, levels)
+    return path
+
+
+def _remember_failure(object_name: str):
+    now = time.monotonic()
+    for name in [name for name, until in _failed.items() if until <= now]:
+        del _failed[name]
+    _failed[object_name] = now + PEAKS_RETRY_AFTER
+
+
+async def _build(object_name: str, audio_data: bytes, file_extension: str):
+    try:
+        with span("waveform.peaks", stage="peaks", bytes=len(audio_data)), timer(PEAKS_SECONDS):
+            await asyncio.to_thread(build_peaks, object_name, audio_data, file_extension)
+        _failed.pop(object_name, None)
+    except (AudioDecodeError, OSError, ValueError) as e:
+        logger.warning("Waveform peaks skipped for %s: %s", object_name, e)
+        _remember_failure(object_name)
+
+
+def _track(object_name: str, build: Awaitable) -> asyncio.Task:
+    task = asyncio.create_task(build)
+    _building[object_name] = task
+    task.add_done_callback(lambda _: _building.pop(object_name, None))
+    return task
+
+
+def schedule_peaks(object_name: str, audio_data: bytes, file_extension: str):
+    """Build peaks in the background so uploads don't wait for them"""
+    if not PEAKS_ENABLED:
+        return
+    _track(object_name, _build(object_name, audio_data, file_extension))
+
+
+async def _fetch_and_build(object_name: str, fetch: Callable[[str], Awaitable[Optional[bytes]]]):
+    audio_data = await fetch(object_name)
+    if audio_data is None:
+        logger.warning("Waveform peaks skipped for %s: not in storage", object_name)
+        _remember_failure(object_name)
+        return
+    await _build(object_name, audio_data, os.path.splitext(object_name)[1])
+
+
+async def ensure_peaks(object_name: str, fetch: Callable[[str], Awaitable[Optional[bytes]]]) -> Optional[str]:
+    """
+    Path of the object's peaks file, built from ``fetch(object_name)`` (the
+    stored audio) when this instance doesn't have it; None if it can't be,
+    without fetching again while an earlier failure is remembered
+    """
+    path = peaks_path(object_name)
+    if os.path.exists(path):
+        return path
+    if not PEAKS_ENABLED or _failed.get(object_name, 0) > time.monotonic():
+        return None
+    task = _building.get(object_name) or _track(object_name, _fetch_and_build(object_name, fetch))
+    await asyncio.shield(task)
+    return path if os.path.exists(path) else None
+
+
+def read_info(mapped) -> PeaksInfo:
+    magic, bits, rate, samples, count = HEADER.unpack_from(mapped, 0)
+    if magic != MAGIC:
+        raise ValueError("Not a peaks file")
+    levels = [Level(*LEVEL.unpack_from(mapped, HEADER.size + i * LEVEL.size)) for i in range(count)]
+    return PeaksInfo(bits, rate, samples, levels)
+
+
+def choose_level(info: PeaksInfo, resolution: Optional[float]) -> Level:
+    """Coarsest level with at least ``resolution`` peaks per second (the overview if None)"""
+    if resolution is None:
+        return info.levels[-1]
+    for level in reversed(info.levels):
+        if info.sample_rate / level.samples_per_peak >= resolution:
+            return level
+    return info.levels[0]
+
+
+def read_peaks(path: str, resolution: Optional[float] = None, start: Optional[float] = None,
+               end: Optional[float] = None) -> Tuple[bytes, Level, int, int]:
+    """
+    One level of a peaks file as ``.dat`` bytes, windowed to [start, end)
+    seconds; returns (body, level, first peak, peak count). Only the
+    pages holding that window are read.
+    """
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        info = read_info(mapped)
+        level = choose_level(info, resolution)
+        seconds_per_peak = level.samples_per_peak / info.sample_rate
+        first = min(level.count, int(start / seconds_per_peak)) if start else 0
+        last = level.count if end is None else min(level.count, -int(-end // seconds_per_peak))
+        count = max(0, last - first)
+        width = 2 * (info.bits // 8)
+        data = mapped[level.offset + first * width:level.offset + (first + count) * width]
+    header = DAT_HEADER.pack(1, 1 if info.bits == 8 else 0, info.sample_rate, level.samples_per_peak, count)
+    return header + data, level, first, count
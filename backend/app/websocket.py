@@ -2,16 +2,30 @@ from fastapi import WebSocket, WebSocketDisconnect
 import asyncio
 import json
 import base64
+import math
 import logging
-from typing import List, Dict, Set
+from typing import List, Dict, Optional, Set, Union
 from .storage import upload_audio_file
-from .assembly import transcribe_audio_realtime, transcribe_audio
-from .database import SessionLocal
+from .preprocessing import maybe_preprocess
+from .backends import check_requested, choose_backend
+from .assembly import chunk_mode, transcribe_audio_chunked, transcribe_audio_realtime, transcribe_audio
+from sqlalchemy.orm import defer
 from .models import Transcript
-from .config import MAX_CONNECTIONS
+from .config import MAX_CONNECTIONS, LOG_SAMPLE_RATE, UTTERANCE_PAGE_MAX, UTTERANCE_PAGE_SIZE
+from .metrics import WEBSOCKET_CONNECTIONS, WEBSOCKET_SEND_QUEUE, in_flight
+from .tracing import span
+from .rate_limit import RateLimited, client_key, limiter, upload_gate
+from .scheduler import INTERACTIVE, PRIORITIES, parse_priority, scheduler
+from .audio import estimate_duration
+from .cpu_tasks import dumps_json, encode_response, enhance_utterances, loads_json
+from .cache import canonical_id, response_cache
+from .workers import run_cpu
+from .transcript_index import LARGE_COLUMNS, parse_fields, parse_speakers, transcript_payload, view_key
+from .retention import needs_payload, rehydrate
+from .replicas import read_router, transcript_key
+from .delivery import UtteranceStream
+from .tenants import TenantInfo, owned_by, owner_key, quotas, tenant_of
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Connection manager for real-time updates
@@ -25,30 +39,47 @@ class ConnectionManager:
         self.active_connections.append(websocket)
         if connection_id:
             self.connection_ids[websocket] = connection_id
-        logger.info(f"WebSocket connected. Total connections: {len(self.active_connections)}")
+        WEBSOCKET_CONNECTIONS.set(len(self.active_connections))
+        logger.info("WebSocket connected. Total connections: %d", len(self.active_connections))
         
     def disconnect(self, websocket: WebSocket):
         if websocket in self.active_connections:
             self.active_connections.remove(websocket)
         if websocket in self.connection_ids:
             del self.connection_ids[websocket]
-        logger.info(f"WebSocket disconnected. Total connections: {len(self.active_connections)}")
+        WEBSOCKET_CONNECTIONS.set(len(self.active_connections))
+        logger.info("WebSocket disconnected. Total connections: %d", len(self.active_connections))
         
-    async def send_personal_message(self, message: Dict, websocket: WebSocket):
+    async def send_personal_message(self, message: Union[Dict, str], websocket: WebSocket):
+        """Send a dict as JSON, or a str that is already serialized JSON"""
         try:
-            await websocket.send_json(message)
+            with in_flight(WEBSOCKET_SEND_QUEUE):
+                await websocket.send_text(message if isinstance(message, str) else dumps_json(message))
         except Exception as e:
             logger.error(f"Error sending personal message: {e}")
             self.disconnect(websocket)
             
-    async def broadcast(self, message: Dict):
+    async def broadcast(self, message: Union[Dict, str]):
+        """Send to every connection; the message is serialized once, not per client"""
+        await self._send_all(message, list(self.active_connections))
+
+    async def broadcast_to_tenant(self, message: Union[Dict, str], tenant: Optional[TenantInfo]):
+        """Send to the connections of one tenant (or, for None, the anonymous ones)"""
+        owner = owner_key(tenant)
+        await self._send_all(message, [c for c in self.active_connections if owner_key(tenant_of(c)) == owner])
+
+    async def _send_all(self, message: Union[Dict, str], connections: List[WebSocket]):
+        text = message if isinstance(message, str) else dumps_json(message)
         disconnected = []
-        for connection in self.active_connections:
+        WEBSOCKET_SEND_QUEUE.inc(len(connections))
+        for connection in connections:
             try:
-                await connection.send_json(message)
+                await connection.send_text(text)
             except Exception as e:
                 logger.error(f"Error broadcasting to connection: {e}")
                 disconnected.append(connection)
+            finally:
+                WEBSOCKET_SEND_QUEUE.dec()
         
         # Clean up disconnected connections
         for conn in disconnected:
@@ -68,10 +99,10 @@ async def websocket_handler(ws: WebSocket):
             try:
                 # Receive data with timeout
                 data = await asyncio.wait_for(ws.receive_text(), timeout=300.0)  # 5 minute timeout
-                logger.info(f"Received WebSocket data, length: {len(data)}")
+                logger.debug("Received WebSocket data, length: %d", len(data), extra={"sample_rate": LOG_SAMPLE_RATE})
                 
                 try:
-                    message = json.loads(data)
+                    message = loads_json(data)
                     await process_websocket_message(ws, message)
                     
                 except json.JSONDecodeError as e:
@@ -107,15 +138,36 @@ async def process_websocket_message(ws: WebSocket, message: Dict):
         await handle_get_transcripts(ws, message)
     elif message_type == "get_transcript":
         await handle_get_single_transcript(ws, message)
+    elif message_type == "get_utterances":
+        await handle_get_utterances(ws, message)
     else:
         await manager.send_personal_message({
             "status": "error",
             "message": "Invalid message type or missing audio_data",
-            "available_types": ["transcribe", "get_transcripts", "get_transcript"]
+            "available_types": ["transcribe", "get_transcripts", "get_transcript", "get_utterances"]
         }, ws)
 
 async def handle_audio_transcription(ws: WebSocket, message: Dict):
     """Handle audio transcription requests"""
+    # Root span: upload, submit, queue, processing and persist all nest under it
+    with span("websocket.transcribe", filename=message.get("filename", "")):
+        try:
+            limiter.check(client_key(ws), scope="websocket")
+            await _handle_audio_transcription(ws, message)
+        except RateLimited as e:
+            await send_rate_limited(ws, e)
+
+async def send_rate_limited(ws: WebSocket, exc: RateLimited):
+    """Tell the client to back off; mirrors HTTP 429 / close code 1013"""
+    await manager.send_personal_message({
+        "status": "error",
+        "message": str(exc),
+        "error_type": "rate_limited",
+        "code": 1013,
+        "retry_after": max(1, math.ceil(exc.retry_after))
+    }, ws)
+
+async def _handle_audio_transcription(ws: WebSocket, message: Dict):
     try:
         await manager.send_personal_message({
             "status": "received",
@@ -124,8 +176,9 @@ async def handle_audio_transcription(ws: WebSocket, message: Dict):
         
         # Decode base64 audio data
         try:
-            audio_bytes = base64.b64decode(message["audio_data"])
-            logger.info(f"Successfully decoded audio data: {len(audio_bytes)} bytes")
+            with span("websocket.decode", stage="decode"):
+                audio_bytes = base64.b64decode(message["audio_data"])
+            logger.debug("Decoded audio data: %d bytes", len(audio_bytes))
         except Exception as e:
             logger.error(f"Base64 decode error: {e}")
             await manager.send_personal_message({
@@ -135,6 +188,17 @@ async def handle_audio_transcription(ws: WebSocket, message: Dict):
             }, ws)
             return
         
+        if message.get("backend"):
+            try:
+                check_requested(message["backend"])
+            except ValueError as e:
+                await manager.send_personal_message({
+                    "status": "error",
+                    "message": str(e),
+                    "error_type": "invalid_backend"
+                }, ws)
+                return
+        
         file_extension = message.get("file_extension", ".wav")
         filename = message.get("filename", f"audio{file_extension}")
         
@@ -145,16 +209,22 @@ async def handle_audio_transcription(ws: WebSocket, message: Dict):
         }, ws)
         
         try:
-            logger.info(f"Starting upload for file: {filename}, size: {len(audio_bytes)} bytes")
-            audio_url = await upload_audio_file(audio_bytes, file_extension)
-            logger.info(f"Successfully uploaded to Supabase: {audio_url}")
+            logger.info("Uploading %s (%d bytes)", filename, len(audio_bytes))
+            async with upload_gate.slot():
+                prepared = await maybe_preprocess(audio_bytes, file_extension, message.get("preprocess"))
+                audio_url = await upload_audio_file(prepared.data, prepared.file_extension)
+            logger.debug("Uploaded to Supabase: %s", audio_url)
             
             await manager.send_personal_message({
                 "status": "uploaded",
                 "message": "File uploaded successfully, starting transcription...",
-                "audio_url": audio_url
+                "audio_url": audio_url,
+                "preprocessing": prepared.report or None
             }, ws)
             
+        except RateLimited as e:
+            await send_rate_limited(ws, e)
+            return
         except Exception as e:
             error_details = str(e)
             logger.error(f"Upload error details: {error_details}")
@@ -172,24 +242,58 @@ async def handle_audio_transcription(ws: WebSocket, message: Dict):
         
         # Start transcription with real-time updates
         try:
-            logger.info(f"Starting real-time transcription for: {audio_url}")
+            logger.debug("Starting real-time transcription for: %s", audio_url)
+            
+            language = message.get("language")
+            backend = choose_backend(message.get("backend"), size=len(prepared.data), language=language)
+            mode = chunk_mode(message.get("chunked"))
+            priority = parse_priority(message.get("priority"), default=INTERACTIVE, allowed=PRIORITIES)
+            duration = (prepared.report or {}).get("processed_duration") or estimate_duration(
+                len(prepared.data), prepared.file_extension, prepared.data[:64])
+
+            async def queued(estimate):
+                await manager.send_personal_message({
+                    "status": "queued",
+                    "message": "Waiting for a transcription slot",
+                    **estimate
+                }, ws)
+
+            # Results arrive as a summary plus sequenced utterance pages (see delivery.py)
+            stream = UtteranceStream(ws, message.get("page_size") or UTTERANCE_PAGE_SIZE,
+                                     message.get("initial_utterances"), message.get("paged", True) is not False)
             
-            result = await transcribe_audio_realtime(audio_url, websocket=ws)
+            # Tenant quotas, then wait for an upstream job slot (priority, then fair share), with queue updates
+            with await quotas.admit(tenant_of(ws), duration):
+                async with scheduler.slot(client_key(ws), priority, duration, on_wait=queued) as ticket:
+                    if mode != "off":
+                        result = await transcribe_audio_chunked(
+                            audio_url, websocket=stream, audio_data=prepared.data,
+                            file_extension=prepared.file_extension, force=(mode == "on"),
+                            preprocessing=prepared.report, backend=backend, language=language, ticket=ticket
+                        )
+                    else:
+                        result = await transcribe_audio_realtime(audio_url, websocket=stream,
+                                                                 preprocessing=prepared.report,
+                                                                 backend=backend, language=language)
+            read_router.pin(client_key(ws))
             
-            # Broadcast to all connected clients that a new transcript is available
-            await manager.broadcast({
+            # Tell the tenant's other connected clients that a new transcript is available
+            await manager.broadcast_to_tenant({
                 "status": "new_transcript",
                 "message": "New transcript available",
                 "transcript_id": result["id"],
                 "preview": result["text"][:100] + "..." if len(result["text"]) > 100 else result["text"]
-            })
+            }, tenant_of(ws))
             
+        except RateLimited as e:
+            await send_rate_limited(ws, e)
         except Exception as e:
             logger.error(f"Transcription error: {e}")
             await manager.send_personal_message({
                 "status": "error",
                 "message": f"Transcription failed: {str(e)}",
-                "error_type": "transcription_error"
+                "error_type": "transcription_error",
+                "upstream_id": getattr(e, "transcript_id", None)
             }, ws)
             
     except Exception as e:
@@ -207,9 +311,10 @@ async def handle_get_transcripts(ws: WebSocket, message: Dict):
         limit = message.get("limit", 10)
         offset = (page - 1) * limit
         
-        db = SessionLocal()
+        db = read_router.session(client_key(ws))
         try:
-            transcripts = db.query(Transcript)\
+            query = db.query(Transcript).filter(owned_by(tenant_of(ws)))
+            transcripts = query\
                            .order_by(Transcript.created_at.desc())\
                            .offset(offset)\
                            .limit(limit)\
@@ -261,9 +366,52 @@ async def handle_get_single_transcript(ws: WebSocket, message: Dict):
             }, ws)
             return
         
-        db = SessionLocal()
         try:
-            transcript = db.query(Transcript).filter(Transcript.id == transcript_id).first()
+            transcript_id = canonical_id(transcript_id)
+        except ValueError:
+            await manager.send_personal_message({
+                "status": "error",
+                "message": "Invalid transcript id"
+            }, ws)
+            return
+        
+        # Optional window: "start"/"end" in seconds, "speaker" and "fields" as lists or comma-separated
+        window_start, window_end = message.get("start"), message.get("end")
+        try:
+            # Same rules as the REST query parameters: seconds >= 0, end after start
+            window_start, window_end = (None if v is None else float(v) for v in (window_start, window_end))
+            if any(v is not None and not (math.isfinite(v) and v >= 0) for v in (window_start, window_end)):
+                raise ValueError
+        except (TypeError, ValueError):
+            await manager.send_personal_message({
+                "status": "error",
+                "message": "start and end must be non-negative numbers of seconds"
+            }, ws)
+            return
+        if window_start is not None and window_end is not None and window_end <= window_start:
+            await manager.send_personal_message({
+                "status": "error",
+                "message": "end must be after start"
+            }, ws)
+            return
+        speaker, fields = message.get("speaker"), message.get("fields")
+        speakers = parse_speakers(",".join(speaker) if isinstance(speaker, list) else speaker)
+        wanted = parse_fields(",".join(fields) if isinstance(fields, list) else fields)
+        partial = wanted is not None or window_start is not None or window_end is not None or speakers is not None
+        
+        tenant = tenant_of(ws)
+        variant = f"{owner_key(tenant)}|ws:" + view_key(wanted, window_start, window_end, speakers)
+        cached = await response_cache.get(transcript_id, variant)
+        if cached is not None:
+            await manager.send_personal_message(cached.body.decode("utf-8"), ws)
+            return
+        
+        db = read_router.session(client_key(ws), transcript_key(transcript_id))
+        try:
+            query = db.query(Transcript)
+            if partial:
+                query = query.options(*(defer(getattr(Transcript, c)) for c in LARGE_COLUMNS))
+            transcript = query.filter(Transcript.id == transcript_id, owned_by(tenant)).first()
             
             if not transcript:
                 await manager.send_personal_message({
@@ -271,28 +419,20 @@ async def handle_get_single_transcript(ws: WebSocket, message: Dict):
                     "message": "Transcript not found"
                 }, ws)
                 return
+            if needs_payload(wanted, window_start is not None or window_end is not None or speakers is not None):
+                await rehydrate(transcript)
             
-            transcript_data = {
-                "id": str(transcript.id),
-                "audio_url": transcript.audio_url,
-                "transcript": transcript.transcript,
-                "diarized_transcript": transcript.diarized_transcript,
-                "utterances": transcript.utterances,
-                "speakers_count": transcript.speakers_count,
-                "confidence_score": transcript.confidence_score,
-                "processing_time": transcript.processing_time,
-                "audio_duration": transcript.audio_duration,
-                "language_detected": transcript.language_detected,
-                "status": transcript.status,
-                "created_at": transcript.created_at.isoformat() if transcript.created_at else None,
-                "completed_at": transcript.completed_at.isoformat() if transcript.completed_at else None
-            }
+            transcript_data = transcript_payload(transcript, wanted, window_start, window_end, speakers)
             
-            await manager.send_personal_message({
+            # Encode off the event loop; large transcripts take a while
+            body, etag = await run_cpu(encode_response, {
                 "status": "success",
                 "message": "Transcript retrieved",
                 "data": transcript_data
-            }, ws)
+            }, task="json", size=len(transcript_data.get("utterances") or []))
+            if transcript.status == "completed":
+                await response_cache.set(transcript_id, variant, body, etag)
+            await manager.send_personal_message(body.decode("utf-8"), ws)
             
         finally:
             db.close()
@@ -304,10 +444,57 @@ async def handle_get_single_transcript(ws: WebSocket, message: Dict):
             "message": f"Failed to get transcript: {str(e)}"
         }, ws)
 
+async def handle_get_utterances(ws: WebSocket, message: Dict):
+    """Send utterances[offset:offset + limit] of a transcript as sequenced pages"""
+    try:
+        transcript_id = message.get("transcript_id")
+        if not transcript_id:
+            await manager.send_personal_message({
+                "status": "error",
+                "message": "transcript_id is required"
+            }, ws)
+            return
+        stream = UtteranceStream(ws, message.get("page_size") or UTTERANCE_PAGE_SIZE)
+        try:
+            offset = max(0, int(message.get("offset", 0)))
+            limit = max(0, min(int(message.get("limit", stream.page_size)), UTTERANCE_PAGE_MAX))
+        except (TypeError, ValueError):
+            await manager.send_personal_message({
+                "status": "error",
+                "message": "offset and limit must be integers"
+            }, ws)
+            return
+        
+        db = read_router.session(client_key(ws), transcript_key(transcript_id))
+        try:
+            transcript = db.query(Transcript).options(defer(Transcript.diarized_transcript)) \
+                .filter(Transcript.id == transcript_id, owned_by(tenant_of(ws))).first()
+            if not transcript:
+                await manager.send_personal_message({
+                    "status": "error",
+                    "message": "Transcript not found"
+                }, ws)
+                return
+            await rehydrate(transcript)
+            utterances = transcript.utterances or []
+        finally:
+            db.close()
+        
+        # Only the requested slice is converted; totals still refer to the whole transcript
+        await stream.pages(transcript_id, enhance_utterances(utterances[offset:offset + limit]), offset,
+                           len(utterances))
+        
+    except Exception as e:
+        logger.error(f"Error getting utterances: {e}")
+        await manager.send_personal_message({
+            "status": "error",
+            "message": f"Failed to get utterances: {str(e)}"
+        }, ws)
+
 # Legacy function for backward compatibility
-async def notify_clients(data):
-    """Notify all connected clients"""
-    await manager.broadcast({
+async def notify_clients(data, tenant: Optional[TenantInfo] = None):
+    """Notify the connected clients of the tenant the data belongs to"""
+    await manager.broadcast_to_tenant({
         "status": "notification",
         "data": data
-    })
+    }, tenant)
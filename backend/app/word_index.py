@@ -0,0 +1,185 @@
+"""
+Per-transcript word index for click-to-seek and keyword spotting
+
+``build_word_index`` turns a transcript's utterances into one packed blob:
+the sorted term list, and for each term its occurrences as four parallel
+arrays. Those arrays hold the word ordinal, the start and end times (ms)
+and a speaker code. ``WordIndex`` reads a blob back with NumPy views, with
+no copying. A term lookup is a binary search, a phrase lookup intersects
+ordinals, and a prefix (``refund*``) is a range of the sorted terms.
+
+Pure functions (NumPy aside) with no config or I/O imports, so they can
+run on the process pool like cpu_tasks.
+"""
+import re
+import struct
+from bisect import bisect_left
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+MAGIC = b"STTWIDX1"
+# magic, words, terms, speakers
+HEADER = struct.Struct("<8sIII")
+MAX_TERM_BYTES = 64
+TOKEN = re.compile(r"[\w']+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased words without surrounding punctuation; "Don't!" -> ["don't"]"""
+    terms = []
+    for match in TOKEN.findall(text.lower()):
+        term = match.strip("'")
+        if term:
+            terms.append(term.encode("utf-8")[:MAX_TERM_BYTES].decode("utf-8", "ignore"))
+    return terms
+
+
+def _words(utterances: Sequence[Dict]):
+    """(term, start, end, speaker) for every word in time order"""
+    for utterance in sorted(utterances, key=lambda u: u.get("start", 0)):
+        speaker = str(utterance.get("speaker"))
+        words = utterance.get("words") or []
+        if not words:
+            # No word timings: every word gets the utterance's span
+            words = [{"text": utterance.get("text", ""), "start": utterance.get("start", 0),
+                      "end": utterance.get("end", 0)}]
+        for word in words:
+            for term in tokenize(word.get("text", "")):
+                yield term, word.get("start", 0), word.get("end", 0), str(word.get("speaker") or speaker)
+
+
+def build_word_index(utterances: Sequence[Dict]) -> bytes:
+    """Pack a transcript's words into a WordIndex blob"""
+    terms_seen, starts, ends, speaker_codes = [], [], [], []
+    speakers: Dict[str, int] = {}
+    for term, start, end, speaker in _words(utterances):
+        terms_seen.append(term)
+        starts.append(start)
+        ends.append(end)
+        speaker_codes.append(speakers.setdefault(speaker, len(speakers)))
+
+    words = len(terms_seen)
+    vocabulary = sorted(set(terms_seen))
+    term_ids = {term: i for i, term in enumerate(vocabulary)}
+    ids = np.fromiter((term_ids[t] for t in terms_seen), dtype=np.uint32, count=words)
+    # Stable sort: occurrences of a term stay in ordinal (= time) order
+    order = np.argsort(ids, kind="stable").astype(np.uint32)
+    counts = np.bincount(ids, minlength=len(vocabulary)).astype(np.uint32)
+
+    parts = [HEADER.pack(MAGIC, words, len(vocabulary), len(speakers))]
+    for label in speakers:
+        encoded = label.encode("utf-8")
+        parts.append(struct.pack("<H", len(encoded)) + encoded)
+    for term in vocabulary:
+        encoded = term.encode("utf-8")
+        parts.append(struct.pack("<B", len(encoded)) + encoded)
+    parts.append(counts.tobytes())
+    parts.append(order.tobytes())
+    parts.append(np.asarray(starts, dtype=np.uint32)[order].tobytes())
+    parts.append(np.asarray(ends, dtype=np.uint32)[order].tobytes())
+    parts.append(np.asarray(speaker_codes, dtype=np.uint16)[order].tobytes())
+    return b"".join(parts)
+
+
+def term_counts(blob: bytes) -> List[Tuple[str, int, int]]:
+    """(term, occurrences, first start ms) per term, for the cross-transcript table"""
+    index = WordIndex(blob)
+    firsts = index.starts[index.offsets[:-1]] if index.words else []
+    return [(term, int(count), int(first)) for term, count, first in zip(index.terms, index.counts, firsts)]
+
+
+def index_transcript(utterances: Sequence[Dict]) -> Tuple[bytes, List[Tuple[str, int, int]]]:
+    """The blob and its per-term summary in one call (one process-pool round trip)"""
+    blob = build_word_index(utterances)
+    return blob, term_counts(blob)
+
+
+class WordIndex:
+    """Read-only view of a packed word index"""
+
+    def __init__(self, blob: bytes):
+        magic, self.words, term_count, speaker_count = HEADER.unpack_from(blob, 0)
+        if magic != MAGIC:
+            raise ValueError("Not a word index")
+        position = HEADER.size
+        self.speakers: List[str] = []
+        for _ in range(speaker_count):
+            (length,) = struct.unpack_from("<H", blob, position)
+            self.speakers.append(bytes(blob[position + 2:position + 2 + length]).decode("utf-8"))
+            position += 2 + length
+        self.terms: List[str] = []
+        for _ in range(term_count):
+            length = blob[position]
+            self.terms.append(bytes(blob[position + 1:position + 1 + length]).decode("utf-8"))
+            position += 1 + length
+
+        def take(dtype, count):
+            nonlocal position
+            array = np.frombuffer(blob, dtype=dtype, count=count, offset=position)
+            position += array.nbytes
+            return array
+
+        self.counts = take(np.uint32, term_count)
+        self.offsets = np.concatenate(([0], np.cumsum(self.counts, dtype=np.int64)))
+        self.ordinals = take(np.uint32, self.words)
+        self.starts = take(np.uint32, self.words)
+        self.ends = take(np.uint32, self.words)
+        self.speaker_codes = take(np.uint16, self.words)
+
+    def _span(self, term: str) -> Optional[slice]:
+        i = bisect_left(self.terms, term)
+        if i == len(self.terms) or self.terms[i] != term:
+            return None
+        return slice(int(self.offsets[i]), int(self.offsets[i + 1]))
+
+    def _prefix_spans(self, prefix: str) -> List[slice]:
+        i = bisect_left(self.terms, prefix)
+        spans = []
+        while i < len(self.terms) and self.terms[i].startswith(prefix):
+            spans.append(slice(int(self.offsets[i]), int(self.offsets[i + 1])))
+            i += 1
+        return spans
+
+    def find(self, query: str, speakers: Optional[set] = None, limit: Optional[int] = None) -> List[Dict]:
+        """
+        Occurrences of a word, a phrase ("thank you") or a prefix ("refund*"), in time order
+
+        Each hit has start/end in seconds (a phrase spans its first to last
+        word) and the speaker label.
+        """
+        terms = tokenize(query)
+        if not terms:
+            return []
+        if len(terms) == 1 and query.rstrip().endswith("*"):
+            positions = np.concatenate([np.arange(s.start, s.stop) for s in self._prefix_spans(terms[0])] or
+                                       [np.empty(0, dtype=np.int64)])
+            positions = positions[np.argsort(self.ordinals[positions], kind="stable")]
+            starts, ends = self.starts[positions], self.ends[positions]
+            codes = self.speaker_codes[positions]
+        else:
+            spans = [self._span(term) for term in terms]
+            if any(s is None for s in spans):
+                return []
+            first = np.arange(spans[0].start, spans[0].stop)
+            ordinals = self.ordinals[first].astype(np.int64)
+            last_positions = first
+            for offset, span in enumerate(spans[1:], 1):
+                following = self.ordinals[span].astype(np.int64)
+                found = np.searchsorted(following, ordinals + offset)
+                found = np.minimum(found, max(len(following) - 1, 0))
+                keep = (following[found] == ordinals + offset) if len(following) else np.zeros(len(ordinals), bool)
+                first, ordinals = first[keep], ordinals[keep]
+                last_positions = span.start + found[keep]
+            starts, ends = self.starts[first], self.ends[last_positions]
+            codes = self.speaker_codes[first]
+
+        hits = []
+        for start, end, code in zip(starts.tolist(), ends.tolist(), codes.tolist()):
+            label = self.speakers[code]
+            if speakers is not None and label not in speakers:
+                continue
+            hits.append({"start": start / 1000.0, "end": end / 1000.0, "speaker": label})
+            if limit is not None and len(hits) >= limit:
+                break
+        return hits
@@ -0,0 +1,97 @@
+"""
+Managed executor for CPU-bound stages (speaker statistics, JSON encoding,
+subtitle rendering) so they don't stall the event loop
+
+Functions sent to a process pool must be importable by the workers: keep
+them in dependency-free modules such as ``cpu_tasks`` or
+``subtitle_generator``.
+"""
+import asyncio
+import functools
+import logging
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+from typing import Any, Callable, Optional, TypeVar
+
+from .config import CPU_OFFLOAD_MIN_ITEMS, CPU_POOL_KIND, CPU_POOL_SIZE, CPU_TASK_TIMEOUT
+from .metrics import CPU_TASK_SECONDS, CPU_TASK_TIMEOUTS
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class CpuTaskTimeout(Exception):
+    """A CPU task didn't finish within its timeout"""
+
+
+class CpuPool:
+    """
+    Lazily started process or thread pool.
+
+    A timed-out task is abandoned rather than killed (executors can't
+    interrupt a running call); its worker frees up when it finishes. A
+    crashed process pool is replaced on the next call.
+    """
+
+    def __init__(self, kind: str = "process", size: int = 2, timeout: float = 30.0, min_items: int = 0):
+        self.kind = kind
+        self.size = size
+        self.timeout = timeout
+        self.min_items = min_items
+        self._executor: Optional[Executor] = None
+
+    @property
+    def executor(self) -> Optional[Executor]:
+        if self._executor is None and self.size > 0:
+            if self.kind == "thread":
+                self._executor = ThreadPoolExecutor(max_workers=self.size, thread_name_prefix="cpu")
+            else:
+                # spawn: workers must not inherit the server's threads and sockets
+                self._executor = ProcessPoolExecutor(max_workers=self.size, mp_context=get_context("spawn"))
+        return self._executor
+
+    async def run(self, func: Callable[..., T], *args: Any, task: str, size: Optional[int] = None,
+                  timeout: Optional[float] = None) -> T:
+        """
+        Run ``func(*args)`` in the pool and await the result.
+
+        ``size`` (e.g. number of utterances) lets small jobs run inline, where
+        handing them to a worker would cost more than it saves.
+        """
+        start = time.perf_counter()
+        try:
+            if self.executor is None or (size is not None and size < self.min_items):
+                return func(*args)
+            future = asyncio.get_running_loop().run_in_executor(self.executor, functools.partial(func, *args))
+            try:
+                return await asyncio.wait_for(future, timeout or self.timeout)
+            except asyncio.TimeoutError:
+                CPU_TASK_TIMEOUTS.labels(task=task).inc()
+                raise CpuTaskTimeout(f"{task} took longer than {timeout or self.timeout:.0f}s") from None
+            except BrokenProcessPool:
+                logger.error("CPU worker pool crashed during %s; restarting it", task)
+                self.shutdown()
+                raise
+        finally:
+            CPU_TASK_SECONDS.labels(task=task).observe(time.perf_counter() - start)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+cpu_pool = CpuPool(CPU_POOL_KIND, CPU_POOL_SIZE, CPU_TASK_TIMEOUT, CPU_OFFLOAD_MIN_ITEMS)
+
+
+async def run_cpu(func: Callable[..., T], *args: Any, task: str, size: Optional[int] = None,
+                  timeout: Optional[float] = None) -> T:
+    """Run a CPU-bound function on the shared pool"""
+    return await cpu_pool.run(func, *args, task=task, size=size, timeout=timeout)
+
+
+def shutdown_workers():
+    cpu_pool.shutdown()
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Latency benchmark: chunked transcription vs a single upstream job
+
+Uses a mock backend whose latency is queue time + audio duration x real-time
+factor (scaled down by --time-scale so a run takes seconds), over synthetic
+multi-speaker audio. Also checks that stitching recovers every word with
+consistent speaker labels. Prints a JSON report.
+
+    python benchmarks/bench_chunked.py --minutes 120
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.chunking import Chunk, plan_chunks, transcribe_in_chunks  # noqa: E402
+
+SAMPLE_RATE = 8000
+SPEAKERS = ["A", "B", "C"]
+
+
+def synthesize(minutes: float, seed: int = 7):
+    """Noise-burst 'words' separated by short gaps and longer turn pauses"""
+    rng = np.random.default_rng(seed)
+    total_ms = int(minutes * 60_000)
+    script = []
+    t = 0
+    turn = 0
+    while t < total_ms - 2000:
+        speaker = SPEAKERS[turn % len(SPEAKERS)]
+        for _ in range(rng.integers(5, 40)):
+            length = int(rng.integers(200, 600))
+            if t + length >= total_ms:
+                break
+            script.append({"text": f"w{len(script)}", "start": t, "end": t + length, "speaker": speaker})
+            t += length + int(rng.integers(60, 200))
+        t += int(rng.integers(700, 2000))
+        turn += int(rng.integers(1, 3))
+
+    samples = (rng.standard_normal(total_ms * SAMPLE_RATE // 1000) * 30).astype(np.int16)
+    for word in script:
+        a, b = word["start"] * SAMPLE_RATE // 1000, word["end"] * SAMPLE_RATE // 1000
+        samples[a:b] = (rng.standard_normal(b - a) * 3000).astype(np.int16)
+    return samples, script
+
+
+class MockBackend:
+    """Answers like AssemblyAI for any span of the synthetic script"""
+
+    def __init__(self, script, queue_seconds, rtf, time_scale):
+        self.script = script
+        self.starts = np.array([w["start"] for w in script])
+        self.queue_seconds = queue_seconds
+        self.rtf = rtf
+        self.time_scale = time_scale
+
+    async def transcribe(self, start_ms: int, end_ms: int, relabel: int = 0) -> dict:
+        duration = (end_ms - start_ms) / 1000
+        await asyncio.sleep((self.queue_seconds + duration * self.rtf) * self.time_scale)
+
+        lo, hi = np.searchsorted(self.starts, [start_ms, end_ms])
+        utterances = []
+        for word in self.script[lo:hi]:
+            if word["end"] > end_ms:
+                continue
+            # Each job labels speakers independently, in its own order
+            label = SPEAKERS[(SPEAKERS.index(word["speaker"]) + relabel) % len(SPEAKERS)]
+            local = {"text": word["text"], "start": word["start"] - start_ms,
+                     "end": word["end"] - start_ms, "confidence": 0.9, "speaker": label}
+            if utterances and utterances[-1]["speaker"] == label:
+                utterances[-1]["words"].append(local)
+                utterances[-1]["end"] = local["end"]
+            else:
+                utterances.append({"speaker": label, "start": local["start"], "end": local["end"],
+                                   "confidence": 0.9, "words": [local]})
+        for u in utterances:
+            u["text"] = " ".join(w["text"] for w in u["words"])
+        return {"id": f"mock-{start_ms}", "status": "completed", "utterances": utterances,
+                "audio_duration": end_ms - start_ms, "language_code": "en", "confidence": 0.9}
+
+
+def accuracy(script, result) -> dict:
+    words = [w for u in result["utterances"] for w in u["words"]]
+    by_text = {w["text"]: w for w in words}
+    recovered = [w for w in script if w["text"] in by_text]
+    # Best consistent mapping of stitched labels to ground truth
+    pairs = {}
+    for w in recovered:
+        key = (by_text[w["text"]]["speaker"], w["speaker"])
+        pairs[key] = pairs.get(key, 0) + 1
+    best = {}
+    for (got, truth), n in sorted(pairs.items(), key=lambda kv: -kv[1]):
+        if got not in best and truth not in best.values():
+            best[got] = truth
+    consistent = sum(n for (got, truth), n in pairs.items() if best.get(got) == truth)
+    return {
+        "words_expected": len(script),
+        "words_returned": len(words),
+        "duplicates": len(words) - len(by_text),
+        "recall": round(len(recovered) / max(1, len(script)), 4),
+        "speaker_consistency": round(consistent / max(1, len(recovered)), 4),
+    }
+
+
+async def main(args):
+    samples, script = synthesize(args.minutes)
+    total_ms = len(samples) * 1000 // SAMPLE_RATE
+    backend = MockBackend(script, args.queue_seconds, args.rtf, args.time_scale)
+
+    start = time.perf_counter()
+    single = await backend.transcribe(0, total_ms)
+    single_latency = time.perf_counter() - start
+
+    start = time.perf_counter()
+    chunks = plan_chunks(samples, SAMPLE_RATE, args.chunk_seconds, args.overlap)
+    plan_time = time.perf_counter() - start
+
+    async def transcribe_chunk(chunk: Chunk, _samples):
+        return await backend.transcribe(chunk.offset_ms, chunk.end_ms, relabel=chunk.index)
+
+    start = time.perf_counter()
+    chunked = await transcribe_in_chunks(samples, SAMPLE_RATE, chunks, transcribe_chunk, args.concurrency)
+    chunked_latency = time.perf_counter() - start
+
+    report = {
+        "audio_minutes": args.minutes,
+        "chunks": len(chunks),
+        "concurrency": args.concurrency,
+        "time_scale": args.time_scale,
+        "single_job": {"latency_s": round(single_latency, 3),
+                       "simulated_s": round(single_latency / args.time_scale, 1),
+                       **accuracy(script, single)},
+        "chunked": {"latency_s": round(chunked_latency, 3),
+                    "simulated_s": round(chunked_latency / args.time_scale, 1),
+                    "plan_ms": round(plan_time * 1000, 1),
+                    **accuracy(script, chunked)},
+    }
+    report["speedup"] = round(single_latency / chunked_latency, 2)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--minutes", type=float, default=90)
+    parser.add_argument("--chunk-seconds", type=float, default=600)
+    parser.add_argument("--overlap", type=float, default=20)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--queue-seconds", type=float, default=15, help="simulated upstream queue time per job")
+    parser.add_argument("--rtf", type=float, default=0.25, help="simulated processing time per second of audio")
+    parser.add_argument("--time-scale", type=float, default=0.002, help="multiply simulated delays by this")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,446 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmark: the API under load against local stand-ins
+
+Starts benchmarks/standins.py (AssemblyAI and Supabase storage answering
+from memory; --queue-seconds and --realtime-factor set job latency) and
+the API under uvicorn in separate processes. It then runs these phases
+against them:
+
+  upload     concurrent POST /api/upload-audio
+  websocket  WebSocket transcribe sessions, from upload to "completed"
+  reads      a list/detail/SRT mix over the transcripts just created
+  broadcast  transcribe sessions while --idle-clients sockets sit idle;
+             latency is from the session's "completed" to each idle
+             client receiving the "new_transcript" broadcast
+
+Each phase reports throughput, p50/p95/p99 latency, errors, and what the
+API process measured itself: event-loop lag (a 5 ms sleep probe) and peak
+RSS. The API needs a Postgres DATABASE_URL (tables are created if
+missing). The JSON report goes to stdout, or to --output. Give --compare a
+previous report to list regressions beyond --tolerance; the exit status is
+1 if there are any.
+
+    DATABASE_URL=postgresql://... python benchmarks/bench_e2e.py --output base.json
+    DATABASE_URL=postgresql://... python benchmarks/bench_e2e.py --compare base.json
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+PROBE_INTERVAL = 0.005
+# Phase metrics compared by --compare, and whether bigger is better
+COMPARED = {
+    "throughput_per_s": True, "p50_ms": False, "p95_ms": False, "p99_ms": False,
+    "lag_p99_ms": False, "rss_peak_mb": False,
+}
+
+
+# API process side
+
+def rss_bytes() -> int:
+    """Current resident set size (Linux), else the peak so far"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class ServerMonitor:
+    """Event-loop lag and RSS sampled inside the API process, reset per phase"""
+
+    def __init__(self):
+        self.lags = []
+        self.rss_peak = 0
+
+    async def start(self):
+        self.task = asyncio.create_task(self._probe())
+
+    async def _probe(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(PROBE_INTERVAL)
+            self.lags.append(time.perf_counter() - start - PROBE_INTERVAL)
+            if len(self.lags) % 20 == 0:
+                self.rss_peak = max(self.rss_peak, rss_bytes())
+
+    async def stats(self, reset: bool = False):
+        lag_ms = np.array(self.lags or [0.0]) * 1000
+        result = {
+            "lag_p50_ms": round(float(np.percentile(lag_ms, 50)), 2),
+            "lag_p99_ms": round(float(np.percentile(lag_ms, 99)), 2),
+            "lag_max_ms": round(float(lag_ms.max()), 2),
+            "rss_peak_mb": round(max(self.rss_peak, rss_bytes()) / 2 ** 20, 1),
+        }
+        if reset:
+            self.lags = []
+            self.rss_peak = 0
+        return result
+
+
+def serve_app(port: int):
+    import uvicorn
+
+    from app import models  # noqa: F401 - registers the tables
+    from app.database import Base, engine
+    from app.main import app as api
+
+    Base.metadata.create_all(bind=engine)
+    monitor = ServerMonitor()
+    api.on_event("startup")(monitor.start)
+    api.add_api_route("/bench/stats", monitor.stats, methods=["GET"])
+    uvicorn.run(api, host="127.0.0.1", port=port, log_level="warning")
+
+
+def serve_standins(port: int, queue_seconds: float, realtime_factor: float):
+    import uvicorn
+
+    from standins import create_app
+
+    uvicorn.run(create_app(queue_seconds, realtime_factor), host="127.0.0.1", port=port, log_level="warning")
+
+
+# Driver side
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def make_wav(seconds: float, rate: int = 16000) -> bytes:
+    from app.audio import encode_wav
+
+    rng = np.random.default_rng(3)
+    return encode_wav((rng.standard_normal(int(seconds * rate)) * 2000).astype(np.int16), rate)
+
+
+def summarize(latencies, errors: int, wall: float) -> dict:
+    ms = np.array(latencies or [0.0]) * 1000
+    return {
+        "ops": len(latencies),
+        "errors": errors,
+        "throughput_per_s": round(len(latencies) / wall, 2) if wall else 0.0,
+        "p50_ms": round(float(np.percentile(ms, 50)), 2),
+        "p95_ms": round(float(np.percentile(ms, 95)), 2),
+        "p99_ms": round(float(np.percentile(ms, 99)), 2),
+        "max_ms": round(float(ms.max()), 2),
+    }
+
+
+async def bounded(concurrency: int, count: int, op):
+    """Run ``op(i)`` ``count`` times, ``concurrency`` at a time; returns latencies and the error count"""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors = [], 0
+
+    async def one(i):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await op(i)
+                latencies.append(time.perf_counter() - start)
+            except Exception:
+                errors += 1
+
+    await asyncio.gather(*(one(i) for i in range(count)))
+    return latencies, errors
+
+
+async def upload_phase(client, args, audio: bytes):
+    async def upload(i):
+        r = await client.post("/api/upload-audio", files={"file": (f"bench{i}.wav", audio, "audio/wav")})
+        r.raise_for_status()
+
+    return await bounded(args.upload_concurrency, args.uploads, upload)
+
+
+async def transcribe_session(ws_url: str, audio_b64: str, timeout: float, completions=None) -> str:
+    """One WebSocket transcribe session; returns the transcript id"""
+    import websockets
+
+    async with websockets.connect(ws_url, max_size=None) as ws:
+        await ws.send(json.dumps({"type": "transcribe", "audio_data": audio_b64,
+                                  "file_extension": ".wav", "filename": "bench.wav"}))
+        deadline = time.monotonic() + timeout
+        while True:
+            message = json.loads(await asyncio.wait_for(ws.recv(), max(0.0, deadline - time.monotonic())))
+            if message.get("status") == "completed":
+                if completions is not None:
+                    completions[message["data"]["id"]] = time.perf_counter()
+                return message["data"]["id"]
+            if message.get("status") == "error":
+                raise RuntimeError(message.get("message"))
+
+
+async def websocket_phase(ws_url: str, args, audio_b64: str, ids):
+    async def session(i):
+        ids.append(await transcribe_session(ws_url, audio_b64, args.session_timeout))
+
+    return await bounded(args.sessions, args.sessions, session)
+
+
+async def reads_phase(client, args, ids):
+    rng = random.Random(11)
+    ops = [("list", 3), ("detail", 5), ("srt", 2)]
+    kinds = rng.choices([k for k, _ in ops], weights=[w for _, w in ops], k=args.reads)
+    targets = [rng.choice(ids) for _ in range(args.reads)]
+    per_kind = {kind: [] for kind, _ in ops}
+
+    async def read(i):
+        kind, transcript_id = kinds[i], targets[i]
+        url = {"list": "/api/transcripts?limit=20", "detail": f"/api/transcripts/{transcript_id}",
+               "srt": f"/api/transcripts/{transcript_id}/srt"}[kind]
+        start = time.perf_counter()
+        r = await client.get(url)
+        r.raise_for_status()
+        per_kind[kind].append(time.perf_counter() - start)
+
+    started = time.perf_counter()
+    latencies, errors = await bounded(args.read_concurrency, args.reads, read)
+    wall = time.perf_counter() - started
+    return latencies, errors, {kind: summarize(values, 0, wall) for kind, values in per_kind.items()}
+
+
+async def broadcast_phase(ws_url: str, args, audio_b64: str):
+    import websockets
+
+    receipts, completions = [], {}
+    ready = asyncio.Event()
+    connected = 0
+
+    async def idle_client():
+        nonlocal connected
+        async with websockets.connect(ws_url, max_size=None) as ws:
+            connected += 1
+            if connected == args.idle_clients:
+                ready.set()
+            async for raw in ws:
+                message = json.loads(raw)
+                if message.get("status") == "new_transcript":
+                    receipts.append((message["transcript_id"], time.perf_counter()))
+
+    clients = [asyncio.create_task(idle_client()) for _ in range(args.idle_clients)]
+    await asyncio.wait_for(ready.wait(), 60)
+    started = time.perf_counter()
+    latencies, errors = await bounded(args.broadcasts, args.broadcasts, lambda i: transcribe_session(
+        ws_url, audio_b64, args.session_timeout, completions))
+    await asyncio.sleep(1.0)  # let the last broadcasts land
+    wall = time.perf_counter() - started
+    for task in clients:
+        task.cancel()
+    await asyncio.gather(*clients, return_exceptions=True)
+
+    delivery = [t - completions[tid] for tid, t in receipts if tid in completions]
+    expected = len(completions) * args.idle_clients
+    return latencies, errors, wall, {
+        "idle_clients": args.idle_clients,
+        "delivered": len(delivery),
+        "missed": expected - len(delivery),
+        "delivery": summarize(delivery, expected - len(delivery), wall),
+    }
+
+
+async def run_phases(args, api_url: str) -> dict:
+    import httpx
+
+    ws_url = api_url.replace("http://", "ws://") + "/ws"
+    audio = make_wav(args.audio_seconds)
+    audio_b64 = base64.b64encode(audio).decode()
+    phases = {}
+    ids = []
+    async with httpx.AsyncClient(base_url=api_url, timeout=args.session_timeout,
+                                 limits=httpx.Limits(max_connections=None)) as client:
+        async def phase(name, run):
+            await client.get("/bench/stats", params={"reset": "true"})
+            started = time.perf_counter()
+            result = await run()
+            wall = time.perf_counter() - started
+            latencies, errors, extra = result[0], result[1], result[2] if len(result) > 2 else {}
+            server = (await client.get("/bench/stats")).json()
+            phases[name] = {**summarize(latencies, errors, wall), **server, "wall_seconds": round(wall, 3)}
+            if extra:
+                phases[name]["detail"] = extra
+            print(f"{name}: {json.dumps(phases[name])}", file=sys.stderr)
+
+        await phase("upload", lambda: upload_phase(client, args, audio))
+        await phase("websocket", lambda: websocket_phase(ws_url, args, audio_b64, ids))
+        if ids:
+            await phase("reads", lambda: reads_phase(client, args, ids))
+
+        async def broadcast():
+            latencies, errors, _, extra = await broadcast_phase(ws_url, args, audio_b64)
+            return latencies, errors, extra
+
+        await phase("broadcast", broadcast)
+    return phases
+
+
+def wait_ready(url: str, process: subprocess.Popen, timeout: float = 60):
+    import httpx
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{url} exited with status {process.returncode}")
+        try:
+            httpx.get(url, timeout=1).raise_for_status()
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout:.0f}s")
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True,
+                              text=True, timeout=10).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ""
+
+
+def compare(current: dict, baseline: dict, tolerance: float) -> list:
+    """Metrics that got worse than the baseline by more than ``tolerance`` (relative)"""
+    regressions = []
+    for name, metrics in current["phases"].items():
+        base = baseline.get("phases", {}).get(name)
+        if not base:
+            continue
+        for metric, higher_is_better in COMPARED.items():
+            new, old = metrics.get(metric), base.get(metric)
+            if not new or not old:
+                continue
+            change = (new - old) / old
+            worse = -change if higher_is_better else change
+            if worse > tolerance:
+                regressions.append({"phase": name, "metric": metric, "baseline": old, "current": new,
+                                    "change": round(change, 3)})
+    return regressions
+
+
+def run(args) -> int:
+    # Local files (peaks, disk storage) go to a scratch directory, not the working tree
+    with tempfile.TemporaryDirectory(prefix="bench-e2e-") as scratch:
+        return run_in(args, scratch)
+
+
+def run_in(args, scratch: str) -> int:
+    standins_port, api_port = free_port(), free_port()
+    standins_url = f"http://127.0.0.1:{standins_port}"
+    api_url = f"http://127.0.0.1:{api_port}"
+    env = {
+        **os.environ,
+        "ASSEMBLY_API_KEY": "benchmark",
+        "ASSEMBLY_API_BASE": f"{standins_url}/v2",
+        "SUPABASE_URL": standins_url,
+        "SUPABASE_KEY": "benchmark",
+        "STORAGE_BACKEND": "supabase",
+        "TRANSCRIPTION_BACKEND": "assemblyai",
+        "RATE_LIMIT_REQUESTS": str(10 ** 9),
+        "MAX_CONNECTIONS": str(args.idle_clients + args.sessions + args.broadcasts + 50),
+        "LOG_LEVEL": "WARNING",
+        "TRACE_EXPORTER": "none",
+        "LOCAL_STORAGE_DIR": os.path.join(scratch, "storage"),
+        "PEAKS_DIR": os.path.join(scratch, "peaks"),
+    }
+    for item in args.env:
+        key, _, value = item.partition("=")
+        env[key] = value
+    if "DATABASE_URL" not in env:
+        print("DATABASE_URL must point at a Postgres database", file=sys.stderr)
+        return 2
+
+    script = os.path.abspath(__file__)
+    processes = [
+        subprocess.Popen([sys.executable, script, "--serve", "standins", "--port", str(standins_port),
+                          "--queue-seconds", str(args.queue_seconds), "--realtime-factor", str(args.realtime_factor)],
+                         env=env, cwd=BACKEND_DIR),
+        subprocess.Popen([sys.executable, script, "--serve", "app", "--port", str(api_port)], env=env, cwd=BACKEND_DIR),
+    ]
+    try:
+        wait_ready(f"{standins_url}/stats", processes[0])
+        wait_ready(f"{api_url}/health", processes[1])
+        started = datetime.now(timezone.utc).isoformat()
+        phases = asyncio.run(run_phases(args, api_url))
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            try:
+                process.wait(10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    report = {
+        "meta": {
+            "started": started,
+            "git": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "args": {k: v for k, v in vars(args).items() if k not in ("serve", "port", "output", "compare")},
+        },
+        "phases": phases,
+    }
+    status = 0
+    if args.compare:
+        with open(args.compare) as f:
+            report["regressions"] = compare(report, json.load(f), args.tolerance)
+        status = 1 if report["regressions"] else 0
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    print(text)
+    return status
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--uploads", type=int, default=100)
+    parser.add_argument("--upload-concurrency", type=int, default=10)
+    parser.add_argument("--sessions", type=int, default=10, help="concurrent WebSocket transcribe sessions")
+    parser.add_argument("--reads", type=int, default=500)
+    parser.add_argument("--read-concurrency", type=int, default=20)
+    parser.add_argument("--idle-clients", type=int, default=200, help="idle sockets during the broadcast phase")
+    parser.add_argument("--broadcasts", type=int, default=5, help="transcriptions finishing during the broadcast phase")
+    parser.add_argument("--audio-seconds", type=float, default=30, help="length of the uploaded WAV")
+    parser.add_argument("--queue-seconds", type=float, default=0.5, help="stand-in AssemblyAI queue time")
+    parser.add_argument("--realtime-factor", type=float, default=0.05, help="stand-in processing time / audio length")
+    parser.add_argument("--session-timeout", type=float, default=120)
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="extra environment for the API, e.g. --env CPU_POOL_KIND=thread")
+    parser.add_argument("--output", help="also write the JSON report here")
+    parser.add_argument("--compare", help="baseline report to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="allowed relative regression")
+    parser.add_argument("--serve", choices=["app", "standins"], help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve == "app":
+        serve_app(args.port)
+    elif args.serve == "standins":
+        serve_standins(args.port, args.queue_seconds, args.realtime_factor)
+    else:
+        sys.exit(run(args))
+
+
+if __name__ == "__main__":
+    main()
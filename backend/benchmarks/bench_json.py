@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+JSON encoding and compression benchmark for a large transcript response
+
+Builds a transcript payload with --words words (utterances with per-word
+objects, plus the diarized copy stored alongside) and reports, per encoder,
+the median encode time and size, then per compression codec the time and
+bytes on the wire. "fastapi_default" is jsonable_encoder + json.dumps, what
+a plain dict return costs; "permessage_deflate" is raw deflate as the
+WebSocket extension applies it. Prints a JSON report.
+
+    python benchmarks/bench_json.py --words 100000
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+import zlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# app.config insists on these; the benchmark never calls out
+os.environ.setdefault("ASSEMBLY_API_KEY", "benchmark")
+os.environ.setdefault("SUPABASE_URL", "http://localhost")
+os.environ.setdefault("SUPABASE_KEY", "benchmark")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+
+from app.compression import COMPRESSORS  # noqa: E402
+from app.cpu_tasks import encode_json, orjson  # noqa: E402
+from bench_loop_lag import make_utterances  # noqa: E402
+
+
+def make_payload(words: int):
+    utterances = make_utterances(words, seed=1)
+    return {
+        "id": "00000000-0000-0000-0000-000000000000",
+        "status": "completed",
+        "transcript": " ".join(u["text"] for u in utterances),
+        "utterances": utterances,
+        "diarized_transcript": {"utterances": utterances},
+    }
+
+
+def best_of(func, repeat: int):
+    """Median wall time in ms and the last result"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    return round(statistics.median(times) * 1000, 2), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--words", type=int, default=100000, help="words in the transcript")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    payload = make_payload(args.words)
+    encoders = {
+        "fastapi_default": lambda: json.dumps(jsonable_encoder(payload), ensure_ascii=False,
+                                              separators=(",", ":")).encode("utf-8"),
+        "stdlib": lambda: json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8"),
+    }
+    if orjson is not None:
+        encoders["encode_json (orjson)"] = lambda: encode_json(payload)
+
+    report = {"words": args.words, "encode": {}, "compress": {}}
+    for name, encode in encoders.items():
+        ms, body = best_of(encode, args.repeat)
+        report["encode"][name] = {"ms": ms, "bytes": len(body)}
+
+    body = encode_json(payload)
+    codecs = {name: (lambda make=make: (lambda c: c.compress(body) + c.flush())(make()))
+              for name, make in COMPRESSORS.items()}
+    codecs["permessage_deflate"] = lambda: (lambda c: c.compress(body) + c.flush(zlib.Z_SYNC_FLUSH))(
+        zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15))
+    for name, compress in codecs.items():
+        ms, compressed = best_of(compress, args.repeat)
+        report["compress"][name] = {"ms": ms, "bytes": len(compressed),
+                                    "ratio": round(len(body) / len(compressed), 2)}
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
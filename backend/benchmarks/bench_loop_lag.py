@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Event-loop lag benchmark: CPU-heavy post-processing inline vs offloaded
+
+Simulates --jobs large transcripts (--words each) completing at once. Each
+completion runs speaker statistics, JSON encoding of the result and SRT
+rendering, either on the event loop or through workers.CpuPool. A probe task
+sleeps 5 ms in a loop and records how late it wakes up. Prints a JSON report.
+
+    python benchmarks/bench_loop_lag.py --jobs 8 --words 20000
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# app.config insists on these; the benchmark never calls out
+os.environ.setdefault("ASSEMBLY_API_KEY", "benchmark")
+os.environ.setdefault("SUPABASE_URL", "http://localhost")
+os.environ.setdefault("SUPABASE_KEY", "benchmark")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from app.cpu_tasks import dumps_json, speaker_statistics  # noqa: E402
+from app.subtitle_generator import generate_srt_from_transcript  # noqa: E402
+from app.workers import CpuPool  # noqa: E402
+
+PROBE_INTERVAL = 0.005
+
+
+def make_utterances(words: int, seed: int):
+    rng = random.Random(seed)
+    utterances, t, n = [], 0, 0
+    while n < words:
+        count = min(words - n, rng.randint(5, 40))
+        ws = []
+        for _ in range(count):
+            length = rng.randint(150, 500)
+            ws.append({"text": f"word{n}", "start": t, "end": t + length, "confidence": 0.9, "speaker": "A"})
+            t += length + rng.randint(20, 150)
+            n += 1
+        speaker = "ABC"[len(utterances) % 3]
+        utterances.append({"speaker": speaker, "text": " ".join(w["text"] for w in ws),
+                           "start": ws[0]["start"], "end": ws[-1]["end"], "confidence": 0.9, "words": ws})
+        t += rng.randint(300, 1500)
+    return utterances
+
+
+async def complete_job(pool: CpuPool, utterances):
+    size = len(utterances)
+    stats = await pool.run(speaker_statistics, utterances, utterances[-1]["end"] / 1000, task="speaker_stats", size=size)
+    message = {"status": "completed", "data": {"utterances": stats["enhanced_utterances"],
+                                               "speakers_summary": stats["speakers_summary"]}}
+    await pool.run(dumps_json, message, task="json", size=size)
+    await pool.run(generate_srt_from_transcript, {"utterances": stats["enhanced_utterances"]}, 80,
+                   task="subtitles", size=size)
+
+
+async def probe(lags, stop: asyncio.Event):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(PROBE_INTERVAL)
+        lags.append(time.perf_counter() - start - PROBE_INTERVAL)
+
+
+async def run_mode(pool: CpuPool, jobs):
+    # Warm the pool (process start-up) so it isn't billed to the first job
+    await pool.run(dumps_json, {}, task="warmup")
+    lags, stop = [], asyncio.Event()
+    probe_task = asyncio.create_task(probe(lags, stop))
+    await asyncio.sleep(0.05)
+    start = time.perf_counter()
+    await asyncio.gather(*(complete_job(pool, utterances) for utterances in jobs))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await probe_task
+    pool.shutdown()
+    lag_ms = np.array(lags) * 1000
+    return {
+        "wall_seconds": round(elapsed, 3),
+        "lag_p50_ms": round(float(np.percentile(lag_ms, 50)), 2),
+        "lag_p99_ms": round(float(np.percentile(lag_ms, 99)), 2),
+        "lag_max_ms": round(float(lag_ms.max()), 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, default=8, help="transcripts completing concurrently")
+    parser.add_argument("--words", type=int, default=20000, help="words per transcript")
+    parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1))
+    args = parser.parse_args()
+
+    jobs = [make_utterances(args.words, seed) for seed in range(args.jobs)]
+    modes = {
+        "inline": CpuPool(size=0),
+        "thread": CpuPool("thread", args.workers, timeout=300),
+        "process": CpuPool("process", args.workers, timeout=300),
+    }
+    report = {"jobs": args.jobs, "words": args.words, "workers": args.workers}
+    for name, pool in modes.items():
+        report[name] = asyncio.run(run_mode(pool, jobs))
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Word index benchmark: click-to-seek and keyword spotting over many transcripts
+
+Generates --transcripts synthetic transcripts of --words words each, drawn
+from a Zipf-distributed vocabulary so that common words repeat like real
+speech. Reports:
+
+- build: time to build every word index, and the blob size against the
+  utterances JSON it replaces for lookups
+- find: median time to locate a word (and a two-word phrase) inside one
+  transcript, with the parsed index against scanning the word objects
+- keywords: median time to find the transcripts mentioning a keyword,
+  with the term table in SQLite (indexed like transcript_terms) against
+  loading and scanning every transcript's utterances JSON
+
+Prints a JSON report.
+
+    python benchmarks/bench_word_index.py --transcripts 10000 --words 600
+
+At the defaults most of the few minutes it runs go into generating data
+and the one-pass JSON scans.
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import time
+from collections import deque
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.word_index import WordIndex, index_transcript, tokenize  # noqa: E402
+
+
+def make_vocabulary(size: int, rng: random.Random):
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(letters) for _ in range(rng.randint(2, 10))))
+    return sorted(words)
+
+
+def make_transcript(vocabulary, weights, words: int, rng: random.Random):
+    utterances, t, n = [], 0, 0
+    while n < words:
+        count = min(words - n, rng.randint(5, 40))
+        speaker = "ABC"[len(utterances) % 3]
+        ws = []
+        for text in rng.choices(vocabulary, weights, k=count):
+            length = rng.randint(150, 500)
+            ws.append({"text": text, "start": t, "end": t + length, "confidence": 0.9, "speaker": speaker})
+            t += length + rng.randint(20, 150)
+        n += count
+        utterances.append({"speaker": speaker, "text": " ".join(w["text"] for w in ws),
+                           "start": ws[0]["start"], "end": ws[-1]["end"], "confidence": 0.9, "words": ws})
+        t += rng.randint(300, 1500)
+    return utterances
+
+
+def median_ms(func, repeat: int):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    return round(statistics.median(times) * 1000, 3), result
+
+
+def scan_words(utterances, terms):
+    """The lookup without an index: walk every word object"""
+    hits, window = [], deque(maxlen=len(terms))
+    for utterance in utterances:
+        for word in utterance.get("words") or []:
+            for term in tokenize(word["text"]):
+                window.append((term, word))
+                if len(window) == len(terms) and all(t == w for (t, _), w in zip(window, terms)):
+                    hits.append((window[0][1]["start"], word["end"]))
+    return hits
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--transcripts", type=int, default=10000)
+    parser.add_argument("--words", type=int, default=600, help="words per transcript")
+    parser.add_argument("--vocabulary", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    vocabulary = make_vocabulary(args.vocabulary, rng)
+    weights = [1 / (rank + 1) for rank in range(len(vocabulary))]
+    rare = vocabulary[len(vocabulary) // 2]
+    common = vocabulary[0]
+
+    db = sqlite3.connect(":memory:")
+    db.execute("CREATE TABLE transcripts (id INTEGER PRIMARY KEY, utterances TEXT)")
+    db.execute("CREATE TABLE transcript_terms (term TEXT, transcript_id INTEGER, hits INTEGER, first_ms INTEGER, "
+               "PRIMARY KEY (term, transcript_id))")
+
+    build_seconds, blob_bytes, json_bytes = 0.0, 0, 0
+    sample = None
+    for transcript_id in range(args.transcripts):
+        utterances = make_transcript(vocabulary, weights, args.words, rng)
+        body = json.dumps(utterances)
+        start = time.perf_counter()
+        blob, terms = index_transcript(utterances)
+        build_seconds += time.perf_counter() - start
+        blob_bytes += len(blob)
+        json_bytes += len(body)
+        db.execute("INSERT INTO transcripts VALUES (?, ?)", (transcript_id, body))
+        db.executemany("INSERT INTO transcript_terms VALUES (?, ?, ?, ?)",
+                       [(term, transcript_id, hits, first) for term, hits, first in terms])
+        if sample is None:
+            sample = (utterances, blob)
+    db.commit()
+
+    report = {
+        "transcripts": args.transcripts,
+        "words_per_transcript": args.words,
+        "build": {
+            "ms_per_transcript": round(build_seconds * 1000 / args.transcripts, 3),
+            "index_bytes_per_transcript": blob_bytes // args.transcripts,
+            "utterances_json_bytes_per_transcript": json_bytes // args.transcripts,
+        },
+        "find": {},
+        "keywords": {},
+    }
+
+    utterances, blob = sample
+    index = WordIndex(blob)
+    phrase = " ".join(tokenize(utterances[0]["text"])[:2])
+    for label, query in (("common_word", common), ("rare_word", rare), ("phrase", phrase)):
+        index_ms, hits = median_ms(lambda: index.find(query), args.repeat)
+        scan_ms, scanned = median_ms(lambda: scan_words(utterances, tokenize(query)), args.repeat)
+        assert len(hits) == len(scanned), (query, len(hits), len(scanned))
+        report["find"][label] = {"hits": len(hits), "index_ms": index_ms, "scan_ms": scan_ms,
+                                 "parse_ms": median_ms(lambda: WordIndex(blob), args.repeat)[0]}
+
+    for label, term in (("common_word", common), ("rare_word", rare)):
+        index_ms, rows = median_ms(lambda: db.execute(
+            "SELECT transcript_id, hits, first_ms FROM transcript_terms WHERE term = ? ORDER BY hits DESC",
+            (term,)).fetchall(), args.repeat)
+
+        def scan():
+            found = []
+            for transcript_id, body in db.execute("SELECT id, utterances FROM transcripts"):
+                count = len(scan_words(json.loads(body), [term]))
+                if count:
+                    found.append((transcript_id, count))
+            return found
+
+        # One pass: the scan takes seconds at this size
+        scan_ms, scanned = median_ms(scan, 1)
+        assert len(rows) == len(scanned), (term, len(rows), len(scanned))
+        report["keywords"][label] = {"transcripts": len(rows), "term_table_ms": index_ms, "json_scan_ms": scan_ms}
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Read-replica routing check against two local databases
+
+Without arguments, creates a primary and a replica as two SQLite files in a
+temporary directory, each holding one transcript that names its database,
+and checks where app.replicas.ReadRouter sends reads:
+
+  healthy   an up-to-date replica serves reads
+  pinned    a pinned key reads from the primary until the pin expires
+  lagging   a replica more than --max-lag seconds behind is skipped
+  down      an unreachable replica is skipped; the next good check restores it
+
+With --primary and --replica pointing at a PostgreSQL primary and its
+streaming standby (the transcripts table must exist), it also writes a probe
+row on the primary and reports how long it takes to show up on the replica,
+next to the lag the health check measured. Stop the standby's WAL receiver
+(e.g. block the primary's port) and run it again: the replica must then be
+skipped, as its measured lag keeps growing.
+
+Prints one line per check; the exit status is 1 if any failed.
+
+    python benchmarks/check_replicas.py
+    python benchmarks/check_replicas.py --primary postgresql://app@localhost:5432/stt \\
+        --replica postgresql://app@localhost:5433/stt
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("ASSEMBLY_API_KEY", "benchmark")
+os.environ.setdefault("SUPABASE_URL", "http://localhost")
+os.environ.setdefault("SUPABASE_KEY", "benchmark")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from sqlalchemy import create_engine, delete, select, text  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from app.database import Base  # noqa: E402
+from app.models import Transcript  # noqa: E402
+from app.replicas import PG_LAG_SQL, ReadRouter  # noqa: E402
+
+RECEIVER_SQL = text("SELECT status, last_msg_receipt_time FROM pg_stat_wal_receiver")
+
+
+class Checks:
+    def __init__(self):
+        self.failed = 0
+
+    def expect(self, name: str, ok: bool, detail: str = ""):
+        self.failed += not ok
+        print(f"{'PASS' if ok else 'FAIL'}  {name}{'  ' + detail if detail else ''}")
+
+
+def served_by(router: ReadRouter, *keys: str) -> str:
+    """Which database a routed read lands on, by the marker transcript it holds"""
+    with router.session(*keys) as db:
+        return db.execute(select(Transcript.transcript).where(Transcript.audio_url == "marker")).scalar()
+
+
+def seed(url: str, marker: str):
+    engine = create_engine(url)
+    Base.metadata.create_all(engine)
+    with sessionmaker(bind=engine)() as db:
+        db.add(Transcript(audio_url="marker", transcript=marker, status="completed"))
+        db.commit()
+    engine.dispose()
+
+
+def check_routing(args, checks: Checks):
+    with tempfile.TemporaryDirectory(prefix="replicas-") as scratch:
+        primary_url = f"sqlite:///{os.path.join(scratch, 'primary.sqlite')}"
+        replica_url = f"sqlite:///{os.path.join(scratch, 'replica.sqlite')}"
+        seed(primary_url, "primary")
+        seed(replica_url, "replica")
+        primary = create_engine(primary_url)
+        router = ReadRouter([replica_url], max_lag=args.max_lag, pin_seconds=args.pin_seconds,
+                            primary=sessionmaker(bind=primary))
+
+        checks.expect("unchecked replica unused", served_by(router) == "primary")
+        router.check()
+        checks.expect("healthy", served_by(router) == "replica", f"lag {router.replicas[0].lag}")
+
+        router.pin("client:a")
+        checks.expect("pinned", served_by(router, "client:a") == "primary")
+        checks.expect("other keys unpinned", served_by(router, "client:b") == "replica")
+        time.sleep(args.pin_seconds + 0.1)
+        checks.expect("pin expired", served_by(router, "client:a") == "replica")
+
+        router.replicas[0].lag = args.max_lag + 1
+        checks.expect("lagging", served_by(router) == "primary")
+        router.check()
+        checks.expect("caught up", served_by(router) == "replica")
+
+        router.replicas[0].mark_down("check_replicas")
+        checks.expect("marked down", served_by(router) == "primary")
+        router.check()
+        checks.expect("back up", served_by(router) == "replica")
+
+        unreachable = ReadRouter([f"sqlite:///{os.path.join(scratch, 'missing', 'replica.sqlite')}"],
+                                 primary=sessionmaker(bind=primary))
+        unreachable.check()
+        checks.expect("unreachable", served_by(unreachable) == "primary",
+                      (unreachable.replicas[0].error or "").split("\n")[0])
+
+        for r in (router, unreachable):
+            for replica in r.replicas:
+                replica.engine.dispose()
+        primary.dispose()
+
+
+def check_postgres(args, checks: Checks):
+    primary = create_engine(args.primary)
+    router = ReadRouter([args.replica], max_lag=args.max_lag, primary=sessionmaker(bind=primary))
+    replica = router.replicas[0]
+    router.check()
+    with replica.engine.connect() as connection:
+        in_recovery = connection.execute(text("SELECT pg_is_in_recovery()")).scalar()
+        receiver = connection.execute(RECEIVER_SQL).first()
+        lag = connection.execute(PG_LAG_SQL).scalar()
+    checks.expect("replica is a standby", bool(in_recovery))
+    checks.expect("wal receiver streaming", receiver is not None and receiver[0] in ("streaming", None),
+                  f"status {receiver[0] if receiver else 'none'}, last message {receiver[1] if receiver else '-'}")
+    checks.expect("health check", replica.healthy and replica.lag is not None and replica.lag <= args.max_lag,
+                  f"lag {lag}s (max {args.max_lag}s)")
+
+    probe = uuid.uuid4()
+    with sessionmaker(bind=primary)() as db:
+        db.add(Transcript(id=probe, audio_url="replica-check", status="completed"))
+        db.commit()
+    written = time.monotonic()
+    try:
+        visible = None
+        while time.monotonic() - written < args.timeout:
+            with replica.sessions() as db:
+                if db.get(Transcript, probe) is not None:
+                    visible = time.monotonic() - written
+                    break
+            time.sleep(0.05)
+        checks.expect("probe replicated", visible is not None and visible <= args.max_lag,
+                      f"visible after {visible:.2f}s" if visible is not None else f"not visible after {args.timeout}s")
+    finally:
+        with sessionmaker(bind=primary)() as db:
+            db.execute(delete(Transcript).where(Transcript.id == probe))
+            db.commit()
+        replica.engine.dispose()
+        primary.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--primary", help="Primary database URL (default: a temporary SQLite file)")
+    parser.add_argument("--replica", help="Replica database URL")
+    parser.add_argument("--max-lag", type=float, default=5.0)
+    parser.add_argument("--pin-seconds", type=float, default=0.5)
+    parser.add_argument("--timeout", type=float, default=30.0, help="Seconds to wait for the probe row")
+    args = parser.parse_args()
+    if bool(args.primary) != bool(args.replica):
+        parser.error("--primary and --replica go together")
+
+    checks = Checks()
+    if args.primary and create_engine(args.replica).dialect.name == "postgresql":
+        check_postgres(args, checks)
+    elif args.primary:
+        parser.error("--primary/--replica are for a PostgreSQL pair; SQLite runs without them")
+    else:
+        check_routing(args, checks)
+    return 1 if checks.failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,85 @@
+"""
+Local stand-ins for the AssemblyAI transcript API and Supabase storage
+
+One Starlette app serving both, for the end-to-end benchmark:
+
+- ``POST /storage/v1/object/{bucket}/{name}`` stores the body in memory
+  (what the SDK and the HTTP fallback both call); ``GET
+  /storage/v1/object/public/{bucket}/{name}`` returns it.
+- ``POST /v2/transcript`` / ``GET /v2/transcript/{id}`` answer like
+  AssemblyAI through backends.MockBackend: queued for ``queue_seconds``,
+  processing for duration x ``realtime_factor``, then a mock result. The
+  duration comes from the stored WAV when the URL points here.
+
+Point the API at it with ``ASSEMBLY_API_BASE=http://host:port/v2`` and
+``SUPABASE_URL=http://host:port``.
+"""
+import os
+import sys
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("ASSEMBLY_API_KEY", "benchmark")
+os.environ.setdefault("SUPABASE_URL", "http://localhost")
+os.environ.setdefault("SUPABASE_KEY", "benchmark")
+
+from app.backends import MockBackend  # noqa: E402
+
+WAV_HEADER_BYTES = 44
+DEFAULT_DURATION = 60.0
+
+
+def wav_duration(data: bytes) -> Optional[float]:
+    """Duration of a 16-bit PCM WAV from its header, without decoding"""
+    if len(data) < WAV_HEADER_BYTES or data[:4] != b"RIFF" or data[8:12] != b"WAVE":
+        return None
+    channels = int.from_bytes(data[22:24], "little")
+    rate = int.from_bytes(data[24:28], "little")
+    bits = int.from_bytes(data[34:36], "little")
+    if not (channels and rate and bits):
+        return None
+    return (len(data) - WAV_HEADER_BYTES) / (channels * rate * bits // 8)
+
+
+def create_app(queue_seconds: float = 1.0, realtime_factor: float = 0.05) -> Starlette:
+    objects: Dict[str, bytes] = {}
+    backend = MockBackend(queue_seconds=queue_seconds, realtime_factor=realtime_factor)
+
+    async def put_object(request: Request):
+        name = f"{request.path_params['bucket']}/{request.path_params['name']}"
+        objects[name] = await request.body()
+        return JSONResponse({"Key": name, "Id": name})
+
+    async def get_object(request: Request):
+        data = objects.get(f"{request.path_params['bucket']}/{request.path_params['name']}")
+        if data is None:
+            return JSONResponse({"error": "not_found"}, status_code=404)
+        return Response(data, media_type="application/octet-stream")
+
+    async def submit(request: Request):
+        payload = await request.json()
+        audio_url = payload.get("audio_url", "")
+        path = urlparse(audio_url).path.split("/storage/v1/object/public/", 1)[-1]
+        duration = wav_duration(objects.get(path, b"")) or DEFAULT_DURATION
+        job_id = await backend.submit(audio_url, {"duration": duration})
+        return JSONResponse({"id": job_id, "status": "queued"})
+
+    async def status(request: Request):
+        return JSONResponse(await backend.status(request.path_params["job_id"]))
+
+    async def stats(request: Request):
+        return JSONResponse({"objects": len(objects), "bytes": sum(len(v) for v in objects.values())})
+
+    return Starlette(routes=[
+        Route("/storage/v1/object/public/{bucket}/{name:path}", get_object, methods=["GET"]),
+        Route("/storage/v1/object/{bucket}/{name:path}", put_object, methods=["POST", "PUT"]),
+        Route("/v2/transcript", submit, methods=["POST"]),
+        Route("/v2/transcript/{job_id}", status, methods=["GET"]),
+        Route("/stats", stats, methods=["GET"]),
+    ])
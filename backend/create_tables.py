@@ -8,7 +8,7 @@ import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from app.database import engine, Base
-from app.models import Transcript, Speaker
+from app.models import ApiKey, Speaker, Tenant, TenantUsage, Transcript, TranscriptTerm, TranscriptWordIndex
 import logging
 
 # Configure logging
@@ -33,5 +33,41 @@ def recreate_tables():
         logger.error(f"Error creating tables: {e}")
         raise
 
+def recreate_partitioned_tables():
+    """Drop and recreate transcripts/speakers partitioned by month (PostgreSQL)"""
+    from app.partitions import create_partitioned_tables
+    if engine.dialect.name != "postgresql":
+        logger.warning("Partitioning needs PostgreSQL; creating plain tables")
+        recreate_tables()
+        return
+    logger.info("Dropping existing tables...")
+    Base.metadata.drop_all(bind=engine)
+    logger.info("Creating partitioned tables...")
+    create_partitioned_tables(engine)
+    # Everything else (e.g. the word index tables) stays unpartitioned
+    partitioned = {"transcripts", "speakers"}
+    Base.metadata.create_all(bind=engine, tables=[t for n, t in Base.metadata.tables.items() if n not in partitioned])
+    logger.info("Tables created successfully!")
+
+def convert_tables():
+    """Rebuild the existing tables as partitioned ones, keeping their rows"""
+    from app.partitions import convert_to_partitioned
+    if engine.dialect.name != "postgresql":
+        raise SystemExit("Partitioning needs PostgreSQL")
+    convert_to_partitioned(engine)
+    logger.info("Tables converted successfully!")
+
+def create_missing_tables():
+    """Create tables added since the database was set up, leaving existing ones alone"""
+    Base.metadata.create_all(bind=engine)
+    logger.info("Missing tables created")
+
 if __name__ == "__main__":
-    recreate_tables() 
\ No newline at end of file
+    if "--partitioned" in sys.argv:
+        recreate_partitioned_tables()
+    elif "--convert" in sys.argv:
+        convert_tables()
+    elif "--missing" in sys.argv:
+        create_missing_tables()
+    else:
+        recreate_tables() 
\ No newline at end of file
@@ -30,7 +30,9 @@ def main():
         workers=1,
         access_log=False,  # Disable access logs for speed
         log_level="info",
-        loop="asyncio"
+        loop="asyncio",
+        # permessage-deflate shrinks large JSON frames ~5-10x at some CPU cost per connection
+        ws_per_message_deflate=os.getenv("WS_PER_MESSAGE_DEFLATE", "true").lower() == "true",
     )
 
 if __name__ == "__main__":
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Manage tenants and their API keys
+
+    python manage_tenants.py create-tenant team-a --minutes 6000 --concurrency 4
+    python manage_tenants.py issue-key team-a --name ci
+    python manage_tenants.py revoke-key stt_AbCdEfGh
+    python manage_tenants.py set-quota team-a --minutes 12000
+    python manage_tenants.py list
+
+Running APIs pick up changes within API_KEY_CACHE_TTL seconds.
+"""
+
+import argparse
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import select
+
+from app.database import SessionLocal
+from app.models import ApiKey, Tenant, TenantUsage
+from app.tenants import create_tenant, current_month, find_tenant, issue_key, revoke_key
+
+
+def _tenant(db, name_or_id: str) -> Tenant:
+    tenant = find_tenant(db, name_or_id)
+    if tenant is None:
+        raise SystemExit(f"No tenant {name_or_id}")
+    return tenant
+
+
+def _limit(value: str):
+    """'none' clears a quota"""
+    return None if value.lower() == "none" else float(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    create = commands.add_parser("create-tenant", help="Create a tenant")
+    create.add_argument("name")
+    create.add_argument("--minutes", type=float, help="Audio minutes per month")
+    create.add_argument("--concurrency", type=int, help="Jobs queued or running at once")
+
+    quota = commands.add_parser("set-quota", help="Change a tenant's quotas ('none' removes one)")
+    quota.add_argument("tenant")
+    quota.add_argument("--minutes", type=_limit, default=argparse.SUPPRESS)
+    quota.add_argument("--concurrency", type=_limit, default=argparse.SUPPRESS)
+    quota.add_argument("--disable", action="store_true", help="Reject the tenant's keys")
+    quota.add_argument("--enable", action="store_true")
+
+    issue = commands.add_parser("issue-key", help="Create an API key (shown once)")
+    issue.add_argument("tenant")
+    issue.add_argument("--name", help="What the key is for")
+
+    revoke = commands.add_parser("revoke-key", help="Revoke a key by its prefix")
+    revoke.add_argument("prefix")
+
+    commands.add_parser("list", help="Tenants, keys and this month's usage")
+    args = parser.parse_args()
+
+    with SessionLocal() as db:
+        if args.command == "create-tenant":
+            tenant = create_tenant(db, args.name, args.concurrency, args.minutes)
+            print(f"Created tenant {tenant.name} ({tenant.id})")
+        elif args.command == "set-quota":
+            tenant = _tenant(db, args.tenant)
+            if hasattr(args, "minutes"):
+                tenant.monthly_minutes = args.minutes
+            if hasattr(args, "concurrency"):
+                tenant.max_concurrent_jobs = int(args.concurrency) if args.concurrency is not None else None
+            if args.disable or args.enable:
+                tenant.active = args.enable
+            db.commit()
+            print(f"{tenant.name}: {tenant.monthly_minutes} minutes/month, {tenant.max_concurrent_jobs} concurrent jobs, "
+                  f"{'active' if tenant.active else 'disabled'}")
+        elif args.command == "issue-key":
+            tenant = _tenant(db, args.tenant)
+            print(issue_key(db, tenant, args.name))
+        elif args.command == "revoke-key":
+            count = revoke_key(db, args.prefix)
+            print(f"Revoked {count} key(s)")
+        else:
+            month = current_month()
+            for tenant in db.execute(select(Tenant).order_by(Tenant.name)).scalars():
+                usage = db.get(TenantUsage, (tenant.id, month))
+                used = usage.audio_seconds / 60 if usage is not None else 0.0
+                print(f"{tenant.name} ({tenant.id}) {'active' if tenant.active else 'disabled'}: "
+                      f"{used:.1f}/{tenant.monthly_minutes if tenant.monthly_minutes is not None else '-'} minutes "
+                      f"in {month}, concurrency {tenant.max_concurrent_jobs if tenant.max_concurrent_jobs is not None else '-'}")
+                keys = db.execute(select(ApiKey).where(ApiKey.tenant_id == tenant.id).order_by(ApiKey.created_at))
+                for key in keys.scalars():
+                    state = f"revoked {key.revoked_at:%Y-%m-%d}" if key.revoked_at else "active"
+                    print(f"  {key.prefix}…  {key.name or ''}  {state}")
+
+
+if __name__ == "__main__":
+    main()
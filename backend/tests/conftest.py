@@ -0,0 +1,19 @@
+import os
+import sys
+import tempfile
+
+# The app reads its configuration at import time
+_scratch = tempfile.mkdtemp(prefix="stt-tests-")
+os.environ.setdefault("ASSEMBLY_API_KEY", "test")
+os.environ.setdefault("ASSEMBLY_API_BASE", "http://assemblyai.test/v2")
+os.environ.setdefault("SUPABASE_URL", "http://supabase.test")
+os.environ.setdefault("SUPABASE_KEY", "test")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_scratch, 'test.sqlite')}")
+os.environ.setdefault("LOCAL_STORAGE_DIR", os.path.join(_scratch, "storage"))
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+# No real waiting between retries
+os.environ.setdefault("UPSTREAM_BACKOFF_BASE", "0")
+os.environ.setdefault("UPSTREAM_BACKOFF_MAX", "0")
+os.environ.setdefault("POLL_HEDGE_DELAY", "0.05")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,263 @@
+"""
+Fault injection for the upstream clients: retry classification, resumed
+polling, the circuit breaker and the Supabase HTTP fallback, against
+in-process mock servers (httpx.MockTransport)
+"""
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from app import storage
+from app.assembly import PollingInterrupted, run_transcription_job
+from app.backends import AssemblyAIBackend, assembly_breaker
+from app.resilience import (
+    CircuitBreaker,
+    CircuitOpen,
+    RetryPolicy,
+    UpstreamError,
+    hedged,
+    is_retryable,
+    with_retries,
+)
+
+
+class MockAssemblyAI:
+    """
+    A stand-in AssemblyAI: ``submit_faults`` and ``poll_faults`` are status
+    codes (or exceptions) returned before the real answer, one per request
+    """
+
+    def __init__(self, submit_faults=(), poll_faults=(), polls_until_done=2):
+        self.submit_faults = list(submit_faults)
+        self.poll_faults = list(poll_faults)
+        self.polls_until_done = polls_until_done
+        self.submits = 0
+        self.polls = 0
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        submit = request.method == "POST"
+        faults = self.submit_faults if submit else self.poll_faults
+        if submit:
+            self.submits += 1
+        else:
+            self.polls += 1
+        if faults:
+            fault = faults.pop(0)
+            if isinstance(fault, Exception):
+                raise fault
+            return httpx.Response(fault, text="injected", headers={"retry-after": "0"})
+        if submit:
+            return httpx.Response(200, json={"id": "job-1", "status": "queued"})
+        self.polls_until_done -= 1
+        if self.polls_until_done > 0:
+            return httpx.Response(200, json={"id": "job-1", "status": "processing"})
+        return httpx.Response(200, json={"id": "job-1", "status": "completed", "text": "hello", "utterances": []})
+
+    def backend(self) -> AssemblyAIBackend:
+        backend = AssemblyAIBackend()
+        backend.poll_interval = 0
+        backend._client = httpx.AsyncClient(transport=httpx.MockTransport(self.handler))
+        return backend
+
+
+@pytest.fixture(autouse=True)
+def closed_circuits():
+    for breaker in (assembly_breaker, storage.supabase_breaker):
+        breaker.record_success()
+    yield
+    for breaker in (assembly_breaker, storage.supabase_breaker):
+        breaker.record_success()
+
+
+def run(backend, **kwargs):
+    async def go():
+        try:
+            return await run_transcription_job(backend, "http://audio.test/a.wav", **kwargs)
+        finally:
+            await backend.aclose()
+    return asyncio.run(go())
+
+
+# Retry classification
+
+@pytest.mark.parametrize("exc, idempotent, expected", [
+    (UpstreamError("busy", 503), True, True),
+    (UpstreamError("busy", 503), False, True),
+    (UpstreamError("rate limited", 429), False, True),
+    (UpstreamError("server error", 500), True, True),
+    (UpstreamError("server error", 500), False, False),  # the job may exist
+    (UpstreamError("bad request", 400), True, False),
+    (httpx.ConnectError("refused"), False, True),  # never reached the server
+    (httpx.ReadTimeout("slow"), True, True),
+    (httpx.ReadTimeout("slow"), False, False),
+    (CircuitOpen("open"), True, False),
+    (ValueError("bug"), True, False),
+])
+def test_retry_classification(exc, idempotent, expected):
+    assert is_retryable(exc, idempotent) is expected
+
+
+def test_retry_after_header_sets_the_delay():
+    policy = RetryPolicy(max_attempts=3, base_delay=0, max_delay=10)
+    assert policy.delay(0, UpstreamError("busy", 503, retry_after=2.5)) == 2.5
+    assert policy.delay(0, UpstreamError("busy", 503, retry_after=60)) == 10
+
+
+def test_submit_retries_when_the_job_cannot_exist():
+    server = MockAssemblyAI(submit_faults=[503, httpx.ConnectError("refused"), 429])
+    result = run(server.backend())
+    assert result["status"] == "completed"
+    assert server.submits == 4
+
+
+def test_submit_does_not_retry_when_the_job_may_exist():
+    server = MockAssemblyAI(submit_faults=[500])
+    with pytest.raises(UpstreamError) as error:
+        run(server.backend())
+    assert error.value.status_code == 500
+    assert server.submits == 1
+
+
+def test_polling_rides_out_transient_errors():
+    server = MockAssemblyAI(poll_faults=[502, 504, httpx.ReadError("reset")])
+    result = run(server.backend())
+    assert result["status"] == "completed"
+    assert server.submits == 1
+
+
+def test_interrupted_polling_resumes_without_resubmitting():
+    # More failures in a row than the poll policy's attempts
+    server = MockAssemblyAI(poll_faults=[503] * 10)
+    with pytest.raises(PollingInterrupted) as error:
+        run(server.backend())
+    assert error.value.transcript_id == "job-1"
+
+    result = run(server.backend(), upstream_id=error.value.transcript_id)
+    assert result["status"] == "completed"
+    assert server.submits == 1
+
+
+# Circuit breaker
+
+def test_circuit_opens_then_half_opens_and_closes():
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=0.05)
+    policy = RetryPolicy(max_attempts=1, base_delay=0, max_delay=0)
+    calls = []
+
+    async def failing():
+        calls.append("fail")
+        raise UpstreamError("down", 503)
+
+    async def working():
+        calls.append("ok")
+        return "ok"
+
+    async def go():
+        for _ in range(2):
+            with pytest.raises(UpstreamError):
+                await with_retries(failing, "test", policy, breaker)
+        assert breaker.state == CircuitBreaker.OPEN
+
+        # Open: refused without calling upstream
+        with pytest.raises(CircuitOpen):
+            await with_retries(working, "test", policy, breaker)
+        assert calls == ["fail", "fail"]
+
+        # Half-open: one probe; a failure opens the circuit again at once
+        await asyncio.sleep(0.06)
+        with pytest.raises(UpstreamError):
+            await with_retries(failing, "test", policy, breaker)
+        assert breaker.state == CircuitBreaker.OPEN
+
+        # A successful probe closes it
+        await asyncio.sleep(0.06)
+        assert await with_retries(working, "test", policy, breaker) == "ok"
+        assert breaker.state == CircuitBreaker.CLOSED
+
+    asyncio.run(go())
+
+
+def test_open_assembly_circuit_fails_submits_fast():
+    server = MockAssemblyAI()
+    for _ in range(assembly_breaker.failure_threshold):
+        assembly_breaker.record_failure()
+    backend = server.backend()
+    assert not backend.available()
+    with pytest.raises(CircuitOpen):
+        run(backend)
+    assert server.submits == 0
+
+
+def test_hedged_call_returns_the_faster_copy():
+    started = []
+
+    async def call():
+        started.append(time.monotonic())
+        await asyncio.sleep(1.0 if len(started) == 1 else 0)
+        return len(started)
+
+    async def go():
+        begin = time.monotonic()
+        result = await hedged(call, 0.05)
+        return result, time.monotonic() - begin
+
+    result, elapsed = asyncio.run(go())
+    assert result == 2
+    assert elapsed < 0.5
+
+
+# Supabase upload fallback
+
+@pytest.fixture
+def supabase_http(monkeypatch):
+    """Route the HTTP uploader to a mock Supabase that fails ``faults`` first"""
+    server = {"faults": [], "uploads": []}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        server["uploads"].append(request.url.path)
+        if server["faults"]:
+            return httpx.Response(server["faults"].pop(0), text="injected")
+        return httpx.Response(200, json={"Key": request.url.path})
+
+    real_client = httpx.AsyncClient
+    monkeypatch.setattr(httpx, "AsyncClient",
+                        lambda **kwargs: real_client(transport=httpx.MockTransport(handler), **kwargs))
+    return server
+
+
+def test_upload_falls_back_to_http_when_the_sdk_fails(monkeypatch, supabase_http):
+    sdk_calls = []
+
+    def broken_sdk(*args):
+        sdk_calls.append(args)
+        raise RuntimeError("sdk down")
+
+    monkeypatch.setattr(storage, "upload_via_sdk", broken_sdk)
+    supabase_http["faults"] = [503]  # the fallback itself retries transient errors
+
+    url = asyncio.run(storage.upload_to_supabase(b"RIFF", "audio_a.wav", ".wav"))
+    assert url == storage.public_url("audio_a.wav")
+    assert len(sdk_calls) == 1
+    assert len(supabase_http["uploads"]) == 2
+
+
+def test_open_sdk_circuit_goes_straight_to_http(monkeypatch, supabase_http):
+    sdk_calls = []
+
+    def broken_sdk(*args):
+        sdk_calls.append(args)
+        raise RuntimeError("sdk down")
+
+    monkeypatch.setattr(storage, "upload_via_sdk", broken_sdk)
+    threshold = storage.supabase_breaker.failure_threshold
+
+    async def go():
+        for i in range(threshold + 3):
+            await storage.upload_to_supabase(b"RIFF", f"audio_{i}.wav", ".wav")
+
+    asyncio.run(go())
+    assert storage.supabase_breaker.state == CircuitBreaker.OPEN
+    assert len(sdk_calls) == threshold
+    assert len(supabase_http["uploads"]) == threshold + 3
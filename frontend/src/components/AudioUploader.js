@@ -70,13 +70,32 @@ const AudioUploader = () => {
         setProgress(85);
         break;
         
+      case 'partial':
+        // Chunked mode: show each chunk's utterances until the final pages replace them
+        setStatusMessage(data.message);
+        setTranscriptionData(prev => ({
+          ...(prev || {}),
+          utterances: [...(prev?.utterances || []), ...data.utterances].sort((a, b) => a.start - b.start)
+        }));
+        break;
+        
       case 'completed':
         setProgress(100);
         setStatusMessage(data.message);
-        setTranscriptionData(data.data);
+        // Utterances follow in 'utterances' pages unless the server sent them inline
+        setTranscriptionData({ ...data.data, utterances: data.data.utterances || [] });
         setIsLoading(false);
         break;
         
+      case 'utterances':
+        setTranscriptionData(prev => {
+          if (!prev || prev.id !== data.transcript_id) return prev;
+          const utterances = [...(prev.utterances || [])];
+          utterances.splice(data.offset, data.count, ...data.utterances);
+          return { ...prev, utterances };
+        });
+        break;
+        
       case 'error':
         setError(data.message);
         setIsLoading(false);